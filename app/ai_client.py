@@ -1,14 +1,41 @@
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import Any, Dict, List, Optional
+import re
+import threading
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Callable, ContextManager, Dict, List, Optional, TypeVar
 
 from dotenv import load_dotenv, find_dotenv
-from openai import OpenAI
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, OpenAI, RateLimitError, Timeout
+
+from .ai_resilience import AI_FIRST_TOKEN_TIMEOUT_S, CircuitOpenError, attempt_timeout, policy
+from .ai_telemetry import AICall, telemetry
+from .plan_validation import parse_json, validate_generated_plan
 
 
 load_dotenv(find_dotenv())
 
+# Client tuning (override via environment). OPENAI_BASE_URL points the clients at another
+# OpenAI-compatible server, e.g. the fake one used by the benchmarks.
+OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o")
+OPENAI_TIMEOUT_S = float(os.environ.get("OPENAI_TIMEOUT_S", "120"))
+OPENAI_CONNECT_TIMEOUT_S = float(os.environ.get("OPENAI_CONNECT_TIMEOUT_S", "10"))
+# Retries of the client itself; app.ai_resilience retries (AI_RETRIES) with deadlines and jitter
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "0"))
+# "single": one completion for the whole week; "parallel": split skeleton, then one completion per
+# day run concurrently (app.plan_parallel); "offline": local rules, no model (app.offline_generator)
+AI_GENERATION_MODES = ("single", "parallel", "offline")
+AI_GENERATION_MODE = os.environ.get("AI_GENERATION_MODE", "single")
+# Serve an offline plan (app.ai_resilience.AI_FALLBACK_GENERATOR) when OPENAI_API_KEY is unset, the
+# model cannot be reached in time or the circuit breaker is open
+AI_OFFLINE_FALLBACK = os.environ.get("AI_OFFLINE_FALLBACK", "1") == "1"
+# "compact": the model writes COMPACT_SCHEMA_BLOCK and expand_compact_plan() builds the plan dict;
+# "schema": the model writes the full SCHEMA_BLOCK JSON
+AI_OUTPUT_FORMATS = ("compact", "schema")
+AI_OUTPUT_FORMAT = os.environ.get("AI_OUTPUT_FORMAT", "compact")
+
 
 SYSTEM_PROMPT = (
     "You are a fitness AI coach. Your job is to output STRICT JSON objects only, never prose. "
@@ -68,11 +95,21 @@ SCHEMA_BLOCK = (
 )
 
 
-def build_user_prompt(*, owner_user_id: int, title: str, description: str, experience: str, days_per_week: int, equipment: str, priority: str) -> str:
-    header = (
-        "Generate a weekly training program and return STRICTLY AND ONLY a valid JSON object matching the SCHEMA and KEY ORDER below. "
-        "No markdown, no code fences, no comments, no extra keys, no explanations. Use null where data is missing. Keep exact key names and order. "
-        "Always start with '{' and end with '}'.\n\n"
+# Same content as SCHEMA_BLOCK at a fraction of the output tokens: no repeated keys per set or
+# exercise, and owner/title/description are filled in server-side
+COMPACT_SCHEMA_BLOCK = (
+    "OUTPUT FORMAT (COMPACT, EXACT):\n"
+    "{\"days\": [{\"d\": 1, \"ex\": [[\"Bench Press\", \"chest\", \"barbell\", \"4x8@150\"], "
+    "[\"Cable Fly\", \"chest\", \"cable\", \"3x12@90~8\", \"slow eccentric\"]]}]}\n"
+    "- d = day_of_week; ex = the day's exercises in order, each [name, muscle_group, equipment or null, sets, notes (optional)].\n"
+    "- sets = \"<sets>x<reps>@<rest_seconds>\", with \"~<rpe>\" appended for an RPE target; "
+    "use a list for sets that differ, e.g. [\"1x6@180\", \"3x10@120\"].\n\n"
+    "STRICT RULES: no other keys; do not repeat owner_user_id, title or description; no markdown, no backticks; return only the JSON object."
+)
+
+
+def _user_input_block(*, owner_user_id: int, title: str, description: str, experience: str, days_per_week: int, equipment: str, priority: str) -> str:
+    return (
         "USER INPUT:\n"
         f"- owner_user_id: {owner_user_id}\n"
         f"- title: {title}\n"
@@ -90,45 +127,163 @@ def build_user_prompt(*, owner_user_id: int, title: str, description: str, exper
         "- EXERCISE COUNT STRICT RULE: if days_per_week = 3 → 7–8 exercises/day; if days_per_week = 4 → 6–7; if days_per_week = 5 → 5–6.\n"
         "- Each exercise: 2–5 working sets depending on experience (novice 2–3; intermediate 3–4; advanced 4–5).\n\n"
     )
-    return header + SCHEMA_BLOCK
 
 
+def build_user_prompt(
+    *,
+    owner_user_id: int,
+    title: str,
+    description: str,
+    experience: str,
+    days_per_week: int,
+    equipment: str,
+    priority: str,
+    output_format: str = "schema",
+) -> str:
+    header = (
+        "Generate a weekly training program and return STRICTLY AND ONLY a valid JSON object matching the SCHEMA and KEY ORDER below. "
+        "No markdown, no code fences, no comments, no extra keys, no explanations. Use null where data is missing. Keep exact key names and order. "
+        "Always start with '{' and end with '}'.\n\n"
+    ) + _user_input_block(
+        owner_user_id=owner_user_id,
+        title=title,
+        description=description,
+        experience=experience,
+        days_per_week=days_per_week,
+        equipment=equipment,
+        priority=priority,
+    )
+    return header + (COMPACT_SCHEMA_BLOCK if output_format == "compact" else SCHEMA_BLOCK)
 
 
+_SET_SPEC_RE = re.compile(r"^\s*(\d+)\s*[x×]\s*(\d+)(?:\s*-\s*\d+)?\s*(?:@\s*(\d+)\s*s?)?\s*(?:~\s*(\d+(?:\.\d+)?))?\s*$")
 
-def _parse_json_strict(content: str) -> Dict[str, Any]:
-    import json
-    # Try direct parse
-    try:
-        return json.loads(content)
-    except Exception:
-        pass
-    s = content.strip()
-    # Strip markdown code fences
-    if s.startswith("```") and s.endswith("```"):
-        lines = s.splitlines()
-        s = "\n".join(lines[1:-1]).strip()
-    # Slice between first '{' and last '}'
-    if "{" in s and "}" in s:
-        try:
-            start = s.find("{")
-            end = s.rfind("}") + 1
-            return json.loads(s[start:end])
-        except Exception:
-            pass
-    # Last resort: strip BOM/whitespace
-    try:
-        return json.loads(s.lstrip("\ufeff\n\r\t "))
-    except Exception as e:
-        preview = content
-        try:
-            preview = content[:500]
-        except Exception:
-            pass
-        raise RuntimeError(f"Failed to parse JSON from OpenAI: {e}; raw: {preview}")
 
+def expand_sets(spec: Any, first_set_number: int = 1) -> List[Dict[str, Any]]:
+    """"4x8@120~8" (or a list of such specs) -> planned_sets dicts. A rep range takes its lower bound."""
+    specs = spec if isinstance(spec, list) else [spec]
+    sets: List[Dict[str, Any]] = []
+    for item in specs:
+        match = _SET_SPEC_RE.match(str(item))
+        if match is None:
+            raise RuntimeError(f"Bad set spec from OpenAI: {item!r}")
+        count, reps, rest, rpe = match.groups()
+        for _ in range(int(count)):
+            sets.append({
+                "set_number": first_set_number + len(sets),
+                "reps": int(reps),
+                "weight": None,
+                "rpe": float(rpe) if rpe is not None and "." in rpe else (int(rpe) if rpe is not None else None),
+                "rest_seconds": int(rest) if rest is not None else None,
+            })
+    return sets
 
-def generate_weekly_program(
+
+def expand_compact_exercise(item: Any, position: int) -> Dict[str, Any]:
+    if not isinstance(item, list) or len(item) < 4:
+        raise RuntimeError(f"Bad compact exercise from OpenAI: {item!r:.200}")
+    name, muscle_group, equipment, spec = item[:4]
+    equipment = None if equipment in (None, "", "null", "none") else equipment
+    return {
+        "name": name,
+        "muscle_group": muscle_group,
+        "equipment": equipment,
+        "position": position,
+        "notes": item[4] if len(item) > 4 and item[4] not in ("", "null") else None,
+        "planned_sets": expand_sets(spec),
+    }
+
+
+def expand_compact_day(day: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "day_of_week": day.get("d", day.get("day_of_week")),
+        "exercises": [expand_compact_exercise(item, position) for position, item in enumerate(day.get("ex") or [], start=1)],
+    }
+
+
+def expand_compact_plan(data: Dict[str, Any], *, owner_user_id: int, title: str, description: Optional[str]) -> Dict[str, Any]:
+    """COMPACT_SCHEMA_BLOCK output -> the SCHEMA_BLOCK plan dict (deterministic)."""
+    if not isinstance(data, dict) or not isinstance(data.get("days"), list):
+        raise RuntimeError(f"Bad compact plan from OpenAI: {data!r:.300}")
+    return {
+        "owner_user_id": owner_user_id,
+        "title": title,
+        "description": description,
+        "weeks": [{"week_number": 1, "days": [expand_compact_day(day) for day in data["days"]]}],
+    }
+
+
+def max_tokens_for(days_per_week: int, output_format: str) -> int:
+    """Output budget for a week: generous for up to 8 exercises x 5 sets a day, instead of a flat 7000."""
+    days = max(int(days_per_week), 1)
+    if output_format == "compact":
+        return 200 + 350 * days
+    return min(600 + 1600 * days, 7000)
+
+
+# Raised when the model is unreachable, too slow (APITimeoutError is an APIConnectionError) or still
+# failing after app.ai_resilience's retries, or when its circuit breaker stopped calling it
+UNREACHABLE_ERRORS = (APIConnectionError, asyncio.TimeoutError, InternalServerError, RateLimitError, CircuitOpenError)
+
+T = TypeVar("T")
+
+
+def has_api_key() -> bool:
+    return bool(os.getenv("OPENAI_API_KEY"))
+
+
+def _client_options() -> Dict[str, Any]:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    return {
+        "api_key": api_key,
+        "base_url": os.getenv("OPENAI_BASE_URL") or None,
+        "timeout": Timeout(OPENAI_TIMEOUT_S, connect=OPENAI_CONNECT_TIMEOUT_S),
+        "max_retries": OPENAI_MAX_RETRIES,
+    }
+
+
+# One client per process (sync) / per event loop (async), created on first use. Each keeps its
+# own HTTP connection pool, so consecutive generations reuse keep-alive connections.
+_client: Optional[OpenAI] = None
+_async_client: Optional[AsyncOpenAI] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OpenAI:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(**_client_options())
+    return _client
+
+
+def get_async_client() -> AsyncOpenAI:
+    """The shared async client; must be called from a running event loop."""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        # Pooled connections belong to the loop that opened them
+        _async_client = AsyncOpenAI(**_client_options())
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_clients() -> None:
+    """Close the shared clients (app shutdown); the next call creates fresh ones."""
+    global _client, _async_client, _async_client_loop
+    client, async_client = _client, _async_client
+    _client, _async_client, _async_client_loop = None, None, None
+    if async_client is not None:
+        await async_client.close()
+    if client is not None:
+        client.close()
+
+
+def _completion_request(
     *,
     owner_user_id: int,
     title: str,
@@ -137,14 +292,10 @@ def generate_weekly_program(
     days_per_week: int,
     equipment: List[str],
     priority: Optional[str],
-    model: str = "gpt-4o",
+    model: Optional[str],
+    output_format: Optional[str] = None,
 ) -> Dict[str, Any]:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set")
-
-    client = OpenAI(api_key=api_key)
-
+    output_format = output_format or AI_OUTPUT_FORMAT
     user_prompt = build_user_prompt(
         owner_user_id=owner_user_id,
         title=title,
@@ -153,23 +304,89 @@ def generate_weekly_program(
         days_per_week=days_per_week,
         equipment=", ".join(equipment) if equipment else "none",
         priority=priority or "none",
+        output_format=output_format,
     )
-
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
+    return {
+        "model": model or OPENAI_MODEL,
+        "messages": [
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt},
         ],
-        response_format={"type": "json_object"},
-        max_tokens=7000,
+        "response_format": {"type": "json_object"},
+        "max_tokens": max_tokens_for(days_per_week, output_format),
+    }
+
+
+def parse_plan(
+    content: str,
+    *,
+    output_format: Optional[str],
+    owner_user_id: int,
+    title: str,
+    description: Optional[str],
+    days_per_week: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Model output -> validated plan dict (app.plan_validation); compact output is expanded first
+    (a full-schema answer is accepted as is)."""
+    data = parse_json(content)
+    if (output_format or AI_OUTPUT_FORMAT) == "compact" and isinstance(data, dict) and "weeks" not in data:
+        data = expand_compact_plan(data, owner_user_id=owner_user_id, title=title, description=description)
+    return validate_generated_plan(
+        data, owner_user_id=owner_user_id, title=title, description=description, days_per_week=days_per_week
     )
 
-    content = response.choices[0].message.content or ""
-    return _parse_json_strict(content)
 
+def _tracked(call: Optional[AICall], kind: str, request: Dict[str, Any]) -> ContextManager[AICall]:
+    """The caller's AICall, or a new one recorded by app.ai_telemetry under `kind`."""
+    return nullcontext(call) if call is not None else telemetry.call(kind, request["model"])
 
-def generate_weekly_program_raw(
+
+async def _complete_async(request: Dict[str, Any], call: AICall) -> str:
+    raw = await get_async_client().chat.completions.with_raw_response.create(**request)
+    response = raw.parse()
+    call.response(raw)
+    call.usage(response.usage, response.model)
+    return response.choices[0].message.content or ""
+
+
+def _complete(request: Dict[str, Any], call: AICall) -> str:
+    raw = get_client().chat.completions.with_raw_response.create(**request)
+    response = raw.parse()
+    call.response(raw)
+    call.usage(response.usage, response.model)
+    return response.choices[0].message.content or ""
+
+
+async def _run_async(request: Dict[str, Any], call: AICall, parse: Callable[[str], T]) -> T:
+    """One completion under app.ai_resilience's deadlines, retries and hedging. `parse` runs inside
+    every attempt, so a hedged attempt only wins with output that parses."""
+
+    async def attempt(call: AICall) -> T:
+        return parse(await _complete_async(request, call))
+
+    return await policy.run(call.kind, attempt, call=call, timeout_s=attempt_timeout(request.get("max_tokens")))
+
+
+def _run(request: Dict[str, Any], call: AICall, parse: Callable[[str], T]) -> T:
+    """Blocking _run_async without hedging; the deadline is the request timeout."""
+    request = {**request, "timeout": Timeout(attempt_timeout(request.get("max_tokens")), connect=OPENAI_CONNECT_TIMEOUT_S)}
+    return policy.run_sync(call.kind, lambda call: parse(_complete(request, call)), call=call)
+
+
+def _plan_parser(
+    output_format: Optional[str], owner_user_id: int, title: str, description: Optional[str], days_per_week: int
+) -> Callable[[str], Dict[str, Any]]:
+    return lambda content: parse_plan(
+        content,
+        output_format=output_format,
+        owner_user_id=owner_user_id,
+        title=title,
+        description=description,
+        days_per_week=days_per_week,
+    )
+
+
+async def generate_weekly_program_raw_async(
     *,
     owner_user_id: int,
     title: str,
@@ -178,36 +395,166 @@ def generate_weekly_program_raw(
     days_per_week: int,
     equipment: List[str],
     priority: Optional[str],
-    model: str = "gpt-4o",
+    model: Optional[str] = None,
+    output_format: Optional[str] = None,
+    call: Optional[AICall] = None,
 ) -> str:
-    """Return raw string content from the model without parsing to JSON."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set")
+    """Awaitable generation on the shared async client; returns the raw model output."""
+    request = _completion_request(
+        owner_user_id=owner_user_id,
+        title=title,
+        description=description,
+        experience=experience,
+        days_per_week=days_per_week,
+        equipment=equipment,
+        priority=priority,
+        model=model,
+        output_format=output_format,
+    )
+    with _tracked(call, "raw", request) as call:
+        return await _run_async(request, call, str)
 
-    client = OpenAI(api_key=api_key)
 
-    user_prompt = build_user_prompt(
+async def stream_weekly_program_async(
+    *,
+    owner_user_id: int,
+    title: str,
+    description: Optional[str],
+    experience: str,
+    days_per_week: int,
+    equipment: List[str],
+    priority: Optional[str],
+    model: Optional[str] = None,
+    output_format: Optional[str] = None,
+    call: Optional[AICall] = None,
+) -> AsyncIterator[str]:
+    """Awaitable generation on the shared async client; yields the model output as it is written.
+    Pass `call` to keep the call open for telemetry past the last chunk (e.g. to cover parsing)."""
+    request = _completion_request(
         owner_user_id=owner_user_id,
         title=title,
-        description=description or "",
+        description=description,
         experience=experience,
         days_per_week=days_per_week,
-        equipment=", ".join(equipment) if equipment else "none",
-        priority=priority or "none",
+        equipment=equipment,
+        priority=priority,
+        model=model,
+        output_format=output_format,
     )
+    timeout_s = attempt_timeout(request["max_tokens"])
+
+    async def open_stream(call: AICall) -> Any:
+        # The read timeout bounds every gap between chunks, the first token included
+        return await get_async_client().chat.completions.with_raw_response.create(
+            **request,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=Timeout(AI_FIRST_TOKEN_TIMEOUT_S, connect=OPENAI_CONNECT_TIMEOUT_S),
+        )
+
+    with _tracked(call, "stream", request) as call:
+        # Retried until the response starts; never hedged, and not retried once chunks were yielded
+        raw = await policy.run("stream", open_stream, call=call, timeout_s=AI_FIRST_TOKEN_TIMEOUT_S, hedge=False)
+        stream = raw.parse()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout_s
+        try:
+            async for chunk in stream:
+                if loop.time() > deadline:
+                    raise asyncio.TimeoutError()
+                if chunk.usage is not None:
+                    # Sent last, with no choices
+                    call.usage(chunk.usage, chunk.model)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    call.first_token()
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+        call.response(raw)
 
-    response = client.chat.completions.create(
+
+async def generate_weekly_program_async(
+    *,
+    owner_user_id: int,
+    title: str,
+    description: Optional[str],
+    experience: str,
+    days_per_week: int,
+    equipment: List[str],
+    priority: Optional[str],
+    model: Optional[str] = None,
+    output_format: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Awaitable generation on the shared async client; returns the parsed plan."""
+    request = _completion_request(
+        owner_user_id=owner_user_id,
+        title=title,
+        description=description,
+        experience=experience,
+        days_per_week=days_per_week,
+        equipment=equipment,
+        priority=priority,
         model=model,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
-        response_format={"type": "json_object"},
-        max_tokens=7000,
+        output_format=output_format,
     )
+    parse = _plan_parser(output_format, owner_user_id, title, description, days_per_week)
+    with telemetry.call("plan", request["model"]) as call:
+        return await _run_async(request, call, parse)
+
 
-    content = response.choices[0].message.content or ""
-    return content
+def generate_weekly_program(
+    *,
+    owner_user_id: int,
+    title: str,
+    description: Optional[str],
+    experience: str,
+    days_per_week: int,
+    equipment: List[str],
+    priority: Optional[str],
+    model: Optional[str] = None,
+    output_format: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Blocking variant for scripts and worker threads; never call it on the event loop."""
+    request = _completion_request(
+        owner_user_id=owner_user_id,
+        title=title,
+        description=description,
+        experience=experience,
+        days_per_week=days_per_week,
+        equipment=equipment,
+        priority=priority,
+        model=model,
+        output_format=output_format,
+    )
+    parse = _plan_parser(output_format, owner_user_id, title, description, days_per_week)
+    with telemetry.call("plan", request["model"]) as call:
+        return _run(request, call, parse)
 
 
+def generate_weekly_program_raw(
+    *,
+    owner_user_id: int,
+    title: str,
+    description: Optional[str],
+    experience: str,
+    days_per_week: int,
+    equipment: List[str],
+    priority: Optional[str],
+    model: Optional[str] = None,
+    output_format: Optional[str] = None,
+    call: Optional[AICall] = None,
+) -> str:
+    """Return raw string content from the model without parsing to JSON (blocking)."""
+    request = _completion_request(
+        owner_user_id=owner_user_id,
+        title=title,
+        description=description,
+        experience=experience,
+        days_per_week=days_per_week,
+        equipment=equipment,
+        priority=priority,
+        model=model,
+        output_format=output_format,
+    )
+    with _tracked(call, "raw", request) as call:
+        return _run(request, call, str)
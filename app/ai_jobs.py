@@ -0,0 +1,278 @@
+"""
+Background AI plan generation (POST /api/v2/ai/generate-plan?async=1).
+
+submit() stores the job in ai_generation_job and returns its id at once. AI_JOB_WORKERS worker
+tasks on the app's event loop claim queued jobs oldest first (one atomic UPDATE ... RETURNING) and
+run them through the runner main.py hands to start(). A claim is a lease (claimed_by,
+lease_expires_at; migration 10_ai_job_lease.sql) of AI_JOB_LEASE_S that the process renews while
+the job runs, so processes sharing the database never run a job twice as long as they are alive.
+Jobs survive restarts: rows whose lease expired (their process crashed or stopped) are queued
+again, on start() and then every renewal, up to AI_JOB_MAX_ATTEMPTS claims. Finished jobs stay
+pollable for AI_JOB_RETENTION_S.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import anyio
+
+from . import db
+
+AI_JOB_WORKERS = int(os.environ.get("AI_JOB_WORKERS", "2"))
+AI_JOB_MAX_ATTEMPTS = int(os.environ.get("AI_JOB_MAX_ATTEMPTS", "3"))
+AI_JOB_RETENTION_S = float(os.environ.get("AI_JOB_RETENTION_S", str(24 * 3600)))
+# Idle workers also look for jobs queued by other processes this often
+AI_JOB_POLL_S = float(os.environ.get("AI_JOB_POLL_S", "1.0"))
+# How long a claim holds without renewal; renewed (and expired leases recovered) every third of it
+AI_JOB_LEASE_S = float(os.environ.get("AI_JOB_LEASE_S", "30"))
+
+Runner = Callable[[Dict[str, Any], str, bool], Awaitable[Dict[str, Any]]]
+
+
+def _percentiles(samples: Deque[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "p50": ordered[(len(ordered) - 1) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+class JobQueue:
+    def __init__(self, workers: int = AI_JOB_WORKERS) -> None:
+        self.workers = max(1, workers)
+        # Identifies this queue's leases among processes sharing the database
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running: Dict[str, float] = {}  # job id -> started_at, jobs this queue holds a lease on
+        self._tasks: List["asyncio.Task"] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[Runner] = None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"submitted": 0, "completed": 0, "failed": 0, "recovered": 0}
+        # Seconds from submit to claim and from claim to finish, most recent jobs
+        self._wait_s: Deque[float] = deque(maxlen=1000)
+        self._run_s: Deque[float] = deque(maxlen=1000)
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    # Storage: blocking SQLite calls, run in worker threads
+
+    def _insert(self, job_id: str, inputs: Dict[str, Any], mode: str, refresh: bool) -> None:
+        with db.get_connection() as conn, db.transaction(conn) as cur:
+            cur.execute(
+                """
+                INSERT INTO ai_generation_job(id, owner_user_id, mode, refresh, inputs_json, created_at)
+                VALUES(?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, inputs.get("owner_user_id"), mode, int(refresh), json.dumps(inputs), time.time()),
+            )
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        with db.get_connection() as conn, db.transaction(conn, immediate=True) as cur:
+            cur.execute(
+                """
+                UPDATE ai_generation_job
+                SET status = 'running', started_at = ?, attempts = attempts + 1,
+                    claimed_by = ?, lease_expires_at = ?
+                WHERE id = (
+                    SELECT id FROM ai_generation_job WHERE status = 'queued' ORDER BY created_at LIMIT 1
+                )
+                RETURNING id, mode, refresh, inputs_json, created_at, started_at
+                """,
+                (now, self.worker_id, now + AI_JOB_LEASE_S),
+            )
+            return cur.fetchone()
+
+    def _finish(self, job_id: str, result: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+        """Record the outcome, unless the lease was lost meanwhile (the job is someone else's now)."""
+        with db.get_connection() as conn, db.transaction(conn) as cur:
+            cur.execute(
+                """
+                UPDATE ai_generation_job SET status = ?, result_json = ?, error = ?, finished_at = ?,
+                    lease_expires_at = NULL
+                WHERE id = ? AND status = 'running' AND claimed_by = ?
+                """,
+                (
+                    "failed" if error is not None else "done",
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                    self.worker_id,
+                ),
+            )
+
+    def _renew(self, job_ids: List[str], expires_at: float) -> None:
+        """Extend (or, with a past `expires_at`, give up) this queue's leases on `job_ids`."""
+        if not job_ids:
+            return
+        with db.get_connection() as conn, db.transaction(conn) as cur:
+            cur.execute(
+                f"""
+                UPDATE ai_generation_job SET lease_expires_at = ?
+                WHERE status = 'running' AND claimed_by = ? AND id IN ({', '.join('?' * len(job_ids))})
+                """,
+                (expires_at, self.worker_id, *job_ids),
+            )
+
+    def _recover(self) -> int:
+        """Requeue running jobs whose lease expired (failing those out of attempts) and drop
+        finished ones past retention. Rows claimed before leases existed count as expired."""
+        expired = "status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)"
+        now = time.time()
+        with db.get_connection() as conn, db.transaction(conn, immediate=True) as cur:
+            cur.execute(
+                f"""
+                UPDATE ai_generation_job SET status = 'failed', error = 'abandoned after repeated restarts',
+                    finished_at = ?, lease_expires_at = NULL
+                WHERE {expired} AND attempts >= ?
+                """,
+                (now, now, AI_JOB_MAX_ATTEMPTS),
+            )
+            cur.execute(
+                f"""
+                UPDATE ai_generation_job SET status = 'queued', started_at = NULL, claimed_by = NULL,
+                    lease_expires_at = NULL
+                WHERE {expired}
+                """,
+                (now,),
+            )
+            recovered = cur.rowcount
+            cur.execute(
+                "DELETE FROM ai_generation_job WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (now - AI_JOB_RETENTION_S,),
+            )
+        return recovered
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status of a job, with its plan once done (or error once failed); None if unknown."""
+        with db.get_connection() as conn:
+            row = conn.execute(
+                """
+                SELECT id, status, mode, result_json, error, attempts, created_at, started_at, finished_at
+                FROM ai_generation_job WHERE id = ?
+                """,
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            job = {
+                "job_id": row["id"],
+                "status": row["status"],
+                "mode": row["mode"],
+                "attempts": row["attempts"],
+                "created_at": row["created_at"],
+                "started_at": row["started_at"],
+                "finished_at": row["finished_at"],
+            }
+            if row["status"] == "queued":
+                job["queue_position"] = conn.execute(
+                    "SELECT COUNT(*) FROM ai_generation_job WHERE status = 'queued' AND created_at < ?",
+                    (row["created_at"],),
+                ).fetchone()[0] + 1
+        if row["result_json"] is not None:
+            job["result"] = json.loads(row["result_json"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        return job
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth, jobs in the table by status, this process's counters, and wait / run time percentiles in seconds."""
+        with db.get_connection() as conn:
+            depth = {
+                r["status"]: r["n"]
+                for r in conn.execute("SELECT status, COUNT(*) AS n FROM ai_generation_job GROUP BY status")
+            }
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": depth.get("queued", 0),
+                "jobs_by_status": depth,
+                **self.stats,
+                "wait_s": _percentiles(self._wait_s),
+                "run_s": _percentiles(self._run_s),
+            }
+
+    # Workers: run on the app's event loop between start() and stop()
+
+    async def start(self, runner: Runner) -> None:
+        self._runner = runner
+        self._wakeup = asyncio.Event()
+        self._count("recovered", await anyio.to_thread.run_sync(self._recover))
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._lease_keeper()))
+
+    async def stop(self) -> None:
+        """Cancel the workers and give up their leases; the jobs they were running are requeued by
+        the next recovery here or in another process."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        running, self._running = list(self._running), {}
+        await anyio.to_thread.run_sync(self._renew, running, 0.0)
+
+    async def submit(self, inputs: Dict[str, Any], mode: str, refresh: bool = False) -> str:
+        job_id = uuid.uuid4().hex
+        await anyio.to_thread.run_sync(self._insert, job_id, inputs, mode, refresh)
+        self._count("submitted")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def _worker(self) -> None:
+        assert self._wakeup is not None and self._runner is not None
+        while True:
+            # Cleared before claiming, so a submit that lands meanwhile still wakes us
+            self._wakeup.clear()
+            job = await anyio.to_thread.run_sync(self._claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), AI_JOB_POLL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            with self._lock:
+                self._wait_s.append(job["started_at"] - job["created_at"])
+            self._running[job["id"]] = job["started_at"]
+            result, error = None, None
+            try:
+                result = await self._runner(json.loads(job["inputs_json"]), job["mode"], bool(job["refresh"]))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            await anyio.to_thread.run_sync(self._finish, job["id"], result, error)
+            self._running.pop(job["id"], None)
+            with self._lock:
+                self._run_s.append(time.time() - job["started_at"])
+                self.stats["failed" if error is not None else "completed"] += 1
+
+    async def _lease_keeper(self) -> None:
+        """Renew the leases of the jobs running here and requeue expired ones (dead processes')."""
+        while True:
+            await asyncio.sleep(AI_JOB_LEASE_S / 3)
+            try:
+                await anyio.to_thread.run_sync(self._renew, list(self._running), time.time() + AI_JOB_LEASE_S)
+                recovered = await anyio.to_thread.run_sync(self._recover)
+            except Exception as e:
+                print(f"DEBUG: AI job lease renewal failed: {type(e).__name__}: {e}")
+                continue
+            if recovered:
+                self._count("recovered", recovered)
+                if self._wakeup is not None:
+                    self._wakeup.set()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,310 @@
+"""
+Timeout, retry, hedging and circuit-breaker policy for model calls (used by app.ai_client).
+
+policy.run(kind, attempt, call=...) runs `attempt` (one completion plus whatever parses it) under a
+per-attempt deadline sized from the request's max_tokens, and retries transient failures
+(connection errors, timeouts, 429 and 5xx) with full-jitter exponential backoff inside an overall
+AI_DEADLINE_S. With AI_HEDGE=1 a second attempt is started when the first has run longer than the
+p95 of recent attempts of the same kind, and the first valid result wins; the other is cancelled.
+The client's own retries are off (OPENAI_MAX_RETRIES=0) so every attempt goes through here and
+shows up in app.ai_telemetry as a retry.
+
+Consecutive transient failures open a circuit breaker: for AI_BREAKER_RESET_S every call fails at
+once with CircuitOpenError (one of ai_client.UNREACHABLE_ERRORS, so main serves the
+AI_FALLBACK_GENERATOR plan), then one probe call decides whether it closes again. A probe that
+is cancelled (client gone, shutdown) decides nothing; the next call probes instead.
+"""
+
+import asyncio
+import importlib
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+from .ai_telemetry import AICall
+
+# Per-attempt deadline: fixed if AI_ATTEMPT_TIMEOUT_S is set, else time to first token plus
+# max_tokens at the slowest generation speed we accept
+AI_ATTEMPT_TIMEOUT_S = float(os.environ["AI_ATTEMPT_TIMEOUT_S"]) if os.environ.get("AI_ATTEMPT_TIMEOUT_S") else None
+AI_FIRST_TOKEN_TIMEOUT_S = float(os.environ.get("AI_FIRST_TOKEN_TIMEOUT_S", "15"))
+AI_MIN_TOKENS_PER_S = float(os.environ.get("AI_MIN_TOKENS_PER_S", "25"))
+# All attempts and backoff of one call
+AI_DEADLINE_S = float(os.environ.get("AI_DEADLINE_S", "180"))
+AI_RETRIES = int(os.environ.get("AI_RETRIES", "2"))
+AI_RETRY_BASE_S = float(os.environ.get("AI_RETRY_BASE_S", "0.5"))
+AI_RETRY_MAX_S = float(os.environ.get("AI_RETRY_MAX_S", "8"))
+# Hedging: the delay is the p95 of the last AI_HEDGE_WINDOW attempts of the same kind, or
+# AI_HEDGE_DELAY_S until AI_HEDGE_MIN_SAMPLES of them have finished
+AI_HEDGE = os.environ.get("AI_HEDGE", "0") == "1"
+AI_HEDGE_DELAY_S = float(os.environ.get("AI_HEDGE_DELAY_S", "20"))
+AI_HEDGE_WINDOW = int(os.environ.get("AI_HEDGE_WINDOW", "200"))
+AI_HEDGE_MIN_SAMPLES = int(os.environ.get("AI_HEDGE_MIN_SAMPLES", "20"))
+AI_BREAKER_FAILURES = int(os.environ.get("AI_BREAKER_FAILURES", "5"))
+AI_BREAKER_RESET_S = float(os.environ.get("AI_BREAKER_RESET_S", "30"))
+# "module:function" with the arguments and result of ai_client.generate_weekly_program
+AI_FALLBACK_GENERATOR = os.environ.get("AI_FALLBACK_GENERATOR", "app.offline_generator:generate_weekly_program_offline")
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_transient(e: BaseException) -> bool:
+    """Worth another attempt: the model was unreachable, too slow, rate limited or failed (5xx)."""
+    if isinstance(e, (APIConnectionError, asyncio.TimeoutError, RateLimitError)):
+        return True
+    return isinstance(e, APIStatusError) and e.status_code >= 500
+
+
+def attempt_timeout(max_tokens: Optional[int]) -> float:
+    if AI_ATTEMPT_TIMEOUT_S is not None:
+        return AI_ATTEMPT_TIMEOUT_S
+    return AI_FIRST_TOKEN_TIMEOUT_S + (max_tokens or 0) / AI_MIN_TOKENS_PER_S
+
+
+def backoff(retry: int) -> float:
+    """Full jitter: uniform in [0, min(AI_RETRY_MAX_S, AI_RETRY_BASE_S * 2^(retry-1))]."""
+    return random.uniform(0, min(AI_RETRY_MAX_S, AI_RETRY_BASE_S * 2 ** (retry - 1)))
+
+
+def fallback_generator() -> Callable[..., Dict[str, Any]]:
+    """The AI_FALLBACK_GENERATOR function, imported on first use."""
+    module, _, name = AI_FALLBACK_GENERATOR.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+class CircuitBreaker:
+    """closed -> open after AI_BREAKER_FAILURES transient failures in a row; open -> half_open
+    after AI_BREAKER_RESET_S, letting one probe through; the probe closes or reopens it."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.stats: Dict[str, int] = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= AI_BREAKER_RESET_S:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= AI_BREAKER_FAILURES):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probing = False
+                self.stats["opened"] += 1
+
+    def abandon(self) -> None:
+        """An allowed call ended without an answer (cancelled): free the probe slot so the next call probes."""
+        with self._lock:
+            self._probing = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "state": self.state, "consecutive_failures": self.failures}
+
+
+class ResiliencePolicy:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.breaker = CircuitBreaker()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        self.stats: Dict[str, int] = {
+            "calls": 0, "attempts": 0, "retries": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0, "failures": 0,
+        }
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def _observe(self, kind: str, latency_s: float) -> None:
+        with self._lock:
+            window = self._latencies.get(kind)
+            if window is None or window.maxlen != AI_HEDGE_WINDOW:
+                window = self._latencies[kind] = deque(window or (), maxlen=AI_HEDGE_WINDOW)
+            window.append(latency_s)
+
+    def hedge_delay(self, kind: str) -> float:
+        """p95 latency of recent successful attempts of `kind`, or AI_HEDGE_DELAY_S with too few of them."""
+        with self._lock:
+            samples = sorted(self._latencies.get(kind) or ())
+        if len(samples) < AI_HEDGE_MIN_SAMPLES:
+            return AI_HEDGE_DELAY_S
+        return samples[min(int(0.95 * len(samples)), len(samples) - 1)]
+
+    async def _attempt(self, kind: str, attempt: Callable[[AICall], Awaitable[T]], call: AICall) -> T:
+        self.count("attempts")
+        t0 = time.perf_counter()
+        result = await attempt(call)
+        self._observe(kind, time.perf_counter() - t0)
+        return result
+
+    async def _race(self, kind: str, attempt: Callable[[AICall], Awaitable[T]], call: AICall, budget: float, hedge: bool) -> T:
+        """One attempt under `budget` seconds, plus a hedged one once it is slower than usual."""
+        hedge_after = self.hedge_delay(kind) if hedge and AI_HEDGE else None
+        if hedge_after is None or hedge_after >= budget:
+            return await asyncio.wait_for(self._attempt(kind, attempt, call), budget)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        pending = {asyncio.ensure_future(self._attempt(kind, attempt, call))}
+        hedged = None
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                until = start + (budget if hedged else hedge_after)
+                done, pending = await asyncio.wait(pending, timeout=max(until - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            self.count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+                if done:
+                    continue
+                if hedged is not None:
+                    raise asyncio.TimeoutError()
+                # The first attempt is slower than usual: race a second one
+                self.count("hedges")
+                hedged = asyncio.ensure_future(self._attempt(kind, attempt, call))
+                pending.add(hedged)
+            raise error  # type: ignore[misc]
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def run(
+        self,
+        kind: str,
+        attempt: Callable[[AICall], Awaitable[T]],
+        *,
+        call: AICall,
+        timeout_s: float,
+        hedge: bool = True,
+    ) -> T:
+        """Result of the first attempt that succeeds; see the module docstring. Non-transient
+        errors (invalid output, 4xx) are raised at once; `call.retries` counts the retries."""
+        self.count("calls")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + AI_DEADLINE_S
+        error: Optional[BaseException] = None
+        for retry in range(AI_RETRIES + 1):
+            if retry:
+                delay = backoff(retry)
+                if loop.time() + delay >= deadline:
+                    break
+                self.count("retries")
+                call.retries += 1
+                await asyncio.sleep(delay)
+            budget = min(timeout_s, deadline - loop.time())
+            if budget <= 0:
+                break
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Model calls suspended for up to {AI_BREAKER_RESET_S:g}s after repeated failures") from error
+            try:
+                result = await self._race(kind, attempt, call, budget, hedge)
+            except Exception as e:
+                if not is_transient(e):
+                    # The model answered; what it said is the caller's problem
+                    self.breaker.success()
+                    raise
+                if isinstance(e, asyncio.TimeoutError):
+                    self.count("timeouts")
+                self.breaker.failure()
+                error = e
+                continue
+            except BaseException:
+                # Cancelled (client gone, shutdown): says nothing about the model
+                self.breaker.abandon()
+                raise
+            self.breaker.success()
+            return result
+        self.count("failures")
+        raise error or asyncio.TimeoutError()
+
+    def run_sync(self, kind: str, attempt: Callable[[AICall], T], *, call: AICall) -> T:
+        """Blocking variant without hedging; the attempt enforces its own deadline (request timeout)."""
+        self.count("calls")
+        deadline = time.monotonic() + AI_DEADLINE_S
+        error: Optional[BaseException] = None
+        for retry in range(AI_RETRIES + 1):
+            if retry:
+                delay = backoff(retry)
+                if time.monotonic() + delay >= deadline:
+                    break
+                self.count("retries")
+                call.retries += 1
+                time.sleep(delay)
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Model calls suspended for up to {AI_BREAKER_RESET_S:g}s after repeated failures") from error
+            self.count("attempts")
+            try:
+                result = attempt(call)
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.success()
+                    raise
+                self.breaker.failure()
+                error = e
+                continue
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            self.breaker.success()
+            return result
+        self.count("failures")
+        raise error  # type: ignore[misc]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            "hedge": AI_HEDGE,
+            "hedge_delay_s": {kind: self.hedge_delay(kind) for kind in list(self._latencies)},
+            "breaker": self.breaker.snapshot(),
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+            self._latencies.clear()
+        self.breaker.reset()
+
+
+policy = ResiliencePolicy()
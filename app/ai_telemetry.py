@@ -0,0 +1,255 @@
+"""
+Telemetry for model calls: token usage, time to first token, latency, retries and parse failures.
+
+ai_client wraps every chat completion in telemetry.call(kind, model): the AICall it yields is
+told when the response (or first streamed token) arrives and what usage it reported, and on exit
+the call is recorded. An exception after the response counts as a parse failure, before it as an
+error. Records feed in-memory counters and histograms (GET /api/v2/ai/metrics) and are buffered
+for the ai_call_log table (migration 09_ai_call_log.sql), written every AI_TELEMETRY_FLUSH_S by
+a task on the app's event loop and pruned to AI_TELEMETRY_RETENTION_S / AI_TELEMETRY_MAX_ROWS.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import anyio
+
+from . import db
+
+AI_TELEMETRY_FLUSH_S = float(os.environ.get("AI_TELEMETRY_FLUSH_S", "5"))
+AI_TELEMETRY_RETENTION_S = float(os.environ.get("AI_TELEMETRY_RETENTION_S", str(30 * 24 * 3600)))
+AI_TELEMETRY_MAX_ROWS = int(os.environ.get("AI_TELEMETRY_MAX_ROWS", "100000"))
+# Rows waiting for the next flush; the oldest are dropped if the table cannot keep up
+AI_TELEMETRY_BUFFER = int(os.environ.get("AI_TELEMETRY_BUFFER", "10000"))
+
+LATENCY_BUCKETS_S = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+TTFT_BUCKETS_S = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+_COLUMNS = (
+    "created_at", "kind", "model", "prompt_tokens", "completion_tokens",
+    "ttft_s", "latency_s", "retries", "parse_failed", "error",
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are the upper bound of the bucket they fall in."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def _percentile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Prometheus-style cumulative counts per upper bound, plus count, sum, mean, p50 and p95."""
+        cumulative, seen = {}, 0
+        for bound, n in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            seen += n
+            cumulative[bound] = seen
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self._percentile(0.5),
+            "p95": self._percentile(0.95),
+            "buckets": cumulative,
+        }
+
+
+class AICall:
+    """One model call being measured; see AITelemetry.call."""
+
+    def __init__(self, kind: str, model: Optional[str]) -> None:
+        self.kind = kind
+        self.model = model
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.ttft_s: Optional[float] = None
+        self.latency_s: Optional[float] = None
+        self.retries = 0
+        self.responded = False
+        self._t0 = time.perf_counter()
+
+    def first_token(self) -> None:
+        if self.ttft_s is None:
+            self.ttft_s = time.perf_counter() - self._t0
+
+    def response(self, raw: Any = None) -> None:
+        """The response is in (for streams: the last chunk). `raw` is the with_raw_response result, for the retry count."""
+        self.latency_s = time.perf_counter() - self._t0
+        self.responded = True
+        if raw is not None:
+            # The client sends the number of its own retries already taken on every attempt;
+            # app.ai_resilience adds its retries to the same count
+            self.retries += int(raw.http_request.headers.get("x-stainless-retry-count") or 0)
+
+    def usage(self, usage: Any, model: Optional[str] = None) -> None:
+        if usage is not None:
+            self.prompt_tokens = usage.prompt_tokens
+            self.completion_tokens = usage.completion_tokens
+        self.model = model or self.model
+
+
+class AITelemetry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: Deque[Tuple[Any, ...]] = deque(maxlen=AI_TELEMETRY_BUFFER)
+        self._task: Optional["asyncio.Task"] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.stats: Dict[str, int] = {
+            "calls": 0, "errors": 0, "parse_failures": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0,
+        }
+        self.by_kind: Dict[str, int] = {}
+        self.by_model: Dict[str, Dict[str, int]] = {}
+        self.histograms = {
+            "latency_s": Histogram(LATENCY_BUCKETS_S),
+            "ttft_s": Histogram(TTFT_BUCKETS_S),
+            "prompt_tokens": Histogram(TOKEN_BUCKETS),
+            "completion_tokens": Histogram(TOKEN_BUCKETS),
+        }
+
+    @contextmanager
+    def call(self, kind: str, model: Optional[str]) -> Iterator[AICall]:
+        call = AICall(kind, model)
+        try:
+            yield call
+        except BaseException as e:
+            if call.responded:
+                self.record(call, parse_failed=True)
+            else:
+                call.latency_s = time.perf_counter() - call._t0
+                self.record(call, error="cancelled" if isinstance(e, (asyncio.CancelledError, GeneratorExit)) else type(e).__name__)
+            raise
+        else:
+            if not call.responded:
+                call.response()
+            self.record(call)
+
+    def record(self, call: AICall, *, parse_failed: bool = False, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["errors"] += error is not None
+            self.stats["parse_failures"] += parse_failed
+            self.stats["retries"] += call.retries
+            self.by_kind[call.kind] = self.by_kind.get(call.kind, 0) + 1
+            model = self.by_model.setdefault(call.model or "unknown", {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            model["calls"] += 1
+            if error is None:
+                self.histograms["latency_s"].observe(call.latency_s or 0.0)
+            if call.ttft_s is not None:
+                self.histograms["ttft_s"].observe(call.ttft_s)
+            for key in ("prompt_tokens", "completion_tokens"):
+                value = getattr(call, key)
+                if value is not None:
+                    self.stats[key] += value
+                    model[key] += value
+                    self.histograms[key].observe(value)
+            self._pending.append((
+                time.time(), call.kind, call.model, call.prompt_tokens, call.completion_tokens,
+                call.ttft_s, call.latency_s or 0.0, call.retries, int(parse_failed), error,
+            ))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and histograms since start (or clear()), in this process."""
+        with self._lock:
+            return {
+                **self.stats,
+                "by_kind": dict(self.by_kind),
+                "by_model": {model: dict(totals) for model, totals in self.by_model.items()},
+                "histograms": {name: h.snapshot() for name, h in self.histograms.items()},
+                "pending_rows": len(self._pending),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+            self._pending.clear()
+
+    # Storage: blocking SQLite calls, run in worker threads
+
+    def flush(self) -> int:
+        """Write buffered rows to ai_call_log and prune it; returns the number of rows written."""
+        with self._lock:
+            rows = list(self._pending)
+            self._pending.clear()
+        with db.get_connection() as conn, db.transaction(conn) as cur:
+            if rows:
+                cur.executemany(
+                    f"INSERT INTO ai_call_log({', '.join(_COLUMNS)}) VALUES({', '.join('?' * len(_COLUMNS))})",
+                    rows,
+                )
+            cur.execute("DELETE FROM ai_call_log WHERE created_at < ?", (time.time() - AI_TELEMETRY_RETENTION_S,))
+            cur.execute(
+                "DELETE FROM ai_call_log WHERE id <= (SELECT id FROM ai_call_log ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (AI_TELEMETRY_MAX_ROWS,),
+            )
+        return len(rows)
+
+    def summary(self, window_s: float) -> List[Dict[str, Any]]:
+        """Per kind and model over the last `window_s` seconds of ai_call_log (all processes)."""
+        with db.get_connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT kind, model, COUNT(*) AS calls,
+                       SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens,
+                       AVG(latency_s) AS avg_latency_s, MAX(latency_s) AS max_latency_s, AVG(ttft_s) AS avg_ttft_s,
+                       SUM(retries) AS retries, SUM(parse_failed) AS parse_failures,
+                       SUM(error IS NOT NULL) AS errors
+                FROM ai_call_log
+                WHERE created_at >= ?
+                GROUP BY kind, model
+                ORDER BY calls DESC
+                """,
+                (time.time() - window_s,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    # Flusher: runs on the app's event loop between start() and stop()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._flusher())
+
+    async def stop(self) -> None:
+        """Stop the flusher and write what is still buffered."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await anyio.to_thread.run_sync(self.flush)
+
+    async def _flusher(self) -> None:
+        while True:
+            await asyncio.sleep(AI_TELEMETRY_FLUSH_S)
+            try:
+                await anyio.to_thread.run_sync(self.flush)
+            except Exception as e:
+                print(f"DEBUG: AI telemetry flush failed: {type(e).__name__}: {e}")
+
+
+telemetry = AITelemetry()
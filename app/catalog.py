@@ -0,0 +1,137 @@
+"""
+In-memory exercise catalog index keyed on lower(name).
+
+Global exercises live in one shared map and each user's own exercises in a per-owner map,
+both loaded lazily. ExerciseRepo.create invalidates the affected map (again once its
+transaction commits); resolve_or_create
+turns a batch of plan exercises into ids with at most one SELECT and one executemany INSERT.
+"""
+
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from . import db
+
+
+def normalize_name(name: str) -> str:
+    return name.strip().lower()
+
+
+class ExerciseCatalog:
+    def __init__(self) -> None:
+        self._global: Optional[Dict[str, int]] = None
+        self._users: Dict[int, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _drop(self, owner_user_id: Optional[int], is_global: bool) -> None:
+        with self._lock:
+            if is_global or owner_user_id is None:
+                self._global = None
+            if owner_user_id is not None:
+                self._users.pop(owner_user_id, None)
+
+    def invalidate(self, owner_user_id: Optional[int] = None, is_global: bool = False, conn: Optional[sqlite3.Connection] = None) -> None:
+        """
+        Drop the owner's map (and the global one if `is_global` or no owner). Given the writer's
+        `conn`, it is dropped again once its transaction commits, so a lookup that reloaded the
+        pre-commit rows in between cannot keep them.
+        """
+        self._drop(owner_user_id, is_global)
+        if conn is not None:
+            db.after_commit(conn, lambda: self._drop(owner_user_id, is_global))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._global = None
+            self._users.clear()
+
+    def _load(self, owner_user_id: Optional[int], conn: sqlite3.Connection) -> None:
+        """Fill whichever of the global / owner maps is missing with a single SELECT."""
+        need_global = self._global is None
+        need_user = owner_user_id is not None and owner_user_id not in self._users
+        if not (need_global or need_user):
+            return
+        clauses = []
+        params = []
+        if need_global:
+            clauses.append("is_global = 1")
+        if need_user:
+            clauses.append("owner_user_id = ?")
+            params.append(owner_user_id)
+        rows = conn.execute(
+            f"SELECT id, name, owner_user_id, is_global FROM exercise WHERE {' OR '.join(clauses)} ORDER BY id",
+            params,
+        ).fetchall()
+        global_map: Dict[str, int] = {}
+        user_map: Dict[str, int] = {}
+        for row in rows:
+            key = normalize_name(row["name"])
+            if row["is_global"]:
+                global_map.setdefault(key, row["id"])
+            if owner_user_id is not None and row["owner_user_id"] == owner_user_id:
+                user_map.setdefault(key, row["id"])
+        with self._lock:
+            if need_global:
+                self._global = global_map
+            if need_user:
+                self._users[owner_user_id] = user_map  # type: ignore[index]
+
+    def lookup(self, owner_user_id: Optional[int], name: str, conn: Optional[sqlite3.Connection] = None) -> Optional[int]:
+        """Exercise id for `name`, preferring the user's own exercise over a global one."""
+        with db.use_connection(conn) as conn:
+            self._load(owner_user_id, conn)
+        key = normalize_name(name)
+        with self._lock:
+            if owner_user_id is not None:
+                hit = self._users.get(owner_user_id, {}).get(key)
+                if hit is not None:
+                    return hit
+            return (self._global or {}).get(key)
+
+    def resolve_or_create(
+        self,
+        owner_user_id: int,
+        exercises: Iterable[Dict[str, Any]],
+        conn: Optional[sqlite3.Connection] = None,
+    ) -> Dict[str, int]:
+        """
+        Map normalized name → exercise id for every {"name", "muscle_group", "equipment"} item.
+        Names unknown to both the user and the global catalog are created as the user's exercises.
+        """
+        wanted: Dict[str, Dict[str, Any]] = {}
+        for ex in exercises:
+            wanted.setdefault(normalize_name(ex["name"]), ex)
+
+        with db.use_connection(conn) as conn:
+            resolved: Dict[str, int] = {}
+            for key in wanted:
+                hit = self.lookup(owner_user_id, key, conn=conn)
+                if hit is not None:
+                    resolved[key] = hit
+            missing = [key for key in wanted if key not in resolved]
+            if not missing:
+                return resolved
+
+            with db.transaction(conn) as cur:
+                # OR IGNORE: another process may have created the same name since our index was loaded
+                cur.executemany(
+                    "INSERT OR IGNORE INTO exercise(owner_user_id, name, muscle_group, equipment, is_global) VALUES(?, ?, ?, ?, 0)",
+                    [
+                        (owner_user_id, wanted[k]["name"].strip(), wanted[k]["muscle_group"], wanted[k].get("equipment"))
+                        for k in missing
+                    ],
+                )
+                placeholders = ",".join("lower(?)" for _ in missing)
+                cur.execute(
+                    f"SELECT id, name FROM exercise WHERE owner_user_id = ? AND lower(name) IN ({placeholders})",
+                    (owner_user_id, *(wanted[k]["name"].strip() for k in missing)),
+                )
+                for row in cur.fetchall():
+                    resolved[normalize_name(row["name"])] = row["id"]
+            # The insert may still be rolled back by the caller's unit of work; reload this owner lazily
+            self.invalidate(owner_user_id, conn=conn)
+        return resolved
+
+
+exercise_catalog = ExerciseCatalog()
@@ -1,43 +1,254 @@
 """
 SQLite connection helpers and schema integrity utilities for Program ↔ Workout schema.
 No destructive actions; only ensure missing indexes and triggers exist.
+
+Connections come from a small process-wide pool. Each connection is opened once,
+tuned with PRAGMAs (WAL, synchronous=NORMAL, mmap, cache, busy timeout) and then
+reused. Nested get_connection() calls on the same thread share one connection, and
+unit_of_work() lets several repo calls share one connection and a single commit.
 """
 
-from pathlib import Path
+import os
+import queue
 import sqlite3
+import threading
+from pathlib import Path
 from contextlib import contextmanager
-from typing import Generator, Iterable
+from typing import Callable, Dict, Generator, Iterable, List, Optional
 
 
 # Database file path
 DB_PATH = Path(__file__).resolve().parent.parent / "database" / "workout.db"
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "database" / "migrations"
+DAY_PROGRESS_MIGRATION = MIGRATIONS_DIR / "04_day_progress.sql"
+WEEK_TEMPLATE_MIGRATION = MIGRATIONS_DIR / "05_program_week_template.sql"
+PLANNED_WEEKS_MIGRATION = MIGRATIONS_DIR / "06_program_planned_weeks.sql"
+AI_PLAN_CACHE_MIGRATION = MIGRATIONS_DIR / "07_ai_plan_cache.sql"
+AI_GENERATION_JOB_MIGRATION = MIGRATIONS_DIR / "08_ai_generation_job.sql"
+AI_CALL_LOG_MIGRATION = MIGRATIONS_DIR / "09_ai_call_log.sql"
+AI_JOB_LEASE_MIGRATION = MIGRATIONS_DIR / "10_ai_job_lease.sql"
+DAY_PROGRESS_TRIGGERS = {
+    "trg_day_progress_workout_ins",
+    "trg_day_progress_workout_del",
+    "trg_day_progress_workout_set_ins",
+    "trg_day_progress_workout_set_del",
+    "trg_day_progress_workout_set_upd",
+    "trg_day_progress_planned_set_ins",
+    "trg_day_progress_planned_set_del",
+    "trg_day_progress_planned_set_upd",
+}
+
+# Pool / PRAGMA tuning (override via environment)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "16"))
+# How long a thread waits for a connection when all DB_POOL_SIZE are checked out
+DB_POOL_TIMEOUT_S = float(os.environ.get("DB_POOL_TIMEOUT_S", "30"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", str(16 * 1024)))
 
 
 def get_db_path() -> Path:
     return DB_PATH
 
 
-@contextmanager
-def get_connection() -> Generator[sqlite3.Connection, None, None]:
-    conn = sqlite3.connect(str(DB_PATH))
+def _open_connection(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path), timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON;")
-    try:
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS};")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE};")
+    # Negative cache_size is in KiB rather than pages
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB};")
+    return conn
+
+
+class ConnectionPool:
+    """
+    Bounded pool of tuned SQLite connections.
+    - At most `size` connections are checked out at once; further threads wait for one to be
+      released, up to DB_POOL_TIMEOUT_S, then get sqlite3.OperationalError
+    - A thread keeps the same connection for nested get_connection() calls
+    - Released connections go back to an idle LIFO queue
+    - Any transaction left open by the caller is rolled back on release
+    """
+
+    def __init__(self, path: Path, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = max(1, size)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=self.size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self.stats: Dict[str, int] = {"opened": 0, "reused": 0, "closed": 0, "commits": 0, "waits": 0, "timeouts": 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def _acquire(self) -> sqlite3.Connection:
+        if not self._slots.acquire(blocking=False):
+            self._count("waits")
+            if not self._slots.acquire(timeout=DB_POOL_TIMEOUT_S):
+                self._count("timeouts")
+                raise sqlite3.OperationalError(
+                    f"No pooled connection free after {DB_POOL_TIMEOUT_S:g}s ({self.size} checked out)"
+                )
+        try:
+            conn = self._idle.get_nowait()
+            self._count("reused")
+            return conn
+        except queue.Empty:
+            pass
+        try:
+            conn = _open_connection(self.path)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._count("opened")
+        return conn
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            _pop_after_commit(conn)
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+                self._count("closed")
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Generator[sqlite3.Connection, None, None]:
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            local.depth += 1
+            try:
+                yield conn
+            finally:
+                local.depth -= 1
+            return
+
+        conn = self._acquire()
+        local.conn = conn
+        local.depth = 1
+        try:
+            yield conn
+        finally:
+            local.conn = None
+            local.depth = 0
+            self._release(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            self._count("closed")
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+    return _pool
+
+
+def configure(db_path: Optional[Path] = None, pool_size: Optional[int] = None) -> ConnectionPool:
+    """Point the app at another database file and/or resize the pool (closes idle connections)."""
+    global _pool, DB_PATH, DB_POOL_SIZE
+    with _pool_lock:
+        if db_path is not None:
+            DB_PATH = Path(db_path)
+        if pool_size is not None:
+            DB_POOL_SIZE = pool_size
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+        return _pool
+
+
+@contextmanager
+def get_connection() -> Generator[sqlite3.Connection, None, None]:
+    with get_pool().connection() as conn:
+        yield conn
+
+
+@contextmanager
+def use_connection(conn: Optional[sqlite3.Connection] = None) -> Generator[sqlite3.Connection, None, None]:
+    """Yield `conn` when the caller already holds one (unit of work), otherwise borrow from the pool."""
+    if conn is not None:
         yield conn
-    finally:
-        conn.close()
+        return
+    with get_connection() as pooled:
+        yield pooled
+
+
+# Callbacks waiting for the open transaction of a connection to commit, keyed by id(conn)
+_after_commit: Dict[int, List[Callable[[], None]]] = {}
+_after_commit_lock = threading.Lock()
+
+
+def after_commit(conn: sqlite3.Connection, callback: Callable[[], None]) -> None:
+    """Run `callback` once the transaction open on `conn` commits (right away if none is open); dropped on rollback."""
+    if not conn.in_transaction:
+        callback()
+        return
+    with _after_commit_lock:
+        _after_commit.setdefault(id(conn), []).append(callback)
+
+
+def _pop_after_commit(conn: sqlite3.Connection) -> List[Callable[[], None]]:
+    with _after_commit_lock:
+        return _after_commit.pop(id(conn), [])
 
 
 @contextmanager
-def transaction(conn: sqlite3.Connection) -> Iterable[sqlite3.Cursor]:
+def transaction(conn: sqlite3.Connection, immediate: bool = False) -> Iterable[sqlite3.Cursor]:
+    """
+    Run the block in one transaction on `conn`. `immediate` takes the write lock up front
+    (BEGIN IMMEDIATE) so a check-then-insert cannot race another writer.
+    """
     cur = conn.cursor()
+    if conn.in_transaction:
+        # Already inside a unit of work: join it, the outermost transaction commits
+        yield cur
+        return
     try:
-        cur.execute("BEGIN")
+        cur.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
         yield cur
         conn.commit()
+        get_pool()._count("commits")
     except Exception:
         conn.rollback()
+        _pop_after_commit(conn)
         raise
+    for callback in _pop_after_commit(conn):
+        callback()
+
+
+@contextmanager
+def unit_of_work(conn: Optional[sqlite3.Connection] = None) -> Generator[sqlite3.Connection, None, None]:
+    """
+    One connection and one transaction for a multi-step operation.
+    Pass the yielded connection to repo methods (conn=...); it commits once on exit.
+    Given an existing `conn`, joins the caller's unit of work instead.
+    """
+    with use_connection(conn) as conn, transaction(conn):
+        yield conn
 
 
 def _execute_many(cur: sqlite3.Cursor, statements: Iterable[str]) -> None:
@@ -52,7 +263,15 @@ def ensure_schema_integrity() -> None:
     Ensure required indexes and triggers exist for the Program ↔ Workout schema.
     - Creates idempotent indexes on FK/join columns
     - Creates BEFORE INSERT/UPDATE triggers on workout_set enforcing invariants A/B/C
+    - Creates the day_progress counters and their triggers (04_day_progress.sql), backfilling if new
+    - Creates the program_week_template table for template-derived weeks (05_program_week_template.sql)
+    - Adds program.planned_weeks for lazily stored programs (06_program_planned_weeks.sql)
+    - Creates the ai_plan_cache table behind app.plan_cache (07_ai_plan_cache.sql)
+    - Creates the ai_generation_job table behind app.ai_jobs (08_ai_generation_job.sql)
+    - Creates the ai_call_log table behind app.ai_telemetry (09_ai_call_log.sql)
+    - Adds the worker lease columns to ai_generation_job (10_ai_job_lease.sql)
     """
+    day_progress_created = False
     with get_connection() as conn, transaction(conn) as cur:
         # Indexes (idempotent)
         _execute_many(cur, [
@@ -75,6 +294,7 @@ def ensure_schema_integrity() -> None:
             "CREATE UNIQUE INDEX IF NOT EXISTS workout_exercise_uq ON workout_exercise(workout_id, position)",
             "CREATE INDEX IF NOT EXISTS workout_set_wex_idx ON workout_set(workout_exercise_id)",
             "CREATE INDEX IF NOT EXISTS workout_set_planned_idx ON workout_set(planned_set_id)",
+            "CREATE INDEX IF NOT EXISTS workout_set_wex_planned_idx ON workout_set(workout_exercise_id, planned_set_id)",
         ])
 
         # Triggers: create only if not already present
@@ -158,6 +378,104 @@ def ensure_schema_integrity() -> None:
             )
 
 
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='day_progress'")
+        day_progress_created = cur.fetchone() is None
+        if day_progress_created or not DAY_PROGRESS_TRIGGERS <= existing_triggers:
+            with open(DAY_PROGRESS_MIGRATION, "r", encoding="utf-8") as f:
+                cur.executescript(f.read())
+
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='program_week_template'")
+        if cur.fetchone() is None:
+            with open(WEEK_TEMPLATE_MIGRATION, "r", encoding="utf-8") as f:
+                cur.executescript(f.read())
+
+        cur.execute("PRAGMA table_info(program)")
+        if "planned_weeks" not in {row["name"] for row in cur.fetchall()}:
+            with open(PLANNED_WEEKS_MIGRATION, "r", encoding="utf-8") as f:
+                cur.executescript(f.read())
+
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='ai_plan_cache'")
+        if cur.fetchone() is None:
+            with open(AI_PLAN_CACHE_MIGRATION, "r", encoding="utf-8") as f:
+                cur.executescript(f.read())
+
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='ai_generation_job'")
+        if cur.fetchone() is None:
+            with open(AI_GENERATION_JOB_MIGRATION, "r", encoding="utf-8") as f:
+                cur.executescript(f.read())
+
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='ai_call_log'")
+        if cur.fetchone() is None:
+            with open(AI_CALL_LOG_MIGRATION, "r", encoding="utf-8") as f:
+                cur.executescript(f.read())
+
+        cur.execute("PRAGMA table_info(ai_generation_job)")
+        if "lease_expires_at" not in {row["name"] for row in cur.fetchall()}:
+            with open(AI_JOB_LEASE_MIGRATION, "r", encoding="utf-8") as f:
+                cur.executescript(f.read())
+
+    if day_progress_created:
+        rebuild_day_progress()
+
+
+_DAY_PROGRESS_REBUILD_SQL = """
+    WITH latest AS (
+        SELECT owner_user_id, program_day_id, id, started_at,
+               ROW_NUMBER() OVER (PARTITION BY owner_user_id, program_day_id ORDER BY started_at DESC, id DESC) AS recency
+        FROM workout
+        WHERE :user_id IS NULL OR owner_user_id = :user_id
+    ),
+    done AS (
+        SELECT w.owner_user_id, w.program_day_id, COUNT(DISTINCT ws.planned_set_id) AS completed_sets
+        FROM workout w
+        JOIN workout_exercise we ON we.workout_id = w.id
+        JOIN workout_set ws ON ws.workout_exercise_id = we.id
+        WHERE :user_id IS NULL OR w.owner_user_id = :user_id
+        GROUP BY w.owner_user_id, w.program_day_id
+    ),
+    planned AS (
+        SELECT pde.program_day_id, COUNT(*) AS planned_sets
+        FROM planned_set ps
+        JOIN program_day_exercise pde ON pde.id = ps.program_day_exercise_id
+        WHERE pde.program_day_id IN (SELECT program_day_id FROM latest)
+        GROUP BY pde.program_day_id
+    )
+    SELECT l.owner_user_id AS user_id, l.program_day_id,
+           COALESCE(p.planned_sets, 0) AS planned_sets,
+           COALESCE(d.completed_sets, 0) AS completed_sets,
+           l.id AS last_workout_id, l.started_at AS last_workout_started_at
+    FROM latest l
+    LEFT JOIN planned p ON p.program_day_id = l.program_day_id
+    LEFT JOIN done d ON d.owner_user_id = l.owner_user_id AND d.program_day_id = l.program_day_id
+    WHERE l.recency = 1
+"""
+
+
+def rebuild_day_progress(user_id: Optional[int] = None, conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
+    """
+    Recompute day_progress from workouts and planned sets (all users, or one) and fix rows that drifted.
+    Returns {"checked", "repaired", "removed"}.
+    """
+    columns = ("planned_sets", "completed_sets", "last_workout_id", "last_workout_started_at")
+    with use_connection(conn) as conn, transaction(conn) as cur:
+        cur.execute(_DAY_PROGRESS_REBUILD_SQL, {"user_id": user_id})
+        expected = {(r["user_id"], r["program_day_id"]): tuple(r[c] for c in columns) for r in cur.fetchall()}
+        cur.execute(
+            f"SELECT user_id, program_day_id, {', '.join(columns)} FROM day_progress WHERE ? IS NULL OR user_id = ?",
+            (user_id, user_id),
+        )
+        current = {(r["user_id"], r["program_day_id"]): tuple(r[c] for c in columns) for r in cur.fetchall()}
+
+        drifted = [key + values for key, values in expected.items() if current.get(key) != values]
+        orphaned = [key for key in current if key not in expected]
+        cur.executemany(
+            f"INSERT OR REPLACE INTO day_progress(user_id, program_day_id, {', '.join(columns)}) VALUES(?, ?, ?, ?, ?, ?)",
+            drifted,
+        )
+        cur.executemany("DELETE FROM day_progress WHERE user_id = ? AND program_day_id = ?", orphaned)
+    return {"checked": len(expected), "repaired": len(drifted), "removed": len(orphaned)}
+
+
 if __name__ == "__main__":
     ensure_schema_integrity()
     print(f"Ensured schema integrity at {DB_PATH}")
@@ -2,26 +2,62 @@
 FastAPI application wired to Program ↔ Workout services and reports (v2 endpoints).
 """
 
+import asyncio
+import copy
+import functools
+import json
+from contextlib import asynccontextmanager
+
+import anyio
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi import Response, Request, Form
 from fastapi import Body
 import uvicorn
 from typing import Optional
 from typing import Dict, Any, List
 
-from . import services
+from . import services, plan_import
 from . import db as app_db
-from .repo import UserRepo
+from .repo import UserRepo, ProgramRepo
+from .program_tree import get_program_tree, find_week
 from .security import hash_password, verify_password, sign_token, verify_token
 from . import db as app_db
-from .ai_client import generate_weekly_program, generate_weekly_program_raw
+from . import ai_client, ai_jobs, ai_resilience, offline_generator
+from .ai_telemetry import telemetry as ai_telemetry
+from .ai_client import generate_weekly_program_async, generate_weekly_program_raw_async, stream_weekly_program_async
+from .plan_cache import plan_cache, plan_cache_key
+from .plan_stream import PlanStreamParser
+from .plan_parallel import generate_weekly_program_parallel_async
+from .single_flight import EventFeed, ai_generation_flight
+from .offline_generator import generate_weekly_program_offline
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # DB-bound endpoints are plain `def` handlers, so FastAPI runs them in AnyIO's
+    # worker threads instead of on the event loop. Size that threadpool to the
+    # connection pool so every worker can hold a pooled connection.
+    anyio.to_thread.current_default_thread_limiter().total_tokens = app_db.DB_POOL_SIZE
+    # Indexes, invariant triggers and day_progress counters for databases created before them
+    await anyio.to_thread.run_sync(app_db.ensure_schema_integrity)
+    # Background generations (generate-plan?async=1), including jobs queued before a restart
+    await ai_jobs.job_queue.start(_generate_plan)
+    # Writes model call telemetry to ai_call_log every AI_TELEMETRY_FLUSH_S
+    await ai_telemetry.start()
+    yield
+    await ai_jobs.job_queue.stop()
+    await ai_generation_flight.cancel_all()
+    await ai_telemetry.stop()
+    # Shared OpenAI clients hold pooled keep-alive connections
+    await ai_client.close_clients()
+
 
 app = FastAPI(
     title="IRON AI Workout Planner",
     description="AI-powered workout planning and tracking",
     version="2.0.0",
+    lifespan=lifespan,
 )
 
 app.mount("/static", StaticFiles(directory="frontend"), name="static")
@@ -48,7 +84,7 @@ COOKIE_MAX_AGE = 60 * 60 * 24 * 7
 
 
 @app.post("/api/v2/auth/register")
-async def api_register(email: str = Form(...), password: str = Form(...)):
+def api_register(email: str = Form(...), password: str = Form(...)):
     existing = UserRepo.get_by_email(email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
@@ -58,7 +94,7 @@ async def api_register(email: str = Form(...), password: str = Form(...)):
 
 
 @app.post("/api/v2/auth/login")
-async def api_login(response: Response, email: str = Form(...), password: str = Form(...)):
+def api_login(response: Response, email: str = Form(...), password: str = Form(...)):
     user = UserRepo.get_by_email(email)
     if not user or not verify_password(password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -74,7 +110,7 @@ async def api_logout(response: Response):
 
 
 @app.get("/api/v2/auth/me")
-async def api_me(request: Request):
+def api_me(request: Request):
     token = request.cookies.get(COOKIE_NAME)
     if not token:
         return {"authenticated": False}
@@ -89,7 +125,7 @@ async def api_me(request: Request):
 
 # v2 EXERCISES
 @app.post("/api/v2/exercises")
-async def api_create_exercise(
+def api_create_exercise(
     name: str = Form(...),
     muscle_group: str = Form(...),
     equipment: Optional[str] = Form(None),
@@ -110,13 +146,13 @@ async def api_create_exercise(
 
 
 @app.get("/api/v2/exercises")
-async def api_list_exercises(owner_user_id: Optional[int] = None):
+def api_list_exercises(owner_user_id: Optional[int] = None):
     return services.list_exercises_v2(owner_user_id)
 
 
 # v2 PROGRAM BUILDING
 @app.post("/api/v2/programs")
-async def api_create_program(
+def api_create_program(
     owner_user_id: int = Form(...),
     title: str = Form(...),
     description: Optional[str] = Form(None),
@@ -128,7 +164,7 @@ async def api_create_program(
 
 
 @app.post("/api/v2/programs/{program_id}/weeks/{week_number}")
-async def api_ensure_week(program_id: int, week_number: int):
+def api_ensure_week(program_id: int, week_number: int):
     try:
         return services.ensure_week(program_id, week_number)
     except Exception as e:
@@ -136,7 +172,7 @@ async def api_ensure_week(program_id: int, week_number: int):
 
 
 @app.post("/api/v2/programs/{program_id}/weeks/{week_number}/days/{day_of_week}")
-async def api_ensure_day(program_id: int, week_number: int, day_of_week: int):
+def api_ensure_day(program_id: int, week_number: int, day_of_week: int):
     try:
         return services.ensure_day(program_id, week_number, day_of_week)
     except Exception as e:
@@ -144,7 +180,7 @@ async def api_ensure_day(program_id: int, week_number: int, day_of_week: int):
 
 
 @app.post("/api/v2/programs/{program_id}/weeks/{week_number}/days/{day_of_week}/exercises")
-async def api_add_day_exercise(
+def api_add_day_exercise(
     program_id: int,
     week_number: int,
     day_of_week: int,
@@ -159,7 +195,7 @@ async def api_add_day_exercise(
 
 
 @app.post("/api/v2/programs/{program_id}/weeks/{week_number}/days/{day_of_week}/exercises/{position}/planned-sets")
-async def api_add_planned_set(
+def api_add_planned_set(
     program_id: int,
     week_number: int,
     day_of_week: int,
@@ -178,7 +214,7 @@ async def api_add_planned_set(
 
 # v2 WORKOUTS
 @app.post("/api/v2/workouts/start")
-async def api_start_workout(
+def api_start_workout(
     owner_user_id: int = Form(...),
     program_id: int = Form(...),
     week_number: int = Form(...),
@@ -197,12 +233,21 @@ async def api_start_workout(
         # Check if week exists
         cur.execute("SELECT id FROM program_week WHERE program_id = ? AND week_number = ?", (program_id, week_number))
         week = cur.fetchone()
+        if not week:
+            # Lazily stored programs write later weeks on first access
+            week_id = plan_import.ensure_week_materialized(program_id, week_number, conn=conn)
+            week = {"id": week_id} if week_id is not None else None
         if not week:
             raise HTTPException(status_code=404, detail="Week not found")
         
         # Check if day exists
         cur.execute("SELECT id FROM program_day WHERE program_week_id = ? AND day_of_week = ?", (week["id"], day_of_week))
         day = cur.fetchone()
+        if not day:
+            # Template-derived weeks only get day rows once a workout starts on them
+            ProgramRepo.materialize_days(program_id, week_number, [day_of_week], conn=conn)
+            cur.execute("SELECT id FROM program_day WHERE program_week_id = ? AND day_of_week = ?", (week["id"], day_of_week))
+            day = cur.fetchone()
         if not day:
             raise HTTPException(status_code=404, detail="Day not found")
         
@@ -264,8 +309,9 @@ async def api_start_workout(
 
 
 @app.post("/api/v2/programs/{program_id}/weeks/{to_week}/progress")
-async def api_progress_week(program_id: int, to_week: int, from_week: int = Query(...)):
-    """Generate planned sets for week `to_week` based on `from_week` with progression rules."""
+def api_progress_week(program_id: int, to_week: int, from_week: int = Query(1)):
+    """Generate planned sets for week `to_week` from week 1 with the progression rules (which are
+    relative to week 1, so any other `from_week` is a 400)."""
     try:
         result = services.generate_week_progression(program_id, from_week, to_week)
         return result
@@ -274,8 +320,8 @@ async def api_progress_week(program_id: int, to_week: int, from_week: int = Quer
 
 
 @app.post("/api/v2/programs/{program_id}/weeks/{to_week}/progress-from-actuals")
-async def api_progress_week_from_actuals(request: Request, program_id: int, to_week: int, from_week: int = Query(...)):
-    """Generate planned sets for week `to_week` based on user's actuals in `from_week` (fallback to planned)."""
+def api_progress_week_from_actuals(request: Request, program_id: int, to_week: int, from_week: int = Query(...)):
+    """Generate planned sets for week `to_week` based on user's actuals in `from_week`; sets not logged are carried over as planned."""
     token = request.cookies.get(COOKIE_NAME)
     auth_user_id = verify_token(token) if token else None
     if not auth_user_id:
@@ -286,8 +332,29 @@ async def api_progress_week_from_actuals(request: Request, program_id: int, to_w
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/api/v2/programs/{program_id}/regenerate-progression")
+def api_regenerate_progression(program_id: int, weeks: Optional[int] = Query(None)):
+    """Rebuild planned sets of weeks 2..`weeks` from week 1 with the default progression rules."""
+    try:
+        return services.regenerate_program_progression(program_id, weeks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/api/v2/programs/{program_id}/progress-from-actuals")
+def api_progress_program_from_actuals(request: Request, program_id: int):
+    """Recompute next-week planned sets for every day of the program the user has completed."""
+    token = request.cookies.get(COOKIE_NAME)
+    auth_user_id = verify_token(token) if token else None
+    if not auth_user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        return services.apply_progression_from_actuals(program_id, auth_user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @app.post("/api/v2/workouts/{workout_id}/log-set")
-async def api_log_set(workout_id: int, position: int, planned_set_id: int, set_number: int, reps: int, weight: Optional[float] = None, rpe: Optional[float] = None, rest_seconds: Optional[int] = None):
+def api_log_set(workout_id: int, position: int, planned_set_id: int, set_number: int, reps: int, weight: Optional[float] = None, rpe: Optional[float] = None, rest_seconds: Optional[int] = None):
     try:
         return services.log_workout_set(workout_id, position, planned_set_id, set_number, reps, weight, rpe, rest_seconds)
     except Exception as e:
@@ -295,87 +362,21 @@ async def api_log_set(workout_id: int, position: int, planned_set_id: int, set_n
 
 
 @app.get("/api/v2/workouts/{workout_id}/session")
-async def api_get_workout_session(request: Request, workout_id: int):
+def api_get_workout_session(request: Request, workout_id: int):
     """Get workout session data with exercises and planned sets"""
-    with app_db.get_connection() as conn:
-        cur = conn.cursor()
-        
-        # Get workout info
-        cur.execute("""
-            SELECT w.id, w.owner_user_id, w.program_day_id, w.started_at,
-                   p.title as program_title, pw.week_number, pd.day_of_week
-            FROM workout w
-            JOIN program_day pd ON pd.id = w.program_day_id
-            JOIN program_week pw ON pw.id = pd.program_week_id
-            JOIN program p ON p.id = pw.program_id
-            WHERE w.id = ?
-        """, (workout_id,))
-        
-        workout = cur.fetchone()
-        if not workout:
-            raise HTTPException(status_code=404, detail="Workout not found")
-        
-        token = request.cookies.get(COOKIE_NAME)
-        auth_user_id = verify_token(token) if token else None
-        if not auth_user_id or auth_user_id != workout["owner_user_id"]:
-            raise HTTPException(status_code=403, detail="Forbidden")
+    session = services.load_workout_session(workout_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Workout not found")
 
-        # Get exercises with their planned sets
-        cur.execute("""
-            SELECT we.id, we.position, e.name as exercise_name,
-                   pde.id as program_day_exercise_id
-            FROM workout_exercise we
-            JOIN program_day_exercise pde ON pde.id = we.program_day_exercise_id
-            JOIN exercise e ON e.id = pde.exercise_id
-            WHERE we.workout_id = ?
-            ORDER BY we.position
-        """, (workout_id,))
-        
-        exercises = []
-        for exercise_row in cur.fetchall():
-            # Get planned sets for this exercise
-            cur.execute("""
-                SELECT ps.id, ps.set_number, ps.reps as planned_reps, ps.weight as planned_weight
-                FROM planned_set ps
-                WHERE ps.program_day_exercise_id = ?
-                ORDER BY ps.set_number
-            """, (exercise_row["program_day_exercise_id"],))
-            
-            sets = []
-            for set_row in cur.fetchall():
-                # Check if this set has been logged
-                cur.execute("""
-                    SELECT ws.reps as actual_reps, ws.weight as actual_weight
-                    FROM workout_set ws
-                    WHERE ws.planned_set_id = ?
-                """, (set_row["id"],))
-                
-                actual_set = cur.fetchone()
-                
-                sets.append({
-                    "id": set_row["id"],
-                    "set_number": set_row["set_number"],
-                    "planned_reps": set_row["planned_reps"],
-                    "planned_weight": set_row["planned_weight"],
-                    "actual_reps": actual_set["actual_reps"] if actual_set else None,
-                    "actual_weight": actual_set["actual_weight"] if actual_set else None
-                })
-            
-            exercises.append({
-                "id": exercise_row["id"],
-                "position": exercise_row["position"],
-                "exercise_name": exercise_row["exercise_name"],
-                "sets": sets
-            })
-        
-        return {
-            "workout": dict(workout),
-            "exercises": exercises
-        }
+    token = request.cookies.get(COOKIE_NAME)
+    auth_user_id = verify_token(token) if token else None
+    if not auth_user_id or auth_user_id != session["workout"]["owner_user_id"]:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return session
 
 
 @app.post("/api/v2/workouts/{workout_id}/sets/{planned_set_id}")
-async def api_log_set(
+def api_log_set(
     workout_id: int, 
     planned_set_id: int,
     reps: int = Form(...),
@@ -432,7 +433,7 @@ async def api_log_set(
 
 
 @app.post("/api/v2/workouts/{workout_id}/finish")
-async def api_finish_workout(workout_id: int, notes: Optional[str] = None):
+def api_finish_workout(workout_id: int, notes: Optional[str] = None):
     try:
         return services.finish_workout(workout_id, notes)
     except Exception as e:
@@ -441,34 +442,34 @@ async def api_finish_workout(workout_id: int, notes: Optional[str] = None):
 
 # v2 REPORTS
 @app.get("/api/v2/reports/planned-sets")
-async def api_report_planned_sets(program_id: int, week_number: int):
+def api_report_planned_sets(program_id: int, week_number: int):
     return services.report_total_planned_sets(program_id, week_number)
 
 
 @app.get("/api/v2/reports/actual-sets")
-async def api_report_actual_sets(program_id: int, week_number: int):
+def api_report_actual_sets(program_id: int, week_number: int):
     return services.report_total_actual_sets(program_id, week_number)
 
 
 @app.get("/api/v2/reports/sets-by-muscle-group")
-async def api_report_sets_by_muscle_group(program_id: int, week_number: int):
+def api_report_sets_by_muscle_group(program_id: int, week_number: int):
     return services.report_sets_by_muscle_group(program_id, week_number)
 
 
 @app.get("/api/v2/reports/progress")
-async def api_report_progress(program_id: int, exercise_id: int):
+def api_report_progress(program_id: int, exercise_id: int):
     return services.report_progress_for_exercise(program_id, exercise_id)
 
 
 # Read-only: list programs (for ready-made plans)
 @app.get("/api/v2/programs/list")
-async def api_programs_list():
+def api_programs_list():
     return services.get_programs_list()
 
 
 # Get program info by ID
 @app.get("/api/v2/programs/{program_id}/info")
-async def get_program_info(program_id: int):
+def get_program_info(program_id: int):
     try:
         return services.get_program_info(program_id)
     except ValueError as e:
@@ -476,7 +477,7 @@ async def get_program_info(program_id: int):
 
 # Get program weeks count by ID
 @app.get("/api/programs/{program_id}/weeks")
-async def get_program_weeks_by_id(program_id: int):
+def get_program_weeks_by_id(program_id: int):
     try:
         return services.get_program_weeks_count(program_id)
     except ValueError as e:
@@ -484,7 +485,7 @@ async def get_program_weeks_by_id(program_id: int):
 
 # Get program weeks count by name (legacy)
 @app.get("/api/programs/{program_name}/weeks")
-async def get_program_weeks(program_name: str):
+def get_program_weeks(program_name: str):
     with app_db.get_connection() as conn:
         cur = conn.cursor()
         # Find program by title (case-insensitive search)
@@ -500,66 +501,22 @@ async def get_program_weeks(program_name: str):
             )
         program_id = prog["id"]
 
-        # Get weeks count
-        cur.execute("SELECT COUNT(*) as weeks_count FROM program_week WHERE program_id = ?", (program_id,))
-        weeks_count = cur.fetchone()["weeks_count"]
-        
-        return {"program_name": prog["title"], "weeks_count": weeks_count}
+    # Lazily stored programs have rows for week 1 only; their length is program.planned_weeks
+    weeks_count = services.get_program_weeks_count(program_id)["weeks_count"]
+    return {"program_name": prog["title"], "weeks_count": weeks_count}
 
 
 # Get specific week data by ID
 @app.get("/api/programs/{program_id}/weeks/{week_number}")
-async def get_program_week_by_id(program_id: int, week_number: int):
-    with app_db.get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, title FROM program WHERE id = ?", (program_id,))
-        prog = cur.fetchone()
-        if not prog:
-            raise HTTPException(status_code=404, detail="Program not found")
-        
-        # Get specific week
-        cur.execute("SELECT id FROM program_week WHERE program_id = ? AND week_number = ?", (program_id, week_number))
-        week = cur.fetchone()
-        if not week:
-            raise HTTPException(status_code=404, detail=f"Week {week_number} not found for this program")
-        week_id = week["id"]
-
-        # Days and exercises
-        cur.execute(
-            "SELECT id, day_of_week FROM program_day WHERE program_week_id = ? ORDER BY day_of_week",
-            (week_id,),
-        )
-        days_rows = cur.fetchall()
-        print(f"DEBUG: Found {len(days_rows)} days for week {week_number} of program {program_id}")
-        days_out = []
-        for d in days_rows:
-            cur.execute(
-                """
-                SELECT e.name
-                FROM program_day_exercise pde
-                JOIN exercise e ON e.id = pde.exercise_id
-                WHERE pde.program_day_id = ?
-                ORDER BY pde.position
-                """,
-                (d["id"],),
-            )
-            ex_names = [r[0] for r in cur.fetchall()]
-            print(f"DEBUG: Day {d['day_of_week']} has {len(ex_names)} exercises: {ex_names}")
-            days_out.append({
-                "day_number": d["day_of_week"],
-                "exercises": ex_names,
-            })
-
-        return {
-            "program_id": prog["id"],
-            "program_name": prog["title"],
-            "week_number": week_number,
-            "days": days_out,
-        }
+def get_program_week_by_id(program_id: int, week_number: int):
+    try:
+        return services.get_program_week_data(program_id, week_number)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 # Get specific week data by name (legacy)
 @app.get("/api/programs/{program_name}/weeks/{week_number}")
-async def get_program_week(program_name: str, week_number: int):
+def get_program_week(program_name: str, week_number: int):
     with app_db.get_connection() as conn:
         cur = conn.cursor()
         # Find program by title (case-insensitive search)
@@ -575,47 +532,29 @@ async def get_program_week(program_name: str, week_number: int):
             )
         program_id = prog["id"]
 
-        # Get specific week
-        cur.execute("SELECT id FROM program_week WHERE program_id = ? AND week_number = ?", (program_id, week_number))
-        week = cur.fetchone()
-        if not week:
-            raise HTTPException(status_code=404, detail=f"Week {week_number} not found for this program")
-        week_id = week["id"]
+    try:
+        week = services.get_program_week_data(program_id, week_number)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {
+        "program_name": week["program_name"],
+        "week_number": week_number,
+        "days": week["days"],
+    }
 
-        # Days and exercises
-        cur.execute(
-            "SELECT id, day_of_week FROM program_day WHERE program_week_id = ? ORDER BY day_of_week",
-            (week_id,),
-        )
-        days_rows = cur.fetchall()
-        days_out = []
-        for d in days_rows:
-            cur.execute(
-                """
-                SELECT e.name
-                FROM program_day_exercise pde
-                JOIN exercise e ON e.id = pde.exercise_id
-                WHERE pde.program_day_id = ?
-                ORDER BY pde.position
-                """,
-                (d["id"],),
-            )
-            ex_names = [r[0] for r in cur.fetchall()]
-            days_out.append({
-                "day_number": d["day_of_week"],
-                "exercises": ex_names,
-            })
 
-        return {
-            "program_name": prog["title"],
-            "week_number": week_number,
-            "days": days_out,
-        }
+# Whole program tree in one response (cached per program)
+@app.get("/api/v2/programs/{program_id}/overview")
+def api_program_overview(program_id: int):
+    try:
+        return services.get_program_overview(program_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 # User program management
 @app.post("/api/v2/user-programs")
-async def api_select_program(
+def api_select_program(
     user_id: int = Form(...),
     program_id: int = Form(...),
     notes: Optional[str] = Form(None)
@@ -656,7 +595,7 @@ async def api_select_program(
 
 
 @app.get("/api/v2/user-programs")
-async def api_get_user_programs(request: Request, user_id: Optional[int] = None):
+def api_get_user_programs(request: Request, user_id: Optional[int] = None):
     """Get all programs selected by the authenticated user. Ignores user_id query param."""
     token = request.cookies.get(COOKIE_NAME)
     auth_user_id = verify_token(token) if token else None
@@ -697,7 +636,7 @@ async def api_get_user_programs(request: Request, user_id: Optional[int] = None)
 
 
 @app.put("/api/v2/user-programs/{user_program_id}/activate")
-async def api_activate_program(user_program_id: int):
+def api_activate_program(user_program_id: int):
     """Activate a user program (deactivate others)"""
     with app_db.get_connection() as conn:
         cur = conn.cursor()
@@ -722,7 +661,7 @@ async def api_activate_program(user_program_id: int):
 
 
 @app.delete("/api/v2/user-programs/{user_program_id}")
-async def api_remove_user_program(user_program_id: int):
+def api_remove_user_program(user_program_id: int):
     """Remove a program from user's selected programs"""
     with app_db.get_connection() as conn:
         cur = conn.cursor()
@@ -740,201 +679,228 @@ async def api_remove_user_program(user_program_id: int):
 
 
 @app.get("/api/v2/programs/{program_id}/weeks/{week_number}/days/{day_number}/status")
-async def api_get_day_status(request: Request, program_id: int, week_number: int, day_number: int):
+def api_get_day_status(request: Request, program_id: int, week_number: int, day_number: int):
     """Get completion status for a specific day"""
-    with app_db.get_connection() as conn:
-        cur = conn.cursor()
-        token = request.cookies.get(COOKIE_NAME)
-        auth_user_id = verify_token(token) if token else None
-        if not auth_user_id:
-            cur.execute(
-                """
-                SELECT pd.id
-                FROM program_day pd
-                JOIN program_week pw ON pw.id = pd.program_week_id
-                WHERE pw.program_id = ? AND pw.week_number = ? AND pd.day_of_week = ?
-                """,
-                (program_id, week_number, day_number),
-            )
-            day = cur.fetchone()
-            if not day:
-                raise HTTPException(status_code=404, detail="Day not found")
-            return {"completed": False, "total_sets": 0, "completed_sets": 0}
-        cur.execute(
-            """
-            SELECT pd.id
-            FROM program_day pd
-            JOIN program_week pw ON pw.id = pd.program_week_id
-            WHERE pw.program_id = ? AND pw.week_number = ? AND pd.day_of_week = ?
-        """,
-            (program_id, week_number, day_number),
-        )
-        day = cur.fetchone()
-        if not day:
-            raise HTTPException(status_code=404, detail="Day not found")
-        cur.execute(
-            """
-            SELECT ps.id
-            FROM planned_set ps
-            JOIN program_day_exercise pde ON pde.id = ps.program_day_exercise_id
-            WHERE pde.program_day_id = ?
-        """,
-            (day["id"],),
-        )
-        planned_sets = cur.fetchall()
-        total_sets = len(planned_sets)
-        if total_sets == 0:
-            return {"completed": False, "total_sets": 0, "completed_sets": 0}
-        cur.execute(
-            """
-            SELECT COUNT(*) as completed_count
-            FROM workout_set ws
-            JOIN planned_set ps ON ps.id = ws.planned_set_id
-            JOIN program_day_exercise pde ON pde.id = ps.program_day_exercise_id
-            JOIN workout w ON w.id = (
-                SELECT we.workout_id 
-                FROM workout_exercise we 
-                WHERE we.program_day_exercise_id = pde.id
-                LIMIT 1
-            )
-            WHERE pde.program_day_id = ? AND w.owner_user_id = ?
-        """,
-            (day["id"], auth_user_id),
-        )
-        completed_result = cur.fetchone()
-        completed_sets = completed_result["completed_count"] if completed_result else 0
-        return {
-            "completed": completed_sets >= total_sets,
-            "total_sets": total_sets,
-            "completed_sets": completed_sets,
-        }
+    token = request.cookies.get(COOKIE_NAME)
+    auth_user_id = verify_token(token) if token else None
+    try:
+        day = services.get_days_status(program_id, auth_user_id, week_number=week_number, day_of_week=day_number)[0]
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Day not found")
+    return {
+        "completed": day["completed"],
+        "total_sets": day["planned_sets"] if auth_user_id else 0,
+        "completed_sets": day["completed_sets"],
+    }
+
+
+# Batch status: every day of one week, or of the whole program
+@app.get("/api/v2/programs/{program_id}/weeks/{week_number}/status")
+def api_get_week_status(request: Request, program_id: int, week_number: int):
+    token = request.cookies.get(COOKIE_NAME)
+    auth_user_id = verify_token(token) if token else None
+    try:
+        days = services.get_days_status(program_id, auth_user_id, week_number=week_number)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"program_id": program_id, "week_number": week_number, "days": days}
+
+
+@app.get("/api/v2/programs/{program_id}/status")
+def api_get_program_status(request: Request, program_id: int):
+    token = request.cookies.get(COOKIE_NAME)
+    auth_user_id = verify_token(token) if token else None
+    try:
+        days = services.get_days_status(program_id, auth_user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"program_id": program_id, "days": days}
 
 
 # Legacy export endpoint (used by program-view.html)
 @app.get("/api/programs/{program_name}/export")
-async def export_program(program_name: str):
+def export_program(program_name: str):
     # Build a lightweight export from current DB schema (week 1 by default)
     with app_db.get_connection() as conn:
         cur = conn.cursor()
         # Find program by title
-        cur.execute("SELECT id, title FROM program WHERE title = ?", (program_name,))
+        cur.execute("SELECT id FROM program WHERE title = ?", (program_name,))
         prog = cur.fetchone()
         if not prog:
             raise HTTPException(status_code=404, detail=f"Program '{program_name}' not found")
-        program_id = prog["id"]
-
-        # Get week 1
-        cur.execute("SELECT id FROM program_week WHERE program_id = ? AND week_number = 1", (program_id,))
-        week = cur.fetchone()
-        if not week:
-            raise HTTPException(status_code=404, detail="Week 1 not found for this program")
-        week_id = week["id"]
-
-        # Days and exercises
-        cur.execute(
-            "SELECT id, day_of_week FROM program_day WHERE program_week_id = ? ORDER BY day_of_week",
-            (week_id,),
-        )
-        days_rows = cur.fetchall()
-        days_out = []
-        for d in days_rows:
-            cur.execute(
-                """
-                SELECT e.name
-                FROM program_day_exercise pde
-                JOIN exercise e ON e.id = pde.exercise_id
-                WHERE pde.program_day_id = ?
-                ORDER BY pde.position
-                """,
-                (d["id"],),
-            )
-            ex_names = [r[0] for r in cur.fetchall()]
-            # Legacy export expects label/emphasis fields
-            days_out.append({
-                "label": f"Day {d['day_of_week']}",
-                "emphasis": "",
-                "exercises": ex_names,
-            })
-
-        export = {
-            "program": {"name": prog["title"], "days_per_week": len(days_out)},
-            "week": {"week_no": 1},
-            "days": days_out,
+        tree = get_program_tree(prog["id"], conn=conn)
+
+    week = find_week(tree, 1) if tree else None
+    if week is None:
+        raise HTTPException(status_code=404, detail="Week 1 not found for this program")
+
+    # Legacy export expects label/emphasis fields
+    days_out = [
+        {
+            "label": f"Day {d['day_of_week']}",
+            "emphasis": "",
+            "exercises": [ex["name"] for ex in d["exercises"]],
         }
-        return export
+        for d in week["days"]
+    ]
+    export = {
+        "program": {"name": tree["title"], "days_per_week": len(days_out)},
+        "week": {"week_no": 1},
+        "days": days_out,
+    }
+    return export
+
+
+def _ai_generation_inputs(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize the ai-plan form payload into generate_weekly_program_* keyword arguments."""
+    owner_user_id: int = int(payload.get("owner_user_id"))
+
+    # Generate unique title based on user parameters and timestamp
+    import datetime
+    experience = payload.get("experience", "novice")
+    days = payload.get("days", 3)
+    equipment = payload.get("equipment", [])
+    priorities = payload.get("priorities", [])
+
+    # Create descriptive title
+    exp_map = {"novice": "Beginner", "6_12": "Intermediate", "1_3": "Advanced", "3_plus": "Expert"}
+    exp_name = exp_map.get(experience, "Beginner")
+
+    priority_text = ""
+    if priorities:
+        priority_text = f" - {', '.join(priorities[:2])}"
+
+    equipment_text = ""
+    if equipment:
+        equipment_text = f" ({', '.join(equipment[:2])})"
+
+    timestamp = datetime.datetime.now().strftime("%m%d_%H%M")
+    title: str = f"{exp_name} {days}Day{priority_text}{equipment_text} - {timestamp}"
+
+    description: Optional[str] = payload.get("description")
+    # Map experience from UI to expected values
+    raw_experience: str = str(payload.get("experience") or "novice")
+    experience_map = {"novice": "novice", "6_12": "intermediate", "1_3": "intermediate", "3_plus": "advanced"}
+    experience = experience_map.get(raw_experience, "novice")
+    days_per_week: int = int(payload.get("days") or payload.get("days_per_week") or 3)
+    # Normalize equipment (accept list or comma-separated string)
+    equipment_raw = payload.get("equipment")
+    if isinstance(equipment_raw, str):
+        equipment: List[str] = [s.strip() for s in equipment_raw.split(",") if s.strip()]
+    else:
+        equipment = list(equipment_raw or [])
+    # Normalize priorities (accept list or comma-separated string)
+    priorities_raw = payload.get("priorities")
+    if isinstance(priorities_raw, str):
+        priorities_list: List[str] = [s.strip() for s in priorities_raw.split(",") if s.strip()]
+    else:
+        priorities_list = list(priorities_raw or [])
+    priority_joined = ", ".join(priorities_list[:2]) if priorities_list else None
+
+    return {
+        "owner_user_id": owner_user_id,
+        "title": title,
+        "description": description,
+        "experience": experience,
+        "days_per_week": days_per_week,
+        "equipment": equipment,
+        "priority": priority_joined,
+    }
+
+
+def _ai_plan_cache_key(inputs: Dict[str, Any]) -> str:
+    return plan_cache_key(
+        experience=inputs["experience"],
+        days_per_week=inputs["days_per_week"],
+        equipment=inputs["equipment"],
+        priority=inputs["priority"],
+        description=inputs["description"],
+        model=ai_client.OPENAI_MODEL,
+    )
+
+
+async def _offline_plan(inputs: Dict[str, Any], reason: str) -> Dict[str, Any]:
+    """Rule-based plan (app.offline_generator), or for fallbacks the AI_FALLBACK_GENERATOR one;
+    `reason` is counted in offline_generator.stats."""
+    offline_generator.stats[reason] += 1
+    generate = generate_weekly_program_offline if reason == "requested" else ai_resilience.fallback_generator()
+    return await anyio.to_thread.run_sync(functools.partial(generate, **inputs))
+
+
+def _fallback_reason(e: BaseException) -> str:
+    return "fallback_circuit_open" if isinstance(e, ai_resilience.CircuitOpenError) else "fallback_unreachable"
+
+
+async def _generate_plan(inputs: Dict[str, Any], mode: str, refresh: bool = False) -> Dict[str, Any]:
+    """Plan for normalized inputs: from the plan cache unless refresh, else one coalesced model call.
+    Falls back to the offline generator (not cached) when there is no API key or the model is
+    unreachable, unless AI_OFFLINE_FALLBACK=0."""
+    if mode == "offline":
+        return await _offline_plan(inputs, "requested")
+    cache_key = _ai_plan_cache_key(inputs)
+    if not refresh:
+        cached = await anyio.to_thread.run_sync(plan_cache.get, cache_key, inputs["owner_user_id"], inputs["title"])
+        if cached is not None:
+            return cached
+    if not ai_client.has_api_key() and ai_client.AI_OFFLINE_FALLBACK:
+        return await _offline_plan(inputs, "fallback_no_key")
+
+    async def generate() -> Dict[str, Any]:
+        # Awaited on the shared async client: the event loop keeps serving other requests
+        if mode == "parallel":
+            plan = await generate_weekly_program_parallel_async(**inputs)
+        else:
+            plan = await generate_weekly_program_async(**inputs)
+        await anyio.to_thread.run_sync(plan_cache.put, cache_key, plan)
+        return plan
+
+    # Identical requests already in flight (double clicks, several tabs) await one generation
+    try:
+        result, shared = await ai_generation_flight.do(f"{mode}:{cache_key}", generate)
+    except ai_client.UNREACHABLE_ERRORS as e:
+        if not ai_client.AI_OFFLINE_FALLBACK:
+            raise
+        return await _offline_plan(inputs, _fallback_reason(e))
+    if shared:
+        result = copy.deepcopy(result)
+        result["owner_user_id"] = inputs["owner_user_id"]
+        result["title"] = inputs["title"]
+    return result
 
 
 # AI generation endpoint
 @app.post("/api/v2/ai/generate-plan")
-async def api_ai_generate_plan(payload: Dict[str, Any] = Body(...), raw: Optional[int] = Query(None)):
+async def api_ai_generate_plan(
+    response: Response,
+    payload: Dict[str, Any] = Body(...),
+    raw: Optional[int] = Query(None),
+    refresh: Optional[int] = Query(None),
+    mode: Optional[str] = Query(None),
+    background: Optional[int] = Query(None, alias="async"),
+):
     """Generate a one-week JSON plan via OpenAI using form selections from ai-plan page.
-    If raw=1 is provided, return raw model output (for debugging formatting issues)."""
+    If raw=1 is provided, return raw model output (for debugging formatting issues).
+    Plans are served from app.plan_cache when the same inputs were generated before;
+    refresh=1 skips the lookup and regenerates (the new plan replaces the cached one).
+    mode=single|parallel|offline overrides AI_GENERATION_MODE.
+    async=1 queues the generation (app.ai_jobs) and answers 202 with a job id at once;
+    poll GET /api/v2/ai/jobs/{job_id} for the plan."""
     try:
-        owner_user_id: int = int(payload.get("owner_user_id"))
-        
-        # Generate unique title based on user parameters and timestamp
-        import datetime
-        experience = payload.get("experience", "novice")
-        days = payload.get("days", 3)
-        equipment = payload.get("equipment", [])
-        priorities = payload.get("priorities", [])
-        
-        # Create descriptive title
-        exp_map = {"novice": "Beginner", "6_12": "Intermediate", "1_3": "Advanced", "3_plus": "Expert"}
-        exp_name = exp_map.get(experience, "Beginner")
-        
-        priority_text = ""
-        if priorities:
-            priority_text = f" - {', '.join(priorities[:2])}"
-        
-        equipment_text = ""
-        if equipment:
-            equipment_text = f" ({', '.join(equipment[:2])})"
-        
-        timestamp = datetime.datetime.now().strftime("%m%d_%H%M")
-        title: str = f"{exp_name} {days}Day{priority_text}{equipment_text} - {timestamp}"
-        
-        description: Optional[str] = payload.get("description")
-        # Map experience from UI to expected values
-        raw_experience: str = str(payload.get("experience") or "novice")
-        experience_map = {"novice": "novice", "6_12": "intermediate", "1_3": "intermediate", "3_plus": "advanced"}
-        experience = experience_map.get(raw_experience, "novice")
-        days_per_week: int = int(payload.get("days") or payload.get("days_per_week") or 3)
-        # Normalize equipment (accept list or comma-separated string)
-        equipment_raw = payload.get("equipment")
-        if isinstance(equipment_raw, str):
-            equipment: List[str] = [s.strip() for s in equipment_raw.split(",") if s.strip()]
-        else:
-            equipment = list(equipment_raw or [])
-        # Normalize priorities (accept list or comma-separated string)
-        priorities_raw = payload.get("priorities")
-        if isinstance(priorities_raw, str):
-            priorities_list: List[str] = [s.strip() for s in priorities_raw.split(",") if s.strip()]
-        else:
-            priorities_list = list(priorities_raw or [])
-        priority_joined = ", ".join(priorities_list[:2]) if priorities_list else None
-
-        if raw:
-            content = generate_weekly_program_raw(
-                owner_user_id=owner_user_id,
-                title=title,
-                description=description,
-                experience=experience,
-                days_per_week=days_per_week,
-                equipment=equipment,
-                priority=priority_joined,
-            )
+        inputs = _ai_generation_inputs(payload)
+        mode = mode or ai_client.AI_GENERATION_MODE
+        if mode not in ai_client.AI_GENERATION_MODES:
+            raise ValueError(f"mode must be one of {', '.join(ai_client.AI_GENERATION_MODES)}")
+
+        if raw and mode != "offline":
+            content = await generate_weekly_program_raw_async(**inputs)
             return {"raw": content}
 
-        result = generate_weekly_program(
-            owner_user_id=owner_user_id,
-            title=title,
-            description=description,
-            experience=experience,
-            days_per_week=days_per_week,
-            equipment=equipment,
-            priority=priority_joined,
-        )
+        if background:
+            job_id = await ai_jobs.job_queue.submit(inputs, mode, bool(refresh))
+            response.status_code = 202
+            return {"job_id": job_id, "status": "queued", "poll": f"/api/v2/ai/jobs/{job_id}"}
+
+        result = await _generate_plan(inputs, mode, bool(refresh))
         
         # Debug: Print the AI-generated result
         print(f"DEBUG: AI generated result:")
@@ -945,188 +911,230 @@ async def api_ai_generate_plan(payload: Dict[str, Any] = Body(...), raw: Optiona
             print(f"  First week days: {len(first_week.get('days', []))}")
             for i, day in enumerate(first_week.get('days', [])):
                 print(f"    Day {i+1}: day_of_week={day.get('day_of_week')}, exercises={len(day.get('exercises', []))}")
-        
+
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"{type(e).__name__}: {e}")
 
 
-@app.post("/api/v2/ai/save-plan")
-async def api_save_ai_plan(request: Request, plan_data: Dict[str, Any] = Body(...)):
-    """Save an AI-generated plan to the database."""
+@app.get("/api/v2/ai/jobs/stats")
+def api_ai_jobs_stats():
+    """Queue depth, wait and run times of background generations."""
+    return ai_jobs.job_queue.snapshot()
+
+
+@app.get("/api/v2/ai/jobs/{job_id}")
+def api_ai_job(job_id: str):
+    """Status of a background generation; includes the plan once status is "done"."""
+    job = ai_jobs.job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _day_events(week_index: int, day_index: int, day: Dict[str, Any]) -> List[str]:
+    """One "exercise" event per exercise of a finished day, then its "day" event."""
+    events = []
+    for exercise in day.get("exercises") or []:
+        events.append(_sse("exercise", {
+            "week_index": week_index, "day_index": day_index,
+            "day_of_week": day.get("day_of_week"), "exercise": exercise,
+        }))
+    events.append(_sse("day", {"week_index": week_index, "day_index": day_index, "day": day}))
+    return events
+
+
+def _plan_events(plan: Dict[str, Any]) -> List[str]:
+    """A finished (cached) plan replayed as the events the streaming parser would have sent."""
+    events = []
+    for week_index, week in enumerate(plan.get("weeks") or []):
+        for day_index, day in enumerate(week.get("days") or []):
+            events.extend(_day_events(week_index, day_index, day))
+    return events
+
+
+async def _follow(feed: EventFeed, flight: "asyncio.Future"):
+    """Every event of `feed`, from the first, until `flight` is done."""
+    seen = 0
+    while True:
+        more = asyncio.ensure_future(feed.wait(seen))
+        await asyncio.wait({more, flight}, return_when=asyncio.FIRST_COMPLETED)
+        more.cancel()
+        for event in feed.events[seen:]:
+            yield event
+        seen = len(feed.events)
+        if flight.done():
+            return
+
+
+async def _stream_parallel(inputs: Dict[str, Any], plan: Dict[str, Any]):
+    """mode=parallel as SSE: each day's events once its completion finishes (in completion order;
+    day_index places it), then the merged plan is stored in `plan`."""
+    days: asyncio.Queue = asyncio.Queue()
+    task = asyncio.ensure_future(
+        generate_weekly_program_parallel_async(**inputs, on_day=lambda day_index, day: days.put_nowait((day_index, day)))
+    )
+    task.add_done_callback(lambda _: days.put_nowait(None))
     try:
-        # Get authenticated user ID from request
-        token = request.cookies.get(COOKIE_NAME)
-        auth_user_id = verify_token(token) if token else None
-        if not auth_user_id:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        
-        # Use authenticated user ID, not the one from plan data
-        owner_user_id: int = auth_user_id
-        print(f"DEBUG: Authenticated user_id: {auth_user_id}")
-        print(f"DEBUG: Plan data owner_user_id: {plan_data.get('owner_user_id')}")
-        print(f"DEBUG: Using owner_user_id: {owner_user_id}")
-        
-        title: str = str(plan_data.get("title") or "AI Program")
-        description: Optional[str] = plan_data.get("description")
-        weeks = plan_data.get("weeks", [])
-        
-        if not weeks:
-            raise HTTPException(status_code=400, detail="No weeks data provided")
-        
-        # Create the program
-        program = services.create_program_v2(owner_user_id, title, description)
-        program_id = program["id"]
-        
-        # Get the first week data (AI generates only 1 week)
-        first_week = weeks[0] if weeks else {}
-        first_week_days = first_week.get("days", [])
-        print(f"DEBUG: First week has {len(first_week_days)} days")
-        for i, day in enumerate(first_week_days):
-            exercises = day.get('exercises', [])
-            print(f"DEBUG: Day {i+1}: day_of_week={day.get('day_of_week')} with {len(exercises)} exercises")
-            for j, exercise in enumerate(exercises):
-                print(f"  Exercise {j+1}: {exercise.get('name')} ({exercise.get('muscle_group')})")
-        
-        # Generate 8 weeks based on the first week
-        for week_number in range(1, 9):
-            # Ensure week exists
-            services.ensure_week(program_id, week_number)
-            
-            # For week 1, use the original data; for other weeks, copy the structure
-            if week_number == 1:
-                days_to_process = first_week_days
-            else:
-                # Copy the structure from week 1 for weeks 2-8
-                days_to_process = first_week_days
-            
-            # Process each day
-            for day_data in days_to_process:
-                day_of_week = day_data.get("day_of_week")
-                exercises = day_data.get("exercises", [])
-                
-                print(f"DEBUG: Processing week {week_number}, day {day_of_week} with {len(exercises)} exercises")
-                
-                if not day_of_week or not exercises:
-                    print(f"DEBUG: Skipping day {day_of_week} - no day_of_week or no exercises")
-                    continue
-                
-                # Ensure day exists
-                services.ensure_day(program_id, week_number, day_of_week)
-                
-                # Process each exercise
-                for exercise_data in exercises:
-                    exercise_name = exercise_data.get("name")
-                    muscle_group = exercise_data.get("muscle_group")
-                    equipment = exercise_data.get("equipment")
-                    position = exercise_data.get("position", 1)
-                    notes = exercise_data.get("notes")
-                    planned_sets = exercise_data.get("planned_sets", [])
-                    
-                    if not exercise_name or not muscle_group:
-                        continue
-                    
-                    # Create or get exercise
-                    try:
-                        # Use the correct create_exercise function directly from services module
-                        exercise = services.create_exercise(
-                            owner_user_id,
-                            exercise_name,
-                            muscle_group,
-                            equipment,
-                            False
-                        )
-                        exercise_id = exercise["id"]
-                        print(f"DEBUG: Created new exercise {exercise_name} with ID {exercise_id}")
-                    except Exception as e:
-                        print(f"DEBUG: Failed to create exercise {exercise_name}: {e}")
-                        # Exercise might already exist, try to find it
-                        exercises_list = services.list_exercises(owner_user_id)
-                        existing_exercise = next(
-                            (ex for ex in exercises_list if ex["name"] == exercise_name), 
-                            None
-                        )
-                        if existing_exercise:
-                            exercise_id = existing_exercise["id"]
-                            print(f"DEBUG: Found existing exercise {exercise_name} with ID {exercise_id}")
-                        else:
-                            print(f"DEBUG: Exercise {exercise_name} not found, skipping...")
-                            continue
-                    
-                    # Add exercise to day
-                    try:
-                        result = services.add_day_exercise(
-                            program_id=program_id,
-                            week_number=week_number,
-                            day_of_week=day_of_week,
-                            exercise_id=exercise_id,
-                            position=position,
-                            notes=notes
-                        )
-                        print(f"DEBUG: Added exercise {exercise_name} to week {week_number}, day {day_of_week}, position {position}")
-                    except Exception as e:
-                        print(f"DEBUG: Error adding exercise {exercise_name} to day: {e}")
-                        # Exercise might already be added to this day
-                        pass
-                    
-                    # Add planned sets with progression for weeks 2-8
-                    for set_data in planned_sets:
-                        set_number = set_data.get("set_number", 1)
-                        base_reps = set_data.get("reps", 8)
-                        base_weight = set_data.get("weight")
-                        rpe = set_data.get("rpe")
-                        rest_seconds = set_data.get("rest_seconds")
-                        
-                        # Apply progression for weeks 2-8
-                        if week_number > 1:
-                            # Increase reps by 1 every 2 weeks, or increase weight by 2.5% every week
-                            if week_number % 2 == 0:
-                                reps = base_reps + 1
-                                weight = base_weight
-                            else:
-                                reps = base_reps
-                                weight = base_weight * 1.025 if base_weight else None
-                        else:
-                            reps = base_reps
-                            weight = base_weight
-                        
-                        try:
-                            services.add_planned_set(
-                                program_id=program_id,
-                                week_number=week_number,
-                                day_of_week=day_of_week,
-                                position=position,
-                                set_number=set_number,
-                                reps=reps,
-                                weight=weight,
-                                rpe=rpe,
-                                rest_seconds=rest_seconds
-                            )
-                        except Exception:
-                            # Set might already exist
-                            pass
-        
-        # Auto-attach this new program to the creating user so it shows up in My Plans
+        while True:
+            item = await days.get()
+            if item is None:
+                break
+            for event in _day_events(0, *item):
+                yield event
+        plan.update(task.result())
+    finally:
+        task.cancel()
+
+
+@app.post("/api/v2/ai/generate-plan/stream")
+async def api_ai_generate_plan_stream(
+    payload: Dict[str, Any] = Body(...), refresh: Optional[int] = Query(None), mode: Optional[str] = Query(None)
+):
+    """Same inputs as generate-plan, answered as Server-Sent Events while the model writes:
+    "exercise" and "day" events as each one closes, then "plan" with the complete plan
+    (or "error" with a detail message). Offline plans (mode=offline, or the fallback before
+    anything was sent) are replayed as the same events. mode overrides AI_GENERATION_MODE as on
+    generate-plan; with parallel each day is sent whole when its completion finishes, in
+    completion order (day_index says where it goes), and the merged plan follows. Identical
+    requests streaming at the same time share one generation (counted in coalescing stats)."""
+    try:
+        inputs = _ai_generation_inputs(payload)
+        mode = mode or ai_client.AI_GENERATION_MODE
+        if mode not in ai_client.AI_GENERATION_MODES:
+            raise ValueError(f"mode must be one of {', '.join(ai_client.AI_GENERATION_MODES)}")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"{type(e).__name__}: {e}")
+    cache_key = _ai_plan_cache_key(inputs)
+
+    async def replay(plan: Dict[str, Any]):
+        for event in _plan_events(plan):
+            yield event
+        yield _sse("plan", plan)
+
+    async def events():
+        sent = False
         try:
-            print(f"DEBUG: Creating user_program with user_id: {owner_user_id}, program_id: {program_id}")
-            with app_db.get_connection() as conn:
-                with app_db.transaction(conn) as cur:
-                    cur.execute(
-                        "INSERT INTO user_program (user_id, program_id) VALUES (?, ?)",
-                        (owner_user_id, program_id),
-                    )
-            print(f"DEBUG: Successfully created user_program")
+            if mode == "offline":
+                async for event in replay(await _offline_plan(inputs, "requested")):
+                    yield event
+                return
+            if not refresh:
+                cached = await anyio.to_thread.run_sync(plan_cache.get, cache_key, inputs["owner_user_id"], inputs["title"])
+                if cached is not None:
+                    async for event in replay(cached):
+                        yield event
+                    return
+            if not ai_client.has_api_key() and ai_client.AI_OFFLINE_FALLBACK:
+                async for event in replay(await _offline_plan(inputs, "fallback_no_key")):
+                    yield event
+                return
+            # Identical requests already streaming (double clicks, several tabs) follow that one
+            # generation: its events so far, then the rest as they come
+            key = f"stream:{mode}:{cache_key}"
+            feed = ai_generation_flight.feed(key)
+
+            async def generate() -> Dict[str, Any]:
+                if mode == "parallel":
+                    plan: Dict[str, Any] = {}
+                    async for event in _stream_parallel(inputs, plan):
+                        feed.publish(event)
+                else:
+                    parser = PlanStreamParser(compact=ai_client.AI_OUTPUT_FORMAT == "compact")
+                    # One telemetry record for the stream and the parse of what it sent
+                    with ai_telemetry.call("stream", ai_client.OPENAI_MODEL) as call:
+                        async for delta in stream_weekly_program_async(**inputs, call=call):
+                            for name, data in parser.feed(delta):
+                                feed.publish(_sse(name, data))
+                        plan = parser.close(
+                            owner_user_id=inputs["owner_user_id"],
+                            title=inputs["title"],
+                            description=inputs["description"],
+                            days_per_week=inputs["days_per_week"],
+                        )
+                await anyio.to_thread.run_sync(plan_cache.put, cache_key, plan)
+                return plan
+
+            flight = asyncio.ensure_future(ai_generation_flight.do(key, generate))
+            try:
+                async for event in _follow(feed, flight):
+                    sent = True
+                    yield event
+                plan, shared = flight.result()
+            except ai_client.UNREACHABLE_ERRORS as e:
+                # Days already sent cannot be taken back; only fall back before the first one
+                if sent or not ai_client.AI_OFFLINE_FALLBACK:
+                    raise
+                async for event in replay(await _offline_plan(inputs, _fallback_reason(e))):
+                    yield event
+                return
+            finally:
+                flight.cancel()
+            if shared:
+                plan = copy.deepcopy(plan)
+                plan["owner_user_id"] = inputs["owner_user_id"]
+                plan["title"] = inputs["title"]
+            if not sent:
+                # Joined a generation that had already finished publishing
+                for event in _plan_events(plan):
+                    yield event
+            yield _sse("plan", plan)
         except Exception as e:
-            print(f"DEBUG: Error creating user_program: {e}")
-            # If linkage already exists or insertion fails, continue without blocking
-            pass
+            yield _sse("error", {"detail": f"{type(e).__name__}: {e}"})
 
-        return {
-            "message": "Plan saved successfully",
-            "program_id": program_id,
-            "program_title": title
-        }
-        
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/v2/ai/plan-cache/stats")
+def api_ai_plan_cache_stats():
+    """Hit/miss counters and sizes of the generated plan cache."""
+    return plan_cache.snapshot()
+
+
+@app.get("/api/v2/ai/offline/stats")
+async def api_ai_offline_stats():
+    """Offline (rule-based) plans served, by reason: requested or fallback."""
+    return dict(offline_generator.stats)
+
+
+@app.get("/api/v2/ai/coalescing/stats")
+async def api_ai_coalescing_stats():
+    """How many generate-plan calls ran and how many joined an identical one already in flight."""
+    return ai_generation_flight.snapshot()
+
+
+@app.get("/api/v2/ai/metrics")
+def api_ai_metrics(window_s: float = Query(24 * 3600, gt=0)):
+    """Model call telemetry of this process (tokens, time to first token, latency, retries, parse
+    failures; counters and histograms), the ai_call_log summary per kind and model over the last
+    window_s seconds, how often the plan cache, coalescing and offline generator saved a call, and
+    the retries, hedges and circuit breaker state of app.ai_resilience."""
+    return {
+        "calls": ai_telemetry.snapshot(),
+        "log": {"window_s": window_s, "by_kind_and_model": ai_telemetry.summary(window_s)},
+        "plan_cache": plan_cache.snapshot(),
+        "coalescing": ai_generation_flight.snapshot(),
+        "offline": dict(offline_generator.stats),
+        "resilience": ai_resilience.policy.snapshot(),
+    }
+
+
+@app.post("/api/v2/ai/save-plan")
+def api_save_ai_plan(request: Request, plan_data: Dict[str, Any] = Body(...)):
+    """Save an AI-generated plan to the database."""
+    # Use authenticated user ID, not the one from plan data
+    token = request.cookies.get(COOKIE_NAME)
+    auth_user_id = verify_token(token) if token else None
+    if not auth_user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        return services.save_ai_plan(auth_user_id, plan_data)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"{type(e).__name__}: {e}")
 
@@ -0,0 +1,285 @@
+"""
+Rule-based plan generator: the SYSTEM_PROMPT / build_user_prompt rules applied locally.
+
+generate_weekly_program_offline() returns a plan in the exact SCHEMA_BLOCK shape in a few
+milliseconds with no model call: the split follows days_per_week (full body / upper-lower /
+push-pull-legs), exercises per day follow the strict count rule, working sets follow experience
+(priority muscles get one more), reps and rest follow compound vs isolation. Exercises come from
+the global exercise catalog first and a built-in list fills what it lacks, picked by the
+available equipment and rotated so a muscle trained twice a week gets different movements.
+Deterministic: the same inputs always give the same plan.
+
+Used for AI_GENERATION_MODE=offline and as the fallback when OPENAI_API_KEY is unset or the model
+cannot be reached in time (see main._generate_plan).
+"""
+
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from . import db
+
+# (name, muscle_group, equipment, compound)
+BUILTIN_EXERCISES: Sequence[Tuple[str, str, str, bool]] = (
+    ("Bench Press", "chest", "barbell", True),
+    ("Incline Barbell Bench Press", "chest", "barbell", True),
+    ("Dumbbell Bench Press", "chest", "dumbbell", True),
+    ("Incline Dumbbell Press", "chest", "dumbbell", True),
+    ("Machine Chest Press", "chest", "machine", True),
+    ("Push-Up", "chest", "bodyweight", True),
+    ("Cable Fly", "chest", "cable", False),
+    ("Dumbbell Fly", "chest", "dumbbell", False),
+    ("Pec Deck", "chest", "machine", False),
+    ("Barbell Row", "back", "barbell", True),
+    ("Lat Pulldown", "back", "machine", True),
+    ("One-Arm Dumbbell Row", "back", "dumbbell", True),
+    ("Seated Cable Row", "back", "cable", True),
+    ("Chest-Supported Dumbbell Row", "back", "dumbbell", True),
+    ("Pull-Up", "back", "bodyweight", True),
+    ("Straight-Arm Pulldown", "back", "cable", False),
+    ("Overhead Press", "shoulders", "barbell", True),
+    ("Seated Dumbbell Press", "shoulders", "dumbbell", True),
+    ("Machine Shoulder Press", "shoulders", "machine", True),
+    ("Dumbbell Lateral Raise", "shoulders", "dumbbell", False),
+    ("Cable Lateral Raise", "shoulders", "cable", False),
+    ("Reverse Pec Deck", "rear delts", "machine", False),
+    ("Rear Delt Dumbbell Fly", "rear delts", "dumbbell", False),
+    ("Face Pull", "rear delts", "cable", False),
+    ("Barbell Squat", "quads", "barbell", True),
+    ("Leg Press", "quads", "machine", True),
+    ("Goblet Squat", "quads", "dumbbell", True),
+    ("Bulgarian Split Squat", "quads", "dumbbell", True),
+    ("Bodyweight Split Squat", "quads", "bodyweight", True),
+    ("Leg Extension", "quads", "machine", False),
+    ("Romanian Deadlift", "hamstrings", "barbell", True),
+    ("Dumbbell Romanian Deadlift", "hamstrings", "dumbbell", True),
+    ("Lying Leg Curl", "hamstrings", "machine", False),
+    ("Seated Leg Curl", "hamstrings", "machine", False),
+    ("Nordic Curl", "hamstrings", "bodyweight", False),
+    ("Barbell Hip Thrust", "glutes", "barbell", True),
+    ("Dumbbell Hip Thrust", "glutes", "dumbbell", True),
+    ("Glute Bridge", "glutes", "bodyweight", False),
+    ("Cable Kickback", "glutes", "cable", False),
+    ("Barbell Curl", "biceps", "barbell", False),
+    ("Standing Dumbbell Curl", "biceps", "dumbbell", False),
+    ("Incline Dumbbell Curl", "biceps", "dumbbell", False),
+    ("Hammer Curl", "biceps", "dumbbell", False),
+    ("Cable Curl", "biceps", "cable", False),
+    ("Triceps Pushdown", "triceps", "machine", False),
+    ("Overhead Cable Triceps Extension", "triceps", "cable", False),
+    ("Skull Crusher", "triceps", "barbell", False),
+    ("Overhead Dumbbell Triceps Extension", "triceps", "dumbbell", False),
+    ("Dips", "triceps", "bodyweight", True),
+    ("Standing Calf Raise", "calves", "machine", False),
+    ("Seated Calf Raise", "calves", "machine", False),
+    ("Dumbbell Calf Raise", "calves", "dumbbell", False),
+    ("Cable Crunch", "abs", "cable", False),
+    ("Hanging Leg Raise", "abs", "bodyweight", False),
+    ("Plank", "abs", "bodyweight", False),
+)
+
+# Catalog / UI vocabulary -> the muscle groups and equipment used here
+MUSCLE_ALIASES = {"lats": "back", "arms": "biceps", "core": "abs", "delts": "shoulders", "legs": "quads"}
+PRIORITY_MUSCLES = {
+    "legs": ("quads", "hamstrings", "glutes"),
+    "arms": ("biceps", "triceps"),
+    "core": ("abs",),
+    "abs": ("abs",),
+}
+EQUIPMENT_ALIASES = {"dumbell": "dumbbell", "dumbbells": "dumbbell", "cables": "cable", "machines": "machine"}
+# Equipment that comes with the selected kinds; bodyweight is always available
+EQUIPMENT_IMPLIES = {"machine": ("machine", "cable")}
+FULL_GYM = ("barbell", "dumbbell", "machine", "cable")
+OPTIONAL_MUSCLES = ("abs", "calves")  # only when asked for as a priority
+
+# Ordered slots per day type: (muscle_group, compound); a day uses the first N that it can fill
+DAY_SLOTS: Dict[str, Sequence[Tuple[str, bool]]] = {
+    "full": (
+        ("quads", True), ("chest", True), ("back", True), ("hamstrings", True), ("shoulders", False),
+        ("biceps", False), ("triceps", False), ("back", True), ("chest", False), ("rear delts", False),
+    ),
+    "upper": (
+        ("chest", True), ("back", True), ("shoulders", True), ("back", True), ("chest", False),
+        ("shoulders", False), ("biceps", False), ("triceps", False), ("rear delts", False),
+    ),
+    "lower": (
+        ("quads", True), ("hamstrings", True), ("glutes", True), ("quads", True), ("hamstrings", False),
+        ("quads", False), ("glutes", False), ("hamstrings", True),
+    ),
+    "push": (
+        ("chest", True), ("shoulders", True), ("chest", True), ("shoulders", False), ("triceps", False),
+        ("chest", False), ("triceps", False), ("shoulders", False),
+    ),
+    "pull": (
+        ("back", True), ("back", True), ("rear delts", False), ("biceps", False), ("back", True),
+        ("biceps", False), ("back", False), ("rear delts", False),
+    ),
+}
+# days_per_week -> day types and the days of the week they fall on
+SPLITS: Dict[int, Tuple[Sequence[str], Sequence[int]]] = {
+    1: (("full",), (1,)),
+    2: (("full", "full"), (1, 4)),
+    3: (("full", "full", "full"), (1, 3, 5)),
+    4: (("upper", "lower", "upper", "lower"), (1, 2, 4, 5)),
+    5: (("push", "pull", "lower", "upper", "lower"), (1, 2, 3, 5, 6)),
+    6: (("push", "pull", "lower", "push", "pull", "lower"), (1, 2, 3, 4, 5, 6)),
+    7: (("push", "pull", "lower", "push", "pull", "lower", "full"), (1, 2, 3, 4, 5, 6, 7)),
+}
+SETS_BY_EXPERIENCE = {"novice": (2, 3), "intermediate": (3, 4), "advanced": (4, 5)}
+
+# Offline plans served: asked for (mode=offline) vs fallbacks; updated by main on the event loop
+stats: Dict[str, int] = {"requested": 0, "fallback_no_key": 0, "fallback_unreachable": 0, "fallback_circuit_open": 0}
+
+Exercise = Tuple[str, str, str, bool]
+
+
+def exercises_per_day(days_per_week: int) -> int:
+    """The strict count rule of SYSTEM_PROMPT (3 → 7, 4 → 6, 5 → 5), extended to 1–7 days."""
+    return {1: 8, 2: 8, 3: 7, 4: 6, 5: 5}.get(days_per_week, 5)
+
+
+def load_catalog(conn: Optional[sqlite3.Connection] = None) -> List[Exercise]:
+    """Global catalog exercises, then the built-in ones the catalog lacks (by name)."""
+    with db.use_connection(conn) as conn:
+        rows = conn.execute(
+            "SELECT name, muscle_group, equipment FROM exercise WHERE is_global = 1 ORDER BY id"
+        ).fetchall()
+    builtin = {name.lower(): (name, muscle, equipment, compound) for name, muscle, equipment, compound in BUILTIN_EXERCISES}
+    catalog: List[Exercise] = []
+    seen: Set[str] = set()
+    for row in rows:
+        key = row["name"].strip().lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        known = builtin.get(key)
+        muscle = (row["muscle_group"] or "").strip().lower()
+        muscle = MUSCLE_ALIASES.get(muscle, muscle)
+        equipment = (row["equipment"] or "bodyweight").strip().lower()
+        equipment = EQUIPMENT_ALIASES.get(equipment, equipment)
+        compound = known[3] if known else muscle in ("chest", "back", "quads", "hamstrings", "glutes") or (
+            muscle == "shoulders" and "press" in key
+        )
+        catalog.append((row["name"], known[1] if known else muscle, equipment, compound))
+    catalog.extend(ex for key, ex in builtin.items() if key not in seen)
+    return catalog
+
+
+def _available_equipment(equipment: Sequence[str]) -> Set[str]:
+    selected = {EQUIPMENT_ALIASES.get(e.strip().lower(), e.strip().lower()) for e in equipment if e and e.strip()}
+    if not selected:
+        # Nothing ticked on the form: assume a full gym
+        selected = set(FULL_GYM)
+    available = {"bodyweight"}
+    for kind in selected - {"none"}:
+        available.update(EQUIPMENT_IMPLIES.get(kind, (kind,)))
+    return available
+
+
+def _priority_muscles(priority: Optional[str]) -> List[str]:
+    muscles: List[str] = []
+    for item in (priority or "").split(","):
+        key = item.strip().lower()
+        if not key or key == "none":
+            continue
+        for muscle in PRIORITY_MUSCLES.get(key, (MUSCLE_ALIASES.get(key, key),)):
+            if muscle not in muscles:
+                muscles.append(muscle)
+    return muscles
+
+
+def generate_weekly_program_offline(
+    *,
+    owner_user_id: int,
+    title: str,
+    description: Optional[str],
+    experience: str,
+    days_per_week: int,
+    equipment: List[str],
+    priority: Optional[str],
+    model: Optional[str] = None,
+    catalog: Optional[List[Exercise]] = None,
+    conn: Optional[sqlite3.Connection] = None,
+) -> Dict[str, Any]:
+    """Same arguments and result shape as ai_client.generate_weekly_program; `model` is ignored."""
+    if catalog is None:
+        catalog = load_catalog(conn)
+    days_per_week = min(max(int(days_per_week), 1), 7)
+    day_types, day_numbers = SPLITS[days_per_week]
+    count = exercises_per_day(days_per_week)
+    available = _available_equipment(equipment)
+    priorities = _priority_muscles(priority)
+    low, high = SETS_BY_EXPERIENCE.get(experience, SETS_BY_EXPERIENCE["novice"])
+
+    by_slot: Dict[Tuple[str, bool], List[Exercise]] = {}
+    for ex in catalog:
+        if ex[2] in available:
+            by_slot.setdefault((ex[1], ex[3]), []).append(ex)
+    # Per slot, how many picks so far this week: the next day starts at the next variation
+    rotation: Dict[Tuple[str, bool], int] = {}
+
+    def pick(slot: Tuple[str, bool], used: Set[str]) -> Optional[Exercise]:
+        for key in (slot, (slot[0], not slot[1])):
+            candidates = by_slot.get(key) or []
+            start = rotation.get(key, 0)
+            for i in range(len(candidates)):
+                ex = candidates[(start + i) % len(candidates)]
+                if ex[0].lower() not in used:
+                    rotation[key] = start + i + 1
+                    return ex
+        return None
+
+    days = []
+    for day_type, day_of_week in zip(day_types, day_numbers):
+        slots = list(DAY_SLOTS[day_type])
+        # Priority muscles are filled first; abs / calves only appear as priorities
+        extra = [(m, False) for m in priorities if m in OPTIONAL_MUSCLES]
+        slots = [s for s in slots if s[0] in priorities] + extra + [s for s in slots if s[0] not in priorities]
+        # Limited equipment can run a day type dry; top it up from the full-body slots
+        slots += DAY_SLOTS["full"]
+        chosen: List[Exercise] = []
+        used: Set[str] = set()
+        for slot in slots:
+            if len(chosen) == count:
+                break
+            ex = pick(slot, used)
+            if ex is not None:
+                used.add(ex[0].lower())
+                chosen.append(ex)
+        # Compounds first, then isolation, keeping slot order within each
+        chosen.sort(key=lambda ex: not ex[3])
+
+        exercises = []
+        trained: Set[str] = set()
+        for position, (name, muscle, equipment_kind, compound) in enumerate(chosen, start=1):
+            sets = (high if compound else low) + (1 if muscle in priorities else 0)
+            if compound:
+                reps, rest = (8, 150) if muscle not in trained else (10, 120)
+            else:
+                reps, rest = (15, 90) if muscle in OPTIONAL_MUSCLES else (12, 90)
+            trained.add(muscle)
+            exercises.append({
+                "name": name,
+                "muscle_group": muscle,
+                "equipment": equipment_kind,
+                "position": position,
+                "notes": None,
+                "planned_sets": [
+                    {
+                        "set_number": n,
+                        "reps": reps,
+                        "weight": None,
+                        # Week 1: effort targets only on the last set, none for novices
+                        "rpe": 8 if n == min(sets, 5) and experience != "novice" else None,
+                        "rest_seconds": rest,
+                    }
+                    for n in range(1, min(sets, 5) + 1)
+                ],
+            })
+        days.append({"day_of_week": day_of_week, "exercises": exercises})
+
+    return {
+        "owner_user_id": owner_user_id,
+        "title": title,
+        "description": description,
+        "weeks": [{"week_number": 1, "days": days}],
+    }
@@ -0,0 +1,186 @@
+"""
+Content-addressed cache of AI-generated plans.
+
+Entries are keyed by a SHA-256 of the normalized generation inputs (experience, days per week,
+equipment, priorities, description, model and a hash of the prompt text). owner_user_id and
+the timestamped title are not part of the key; get() stamps the caller's onto the cached plan.
+An in-memory LRU (AI_PLAN_CACHE_SIZE entries) sits in front of the ai_plan_cache table, whose
+rows expire after AI_PLAN_CACHE_TTL_S and are evicted least-recently-used beyond
+AI_PLAN_CACHE_MAX_ROWS.
+
+Methods touch SQLite: call them from worker threads (anyio.to_thread), not the event loop.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from . import db
+from .ai_client import COMPACT_SCHEMA_BLOCK, SCHEMA_BLOCK, SYSTEM_PROMPT, build_user_prompt
+
+AI_PLAN_CACHE_SIZE = int(os.environ.get("AI_PLAN_CACHE_SIZE", "128"))
+AI_PLAN_CACHE_TTL_S = float(os.environ.get("AI_PLAN_CACHE_TTL_S", str(7 * 24 * 3600)))
+AI_PLAN_CACHE_MAX_ROWS = int(os.environ.get("AI_PLAN_CACHE_MAX_ROWS", "1000"))
+
+# Changing the prompt text must not serve plans generated from the old one
+_PROMPT_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT + build_user_prompt(
+        owner_user_id=0, title="", description="", experience="", days_per_week=0, equipment="", priority=""
+    ) + SCHEMA_BLOCK + COMPACT_SCHEMA_BLOCK).encode()
+).hexdigest()[:16]
+
+
+def _normalize_list(values: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(sorted({v.strip().lower() for v in values if v and v.strip()}))
+
+
+def plan_cache_key(
+    *,
+    experience: str,
+    days_per_week: int,
+    equipment: Iterable[str],
+    priority: Optional[str],
+    description: Optional[str],
+    model: str,
+) -> str:
+    """Hash of the inputs build_user_prompt sees, minus owner_user_id and title; order and case of list items do not matter."""
+    normalized = {
+        "v": _PROMPT_VERSION,
+        "model": model,
+        "experience": experience.strip().lower(),
+        "days_per_week": int(days_per_week),
+        "equipment": _normalize_list(equipment),
+        "priority": _normalize_list((priority or "").split(",")),
+        "description": " ".join((description or "").split()),
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+class PlanCache:
+    def __init__(
+        self,
+        max_entries: int = AI_PLAN_CACHE_SIZE,
+        ttl_s: float = AI_PLAN_CACHE_TTL_S,
+        max_rows: int = AI_PLAN_CACHE_MAX_ROWS,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self.max_rows = max(1, max_rows)
+        # key -> (created_at, plan_json); JSON text so every hit hands out a fresh dict
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "hits": 0, "misses": 0, "memory_hits": 0, "db_hits": 0, "stores": 0, "expired": 0, "evictions": 0,
+        }
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def _remember(self, key: str, created_at: float, plan_json: str) -> None:
+        with self._lock:
+            self._entries[key] = (created_at, plan_json)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(
+        self,
+        key: str,
+        owner_user_id: Optional[int] = None,
+        title: Optional[str] = None,
+        conn: Optional[sqlite3.Connection] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """The cached plan for `key` (with owner_user_id / title replaced when given), or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl_s:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+        if entry is not None:
+            return self._stamp(entry[1], owner_user_id, title)
+
+        with db.use_connection(conn) as conn:
+            row = conn.execute("SELECT plan_json, created_at FROM ai_plan_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row["created_at"] > self.ttl_s:
+                with db.transaction(conn) as cur:
+                    cur.execute("DELETE FROM ai_plan_cache WHERE key = ?", (key,))
+                self._count("expired")
+                row = None
+            if row is None:
+                self._count("misses")
+                return None
+            with db.transaction(conn) as cur:
+                cur.execute("UPDATE ai_plan_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        self._remember(key, row["created_at"], row["plan_json"])
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["db_hits"] += 1
+        return self._stamp(row["plan_json"], owner_user_id, title)
+
+    @staticmethod
+    def _stamp(plan_json: str, owner_user_id: Optional[int], title: Optional[str]) -> Dict[str, Any]:
+        plan = json.loads(plan_json)
+        if owner_user_id is not None:
+            plan["owner_user_id"] = owner_user_id
+        if title is not None:
+            plan["title"] = title
+        return plan
+
+    def put(self, key: str, plan: Dict[str, Any], conn: Optional[sqlite3.Connection] = None) -> None:
+        """Store `plan`, then drop expired rows and the least recently used ones beyond max_rows."""
+        now = time.time()
+        plan_json = json.dumps(plan, separators=(",", ":"))
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO ai_plan_cache(key, plan_json, created_at, last_used_at) VALUES(?, ?, ?, ?)",
+                (key, plan_json, now, now),
+            )
+            cur.execute("DELETE FROM ai_plan_cache WHERE created_at < ?", (now - self.ttl_s,))
+            expired = cur.rowcount
+            cur.execute(
+                """
+                DELETE FROM ai_plan_cache WHERE key IN (
+                    SELECT key FROM ai_plan_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_rows,),
+            )
+            evicted = cur.rowcount
+        self._remember(key, now, plan_json)
+        with self._lock:
+            self.stats["stores"] += 1
+            self.stats["expired"] += max(expired, 0)
+            self.stats["evictions"] += max(evicted, 0)
+
+    def clear(self, conn: Optional[sqlite3.Connection] = None) -> None:
+        with self._lock:
+            self._entries.clear()
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
+            cur.execute("DELETE FROM ai_plan_cache")
+
+    def snapshot(self, conn: Optional[sqlite3.Connection] = None) -> Dict[str, Any]:
+        """Counters plus current sizes, for the stats endpoint."""
+        with db.use_connection(conn) as conn:
+            rows = conn.execute("SELECT COUNT(*) FROM ai_plan_cache").fetchone()[0]
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+                "memory_entries": len(self._entries),
+                "db_rows": rows,
+            }
+
+
+plan_cache = PlanCache()
@@ -0,0 +1,284 @@
+"""
+Bulk import of AI-generated plans into the Program ↔ Workout schema.
+
+The plan is validated up front, exercises are resolved through the catalog index, and the
+8-week program is written with executemany inside a single transaction.
+
+Storage modes (PLAN_STORAGE_MODE, overridable per call):
+- "template" (default): week 1 is written in full; weeks 2..8 are program_week rows plus a
+  program_week_template row (rep delta / load factor relative to week 1) and are computed on read
+- "full": every week gets its own days, day exercises and planned sets
+- "lazy": only week 1 is written and program.planned_weeks records the length; each later week
+  gets its rows on first access through ensure_week_materialized
+"""
+
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import db
+from .catalog import exercise_catalog, normalize_name
+from .program_tree import program_tree_cache
+from .repo import ProgramRepo
+
+PROGRAM_WEEKS = 8
+PLAN_STORAGE_MODES = ("template", "full", "lazy")
+PLAN_STORAGE_MODE = os.environ.get("PLAN_STORAGE_MODE", "template")
+
+
+class PlanImportError(ValueError):
+    pass
+
+
+def _int_field(value: Any, where: str, field: str, lo: Optional[int] = None, hi: Optional[int] = None) -> int:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or int(value) != value:
+        raise PlanImportError(f"{where}: {field} must be an integer, got {value!r}")
+    value = int(value)
+    if (lo is not None and value < lo) or (hi is not None and value > hi):
+        raise PlanImportError(f"{where}: {field}={value} is out of range")
+    return value
+
+
+def _num_field(value: Any, where: str, field: str, lo: float, hi: Optional[float] = None) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise PlanImportError(f"{where}: {field} must be a number or null, got {value!r}")
+    if value < lo or (hi is not None and value > hi):
+        raise PlanImportError(f"{where}: {field}={value} is out of range")
+    return float(value)
+
+
+def validate_plan(plan_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Normalize week 1 of an AI plan into a list of days:
+    [{"day_of_week", "exercises": [{"name", "muscle_group", "equipment", "position", "notes", "sets": [...]}]}]
+    Days without exercises are rest days and are dropped. Raises PlanImportError on anything the DB would reject.
+    """
+    weeks = plan_data.get("weeks") or []
+    if not weeks:
+        raise PlanImportError("No weeks data provided")
+
+    days_out: List[Dict[str, Any]] = []
+    seen_days = set()
+    for day in weeks[0].get("days") or []:
+        exercises = day.get("exercises") or []
+        if not exercises:
+            continue
+        day_of_week = _int_field(day.get("day_of_week"), "day", "day_of_week", 1, 7)
+        where_day = f"day {day_of_week}"
+        if day_of_week in seen_days:
+            raise PlanImportError(f"{where_day}: duplicate day_of_week")
+        seen_days.add(day_of_week)
+
+        ex_out: List[Dict[str, Any]] = []
+        positions = set()
+        for idx, ex in enumerate(exercises, start=1):
+            name = str(ex.get("name") or "").strip()
+            muscle_group = str(ex.get("muscle_group") or "").strip()
+            where_ex = f"{where_day}, exercise {idx}"
+            if not name or not muscle_group:
+                raise PlanImportError(f"{where_ex}: name and muscle_group are required")
+            position = _int_field(ex.get("position", idx), where_ex, "position", 1)
+            if position in positions:
+                raise PlanImportError(f"{where_ex}: duplicate position {position}")
+            positions.add(position)
+
+            sets_out: List[Tuple[int, int, Optional[float], Optional[float], Optional[int]]] = []
+            set_numbers = set()
+            for s_idx, s in enumerate(ex.get("planned_sets") or [], start=1):
+                where_set = f"{where_ex}, set {s_idx}"
+                set_number = _int_field(s.get("set_number", s_idx), where_set, "set_number", 1)
+                if set_number in set_numbers:
+                    raise PlanImportError(f"{where_set}: duplicate set_number {set_number}")
+                set_numbers.add(set_number)
+                reps = _int_field(s.get("reps", 8), where_set, "reps", 0)
+                weight = _num_field(s.get("weight"), where_set, "weight", 0)
+                rpe = _num_field(s.get("rpe"), where_set, "rpe", 0, 10)
+                rest = s.get("rest_seconds")
+                rest_seconds = None if rest is None else _int_field(rest, where_set, "rest_seconds", 0)
+                sets_out.append((set_number, reps, weight, rpe, rest_seconds))
+
+            equipment = ex.get("equipment")
+            ex_out.append({
+                "name": name,
+                "muscle_group": muscle_group,
+                "equipment": str(equipment).strip() if equipment else None,
+                "position": position,
+                "notes": ex.get("notes"),
+                "sets": sets_out,
+            })
+        days_out.append({"day_of_week": day_of_week, "exercises": ex_out})
+
+    if not days_out:
+        raise PlanImportError("Plan has no training days with exercises")
+    return days_out
+
+
+def week_progression_params(week_number: int) -> Tuple[int, float]:
+    """(rep_delta, load_factor) of a week relative to week 1: even weeks +1 rep; odd weeks (3, 5, 7) +2.5% weight."""
+    if week_number == 1:
+        return 0, 1.0
+    if week_number % 2 == 0:
+        return 1, 1.0
+    return 0, 1.025
+
+
+def week_progression(week_number: int, reps: int, weight: Optional[float]) -> Tuple[int, Optional[float]]:
+    """Planned reps / weight of a week 1 set in `week_number` (same rule as the template SQL in program_tree)."""
+    rep_delta, load_factor = week_progression_params(week_number)
+    if load_factor != 1:
+        weight = weight * load_factor if weight else None
+    return reps + rep_delta, weight
+
+
+def import_plan(owner_user_id: int, plan_data: Dict[str, Any], weeks: int = PROGRAM_WEEKS, storage: Optional[str] = None) -> int:
+    """Validate and write an AI plan as a `weeks`-long program in one transaction; returns the new program id."""
+    storage = storage or PLAN_STORAGE_MODE
+    if storage not in PLAN_STORAGE_MODES:
+        raise PlanImportError(f"Unknown plan storage mode {storage!r}")
+    title = str(plan_data.get("title") or "AI Program")
+    description = plan_data.get("description")
+    days = validate_plan(plan_data)
+
+    with db.unit_of_work() as conn:
+        cur = conn.cursor()
+        exercise_ids = exercise_catalog.resolve_or_create(
+            owner_user_id, (ex for day in days for ex in day["exercises"]), conn=conn
+        )
+
+        cur.execute(
+            "INSERT INTO program(owner_user_id, title, description, planned_weeks) VALUES(?, ?, ?, ?)",
+            (owner_user_id, title, description, weeks if storage == "lazy" else None),
+        )
+        program_id = cur.lastrowid
+
+        cur.executemany(
+            "INSERT INTO program_week(program_id, week_number) VALUES(?, ?)",
+            [(program_id, n) for n in range(1, (1 if storage == "lazy" else weeks) + 1)],
+        )
+        cur.execute("SELECT id, week_number FROM program_week WHERE program_id = ?", (program_id,))
+        all_week_ids = {row["week_number"]: row["id"] for row in cur.fetchall()}
+        # Weeks written row by row; in template mode the rest derive from week 1
+        week_ids = all_week_ids if storage == "full" else {1: all_week_ids[1]}
+        cur.executemany(
+            "INSERT INTO program_week_template(program_week_id, template_week_id, rep_delta, load_factor) VALUES(?, ?, ?, ?)",
+            [
+                (week_id, all_week_ids[1], *week_progression_params(n))
+                for n, week_id in all_week_ids.items()
+                if n not in week_ids
+            ],
+        )
+
+        cur.executemany(
+            "INSERT INTO program_day(program_week_id, day_of_week) VALUES(?, ?)",
+            [(week_ids[n], day["day_of_week"]) for n in week_ids for day in days],
+        )
+        cur.execute(
+            """
+            SELECT pd.id, pw.week_number, pd.day_of_week
+            FROM program_day pd
+            JOIN program_week pw ON pw.id = pd.program_week_id
+            WHERE pw.program_id = ?
+            """,
+            (program_id,),
+        )
+        day_ids = {(row["week_number"], row["day_of_week"]): row["id"] for row in cur.fetchall()}
+
+        cur.executemany(
+            "INSERT INTO program_day_exercise(program_day_id, exercise_id, position, notes) VALUES(?, ?, ?, ?)",
+            [
+                (day_ids[(n, day["day_of_week"])], exercise_ids[normalize_name(ex["name"])], ex["position"], ex["notes"])
+                for n in week_ids
+                for day in days
+                for ex in day["exercises"]
+            ],
+        )
+        cur.execute(
+            """
+            SELECT pde.id, pw.week_number, pd.day_of_week, pde.position
+            FROM program_day_exercise pde
+            JOIN program_day pd ON pd.id = pde.program_day_id
+            JOIN program_week pw ON pw.id = pd.program_week_id
+            WHERE pw.program_id = ?
+            """,
+            (program_id,),
+        )
+        pde_ids = {(row["week_number"], row["day_of_week"], row["position"]): row["id"] for row in cur.fetchall()}
+
+        planned_rows = []
+        for n in week_ids:
+            for day in days:
+                for ex in day["exercises"]:
+                    pde_id = pde_ids[(n, day["day_of_week"], ex["position"])]
+                    for set_number, reps, weight, rpe, rest_seconds in ex["sets"]:
+                        reps_n, weight_n = week_progression(n, reps, weight)
+                        planned_rows.append((pde_id, set_number, reps_n, weight_n, rpe, rest_seconds))
+        cur.executemany(
+            """
+            INSERT INTO planned_set(program_day_exercise_id, set_number, reps, weight, rpe, rest_seconds)
+            VALUES(?, ?, ?, ?, ?, ?)
+            """,
+            planned_rows,
+        )
+
+        # Attach the program to its creator so it shows up in My Plans
+        cur.execute(
+            "INSERT OR IGNORE INTO user_program(user_id, program_id) VALUES(?, ?)",
+            (owner_user_id, program_id),
+        )
+        program_tree_cache.invalidate(program_id, conn=conn)
+    return program_id
+
+
+def ensure_week_materialized(program_id: int, week_number: int, conn: Optional[sqlite3.Connection] = None) -> Optional[int]:
+    """
+    Return the id of `week_number`'s program_week, first writing it (days, exercises and planned
+    sets from week 1 via week_progression) if the program is lazily stored and the week is within
+    its planned length. Returns None if the week neither exists nor is due to be written.
+
+    Safe under concurrent first access: the write runs in a BEGIN IMMEDIATE transaction (unless
+    the caller's is already open) and only the caller whose INSERT OR IGNORE created the week
+    copies its rows.
+    """
+    with db.use_connection(conn) as conn:
+        row = conn.execute(
+            """
+            SELECT p.planned_weeks, pw.id AS week_id
+            FROM program p
+            LEFT JOIN program_week pw ON pw.program_id = p.id AND pw.week_number = ?
+            WHERE p.id = ?
+            """,
+            (week_number, program_id),
+        ).fetchone()
+        if row is None:
+            return None
+        if row["week_id"] is not None:
+            return row["week_id"]
+        if row["planned_weeks"] is None or not 1 < week_number <= row["planned_weeks"]:
+            return None
+
+        with db.transaction(conn, immediate=True) as cur:
+            cur.execute(
+                "INSERT OR IGNORE INTO program_week(program_id, week_number) VALUES(?, ?)",
+                (program_id, week_number),
+            )
+            if cur.rowcount == 1:
+                week_id = cur.lastrowid
+                # Derive the week from week 1, copy it into real rows, then drop the derivation
+                cur.execute(
+                    """
+                    INSERT INTO program_week_template(program_week_id, template_week_id, rep_delta, load_factor)
+                    SELECT ?, id, ?, ? FROM program_week WHERE program_id = ? AND week_number = 1
+                    """,
+                    (week_id, *week_progression_params(week_number), program_id),
+                )
+                ProgramRepo.materialize_days(program_id, week_number, conn=conn)
+                cur.execute("DELETE FROM program_week_template WHERE program_week_id = ?", (week_id,))
+                program_tree_cache.invalidate(program_id, conn=conn)
+                return week_id
+            cur.execute(
+                "SELECT id FROM program_week WHERE program_id = ? AND week_number = ?",
+                (program_id, week_number),
+            )
+            return cur.fetchone()["id"]
@@ -0,0 +1,235 @@
+"""
+Fan-out/fan-in plan generation (AI_GENERATION_MODE=parallel).
+
+One short completion returns the split skeleton (day_of_week -> focus muscle groups). Each day is
+then generated by its own completion (in AI_OUTPUT_FORMAT), at most AI_DAY_PARALLELISM at a time,
+with the whole split in its prompt so days do not repeat each other's work. merge_days() validates the days against
+the skeleton and against each other and assembles the usual SCHEMA_BLOCK plan, so wall-clock time
+is about the skeleton plus the slowest day instead of one completion for the whole week. The merged
+plan then goes through the same app.plan_validation checks as a single-completion one.
+"""
+
+import asyncio
+import os
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from . import ai_client
+from .ai_client import (
+    OPENAI_MODEL,
+    SYSTEM_PROMPT,
+    _run_async,
+    _user_input_block,
+    expand_compact_day,
+    max_tokens_for,
+)
+from .ai_telemetry import telemetry
+from .plan_validation import parse_json, validate_generated_plan
+
+AI_DAY_PARALLELISM = int(os.environ.get("AI_DAY_PARALLELISM", "5"))
+
+T = TypeVar("T")
+
+
+SKELETON_SCHEMA_BLOCK = (
+    "OUTPUT SCHEMA (EXACT) - SPLIT SKELETON ONLY, no exercises:\n"
+    "{\n"
+    "  \"days\": [\n"
+    "    { \"day_of_week\": 1, \"focus\": [\"chest\", \"triceps\"] }\n"
+    "  ]\n"
+    "}\n\n"
+    "STRICT RULES: exactly days_per_week entries; day_of_week 1..7 without repeats; focus lists the muscle groups "
+    "trained that day; across the week cover chest, back, legs, arms and shoulders. Return only the JSON object."
+)
+
+DAY_SCHEMA_BLOCK = (
+    "OUTPUT SCHEMA (EXACT) - ONE DAY ONLY:\n"
+    "{\n"
+    "  \"day_of_week\": 1,\n"
+    "  \"exercises\": [\n"
+    "    {\n"
+    "      \"name\": \"exercise name 1\",\n"
+    "      \"muscle_group\": \"muscle group\",\n"
+    "      \"equipment\": \"equipment or null\",\n"
+    "      \"position\": 1,\n"
+    "      \"notes\": null,\n"
+    "      \"planned_sets\": [\n"
+    "        { \"set_number\": 1, \"reps\": 8, \"weight\": null, \"rpe\": null, \"rest_seconds\": 90 }\n"
+    "      ]\n"
+    "    }\n"
+    "  ]\n"
+    "}\n\n"
+    "STRICT RULES: Do not add or reorder keys; do not wrap the JSON in markdown; return only the JSON object."
+)
+
+COMPACT_DAY_SCHEMA_BLOCK = (
+    "OUTPUT FORMAT (COMPACT, EXACT) - ONE DAY ONLY:\n"
+    "{\"d\": 1, \"ex\": [[\"Bench Press\", \"chest\", \"barbell\", \"4x8@150\"], "
+    "[\"Cable Fly\", \"chest\", \"cable\", \"3x12@90~8\", \"slow eccentric\"]]}\n"
+    "- d = day_of_week; ex = the day's exercises in order, each [name, muscle_group, equipment or null, sets, notes (optional)].\n"
+    "- sets = \"<sets>x<reps>@<rest_seconds>\", with \"~<rpe>\" appended for an RPE target; "
+    "use a list for sets that differ, e.g. [\"1x6@180\", \"3x10@120\"].\n\n"
+    "STRICT RULES: no other keys; no markdown, no backticks; return only the JSON object."
+)
+
+
+def _request(user_prompt: str, max_tokens: int, model: Optional[str]) -> Dict[str, Any]:
+    return {
+        "model": model or OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ],
+        "response_format": {"type": "json_object"},
+        "max_tokens": max_tokens,
+    }
+
+
+async def _complete_json(request: Dict[str, Any], kind: str, parse: Callable[[Dict[str, Any]], T]) -> T:
+    """One completion (retried and hedged by app.ai_resilience), parsed to JSON and then by `parse`;
+    its failures count as parse failures in app.ai_telemetry."""
+    with telemetry.call(kind, request["model"]) as call:
+        return await _run_async(request, call, lambda content: parse(parse_json(content)))
+
+
+def _split_text(skeleton: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"- day_of_week {d['day_of_week']}: {', '.join(d['focus'])}" for d in skeleton)
+
+
+def _normalize_skeleton(raw: Dict[str, Any], days_per_week: int) -> List[Dict[str, Any]]:
+    days = raw.get("days") if isinstance(raw, dict) else None
+    if not isinstance(days, list) or len(days) != days_per_week:
+        raise RuntimeError(f"Split skeleton must have {days_per_week} days, got: {raw!r:.300}")
+    skeleton = []
+    for i, day in enumerate(days, start=1):
+        focus = [str(m).strip().lower() for m in (day.get("focus") or []) if str(m).strip()]
+        if not focus:
+            raise RuntimeError(f"Split skeleton day {i} has no focus muscle groups")
+        skeleton.append({"day_of_week": day.get("day_of_week"), "focus": focus})
+    numbers = [d["day_of_week"] for d in skeleton]
+    if not all(isinstance(n, int) and 1 <= n <= 7 for n in numbers) or len(set(numbers)) != len(numbers):
+        # Keep the model's order and focus; only the numbering is unusable
+        for i, day in enumerate(skeleton, start=1):
+            day["day_of_week"] = i
+    return skeleton
+
+
+def merge_days(
+    skeleton: List[Dict[str, Any]],
+    days: List[Dict[str, Any]],
+    *,
+    owner_user_id: int,
+    title: str,
+    description: Optional[str],
+) -> Dict[str, Any]:
+    """Assemble per-day results (in skeleton order) into one plan, checking them for consistency.
+
+    Raises RuntimeError when a day is missing or has no exercises. Repairs what can be repaired
+    mechanically: day_of_week comes from the skeleton, positions and set numbers are renumbered,
+    an exercise repeated within a day is dropped, and an exercise that appears on several days
+    keeps the muscle_group / equipment of its first appearance.
+    """
+    if len(days) != len(skeleton):
+        raise RuntimeError(f"Expected {len(skeleton)} generated days, got {len(days)}")
+    first_seen: Dict[str, Dict[str, Any]] = {}
+    merged_days = []
+    for plan_day, day in zip(skeleton, days):
+        exercises_out = []
+        names = set()
+        for exercise in day.get("exercises") or []:
+            name = str(exercise.get("name") or "").strip()
+            key = name.lower()
+            if not name or key in names:
+                continue
+            names.add(key)
+            canonical = first_seen.setdefault(key, exercise)
+            sets = [
+                {**s, "set_number": n}
+                for n, s in enumerate(exercise.get("planned_sets") or [], start=1)
+            ]
+            if not sets:
+                continue
+            exercises_out.append({
+                **exercise,
+                "name": name,
+                "muscle_group": canonical.get("muscle_group"),
+                "equipment": canonical.get("equipment"),
+                "position": len(exercises_out) + 1,
+                "planned_sets": sets,
+            })
+        if not exercises_out:
+            raise RuntimeError(f"Generated day {plan_day['day_of_week']} has no exercises")
+        merged_days.append({"day_of_week": plan_day["day_of_week"], "exercises": exercises_out})
+    return {
+        "owner_user_id": owner_user_id,
+        "title": title,
+        "description": description,
+        "weeks": [{"week_number": 1, "days": merged_days}],
+    }
+
+
+async def generate_weekly_program_parallel_async(
+    *,
+    owner_user_id: int,
+    title: str,
+    description: Optional[str],
+    experience: str,
+    days_per_week: int,
+    equipment: List[str],
+    priority: Optional[str],
+    model: Optional[str] = None,
+    max_parallel: Optional[int] = None,
+    output_format: Optional[str] = None,
+    on_day: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Awaitable fan-out/fan-in generation; returns a plan in the same shape as generate_weekly_program_async.
+    `on_day(day_index, day)` is called with each day as soon as its completion is parsed (in
+    completion order, numbered as in the merged plan), e.g. to stream it."""
+    inputs = _user_input_block(
+        owner_user_id=owner_user_id,
+        title=title,
+        description=description or "",
+        experience=experience,
+        days_per_week=days_per_week,
+        equipment=", ".join(equipment) if equipment else "none",
+        priority=priority or "none",
+    )
+    skeleton = await _complete_json(
+        _request(
+            "Plan the weekly split only and return STRICTLY AND ONLY a valid JSON object.\n\n" + inputs + SKELETON_SCHEMA_BLOCK,
+            400,
+            model,
+        ),
+        "skeleton",
+        lambda raw: _normalize_skeleton(raw, days_per_week),
+    )
+    split = _split_text(skeleton)
+
+    semaphore = asyncio.Semaphore(max(1, max_parallel or AI_DAY_PARALLELISM))
+    output_format = output_format or ai_client.AI_OUTPUT_FORMAT
+    compact = output_format == "compact"
+
+    async def generate_day(day_index: int, plan_day: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = (
+            "Generate ONE training day of the weekly program below and return STRICTLY AND ONLY a valid JSON object.\n\n"
+            + inputs
+            + f"WEEK SPLIT (the other days are written separately; do not repeat their work):\n{split}\n\n"
+            + f"generate_day: {plan_day['day_of_week']} (focus: {', '.join(plan_day['focus'])}); "
+            + "use the focus muscle groups as muscle_group values.\n\n"
+            + (COMPACT_DAY_SCHEMA_BLOCK if compact else DAY_SCHEMA_BLOCK)
+        )
+        async with semaphore:
+            day = await _complete_json(
+                _request(prompt, max_tokens_for(1, output_format), model),
+                "day",
+                lambda day: expand_compact_day(day) if compact and "exercises" not in day else day,
+            )
+        if on_day is not None:
+            merged = merge_days([plan_day], [day], owner_user_id=owner_user_id, title=title, description=description)
+            on_day(day_index, merged["weeks"][0]["days"][0])
+        return day
+
+    days = await asyncio.gather(*(generate_day(i, d) for i, d in enumerate(skeleton)))
+    plan = merge_days(skeleton, list(days), owner_user_id=owner_user_id, title=title, description=description)
+    return validate_generated_plan(
+        plan, owner_user_id=owner_user_id, title=title, description=description, days_per_week=days_per_week
+    )
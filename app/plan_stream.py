@@ -0,0 +1,169 @@
+"""
+Incremental parser for plan JSON arriving as a token stream (SCHEMA_BLOCK or, with compact=True,
+COMPACT_SCHEMA_BLOCK in app.ai_client).
+
+PlanStreamParser.feed() takes text chunks in any split and returns the events completed by that
+chunk: an "exercise" event as soon as an exercise object closes and a "day" event as soon as a
+day object closes. Each character is scanned once; only the closed objects themselves are
+handed to json.loads. Compact exercises and days are expanded, so events look the same in both
+formats. close() parses and validates the whole buffer into the final plan.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .ai_client import expand_compact_day, expand_compact_exercise, parse_plan
+
+Event = Tuple[str, Dict[str, Any]]
+
+# Container paths, as the keys each container was opened under ("[]" for array items)
+_DAY_PATH = ("", "weeks", "[]", "days", "[]")
+_EXERCISE_PATH = _DAY_PATH + ("exercises", "[]")
+_COMPACT_DAY_PATH = ("", "days", "[]")
+_COMPACT_EXERCISE_PATH = _COMPACT_DAY_PATH + ("ex", "[]")
+
+_STRUCTURAL = re.compile(r'[{}\[\]",]')
+_IN_STRING = re.compile(r'["\\]')
+
+
+class _Container:
+    __slots__ = ("kind", "key", "start", "index", "expect_key", "pending_key", "header")
+
+    def __init__(self, kind: str, key: str, start: int) -> None:
+        self.kind = kind  # "{" or "["
+        self.key = key
+        self.start = start
+        self.index = -1  # items opened so far in an array, minus one
+        self.expect_key = kind == "{"
+        self.pending_key = ""
+        self.header: Dict[str, Any] = {}
+
+
+class PlanStreamParser:
+    def __init__(self, compact: bool = False) -> None:
+        self.compact = compact
+        if compact:
+            self._day_path, self._exercise_path, self._exercises_key = _COMPACT_DAY_PATH, _COMPACT_EXERCISE_PATH, "ex"
+        else:
+            self._day_path, self._exercise_path, self._exercises_key = _DAY_PATH, _EXERCISE_PATH, "exercises"
+        self._text = ""
+        self._pos = 0
+        self._stack: List[_Container] = []
+        self._in_string = False
+        self._string_start = 0
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def _path(self) -> Tuple[str, ...]:
+        return tuple(c.key for c in self._stack)
+
+    def _index(self, depth: int) -> int:
+        return self._stack[depth].index if len(self._stack) > depth else -1
+
+    def feed(self, chunk: str) -> List[Event]:
+        self._text += chunk
+        text = self._text
+        events: List[Event] = []
+        pos = self._pos
+        while True:
+            if self._in_string:
+                m = _IN_STRING.search(text, pos)
+                if m is None:
+                    pos = len(text)
+                    break
+                if m.group() == "\\":
+                    if m.end() >= len(text):
+                        pos = m.start()  # escape split across chunks: rescan it with the next one
+                        break
+                    pos = m.end() + 1
+                    continue
+                self._in_string = False
+                pos = m.end()
+                top = self._stack[-1] if self._stack else None
+                if top is not None and top.kind == "{" and top.expect_key:
+                    top.pending_key = json.loads(text[self._string_start:pos])
+                    top.expect_key = False
+                    if top.pending_key == self._exercises_key and self._path() == self._day_path:
+                        top.header = self._day_header(text[top.start:self._string_start])
+                continue
+            m = _STRUCTURAL.search(text, pos)
+            if m is None:
+                pos = len(text)
+                break
+            ch, at = m.group(), m.start()
+            pos = m.end()
+            top = self._stack[-1] if self._stack else None
+            if ch == '"':
+                self._in_string = True
+                self._string_start = at
+                self._open_item(top)
+            elif ch in "{[":
+                self._open_item(top)
+                key = "" if top is None else ("[]" if top.kind == "[" else top.pending_key)
+                self._stack.append(_Container(ch, key, at))
+            elif ch in "}]":
+                if top is None:
+                    continue
+                path = self._path()
+                self._stack.pop()
+                if path == self._day_path or (path == self._exercise_path and (ch == "]") == self.compact):
+                    events.append(self._closed(path, json.loads(text[top.start:pos])))
+            elif ch == "," and top is not None and top.kind == "{":
+                top.expect_key = True
+        self._pos = pos
+        return events
+
+    @staticmethod
+    def _open_item(top: Optional[_Container]) -> None:
+        # Scalars that are not strings (numbers, null, ...) never reach here; array indices only
+        # matter for the object-valued "weeks" and "days" arrays, so that is enough
+        if top is not None and top.kind == "[":
+            top.index += 1
+
+    @staticmethod
+    def _day_header(prefix: str) -> Dict[str, Any]:
+        # The day's scalar keys come before the exercises in both formats: '{"day_of_week": 1, ' / '{"d": 1, '
+        try:
+            return json.loads(prefix.rstrip().rstrip(",") + "}")
+        except ValueError:
+            return {}
+
+    def _closed(self, path: Tuple[str, ...], obj: Any) -> Event:
+        if self.compact:
+            # One week only; the exercise's position is its index in the day's "ex" array
+            week_index, day_index = 0, self._index(1)
+            if path == _COMPACT_DAY_PATH:
+                return "day", {"week_index": week_index, "day_index": day_index, "day": expand_compact_day(obj)}
+            day = self._stack[2]
+            return "exercise", {
+                "week_index": week_index,
+                "day_index": day_index,
+                "day_of_week": day.header.get("d"),
+                "exercise": expand_compact_exercise(obj, self._index(3) + 1),
+            }
+        week_index, day_index = self._index(1), self._index(3)
+        if path == _DAY_PATH:
+            return "day", {"week_index": week_index, "day_index": day_index, "day": obj}
+        day = self._stack[4]
+        return "exercise", {
+            "week_index": week_index,
+            "day_index": day_index,
+            "day_of_week": day.header.get("day_of_week"),
+            "exercise": obj,
+        }
+
+    def close(
+        self, *, owner_user_id: int, title: str, description: Optional[str], days_per_week: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """The complete plan, expanded and validated by ai_client.parse_plan (which raises when it does not parse)."""
+        return parse_plan(
+            self.text,
+            output_format="compact" if self.compact else "schema",
+            owner_user_id=owner_user_id,
+            title=title,
+            description=description,
+            days_per_week=days_per_week,
+        )
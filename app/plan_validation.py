@@ -0,0 +1,140 @@
+"""
+Parsing and validation of model-written plans (SCHEMA_BLOCK in app.ai_client).
+
+parse_json() finds the JSON object in the model output in one pass (code fences, a BOM or prose
+around it are skipped) and decodes it once. validate_generated_plan() checks the result against
+the precompiled schemas.GeneratedPlan model and the prompt's count rules and repairs what needs
+no new completion: positions, set and day numbers, missing reps, duplicate exercises, too many
+exercises or sets, too few sets. Anything else raises PlanValidationError listing every problem
+with its path in the plan.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from .schemas import GeneratedPlan
+
+# The EXERCISE COUNT STRICT RULE of build_user_prompt; other days_per_week have no count rule
+EXERCISES_PER_DAY = {3: (7, 8), 4: (6, 7), 5: (5, 6)}
+# "Each exercise: 2–5 working sets"
+SETS_PER_EXERCISE = (2, 5)
+DEFAULT_REPS = 8
+# Errors quoted in PlanValidationError's message; the rest are only on .errors
+MAX_ERRORS_SHOWN = 10
+
+_decoder = json.JSONDecoder()
+
+
+class PlanValidationError(RuntimeError):
+    def __init__(self, errors: List[str]) -> None:
+        self.errors = errors
+        shown = "; ".join(errors[:MAX_ERRORS_SHOWN])
+        more = f" (+{len(errors) - MAX_ERRORS_SHOWN} more)" if len(errors) > MAX_ERRORS_SHOWN else ""
+        super().__init__(f"Invalid plan from OpenAI: {shown}{more}")
+
+
+def parse_json(content: str) -> Dict[str, Any]:
+    """The first JSON object in `content`, decoded once; text before and after it is ignored."""
+    start = content.find("{")
+    if start < 0:
+        raise RuntimeError(f"Failed to parse JSON from OpenAI: no JSON object; raw: {content[:500]}")
+    try:
+        data, _ = _decoder.raw_decode(content, start)
+    except json.JSONDecodeError as e:
+        raise RuntimeError(
+            f"Failed to parse JSON from OpenAI: {e.msg} at line {e.lineno} column {e.colno}; raw: {content[:500]}"
+        )
+    return data
+
+
+def _location(loc: tuple) -> str:
+    return ".".join(str(part) for part in loc) or "plan"
+
+
+def validate_generated_plan(
+    data: Any,
+    *,
+    owner_user_id: Optional[int] = None,
+    title: Optional[str] = None,
+    description: Optional[str] = None,
+    days_per_week: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Validated, repaired week-1 plan in the SCHEMA_BLOCK shape; raises PlanValidationError.
+
+    owner_user_id is always the caller's; title and description fall back to the caller's when the
+    model left them out. The exercise count rule is only checked when days_per_week is given.
+    Days without exercises are rest days and are dropped, as plan_import does.
+    """
+    try:
+        plan = GeneratedPlan.model_validate(data)
+    except ValidationError as e:
+        raise PlanValidationError([f"{_location(err['loc'])}: {err['msg']}" for err in e.errors()])
+
+    errors: List[str] = []
+    days = [day for day in plan.weeks[0].days if day.exercises]
+    if not days:
+        errors.append("weeks.0.days: no training days with exercises")
+    elif days_per_week is not None and len(days) != days_per_week:
+        errors.append(f"weeks.0.days: {len(days)} training days, expected {days_per_week}")
+    numbers = [day.day_of_week for day in days]
+    renumber_days = not all(n is not None and 1 <= n <= 7 for n in numbers) or len(set(numbers)) != len(numbers)
+    low, high = EXERCISES_PER_DAY.get(days_per_week, (1, None))
+
+    days_out = []
+    for day_index, day in enumerate(days):
+        where_day = f"day {day_index + 1}"
+        exercises = []
+        seen = set()
+        for exercise in day.exercises:
+            key = exercise.name.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            exercises.append(exercise)
+        if high is not None:
+            exercises = exercises[:high]
+        if len(exercises) < low:
+            errors.append(f"{where_day}: {len(exercises)} exercises, expected {low}-{high} for {days_per_week} days/week")
+
+        exercises_out = []
+        for position, exercise in enumerate(exercises, start=1):
+            sets = exercise.planned_sets[:SETS_PER_EXERCISE[1]]
+            if not sets:
+                errors.append(f"{where_day}, exercise {position} ({exercise.name}): no planned_sets")
+                continue
+            sets = sets + [sets[-1]] * (SETS_PER_EXERCISE[0] - len(sets))
+            sets_out = []
+            reps = DEFAULT_REPS
+            for set_number, s in enumerate(sets, start=1):
+                reps = s.reps if s.reps is not None else reps
+                sets_out.append({
+                    "set_number": set_number,
+                    "reps": reps,
+                    "weight": s.weight,
+                    "rpe": s.rpe,
+                    "rest_seconds": s.rest_seconds,
+                })
+            equipment = exercise.equipment
+            exercises_out.append({
+                "name": exercise.name,
+                "muscle_group": exercise.muscle_group,
+                "equipment": None if not equipment or equipment.lower() in ("null", "none") else equipment,
+                "position": position,
+                "notes": exercise.notes or None,
+                "planned_sets": sets_out,
+            })
+        days_out.append({
+            "day_of_week": day_index + 1 if renumber_days else day.day_of_week,
+            "exercises": exercises_out,
+        })
+
+    if errors:
+        raise PlanValidationError(errors)
+    return {
+        "owner_user_id": owner_user_id if owner_user_id is not None else plan.owner_user_id,
+        "title": plan.title or title,
+        "description": plan.description if plan.description is not None else description,
+        "weeks": [{"week_number": 1, "days": days_out}],
+    }
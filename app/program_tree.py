@@ -0,0 +1,208 @@
+"""
+Whole-program tree (weeks → days → exercises → planned sets) with a per-program cache.
+
+load_program_tree builds the tree from one ordered LEFT JOIN query, which also computes the
+days of template-derived weeks (program_week_template) on read. ProgramTreeCache keeps
+the last trees it built, each stamped with the program's version at load time. ProgramRepo
+writes (and the bulk writers in plan_import / services) call invalidate(), which bumps the
+version now and again after the writing transaction commits, so a stale tree is never served.
+
+Cached trees are shared between requests: treat them as read-only.
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from . import db
+
+PROGRAM_TREE_CACHE_SIZE = int(os.environ.get("PROGRAM_TREE_CACHE_SIZE", "256"))
+
+# Planned values of a template-derived week (database/migrations/05_program_week_template.sql),
+# over t = program_week_template and tps = the template week's planned_set
+DERIVED_REPS_SQL = "tps.reps + t.rep_delta"
+DERIVED_WEIGHT_SQL = "CASE WHEN t.load_factor = 1 THEN tps.weight WHEN tps.weight THEN tps.weight * t.load_factor END"
+
+# Stored rows, then the template days a derived week has no program_day of its own for (ids are NULL)
+_TREE_SQL = f"""
+    SELECT p.id AS program_id, p.owner_user_id, p.title, p.description, p.planned_weeks,
+           pw.id AS week_id, pw.week_number,
+           pd.id AS day_id, pd.day_of_week,
+           pde.id AS pde_id, pde.position, pde.notes,
+           e.id AS exercise_id, e.name AS exercise_name, e.muscle_group, e.equipment,
+           ps.id AS planned_set_id, ps.set_number, ps.reps, ps.weight, ps.rpe, ps.rest_seconds
+    FROM program p
+    LEFT JOIN program_week pw ON pw.program_id = p.id
+    LEFT JOIN program_day pd ON pd.program_week_id = pw.id
+    LEFT JOIN program_day_exercise pde ON pde.program_day_id = pd.id
+    LEFT JOIN exercise e ON e.id = pde.exercise_id
+    LEFT JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
+    WHERE p.id = :program_id
+    UNION ALL
+    SELECT p.id, p.owner_user_id, p.title, p.description, p.planned_weeks,
+           pw.id, pw.week_number,
+           NULL, tpd.day_of_week,
+           NULL, tpde.position, tpde.notes,
+           e.id, e.name, e.muscle_group, e.equipment,
+           NULL, tps.set_number, {DERIVED_REPS_SQL}, {DERIVED_WEIGHT_SQL}, tps.rpe, tps.rest_seconds
+    FROM program p
+    JOIN program_week pw ON pw.program_id = p.id
+    JOIN program_week_template t ON t.program_week_id = pw.id
+    JOIN program_day tpd ON tpd.program_week_id = t.template_week_id
+    LEFT JOIN program_day_exercise tpde ON tpde.program_day_id = tpd.id
+    LEFT JOIN exercise e ON e.id = tpde.exercise_id
+    LEFT JOIN planned_set tps ON tps.program_day_exercise_id = tpde.id
+    WHERE p.id = :program_id
+      AND NOT EXISTS (SELECT 1 FROM program_day pd WHERE pd.program_week_id = pw.id AND pd.day_of_week = tpd.day_of_week)
+    ORDER BY week_number, day_of_week, position, set_number
+"""
+
+
+def load_program_tree(program_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+    """
+    Build {"id", "owner_user_id", "title", "description", "planned_weeks", "weeks": [{"id", "week_number", "days": [
+    {"id", "day_of_week", "materialized", "exercises": [{"id", "position", "notes", "exercise_id", "name",
+    "muscle_group", "equipment", "planned_sets": [{"id", "set_number", "reps", "weight", "rpe", "rest_seconds"}]}]}]}]}
+    from a single query. Returns None if the program does not exist.
+
+    Days of template-derived weeks that have not been materialized yet are computed from their
+    template and have "materialized": False and None for the day / exercise / planned set ids.
+    "planned_weeks" is the length of a lazily stored program (None otherwise), whose later weeks
+    are missing from "weeks" until first accessed.
+    """
+    with db.use_connection(conn) as conn:
+        rows = conn.execute(_TREE_SQL, {"program_id": program_id}).fetchall()
+    if not rows:
+        return None
+
+    first = rows[0]
+    tree: Dict[str, Any] = {
+        "id": first["program_id"],
+        "owner_user_id": first["owner_user_id"],
+        "title": first["title"],
+        "description": first["description"],
+        "planned_weeks": first["planned_weeks"],
+        "weeks": [],
+    }
+    week = day = exercise = None
+    for row in rows:
+        if row["week_id"] is None:
+            continue
+        if week is None or week["id"] != row["week_id"]:
+            week = {"id": row["week_id"], "week_number": row["week_number"], "days": []}
+            tree["weeks"].append(week)
+            day = None
+        # Derived days carry no ids: group by day_of_week / position, which are unique per week / day
+        if row["day_of_week"] is None:
+            continue
+        if day is None or day["day_of_week"] != row["day_of_week"]:
+            day = {"id": row["day_id"], "day_of_week": row["day_of_week"], "materialized": row["day_id"] is not None, "exercises": []}
+            week["days"].append(day)
+            exercise = None
+        if row["position"] is None:
+            continue
+        if exercise is None or exercise["position"] != row["position"]:
+            exercise = {
+                "id": row["pde_id"],
+                "position": row["position"],
+                "notes": row["notes"],
+                "exercise_id": row["exercise_id"],
+                "name": row["exercise_name"],
+                "muscle_group": row["muscle_group"],
+                "equipment": row["equipment"],
+                "planned_sets": [],
+            }
+            day["exercises"].append(exercise)
+        if row["set_number"] is None:
+            continue
+        exercise["planned_sets"].append({
+            "id": row["planned_set_id"],
+            "set_number": row["set_number"],
+            "reps": row["reps"],
+            "weight": row["weight"],
+            "rpe": row["rpe"],
+            "rest_seconds": row["rest_seconds"],
+        })
+    return tree
+
+
+def find_week(tree: Dict[str, Any], week_number: int) -> Optional[Dict[str, Any]]:
+    for week in tree["weeks"]:
+        if week["week_number"] == week_number:
+            return week
+    return None
+
+
+class ProgramTreeCache:
+    """
+    LRU of program trees keyed by program id. An entry is served only while its stamp
+    (global generation, program version) still matches; invalidate() bumps the version.
+    """
+
+    def __init__(self, max_entries: int = PROGRAM_TREE_CACHE_SIZE) -> None:
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[int, Tuple[Tuple[int, int], Dict[str, Any]]]" = OrderedDict()
+        self._versions: Dict[int, int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _stamp(self, program_id: int) -> Tuple[int, int]:
+        return self._generation, self._versions.get(program_id, 0)
+
+    def _bump(self, program_id: Optional[int]) -> None:
+        with self._lock:
+            self.stats["invalidations"] += 1
+            if program_id is None:
+                self._generation += 1
+                self._entries.clear()
+            else:
+                self._versions[program_id] = self._versions.get(program_id, 0) + 1
+                self._entries.pop(program_id, None)
+
+    def invalidate(self, program_id: Optional[int] = None, conn: Optional[sqlite3.Connection] = None) -> None:
+        """
+        Drop the cached tree of `program_id` (all programs if None). Given the writer's `conn`,
+        the version is bumped again once its transaction commits, so a reader that loaded the
+        pre-commit state in between cannot keep it cached.
+        """
+        self._bump(program_id)
+        if conn is not None:
+            db.after_commit(conn, lambda: self._bump(program_id))
+
+    def clear(self) -> None:
+        self._bump(None)
+
+    def get(self, program_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stamp = self._stamp(program_id)
+            entry = self._entries.get(program_id)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(program_id)
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+
+        # Load outside the lock; the stamp taken above makes a concurrent write win
+        tree = load_program_tree(program_id, conn=conn)
+        if tree is None:
+            return None
+        # Uncommitted rows of the caller's own transaction must not leak into the shared cache
+        if conn is not None and conn.in_transaction:
+            return tree
+        with self._lock:
+            if self._stamp(program_id) == stamp:
+                self._entries[program_id] = (stamp, tree)
+                self._entries.move_to_end(program_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return tree
+
+
+program_tree_cache = ProgramTreeCache()
+
+
+def get_program_tree(program_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+    return program_tree_cache.get(program_id, conn=conn)
@@ -0,0 +1,452 @@
+"""
+Week-to-week progression engine.
+
+A source week's sets are loaded into a columnar SetBatch (one list per field), the rules are
+applied column-wise over the whole batch, and the target week(s) are written with a single
+executemany upsert. Rules are small objects with apply(batch, week_number); pass your own list
+to progress_week / progress_program to change the scheme. Rules with `from_base` state a week
+relative to week 1 (as plan_import does), so every target week is computed from week 1's sets;
+the others step from the previous week and add up.
+
+Used by services.generate_week_progression(_from_actuals) and the /progress endpoints.
+"""
+
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import db, plan_import
+from .program_tree import program_tree_cache, DERIVED_REPS_SQL, DERIVED_WEIGHT_SQL
+from .repo import ProgramRepo
+
+WeekFilter = Callable[[int], bool]
+
+
+def even_weeks(week_number: int) -> bool:
+    return week_number % 2 == 0
+
+
+def odd_weeks(week_number: int) -> bool:
+    return week_number % 2 == 1
+
+
+class SetBatch:
+    """
+    Columns of one week's sets, index-aligned: `keys` holds (day_of_week, position, set_number),
+    `logged` marks sets whose values came from the user's actuals.
+    """
+
+    COLUMNS = ("reps", "weight", "rpe", "rest_seconds")
+
+    def __init__(self) -> None:
+        self.keys: List[Tuple[int, int, int]] = []
+        self.reps: List[int] = []
+        self.weight: List[Optional[float]] = []
+        self.rpe: List[Optional[float]] = []
+        self.rest_seconds: List[Optional[int]] = []
+        self.logged: List[bool] = []
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def append(self, key: Tuple[int, int, int], reps: int, weight: Optional[float], rpe: Optional[float], rest_seconds: Optional[int], logged: bool = False) -> None:
+        self.keys.append(key)
+        self.reps.append(reps)
+        self.weight.append(weight)
+        self.rpe.append(rpe)
+        self.rest_seconds.append(rest_seconds)
+        self.logged.append(logged)
+
+    def copy(self) -> "SetBatch":
+        out = SetBatch()
+        out.keys = list(self.keys)
+        out.logged = list(self.logged)
+        for column in self.COLUMNS:
+            setattr(out, column, list(getattr(self, column)))
+        return out
+
+
+class Rule(ABC):
+    """
+    Base rule: `weeks` limits the target weeks it applies to (all weeks if None).
+    Transient rules (deloads) shape one week's output but are not carried into the next week.
+    `from_base` rules expect week 1's sets rather than the previous week's.
+    """
+
+    transient = False
+    from_base = False
+
+    def __init__(self, weeks: Optional[WeekFilter] = None) -> None:
+        self.weeks = weeks
+
+    def applies(self, week_number: int) -> bool:
+        return self.weeks is None or self.weeks(week_number)
+
+    @abstractmethod
+    def apply(self, batch: SetBatch, week_number: int) -> None:
+        ...
+
+
+class RepIncrement(Rule):
+    """reps + step, clamped to [1, max_reps]."""
+
+    def __init__(self, step: int = 1, max_reps: Optional[int] = None, weeks: Optional[WeekFilter] = None) -> None:
+        super().__init__(weeks)
+        self.step = step
+        self.max_reps = max_reps
+
+    def apply(self, batch: SetBatch, week_number: int) -> None:
+        hi = self.max_reps
+        batch.reps = [max(1, r + self.step if hi is None else min(hi, r + self.step)) for r in batch.reps]
+
+
+class LoadIncrease(Rule):
+    """weight × (1 + percent / 100), rounded to `round_to` (at least one step up); NULL / 0 loads are left alone."""
+
+    def __init__(self, percent: float = 2.5, round_to: Optional[float] = 0.5, weeks: Optional[WeekFilter] = None) -> None:
+        super().__init__(weeks)
+        self.factor = 1 + percent / 100
+        self.round_to = round_to
+
+    def apply(self, batch: SetBatch, week_number: int) -> None:
+        factor, step = self.factor, self.round_to
+        if not step:
+            batch.weight = [None if w is None else w * factor for w in batch.weight]
+            return
+        # Light loads would round back to the same weight; move them up by at least one step
+        batch.weight = [
+            None if w is None else w if w == 0 else max(w + step, round(w * factor / step) * step)
+            for w in batch.weight
+        ]
+
+
+class TemplateProgression(Rule):
+    """Week 1's sets as plan_import.week_progression has them in `week_number` (the template deltas of AI plans)."""
+
+    from_base = True
+
+    def apply(self, batch: SetBatch, week_number: int) -> None:
+        rep_delta, load_factor = plan_import.week_progression_params(week_number)
+        batch.reps = [r + rep_delta for r in batch.reps]
+        if load_factor != 1:
+            batch.weight = [w * load_factor if w else None for w in batch.weight]
+
+
+class RpeCap(Rule):
+    def __init__(self, max_rpe: float = 9.5, weeks: Optional[WeekFilter] = None) -> None:
+        super().__init__(weeks)
+        self.max_rpe = max_rpe
+
+    def apply(self, batch: SetBatch, week_number: int) -> None:
+        cap = self.max_rpe
+        batch.rpe = [None if r is None else min(cap, r) for r in batch.rpe]
+
+
+class Deload(Rule):
+    """Every `every`-th week: scale load and reps down and drop RPE; the following week resumes from pre-deload values."""
+
+    transient = True
+
+    def __init__(self, every: int = 4, load_factor: float = 0.9, reps_factor: float = 1.0, rpe_drop: float = 1.0) -> None:
+        super().__init__(lambda week_number: week_number % every == 0)
+        self.load_factor = load_factor
+        self.reps_factor = reps_factor
+        self.rpe_drop = rpe_drop
+
+    def apply(self, batch: SetBatch, week_number: int) -> None:
+        lf, rf, drop = self.load_factor, self.reps_factor, self.rpe_drop
+        batch.weight = [None if w is None else round(w * lf, 2) for w in batch.weight]
+        batch.reps = [max(1, int(round(r * rf))) for r in batch.reps]
+        batch.rpe = [None if r is None else max(0.0, r - drop) for r in batch.rpe]
+
+
+# Planned → planned, relative to week 1 like the AI plan templates: even weeks +1 rep, odd weeks
+# ×1.025 load, so regenerating a saved AI plan reproduces it
+DEFAULT_RULES: Sequence[Rule] = (
+    TemplateProgression(),
+    RpeCap(9.5),
+)
+
+# Planned → planned, week on week: even weeks add a rep and odd weeks 2.5% load on top of the
+# previous week, so the increases add up over the program
+CUMULATIVE_RULES: Sequence[Rule] = (
+    RepIncrement(1, weeks=even_weeks),
+    LoadIncrease(2.5, weeks=odd_weeks),
+    RpeCap(9.5),
+)
+
+# Actuals → planned: beat last week's reps by one at the same load (logged sets only)
+FROM_ACTUALS_RULES: Sequence[Rule] = (
+    RepIncrement(1),
+    RpeCap(9.5),
+)
+
+
+def apply_rules(batch: SetBatch, rules: Iterable[Rule], week_number: int) -> Tuple[SetBatch, SetBatch]:
+    """Returns (carry, output): carry feeds the next week, output also has transient rules applied."""
+    rules = [rule for rule in rules if rule.applies(week_number)]
+    carry = batch.copy()
+    for rule in rules:
+        if not rule.transient:
+            rule.apply(carry, week_number)
+    output = carry
+    transient = [rule for rule in rules if rule.transient]
+    if transient:
+        output = carry.copy()
+        for rule in transient:
+            rule.apply(output, week_number)
+    return carry, output
+
+
+def carry_unlogged(source: SetBatch, output: SetBatch) -> SetBatch:
+    """`output` with the sets not logged in `source` put back to their source values."""
+    out = output.copy()
+    for column in SetBatch.COLUMNS:
+        progressed = getattr(out, column)
+        planned = getattr(source, column)
+        setattr(out, column, [p if logged else s for p, s, logged in zip(progressed, planned, source.logged)])
+    return out
+
+
+def from_base(rules: Iterable[Rule]) -> bool:
+    return any(rule.from_base for rule in rules)
+
+
+_SOURCE_SQL = f"""
+    WITH latest AS (
+        SELECT w.id, w.program_day_id,
+               ROW_NUMBER() OVER (PARTITION BY w.program_day_id ORDER BY w.started_at DESC, w.id DESC) AS recency
+        FROM workout w
+        JOIN program_day pd ON pd.id = w.program_day_id
+        JOIN program_week pw ON pw.id = pd.program_week_id
+        WHERE pw.program_id = :program_id AND pw.week_number = :week_number AND w.owner_user_id = :user_id
+    )
+    SELECT pd.day_of_week, pde.position, ps.set_number,
+           ps.reps, ps.weight, ps.rpe, ps.rest_seconds,
+           ws.reps AS actual_reps, ws.weight AS actual_weight, ws.rpe AS actual_rpe
+    FROM program_week pw
+    JOIN program_day pd ON pd.program_week_id = pw.id
+    JOIN program_day_exercise pde ON pde.program_day_id = pd.id
+    JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
+    LEFT JOIN latest l ON l.program_day_id = pd.id AND l.recency = 1
+    LEFT JOIN workout_exercise we ON we.workout_id = l.id AND we.program_day_exercise_id = pde.id
+    LEFT JOIN workout_set ws ON ws.workout_exercise_id = we.id AND ws.planned_set_id = ps.id
+    WHERE pw.program_id = :program_id AND pw.week_number = :week_number
+    UNION ALL
+    SELECT tpd.day_of_week, tpde.position, tps.set_number,
+           {DERIVED_REPS_SQL}, {DERIVED_WEIGHT_SQL}, tps.rpe, tps.rest_seconds,
+           NULL, NULL, NULL
+    FROM program_week pw
+    JOIN program_week_template t ON t.program_week_id = pw.id
+    JOIN program_day tpd ON tpd.program_week_id = t.template_week_id
+    JOIN program_day_exercise tpde ON tpde.program_day_id = tpd.id
+    JOIN planned_set tps ON tps.program_day_exercise_id = tpde.id
+    WHERE pw.program_id = :program_id AND pw.week_number = :week_number
+      AND NOT EXISTS (SELECT 1 FROM program_day pd WHERE pd.program_week_id = pw.id AND pd.day_of_week = tpd.day_of_week)
+    ORDER BY day_of_week, position, set_number
+"""
+
+
+def load_week(conn: sqlite3.Connection, program_id: int, week_number: int, user_id: Optional[int] = None) -> SetBatch:
+    """
+    One query for a week's planned sets (computed from the template for days of a template-derived
+    week that have no rows). With `user_id`, sets logged in the user's latest workout of each day
+    take their actual reps / weight / RPE instead of the planned ones.
+    """
+    batch = SetBatch()
+    seen = set()
+    rows = conn.execute(_SOURCE_SQL, {"program_id": program_id, "week_number": week_number, "user_id": user_id}).fetchall()
+    for row in rows:
+        key = (row["day_of_week"], row["position"], row["set_number"])
+        if key in seen:
+            continue
+        seen.add(key)
+        logged = row["actual_reps"] is not None
+        if logged:
+            batch.append(key, row["actual_reps"], row["actual_weight"], row["actual_rpe"] if row["actual_rpe"] is not None else row["rpe"], row["rest_seconds"], True)
+        else:
+            batch.append(key, row["reps"], row["weight"], row["rpe"], row["rest_seconds"])
+    return batch
+
+
+# The program_day holding each source day's exercises: its own row, or the template's day
+# for days a template-derived week has not materialized
+_SOURCE_DAYS_CTE = """
+    WITH src AS (
+        SELECT pd.id AS day_id, pd.day_of_week
+        FROM program_week pw
+        JOIN program_day pd ON pd.program_week_id = pw.id
+        WHERE pw.program_id = :program_id AND pw.week_number = :from_week
+        UNION ALL
+        SELECT tpd.id, tpd.day_of_week
+        FROM program_week pw
+        JOIN program_week_template t ON t.program_week_id = pw.id
+        JOIN program_day tpd ON tpd.program_week_id = t.template_week_id
+        WHERE pw.program_id = :program_id AND pw.week_number = :from_week
+          AND NOT EXISTS (SELECT 1 FROM program_day pd WHERE pd.program_week_id = pw.id AND pd.day_of_week = tpd.day_of_week)
+    )
+"""
+
+
+def _ensure_target_weeks(cur: sqlite3.Cursor, program_id: int, from_week: int, to_weeks: Sequence[int]) -> Dict[Tuple[int, int, int], int]:
+    """
+    Give every target week the source week's days and exercises (INSERT OR IGNORE, set-based)
+    and return {(week_number, day_of_week, position): program_day_exercise_id}.
+    Template-derived targets are materialized and detached from their template: they are
+    written explicitly from here on.
+    """
+    cur.executemany(
+        "INSERT OR IGNORE INTO program_week(program_id, week_number) VALUES(?, ?)",
+        [(program_id, n) for n in to_weeks],
+    )
+    for n in to_weeks:
+        ProgramRepo.materialize_days(program_id, n, conn=cur.connection)
+    targets = {f"w{i}": n for i, n in enumerate(to_weeks)}
+    placeholders = ",".join(f":{name}" for name in targets)
+    params = {"program_id": program_id, "from_week": from_week, **targets}
+    cur.execute(
+        f"""
+        DELETE FROM program_week_template
+        WHERE program_week_id IN (SELECT id FROM program_week WHERE program_id = :program_id AND week_number IN ({placeholders}))
+        """,
+        params,
+    )
+    cur.execute(
+        _SOURCE_DAYS_CTE
+        + f"""
+        INSERT OR IGNORE INTO program_day(program_week_id, day_of_week)
+        SELECT pw_t.id, src.day_of_week
+        FROM src
+        JOIN program_week pw_t ON pw_t.program_id = :program_id AND pw_t.week_number IN ({placeholders})
+        """,
+        params,
+    )
+    cur.execute(
+        _SOURCE_DAYS_CTE
+        + f"""
+        INSERT OR IGNORE INTO program_day_exercise(program_day_id, exercise_id, position, notes)
+        SELECT pd_t.id, pde.exercise_id, pde.position, pde.notes
+        FROM src
+        JOIN program_day_exercise pde ON pde.program_day_id = src.day_id
+        JOIN program_week pw_t ON pw_t.program_id = :program_id AND pw_t.week_number IN ({placeholders})
+        JOIN program_day pd_t ON pd_t.program_week_id = pw_t.id AND pd_t.day_of_week = src.day_of_week
+        """,
+        params,
+    )
+    cur.execute(
+        f"""
+        SELECT pw.week_number, pd.day_of_week, pde.position, pde.id
+        FROM program_week pw
+        JOIN program_day pd ON pd.program_week_id = pw.id
+        JOIN program_day_exercise pde ON pde.program_day_id = pd.id
+        WHERE pw.program_id = :program_id AND pw.week_number IN ({placeholders})
+        """,
+        params,
+    )
+    return {(row[0], row[1], row[2]): row[3] for row in cur.fetchall()}
+
+
+def _upsert_weeks(cur: sqlite3.Cursor, weeks: Dict[int, SetBatch], pde_ids: Dict[Tuple[int, int, int], int]) -> int:
+    rows = []
+    for week_number, batch in weeks.items():
+        for (day_of_week, position, set_number), reps, weight, rpe, rest in zip(batch.keys, batch.reps, batch.weight, batch.rpe, batch.rest_seconds):
+            pde_id = pde_ids.get((week_number, day_of_week, position))
+            if pde_id is not None:
+                rows.append((pde_id, set_number, reps, weight, rpe, rest))
+    cur.executemany(
+        """
+        INSERT INTO planned_set(program_day_exercise_id, set_number, reps, weight, rpe, rest_seconds)
+        VALUES(?, ?, ?, ?, ?, ?)
+        ON CONFLICT(program_day_exercise_id, set_number) DO UPDATE
+        SET reps = excluded.reps, weight = excluded.weight, rpe = excluded.rpe, rest_seconds = excluded.rest_seconds
+        WHERE planned_set.reps IS NOT excluded.reps OR planned_set.weight IS NOT excluded.weight
+           OR planned_set.rpe IS NOT excluded.rpe OR planned_set.rest_seconds IS NOT excluded.rest_seconds
+        """,
+        rows,
+    )
+    return len(rows)
+
+
+def _check_program_week(conn: sqlite3.Connection, program_id: int, week_number: int) -> None:
+    row = conn.execute(
+        """
+        SELECT p.id, pw.id AS week_id
+        FROM program p
+        LEFT JOIN program_week pw ON pw.program_id = p.id AND pw.week_number = ?
+        WHERE p.id = ?
+        """,
+        (week_number, program_id),
+    ).fetchone()
+    if not row:
+        raise ValueError("Program not found")
+    if row["week_id"] is None:
+        raise ValueError(f"Week {week_number} not found for this program")
+
+
+def progress_week(
+    program_id: int,
+    from_week: int,
+    to_week: int,
+    user_id: Optional[int] = None,
+    rules: Optional[Sequence[Rule]] = None,
+    conn: Optional[sqlite3.Connection] = None,
+) -> Dict[str, int]:
+    """
+    Write `to_week`'s planned sets from `from_week`. Missing target days / exercises are copied
+    from the source week. `from_base` rules (DEFAULT_RULES) state weeks relative to week 1, so
+    they need from_week=1. With `user_id`, sets the user logged progress from their actuals and
+    the others are carried over as planned.
+    """
+    if rules is None:
+        rules = FROM_ACTUALS_RULES if user_id is not None else DEFAULT_RULES
+    if from_base(rules) and from_week != 1:
+        raise ValueError("These progression rules are relative to week 1; from_week must be 1")
+    if to_week < 1 or to_week == from_week:
+        raise ValueError("to_week must be a different week number >= 1")
+    plan_import.ensure_week_materialized(program_id, from_week, conn=conn)
+    with db.unit_of_work(conn) as conn:
+        _check_program_week(conn, program_id, from_week)
+        source = load_week(conn, program_id, from_week, user_id)
+        _, output = apply_rules(source, rules, to_week)
+        if user_id is not None:
+            output = carry_unlogged(source, output)
+        cur = conn.cursor()
+        pde_ids = _ensure_target_weeks(cur, program_id, from_week, [to_week])
+        written = _upsert_weeks(cur, {to_week: output}, pde_ids)
+        program_tree_cache.invalidate(program_id, conn=conn)
+    return {
+        "program_id": program_id,
+        "from_week": from_week,
+        "to_week": to_week,
+        "planned_sets": written,
+        "from_actuals": sum(source.logged),
+    }
+
+
+def progress_program(
+    program_id: int,
+    weeks: int,
+    base_week: int = 1,
+    rules: Sequence[Rule] = DEFAULT_RULES,
+    conn: Optional[sqlite3.Connection] = None,
+) -> Dict[str, int]:
+    """
+    Regenerate weeks base_week+1 .. weeks in memory, then write every target week with one bulk
+    upsert. `from_base` rules compute each week from `base_week`'s sets; the others are chained
+    week to week.
+    """
+    to_weeks = list(range(base_week + 1, weeks + 1))
+    if not to_weeks:
+        raise ValueError("weeks must be greater than base_week")
+    with db.unit_of_work(conn) as conn:
+        _check_program_week(conn, program_id, base_week)
+        base = carry = load_week(conn, program_id, base_week)
+        rebase = from_base(rules)
+        outputs: Dict[int, SetBatch] = {}
+        for week_number in to_weeks:
+            carry, outputs[week_number] = apply_rules(base if rebase else carry, rules, week_number)
+        cur = conn.cursor()
+        pde_ids = _ensure_target_weeks(cur, program_id, base_week, to_weeks)
+        written = _upsert_weeks(cur, outputs, pde_ids)
+        program_tree_cache.invalidate(program_id, conn=conn)
+    return {"program_id": program_id, "weeks": len(to_weeks), "planned_sets": written}
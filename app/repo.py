@@ -1,16 +1,20 @@
 """
 Repository layer for the Program ↔ Workout schema. CRUD only, no business logic.
 Classes: UserRepo, ExerciseRepo, ProgramRepo, WorkoutRepo
+Every method takes an optional `conn` so services can run several calls in one db.unit_of_work().
 """
 
-from typing import Optional, List, Dict, Any, Tuple
+import sqlite3
+from typing import Optional, List, Dict, Any, Iterable, Tuple
 from . import db
+from .catalog import exercise_catalog
+from .program_tree import program_tree_cache, DERIVED_REPS_SQL, DERIVED_WEIGHT_SQL
 
 
 class UserRepo:
     @staticmethod
-    def create(email: str, password_hash: str) -> int:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def create(email: str, password_hash: str, conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 "INSERT INTO users(email, password_hash) VALUES(?, ?)",
                 (email, password_hash),
@@ -18,16 +22,16 @@ class UserRepo:
             return cur.lastrowid
 
     @staticmethod
-    def get_by_email(email: str) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def get_by_email(email: str, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM users WHERE email = ?", (email,))
             row = cur.fetchone()
             return dict(row) if row else None
 
     @staticmethod
-    def get_by_id(user_id: int) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def get_by_id(user_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
             row = cur.fetchone()
@@ -36,8 +40,8 @@ class UserRepo:
 
 class ExerciseRepo:
     @staticmethod
-    def create(owner_user_id: Optional[int], name: str, muscle_group: str, equipment: Optional[str], is_global: int) -> int:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def create(owner_user_id: Optional[int], name: str, muscle_group: str, equipment: Optional[str], is_global: int, conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 """
                 INSERT INTO exercise(owner_user_id, name, muscle_group, equipment, is_global)
@@ -45,19 +49,20 @@ class ExerciseRepo:
                 """,
                 (owner_user_id, name, muscle_group, equipment, is_global),
             )
+            exercise_catalog.invalidate(owner_user_id, bool(is_global), conn=conn)
             return cur.lastrowid
 
     @staticmethod
-    def get(exercise_id: int) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def get(exercise_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM exercise WHERE id = ?", (exercise_id,))
             row = cur.fetchone()
             return dict(row) if row else None
 
     @staticmethod
-    def list_for_user(user_id: Optional[int]) -> List[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def list_for_user(user_id: Optional[int], conn: Optional[sqlite3.Connection] = None) -> List[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             if user_id is None:
                 cur.execute("SELECT * FROM exercise WHERE is_global = 1 ORDER BY name")
@@ -70,44 +75,59 @@ class ExerciseRepo:
 
 
 class ProgramRepo:
+    # Every write below invalidates the cached program tree (see program_tree.py)
+
+    @staticmethod
+    def _invalidate_tree(cur: sqlite3.Cursor, program_sql: str, key: int) -> None:
+        cur.execute(program_sql, (key,))
+        row = cur.fetchone()
+        if row:
+            program_tree_cache.invalidate(row[0], conn=cur.connection)
+
     @staticmethod
-    def create(owner_user_id: int, title: str, description: Optional[str]) -> int:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def create(owner_user_id: int, title: str, description: Optional[str], conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 "INSERT INTO program(owner_user_id, title, description) VALUES(?, ?, ?)",
                 (owner_user_id, title, description),
             )
-            return cur.lastrowid
+            program_id = cur.lastrowid
+            program_tree_cache.invalidate(program_id, conn=conn)
+            return program_id
 
     @staticmethod
-    def get(program_id: int) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def get(program_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM program WHERE id = ?", (program_id,))
             row = cur.fetchone()
             return dict(row) if row else None
 
     @staticmethod
-    def create_week(program_id: int, week_number: int) -> int:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def create_week(program_id: int, week_number: int, conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 "INSERT INTO program_week(program_id, week_number) VALUES(?, ?)",
                 (program_id, week_number),
             )
-            return cur.lastrowid
+            week_id = cur.lastrowid
+            program_tree_cache.invalidate(program_id, conn=conn)
+            return week_id
 
     @staticmethod
-    def create_day(program_week_id: int, day_of_week: int) -> int:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def create_day(program_week_id: int, day_of_week: int, conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 "INSERT INTO program_day(program_week_id, day_of_week) VALUES(?, ?)",
                 (program_week_id, day_of_week),
             )
-            return cur.lastrowid
+            day_id = cur.lastrowid
+            ProgramRepo._invalidate_tree(cur, "SELECT program_id FROM program_week WHERE id = ?", program_week_id)
+            return day_id
 
     @staticmethod
-    def add_day_exercise(program_day_id: int, exercise_id: int, position: int, notes: Optional[str]) -> int:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def add_day_exercise(program_day_id: int, exercise_id: int, position: int, notes: Optional[str], conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 """
                 INSERT INTO program_day_exercise(program_day_id, exercise_id, position, notes)
@@ -115,11 +135,17 @@ class ProgramRepo:
                 """,
                 (program_day_id, exercise_id, position, notes),
             )
-            return cur.lastrowid
+            pde_id = cur.lastrowid
+            ProgramRepo._invalidate_tree(
+                cur,
+                "SELECT pw.program_id FROM program_day pd JOIN program_week pw ON pw.id = pd.program_week_id WHERE pd.id = ?",
+                program_day_id,
+            )
+            return pde_id
 
     @staticmethod
-    def add_planned_set(program_day_exercise_id: int, set_number: int, reps: int, weight: Optional[float], rpe: Optional[float], rest_seconds: Optional[int]) -> int:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def add_planned_set(program_day_exercise_id: int, set_number: int, reps: int, weight: Optional[float], rpe: Optional[float], rest_seconds: Optional[int], conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 """
                 INSERT INTO planned_set(program_day_exercise_id, set_number, reps, weight, rpe, rest_seconds)
@@ -127,11 +153,80 @@ class ProgramRepo:
                 """,
                 (program_day_exercise_id, set_number, reps, weight, rpe, rest_seconds),
             )
-            return cur.lastrowid
+            planned_set_id = cur.lastrowid
+            ProgramRepo._invalidate_tree(
+                cur,
+                """
+                SELECT pw.program_id
+                FROM program_day_exercise pde
+                JOIN program_day pd ON pd.id = pde.program_day_id
+                JOIN program_week pw ON pw.id = pd.program_week_id
+                WHERE pde.id = ?
+                """,
+                program_day_exercise_id,
+            )
+            return planned_set_id
 
     @staticmethod
-    def get_week(program_id: int, week_number: int) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def materialize_days(program_id: int, week_number: int, days: Optional[Iterable[int]] = None, conn: Optional[sqlite3.Connection] = None) -> Dict[int, int]:
+        """
+        Copy the template days of a template-derived week that it has no program_day for yet (all
+        of them, or only `days`) into real rows, with the computed planned values. Existing days
+        are never touched. Returns {day_of_week: program_day_id} for the days created here.
+        """
+        wanted = None if days is None else set(days)
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
+            cur.execute(
+                """
+                SELECT pw.id AS week_id, tpd.id AS template_day_id, tpd.day_of_week
+                FROM program_week pw
+                JOIN program_week_template t ON t.program_week_id = pw.id
+                JOIN program_day tpd ON tpd.program_week_id = t.template_week_id
+                WHERE pw.program_id = ? AND pw.week_number = ?
+                  AND NOT EXISTS (SELECT 1 FROM program_day pd WHERE pd.program_week_id = pw.id AND pd.day_of_week = tpd.day_of_week)
+                ORDER BY tpd.day_of_week
+                """,
+                (program_id, week_number),
+            )
+            created: Dict[int, int] = {}
+            for row in cur.fetchall():
+                if wanted is not None and row["day_of_week"] not in wanted:
+                    continue
+                cur.execute(
+                    "INSERT OR IGNORE INTO program_day(program_week_id, day_of_week) VALUES(?, ?)",
+                    (row["week_id"], row["day_of_week"]),
+                )
+                if cur.rowcount != 1:
+                    # Materialized concurrently; the other writer copied the exercises
+                    continue
+                day_id = cur.lastrowid
+                cur.execute(
+                    """
+                    INSERT INTO program_day_exercise(program_day_id, exercise_id, position, notes)
+                    SELECT ?, exercise_id, position, notes FROM program_day_exercise WHERE program_day_id = ?
+                    """,
+                    (day_id, row["template_day_id"]),
+                )
+                cur.execute(
+                    f"""
+                    INSERT INTO planned_set(program_day_exercise_id, set_number, reps, weight, rpe, rest_seconds)
+                    SELECT pde.id, tps.set_number, {DERIVED_REPS_SQL}, {DERIVED_WEIGHT_SQL}, tps.rpe, tps.rest_seconds
+                    FROM program_day_exercise pde
+                    JOIN program_day_exercise tpde ON tpde.program_day_id = ? AND tpde.position = pde.position
+                    JOIN planned_set tps ON tps.program_day_exercise_id = tpde.id
+                    JOIN program_week_template t ON t.program_week_id = ?
+                    WHERE pde.program_day_id = ?
+                    """,
+                    (row["template_day_id"], row["week_id"], day_id),
+                )
+                created[row["day_of_week"]] = day_id
+            if created:
+                program_tree_cache.invalidate(program_id, conn=conn)
+            return created
+
+    @staticmethod
+    def get_week(program_id: int, week_number: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute(
                 "SELECT * FROM program_week WHERE program_id = ? AND week_number = ?",
@@ -141,8 +236,8 @@ class ProgramRepo:
             return dict(row) if row else None
 
     @staticmethod
-    def get_day(program_week_id: int, day_of_week: int) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def get_day(program_week_id: int, day_of_week: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute(
                 "SELECT * FROM program_day WHERE program_week_id = ? AND day_of_week = ?",
@@ -152,8 +247,8 @@ class ProgramRepo:
             return dict(row) if row else None
 
     @staticmethod
-    def get_day_exercise(program_day_id: int, position: int) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def get_day_exercise(program_day_id: int, position: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute(
                 "SELECT * FROM program_day_exercise WHERE program_day_id = ? AND position = ?",
@@ -163,8 +258,8 @@ class ProgramRepo:
             return dict(row) if row else None
 
     @staticmethod
-    def list_day_exercises(program_day_id: int) -> List[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def list_day_exercises(program_day_id: int, conn: Optional[sqlite3.Connection] = None) -> List[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute(
                 "SELECT * FROM program_day_exercise WHERE program_day_id = ? ORDER BY position",
@@ -173,8 +268,8 @@ class ProgramRepo:
             return [dict(r) for r in cur.fetchall()]
 
     @staticmethod
-    def list_planned_sets(program_day_exercise_id: int) -> List[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def list_planned_sets(program_day_exercise_id: int, conn: Optional[sqlite3.Connection] = None) -> List[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute(
                 "SELECT * FROM planned_set WHERE program_day_exercise_id = ? ORDER BY set_number",
@@ -185,8 +280,8 @@ class ProgramRepo:
 
 class WorkoutRepo:
     @staticmethod
-    def start(owner_user_id: int, program_day_id: int, started_at: Optional[str]) -> int:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def start(owner_user_id: int, program_day_id: int, started_at: Optional[str], conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 "INSERT INTO workout(owner_user_id, program_day_id, started_at) VALUES(?, ?, COALESCE(?, CURRENT_TIMESTAMP))",
                 (owner_user_id, program_day_id, started_at),
@@ -194,16 +289,16 @@ class WorkoutRepo:
             return cur.lastrowid
 
     @staticmethod
-    def finish(workout_id: int, finished_at: Optional[str], notes: Optional[str]) -> None:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def finish(workout_id: int, finished_at: Optional[str], notes: Optional[str], conn: Optional[sqlite3.Connection] = None) -> None:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 "UPDATE workout SET finished_at = COALESCE(?, CURRENT_TIMESTAMP), notes = COALESCE(?, notes) WHERE id = ?",
                 (finished_at, notes, workout_id),
             )
 
     @staticmethod
-    def ensure_workout_exercise(workout_id: int, program_day_exercise_id: int, position: int) -> int:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def ensure_workout_exercise(workout_id: int, program_day_exercise_id: int, position: int, conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 "SELECT id FROM workout_exercise WHERE workout_id = ? AND program_day_exercise_id = ?",
                 (workout_id, program_day_exercise_id),
@@ -218,8 +313,8 @@ class WorkoutRepo:
             return cur.lastrowid
 
     @staticmethod
-    def add_workout_set(workout_exercise_id: int, planned_set_id: int, set_number: int, reps: int, weight: Optional[float], rpe: Optional[float], rest_seconds: Optional[int]) -> int:
-        with db.get_connection() as conn, db.transaction(conn) as cur:
+    def add_workout_set(workout_exercise_id: int, planned_set_id: int, set_number: int, reps: int, weight: Optional[float], rpe: Optional[float], rest_seconds: Optional[int], conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn, db.transaction(conn) as cur:
             cur.execute(
                 """
                 INSERT INTO workout_set(workout_exercise_id, planned_set_id, set_number, reps, weight, rpe, rest_seconds)
@@ -230,38 +325,38 @@ class WorkoutRepo:
             return cur.lastrowid
 
     @staticmethod
-    def get_workout(workout_id: int) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def get_workout(workout_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM workout WHERE id = ?", (workout_id,))
             row = cur.fetchone()
             return dict(row) if row else None
 
     @staticmethod
-    def count_actual_sets_for_wex(workout_exercise_id: int) -> int:
-        with db.get_connection() as conn:
+    def count_actual_sets_for_wex(workout_exercise_id: int, conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute("SELECT COUNT(*) FROM workout_set WHERE workout_exercise_id = ?", (workout_exercise_id,))
             return int(cur.fetchone()[0])
 
     @staticmethod
-    def planned_count_for_pde(program_day_exercise_id: int) -> int:
-        with db.get_connection() as conn:
+    def planned_count_for_pde(program_day_exercise_id: int, conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute("SELECT COUNT(*) FROM planned_set WHERE program_day_exercise_id = ?", (program_day_exercise_id,))
             return int(cur.fetchone()[0])
 
     @staticmethod
-    def get_planned_set(planned_set_id: int) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def get_planned_set(planned_set_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM planned_set WHERE id = ?", (planned_set_id,))
             row = cur.fetchone()
             return dict(row) if row else None
 
     @staticmethod
-    def get_workout_exercise(wex_id: int) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def get_workout_exercise(wex_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM workout_exercise WHERE id = ?", (wex_id,))
             row = cur.fetchone()
@@ -269,26 +364,37 @@ class WorkoutRepo:
 
     # Reports (SQL only)
     @staticmethod
-    def report_planned_sets_for_week(program_id: int, week_number: int) -> int:
-        with db.get_connection() as conn:
+    def report_planned_sets_for_week(program_id: int, week_number: int, conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute(
                 """
-                SELECT COUNT(ps.id)
-                FROM program_week pw
-                JOIN program_day pd ON pd.program_week_id = pw.id
-                JOIN program_day_exercise pde ON pde.program_day_id = pd.id
-                JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
-                WHERE pw.program_id = ? AND pw.week_number = ?
+                SELECT
+                  (SELECT COUNT(ps.id)
+                   FROM program_week pw
+                   JOIN program_day pd ON pd.program_week_id = pw.id
+                   JOIN program_day_exercise pde ON pde.program_day_id = pd.id
+                   JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
+                   WHERE pw.program_id = :program_id AND pw.week_number = :week_number)
+                  +
+                  -- Template days a derived week has not materialized
+                  (SELECT COUNT(tps.id)
+                   FROM program_week pw
+                   JOIN program_week_template t ON t.program_week_id = pw.id
+                   JOIN program_day tpd ON tpd.program_week_id = t.template_week_id
+                   JOIN program_day_exercise tpde ON tpde.program_day_id = tpd.id
+                   JOIN planned_set tps ON tps.program_day_exercise_id = tpde.id
+                   WHERE pw.program_id = :program_id AND pw.week_number = :week_number
+                     AND NOT EXISTS (SELECT 1 FROM program_day pd WHERE pd.program_week_id = pw.id AND pd.day_of_week = tpd.day_of_week))
                 """,
-                (program_id, week_number),
+                {"program_id": program_id, "week_number": week_number},
             )
             row = cur.fetchone()
             return int(row[0]) if row else 0
 
     @staticmethod
-    def report_actual_sets_for_week(program_id: int, week_number: int) -> int:
-        with db.get_connection() as conn:
+    def report_actual_sets_for_week(program_id: int, week_number: int, conn: Optional[sqlite3.Connection] = None) -> int:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -306,8 +412,8 @@ class WorkoutRepo:
             return int(row[0]) if row else 0
 
     @staticmethod
-    def report_sets_by_muscle_group(program_id: int, week_number: int) -> List[Tuple[str, int]]:
-        with db.get_connection() as conn:
+    def report_sets_by_muscle_group(program_id: int, week_number: int, conn: Optional[sqlite3.Connection] = None) -> List[Tuple[str, int]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -328,8 +434,8 @@ class WorkoutRepo:
             return [(row[0], int(row[1])) for row in cur.fetchall()]
 
     @staticmethod
-    def report_progress_for_exercise(program_id: int, exercise_id: int) -> List[Tuple[int, float, float]]:
-        with db.get_connection() as conn:
+    def report_progress_for_exercise(program_id: int, exercise_id: int, conn: Optional[sqlite3.Connection] = None) -> List[Tuple[int, float, float]]:
+        with db.use_connection(conn) as conn:
             cur = conn.cursor()
             cur.execute(
                 """
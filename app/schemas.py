@@ -4,7 +4,7 @@ Defines the structure of all API responses and request models.
 """
 
 from typing import List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class ProgramInfo(BaseModel):
@@ -193,3 +193,46 @@ class DayExerciseInfo(BaseModel):
     ex_order: int = Field(..., description="Exercise order within day")
     priority_weight: Optional[float] = Field(None, description="Priority weight")
     exercise: ExerciseInfo = Field(..., description="Exercise information")
+
+
+# AI-generated plans (SCHEMA_BLOCK in app.ai_client), validated by app.plan_validation
+class GeneratedSet(BaseModel):
+    """One planned set as the model writes it; missing numbers are filled in by the validator."""
+    model_config = ConfigDict(str_strip_whitespace=True)
+    set_number: Optional[int] = Field(None, description="Set number within the exercise")
+    reps: Optional[int] = Field(None, description="Planned reps", ge=0)
+    weight: Optional[float] = Field(None, description="Planned weight", ge=0)
+    rpe: Optional[float] = Field(None, description="Target RPE", ge=0, le=10)
+    rest_seconds: Optional[int] = Field(None, description="Rest after the set", ge=0)
+
+
+class GeneratedExercise(BaseModel):
+    """One exercise of a generated day."""
+    model_config = ConfigDict(str_strip_whitespace=True)
+    name: str = Field(..., description="Exercise name", min_length=1)
+    muscle_group: str = Field(..., description="Target muscle group", min_length=1)
+    equipment: Optional[str] = Field(None, description="Required equipment")
+    position: Optional[int] = Field(None, description="Order within the day")
+    notes: Optional[str] = Field(None, description="Exercise notes")
+    planned_sets: List[GeneratedSet] = Field(default_factory=list, description="Working sets")
+
+
+class GeneratedDay(BaseModel):
+    """One training day of a generated week."""
+    day_of_week: Optional[int] = Field(None, description="Day of week (1-7)")
+    exercises: List[GeneratedExercise] = Field(default_factory=list, description="Exercises in order")
+
+
+class GeneratedWeek(BaseModel):
+    """One generated week."""
+    week_number: Optional[int] = Field(None, description="Week number")
+    days: List[GeneratedDay] = Field(default_factory=list, description="Training days")
+
+
+class GeneratedPlan(BaseModel):
+    """A generated weekly plan before it is saved (see plan_import.import_plan)."""
+    model_config = ConfigDict(str_strip_whitespace=True)
+    owner_user_id: Optional[int] = Field(None, description="Owner user ID")
+    title: Optional[str] = Field(None, description="Program title")
+    description: Optional[str] = Field(None, description="Program description")
+    weeks: List[GeneratedWeek] = Field(..., description="Generated weeks (only week 1 is used)", min_length=1)
@@ -2,11 +2,13 @@
 Business logic for Program ↔ Workout schema, including invariant checks A/B/C and reports.
 """
 
+import sqlite3
 from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 from .repo import UserRepo, ExerciseRepo, ProgramRepo, WorkoutRepo
 from . import db as app_db
-from . import schemas, repo
+from . import schemas, repo, plan_import, progression
+from .program_tree import get_program_tree, find_week, program_tree_cache
 
 
 class DomainError(Exception):
@@ -43,74 +45,86 @@ def create_program(owner_user_id: int, title: str, description: Optional[str]) -
     return ProgramRepo.get(pid)
 
 
-def ensure_week(program_id: int, week_number: int) -> Dict[str, Any]:
-    week = ProgramRepo.get_week(program_id, week_number)
-    if week:
-        return week
-    ProgramRepo.create_week(program_id, week_number)
-    return ProgramRepo.get_week(program_id, week_number)  # type: ignore
+def ensure_week(program_id: int, week_number: int, conn: Optional[sqlite3.Connection] = None) -> Dict[str, Any]:
+    with app_db.unit_of_work(conn) as conn:
+        week = ProgramRepo.get_week(program_id, week_number, conn=conn)
+        if week:
+            return week
+        # Lazily stored programs write their later weeks on first use
+        if plan_import.ensure_week_materialized(program_id, week_number, conn=conn) is None:
+            ProgramRepo.create_week(program_id, week_number, conn=conn)
+        return ProgramRepo.get_week(program_id, week_number, conn=conn)  # type: ignore
 
 
-def ensure_day(program_id: int, week_number: int, day_of_week: int) -> Dict[str, Any]:
-    week = ensure_week(program_id, week_number)
-    day = ProgramRepo.get_day(week["id"], day_of_week)
-    if day:
-        return day
-    ProgramRepo.create_day(week["id"], day_of_week)
-    return ProgramRepo.get_day(week["id"], day_of_week)  # type: ignore
+def ensure_day(program_id: int, week_number: int, day_of_week: int, conn: Optional[sqlite3.Connection] = None) -> Dict[str, Any]:
+    with app_db.unit_of_work(conn) as conn:
+        week = ensure_week(program_id, week_number, conn=conn)
+        day = ProgramRepo.get_day(week["id"], day_of_week, conn=conn)
+        if day:
+            return day
+        # A template-derived week gets a real copy of the template's day before it is used or edited
+        if not ProgramRepo.materialize_days(program_id, week_number, [day_of_week], conn=conn):
+            ProgramRepo.create_day(week["id"], day_of_week, conn=conn)
+        return ProgramRepo.get_day(week["id"], day_of_week, conn=conn)  # type: ignore
 
 
 def add_day_exercise(program_id: int, week_number: int, day_of_week: int, exercise_id: int, position: int, notes: Optional[str]) -> Dict[str, Any]:
-    day = ensure_day(program_id, week_number, day_of_week)
-    pde_id = ProgramRepo.add_day_exercise(day["id"], exercise_id, position, notes)
+    with app_db.unit_of_work() as conn:
+        day = ensure_day(program_id, week_number, day_of_week, conn=conn)
+        pde_id = ProgramRepo.add_day_exercise(day["id"], exercise_id, position, notes, conn=conn)
     return {"id": pde_id, "program_day_id": day["id"], "exercise_id": exercise_id, "position": position, "notes": notes}
 
 
 def add_planned_set(program_id: int, week_number: int, day_of_week: int, position: int, set_number: int, reps: int, weight: Optional[float], rpe: Optional[float], rest_seconds: Optional[int]) -> Dict[str, Any]:
-    day = ensure_day(program_id, week_number, day_of_week)
-    pde = ProgramRepo.get_day_exercise(day["id"], position)
-    if not pde:
-        raise DomainError("program_day_exercise not found for given position")
-    ps_id = ProgramRepo.add_planned_set(pde["id"], set_number, reps, weight, rpe, rest_seconds)
+    with app_db.unit_of_work() as conn:
+        day = ensure_day(program_id, week_number, day_of_week, conn=conn)
+        pde = ProgramRepo.get_day_exercise(day["id"], position, conn=conn)
+        if not pde:
+            raise DomainError("program_day_exercise not found for given position")
+        ps_id = ProgramRepo.add_planned_set(pde["id"], set_number, reps, weight, rpe, rest_seconds, conn=conn)
     return {"id": ps_id, "program_day_exercise_id": pde["id"], "set_number": set_number, "reps": reps, "weight": weight, "rpe": rpe, "rest_seconds": rest_seconds}
 
 
 # Workouts
 def start_workout(owner_user_id: int, program_id: int, week_number: int, day_of_week: int) -> Dict[str, Any]:
-    day = ensure_day(program_id, week_number, day_of_week)
-    wid = WorkoutRepo.start(owner_user_id, day["id"], None)
-    return WorkoutRepo.get_workout(wid)  # type: ignore
+    # Write a lazy week in its own immediate transaction before the unit of work reads anything
+    plan_import.ensure_week_materialized(program_id, week_number)
+    with app_db.unit_of_work() as conn:
+        day = ensure_day(program_id, week_number, day_of_week, conn=conn)
+        wid = WorkoutRepo.start(owner_user_id, day["id"], None, conn=conn)
+        return WorkoutRepo.get_workout(wid, conn=conn)  # type: ignore
 
 
-def _ensure_invariants_A_B_C(planned_set_id: int, workout_exercise_id: int, set_number: int) -> None:
-    ps = WorkoutRepo.get_planned_set(planned_set_id)
+def _ensure_invariants_A_B_C(planned_set_id: int, workout_exercise_id: int, set_number: int, conn: Optional[sqlite3.Connection] = None) -> None:
+    ps = WorkoutRepo.get_planned_set(planned_set_id, conn=conn)
     if not ps:
         raise DomainError("planned_set not found")
-    wex = WorkoutRepo.get_workout_exercise(workout_exercise_id)
+    wex = WorkoutRepo.get_workout_exercise(workout_exercise_id, conn=conn)
     if not wex:
         raise DomainError("workout_exercise not found")
     if set_number != ps["set_number"]:
         raise DomainError("Invariant A failed: set_number must equal planned_set.set_number")
     if wex["program_day_exercise_id"] != ps["program_day_exercise_id"]:
         raise DomainError("Invariant B failed: workout_exercise.program_day_exercise_id must equal planned_set.program_day_exercise_id")
-    actual = WorkoutRepo.count_actual_sets_for_wex(workout_exercise_id)
-    planned = WorkoutRepo.planned_count_for_pde(ps["program_day_exercise_id"])  # type: ignore
+    actual = WorkoutRepo.count_actual_sets_for_wex(workout_exercise_id, conn=conn)
+    planned = WorkoutRepo.planned_count_for_pde(ps["program_day_exercise_id"], conn=conn)  # type: ignore
     if actual + 1 > planned:
         raise DomainError("Invariant C failed: actual workout sets cannot exceed planned sets")
 
 
 def log_workout_set(workout_id: int, position: int, planned_set_id: int, set_number: int, reps: int, weight: Optional[float], rpe: Optional[float], rest_seconds: Optional[int]) -> Dict[str, Any]:
-    w = WorkoutRepo.get_workout(workout_id)
-    if not w:
-        raise DomainError("workout not found")
-    day_id = w["program_day_id"]
-    pdes = ProgramRepo.list_day_exercises(day_id)
-    target = next((d for d in pdes if d["position"] == position), None)
-    if not target:
-        raise DomainError("program_day_exercise (by position) not found")
-    wex_id = WorkoutRepo.ensure_workout_exercise(workout_id, target["id"], position)
-    _ensure_invariants_A_B_C(planned_set_id, wex_id, set_number)
-    ws_id = WorkoutRepo.add_workout_set(wex_id, planned_set_id, set_number, reps, weight, rpe, rest_seconds)
+    with app_db.unit_of_work() as conn:
+        w = WorkoutRepo.get_workout(workout_id, conn=conn)
+        if not w:
+            raise DomainError("workout not found")
+        day_id = w["program_day_id"]
+        pdes = ProgramRepo.list_day_exercises(day_id, conn=conn)
+        target = next((d for d in pdes if d["position"] == position), None)
+        if not target:
+            raise DomainError("program_day_exercise (by position) not found")
+        wex_id = WorkoutRepo.ensure_workout_exercise(workout_id, target["id"], position, conn=conn)
+        _ensure_invariants_A_B_C(planned_set_id, wex_id, set_number, conn=conn)
+        ws_id = WorkoutRepo.add_workout_set(wex_id, planned_set_id, set_number, reps, weight, rpe, rest_seconds, conn=conn)
     return {"id": ws_id, "workout_exercise_id": wex_id, "planned_set_id": planned_set_id, "set_number": set_number, "reps": reps, "weight": weight, "rpe": rpe, "rest_seconds": rest_seconds}
 
 
@@ -125,7 +139,99 @@ def finish_workout(workout_id: int, notes: Optional[str]) -> Dict[str, Any]:
     return WorkoutRepo.get_workout(workout_id)  # type: ignore
 
 
-def _apply_next_week_progression_from_actuals(workout_id: int) -> None:
+# Workouts that logged every planned set of their day; the latest such workout per day drives
+# next week's plan. {where} narrows by program, workout and/or owner.
+_COMPLETED_DAYS_CTE = """
+    WITH day_sets AS (
+        SELECT w.id AS workout_id, w.program_day_id, w.started_at,
+               pw.program_id, pw.week_number, pd.day_of_week,
+               COUNT(DISTINCT ps.id) AS planned,
+               COUNT(DISTINCT CASE WHEN ws.id IS NOT NULL THEN ps.id END) AS logged
+        FROM workout w
+        JOIN program_day pd ON pd.id = w.program_day_id
+        JOIN program_week pw ON pw.id = pd.program_week_id
+        JOIN program_day_exercise pde ON pde.program_day_id = pd.id
+        JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
+        LEFT JOIN workout_exercise we ON we.workout_id = w.id AND we.program_day_exercise_id = pde.id
+        LEFT JOIN workout_set ws ON ws.workout_exercise_id = we.id AND ws.planned_set_id = ps.id
+        WHERE {where}
+        GROUP BY w.id
+    ),
+    source AS (
+        SELECT workout_id, program_id, week_number + 1 AS next_week, day_of_week,
+               ROW_NUMBER() OVER (PARTITION BY program_day_id ORDER BY started_at DESC, workout_id DESC) AS recency
+        FROM day_sets
+        WHERE logged = planned
+    )
+"""
+
+
+def _progress_completed_days(conn: sqlite3.Connection, program_id: Optional[int] = None, workout_id: Optional[int] = None, user_id: Optional[int] = None) -> Dict[str, int]:
+    """
+    Write next week's planned sets for every completed day matching the filters, set-based:
+    one query finds the source workouts, the next weeks/days are ensured with INSERT OR IGNORE
+    (materializing template-derived days), then per day one INSERT ... ON CONFLICT DO UPDATE joins the workout's actuals onto the next
+    week's exercises (same day, same position).
+    Reps become actual + 1 (min 1), weight is copied as-is.
+    """
+    # Only the filters in use go into the WHERE clause so SQLite can pick the matching index
+    filters = {"pw.program_id": program_id, "w.id": workout_id, "w.owner_user_id": user_id}
+    where = " AND ".join(f"{column} = ?" for column, value in filters.items() if value is not None) or "1"
+    params = [value for value in filters.values() if value is not None]
+    with app_db.transaction(conn) as cur:
+        cur.execute(
+            _COMPLETED_DAYS_CTE.format(where=where)
+            + "SELECT workout_id, program_id, next_week, day_of_week FROM source WHERE recency = 1",
+            params,
+        )
+        sources = [tuple(row) for row in cur.fetchall()]
+        if not sources:
+            return {"days": 0, "planned_sets": 0}
+
+        cur.executemany(
+            "INSERT OR IGNORE INTO program_week(program_id, week_number) VALUES(?, ?)",
+            sorted({(pid, next_week) for _, pid, next_week, _ in sources}),
+        )
+        # Template-derived next weeks: copy the template days first so the upsert has exercises to join
+        next_days: Dict[Tuple[int, int], List[int]] = {}
+        for _, pid, next_week, day_of_week in sources:
+            next_days.setdefault((pid, next_week), []).append(day_of_week)
+        for (pid, next_week), days in next_days.items():
+            ProgramRepo.materialize_days(pid, next_week, days, conn=conn)
+        cur.executemany(
+            """
+            INSERT OR IGNORE INTO program_day(program_week_id, day_of_week)
+            SELECT id, ? FROM program_week WHERE program_id = ? AND week_number = ?
+            """,
+            [(day_of_week, pid, next_week) for _, pid, next_week, day_of_week in sources],
+        )
+        written = 0
+        for source in sources:
+            cur.execute(
+                """
+                INSERT INTO planned_set(program_day_exercise_id, set_number, reps, weight)
+                SELECT pde_next.id, ps.set_number, MAX(1, ws.reps + 1), ws.weight
+                FROM workout_exercise we
+                JOIN workout_set ws ON ws.workout_exercise_id = we.id
+                JOIN planned_set ps ON ps.id = ws.planned_set_id
+                JOIN program_day_exercise pde ON pde.id = ps.program_day_exercise_id
+                JOIN program_week pw_next ON pw_next.program_id = ? AND pw_next.week_number = ?
+                JOIN program_day pd_next ON pd_next.program_week_id = pw_next.id AND pd_next.day_of_week = ?
+                JOIN program_day_exercise pde_next ON pde_next.program_day_id = pd_next.id AND pde_next.position = pde.position
+                WHERE we.workout_id = ?
+                ON CONFLICT(program_day_exercise_id, set_number) DO UPDATE
+                SET reps = excluded.reps, weight = excluded.weight
+                WHERE planned_set.reps IS NOT excluded.reps OR planned_set.weight IS NOT excluded.weight
+                """,
+                (source[1], source[2], source[3], source[0]),
+            )
+            written += cur.rowcount
+        for pid in {source[1] for source in sources}:
+            program_tree_cache.invalidate(pid, conn=conn)
+    return {"days": len(sources), "planned_sets": written}
+
+
+def _apply_next_week_progression_from_actuals(workout_id: int, conn: Optional[sqlite3.Connection] = None) -> None:
     """Populate next week's planned_set for the same day using actuals from this workout.
 
     Rules:
@@ -136,114 +242,48 @@ def _apply_next_week_progression_from_actuals(workout_id: int) -> None:
         - If not: insert planned_set.
     Idempotent: running multiple times will keep the same resulting values.
     """
-    with app_db.get_connection() as conn:
+    with app_db.use_connection(conn) as conn:
+        _progress_completed_days(conn, workout_id=workout_id)
+
+
+def apply_progression_from_actuals(program_id: int, user_id: Optional[int] = None) -> Dict[str, int]:
+    """Bulk mode: recompute next-week progression for every completed day of a program in one pass."""
+    with app_db.unit_of_work() as conn:
         cur = conn.cursor()
+        cur.execute("SELECT 1 FROM program WHERE id = ?", (program_id,))
+        if not cur.fetchone():
+            raise ValueError("Program not found")
+        result = _progress_completed_days(conn, program_id=program_id, user_id=user_id)
+    return {"program_id": program_id, **result}
 
-        # 1) Gather workout → program/week/day info
-        cur.execute(
-            """
-            SELECT w.id AS workout_id, w.program_day_id,
-                   pw.program_id, pw.week_number, pd.day_of_week
-            FROM workout w
-            JOIN program_day pd ON pd.id = w.program_day_id
-            JOIN program_week pw ON pw.id = pd.program_week_id
-            WHERE w.id = ?
-            """,
-            (workout_id,),
-        )
-        wrow = cur.fetchone()
-        if not wrow:
-            return
 
-        program_id = wrow[2]
-        week_number = wrow[3]
-        day_of_week = wrow[4]
+def generate_week_progression(program_id: int, from_week: int, to_week: int) -> Dict[str, Any]:
+    """Planned sets for `to_week` from week 1 using the default progression rules (like AI plan templates); from_week must be 1."""
+    return progression.progress_week(program_id, from_week, to_week)
 
-        # 2) Collect planned sets and actuals for this workout/day
-        cur.execute(
-            """
-            SELECT ps.id AS planned_set_id,
-                   ps.set_number,
-                   pde.position,
-                   ws.reps AS actual_reps,
-                   ws.weight AS actual_weight
-            FROM program_day pd
-            JOIN program_day_exercise pde ON pde.program_day_id = pd.id
-            JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
-            LEFT JOIN workout_exercise we
-                ON we.program_day_exercise_id = pde.id AND we.workout_id = ?
-            LEFT JOIN workout_set ws
-                ON ws.workout_exercise_id = we.id AND ws.planned_set_id = ps.id
-            WHERE pd.id = ?
-            ORDER BY pde.position, ps.set_number
-            """,
-            (workout_id, wrow[1]),
-        )
-        rows = cur.fetchall()
-        if not rows:
-            return
-
-        total_planned = len(rows)
-        completed = sum(1 for r in rows if r[3] is not None)
-        if completed < total_planned:
-            # Day not fully completed; skip progression
-            return
-
-        next_week = week_number + 1
-
-        # 3) Ensure next week/day exists
-        next_day = ensure_day(program_id, next_week, day_of_week)
-        next_day_id = next_day["id"]
-
-        # 4) Upsert planned sets for next week based on actuals
-        with app_db.transaction(conn) as tcur:
-            for planned_set_id, set_number, position, actual_reps, actual_weight in rows:
-                # Safety: if somehow actual is missing, skip (should not happen due to check above)
-                if actual_reps is None:
-                    continue
-
-                new_reps = max(1, int(actual_reps) + 1)
-                new_weight = actual_weight  # can be None
-
-                # Find matching exercise (same position) in next week's same day
-                tcur.execute(
-                    """
-                    SELECT id FROM program_day_exercise
-                    WHERE program_day_id = ? AND position = ?
-                    """,
-                    (next_day_id, position),
-                )
-                pde_next = tcur.fetchone()
-                if not pde_next:
-                    # No matching exercise in next week/day → skip
-                    continue
-
-                pde_next_id = pde_next[0]
-
-                # Check if next planned_set exists
-                tcur.execute(
-                    """
-                    SELECT id FROM planned_set
-                    WHERE program_day_exercise_id = ? AND set_number = ?
-                    """,
-                    (pde_next_id, set_number),
-                )
-                ps_next = tcur.fetchone()
-                if ps_next:
-                    # Update
-                    tcur.execute(
-                        "UPDATE planned_set SET reps = ?, weight = ? WHERE id = ?",
-                        (new_reps, new_weight, ps_next[0]),
-                    )
-                else:
-                    # Insert
-                    tcur.execute(
-                        """
-                        INSERT INTO planned_set (program_day_exercise_id, set_number, reps, weight)
-                        VALUES (?, ?, ?, ?)
-                        """,
-                        (pde_next_id, set_number, new_reps, new_weight),
-                    )
+
+def generate_week_progression_from_actuals(program_id: int, from_week: int, to_week: int, user_id: int) -> Dict[str, Any]:
+    """Planned sets for `to_week` from the user's actuals in `from_week`; sets not logged are carried over unchanged."""
+    return progression.progress_week(program_id, from_week, to_week, user_id=user_id)
+
+
+def regenerate_program_progression(program_id: int, weeks: Optional[int] = None) -> Dict[str, Any]:
+    """Rebuild weeks 2..N from week 1 in one pass; N defaults to the program's last (or last planned) week."""
+    if weeks is None:
+        with app_db.get_connection() as conn:
+            row = conn.execute(
+                """
+                SELECT MAX(COALESCE(p.planned_weeks, 0), COALESCE(MAX(pw.week_number), 0))
+                FROM program p
+                LEFT JOIN program_week pw ON pw.program_id = p.id
+                WHERE p.id = ?
+                """,
+                (program_id,),
+            ).fetchone()
+        weeks = row[0] if row and row[0] else 0
+    if weeks < 2:
+        raise ValueError("Program needs at least 2 weeks to progress")
+    return progression.progress_program(program_id, weeks)
 
 
 # Reports
@@ -438,63 +478,52 @@ def get_programs_list() -> List[Dict[str, Any]]:
 
 def get_program_info(program_id: int) -> Dict[str, Any]:
     """Get program info by ID"""
-    with app_db.get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, title, description FROM program WHERE id = ?", (program_id,))
-        program = cur.fetchone()
-        if not program:
-            raise ValueError("Program not found")
-        return dict(program)
+    tree = get_program_tree(program_id)
+    if tree is None:
+        raise ValueError("Program not found")
+    return {"id": tree["id"], "title": tree["title"], "description": tree["description"]}
 
 
 def get_program_weeks_count(program_id: int) -> Dict[str, Any]:
     """Get program weeks count by ID"""
-    with app_db.get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, title FROM program WHERE id = ?", (program_id,))
-        prog = cur.fetchone()
-        if not prog:
-            raise ValueError("Program not found")
-        cur.execute("SELECT COUNT(*) as weeks_count FROM program_week WHERE program_id = ?", (program_id,))
-        weeks_count = cur.fetchone()["weeks_count"]
-        return {"program_id": prog["id"], "program_name": prog["title"], "weeks_count": weeks_count}
+    tree = get_program_tree(program_id)
+    if tree is None:
+        raise ValueError("Program not found")
+    weeks_count = max(len(tree["weeks"]), tree["planned_weeks"] or 0)
+    return {"program_id": tree["id"], "program_name": tree["title"], "weeks_count": weeks_count}
+
+
+def get_program_overview(program_id: int) -> Dict[str, Any]:
+    """Full program tree: weeks → days → exercises → planned sets (cached, read-only)"""
+    tree = get_program_tree(program_id)
+    if tree is None:
+        raise ValueError("Program not found")
+    return tree
 
 
 def get_program_week_data(program_id: int, week_number: int) -> Dict[str, Any]:
     """Get program week data by ID and week number"""
-    with app_db.get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, title FROM program WHERE id = ?", (program_id,))
-        prog = cur.fetchone()
-        if not prog:
-            raise ValueError("Program not found")
-        cur.execute("SELECT id FROM program_week WHERE program_id = ? AND week_number = ?", (program_id, week_number))
-        week = cur.fetchone()
-        if not week:
-            raise ValueError(f"Week {week_number} not found for this program")
-        week_id = week["id"]
-        cur.execute("SELECT id, day_of_week FROM program_day WHERE program_week_id = ? ORDER BY day_of_week", (week_id,))
-        days_rows = cur.fetchall()
-        print(f"DEBUG: Found {len(days_rows)} days for week {week_number} of program {program_id}")
-        days_out = []
-        for d in days_rows:
-            cur.execute("""
-                SELECT e.name
-                FROM program_day_exercise pde
-                JOIN exercise e ON e.id = pde.exercise_id
-                WHERE pde.program_day_id = ?
-                ORDER BY pde.position
-                """, (d["id"],))
-            ex_names = [r[0] for r in cur.fetchall()]
-            print(f"DEBUG: Day {d['day_of_week']} has {len(ex_names)} exercises: {ex_names}")
-            days_out.append({"day_number": d["day_of_week"], "exercises": ex_names})
-        return {"program_id": prog["id"], "program_name": prog["title"], "week_number": week_number, "days": days_out}
+    tree = get_program_tree(program_id)
+    if tree is None:
+        raise ValueError("Program not found")
+    week = find_week(tree, week_number)
+    if week is None and plan_import.ensure_week_materialized(program_id, week_number) is not None:
+        tree = get_program_tree(program_id)
+        week = find_week(tree, week_number)
+    if week is None:
+        raise ValueError(f"Week {week_number} not found for this program")
+    days_out = [
+        {"day_number": d["day_of_week"], "exercises": [ex["name"] for ex in d["exercises"]]}
+        for d in week["days"]
+    ]
+    return {"program_id": tree["id"], "program_name": tree["title"], "week_number": week_number, "days": days_out}
 
 
 # Workout operations
-def start_workout(program_id: int, week_number: int, day_number: int, user_id: int) -> Dict[str, Any]:
+def start_program_workout(program_id: int, week_number: int, day_number: int, user_id: int) -> Dict[str, Any]:
     """Start a new workout session"""
-    with app_db.get_connection() as conn:
+    plan_import.ensure_week_materialized(program_id, week_number)
+    with app_db.unit_of_work() as conn:
         cur = conn.cursor()
         
         # Check if program exists
@@ -510,10 +539,14 @@ def start_workout(program_id: int, week_number: int, day_number: int, user_id: i
             WHERE pw.program_id = ? AND pw.week_number = ? AND pd.day_of_week = ?
         """, (program_id, week_number, day_number))
         program_day = cur.fetchone()
-        if not program_day:
-            raise ValueError(f"Day {day_number} not found for week {week_number}")
-        
-        program_day_id = program_day["id"]
+        if program_day:
+            program_day_id = program_day["id"]
+        else:
+            # Days of template-derived weeks only get rows once a workout starts on them
+            created = ProgramRepo.materialize_days(program_id, week_number, [day_number], conn=conn)
+            if day_number not in created:
+                raise ValueError(f"Day {day_number} not found for week {week_number}")
+            program_day_id = created[day_number]
         
         # Create workout
         cur.execute("""
@@ -541,86 +574,98 @@ def start_workout(program_id: int, week_number: int, day_number: int, user_id: i
         }
 
 
-def get_workout_session(workout_id: int, user_id: int) -> Dict[str, Any]:
-    """Get workout session data with exercises and planned sets"""
+def load_workout_session(workout_id: int) -> Optional[Dict[str, Any]]:
+    """Load a workout with its exercises, planned sets and this workout's actuals in one query.
+
+    Returns None if the workout does not exist; ownership is checked by the caller.
+    """
     with app_db.get_connection() as conn:
         cur = conn.cursor()
-        
-        # Get workout info
         cur.execute("""
             SELECT w.id, w.owner_user_id, w.program_day_id, w.started_at,
-                   pw.program_id, pw.week_number, pd.day_of_week,
-                   p.title as program_title
+                   p.title AS program_title, pw.week_number, pd.day_of_week,
+                   we.id AS workout_exercise_id, we.position,
+                   e.name AS exercise_name, e.muscle_group, e.equipment, pde.notes,
+                   ps.id AS set_id, ps.set_number, ps.reps AS planned_reps, ps.weight AS planned_weight,
+                   ps.rpe AS planned_rpe, ps.rest_seconds AS planned_rest,
+                   ws.id AS workout_set_id, ws.reps AS actual_reps, ws.weight AS actual_weight,
+                   ws.rpe AS actual_rpe, ws.rest_seconds AS actual_rest
             FROM workout w
-            JOIN program_day pd ON w.program_day_id = pd.id
-            JOIN program_week pw ON pd.program_week_id = pw.id
-            JOIN program p ON pw.program_id = p.id
-            WHERE w.id = ? AND w.owner_user_id = ?
-        """, (workout_id, user_id))
-        workout = cur.fetchone()
-        if not workout:
-            raise ValueError("Workout not found")
-        
-        # Get exercises and sets
-        cur.execute("""
-            SELECT e.name as exercise_name, e.muscle_group, e.equipment,
-                   pde.position, pde.notes,
-                   ps.id as set_id, ps.set_number, ps.reps, ps.weight, ps.rpe, ps.rest_seconds,
-                   ws.id as workout_set_id, ws.reps as actual_reps, ws.weight as actual_weight,
-                   ws.rpe as actual_rpe, ws.rest_seconds as actual_rest
-            FROM program_day_exercise pde
-            JOIN exercise e ON pde.exercise_id = e.id
+            JOIN program_day pd ON pd.id = w.program_day_id
+            JOIN program_week pw ON pw.id = pd.program_week_id
+            JOIN program p ON p.id = pw.program_id
+            LEFT JOIN workout_exercise we ON we.workout_id = w.id
+            LEFT JOIN program_day_exercise pde ON pde.id = we.program_day_exercise_id
+            LEFT JOIN exercise e ON e.id = pde.exercise_id
             LEFT JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
-            LEFT JOIN workout_set ws ON ws.planned_set_id = ps.id AND ws.workout_id = ?
-            WHERE pde.program_day_id = ?
-            ORDER BY pde.position, ps.set_number
-        """, (workout_id, workout["program_day_id"]))
-        
-        exercises_data = cur.fetchall()
-        
-        # Group by exercise
-        exercises = {}
-        for row in exercises_data:
-            exercise_name = row["exercise_name"]
-            if exercise_name not in exercises:
-                exercises[exercise_name] = {
-                    "name": exercise_name,
-                    "muscle_group": row["muscle_group"],
-                    "equipment": row["equipment"],
-                    "position": row["position"],
-                    "notes": row["notes"],
-                    "sets": []
-                }
-            
-            if row["set_id"]:  # If there's a planned set
-                exercises[exercise_name]["sets"].append({
-                    "set_id": row["set_id"],
-                    "set_number": row["set_number"],
-                    "planned_reps": row["reps"],
-                    "planned_weight": row["weight"],
-                    "planned_rpe": row["rpe"],
-                    "planned_rest": row["rest_seconds"],
-                    "workout_set_id": row["workout_set_id"],
-                    "actual_reps": row["actual_reps"],
-                    "actual_weight": row["actual_weight"],
-                    "actual_rpe": row["actual_rpe"],
-                    "actual_rest": row["actual_rest"]
-                })
-        
-        return {
-            "workout_id": workout["id"],
-            "program_id": workout["program_id"],
-            "program_title": workout["program_title"],
-            "week_number": workout["week_number"],
-            "day_number": workout["day_of_week"],
-            "started_at": workout["started_at"],
-            "exercises": list(exercises.values())
-        }
+            LEFT JOIN workout_set ws ON ws.workout_exercise_id = we.id AND ws.planned_set_id = ps.id
+            WHERE w.id = ?
+            ORDER BY we.position, ps.set_number, ws.id
+        """, (workout_id,))
+        rows = cur.fetchall()
+    if not rows:
+        return None
+
+    head = rows[0]
+    workout = {
+        "id": head["id"],
+        "owner_user_id": head["owner_user_id"],
+        "program_day_id": head["program_day_id"],
+        "started_at": head["started_at"],
+        "program_title": head["program_title"],
+        "week_number": head["week_number"],
+        "day_of_week": head["day_of_week"],
+    }
+
+    # Rows arrive ordered by exercise then set; group them in a single pass
+    exercises: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    seen_sets = set()
+    for row in rows:
+        if row["workout_exercise_id"] is None:
+            continue
+        if current is None or current["id"] != row["workout_exercise_id"]:
+            current = {
+                "id": row["workout_exercise_id"],
+                "position": row["position"],
+                "exercise_name": row["exercise_name"],
+                "muscle_group": row["muscle_group"],
+                "equipment": row["equipment"],
+                "notes": row["notes"],
+                "sets": [],
+            }
+            exercises.append(current)
+        if row["set_id"] is None or (current["id"], row["set_id"]) in seen_sets:
+            continue
+        seen_sets.add((current["id"], row["set_id"]))
+        current["sets"].append({
+            "id": row["set_id"],
+            "set_number": row["set_number"],
+            "planned_reps": row["planned_reps"],
+            "planned_weight": row["planned_weight"],
+            "planned_rpe": row["planned_rpe"],
+            "planned_rest": row["planned_rest"],
+            "workout_set_id": row["workout_set_id"],
+            "actual_reps": row["actual_reps"],
+            "actual_weight": row["actual_weight"],
+            "actual_rpe": row["actual_rpe"],
+            "actual_rest": row["actual_rest"],
+        })
+
+    return {"workout": workout, "exercises": exercises}
+
 
+def get_workout_session(workout_id: int, user_id: int) -> Dict[str, Any]:
+    """Get workout session data with exercises and planned sets"""
+    session = load_workout_session(workout_id)
+    if not session or session["workout"]["owner_user_id"] != user_id:
+        raise ValueError("Workout not found")
+    return session
 
-def log_workout_set(workout_id: int, set_id: int, reps: int, weight: float, rpe: float, rest_seconds: int, user_id: int) -> Dict[str, Any]:
+
+def log_session_set(workout_id: int, set_id: int, reps: int, weight: float, rpe: float, rest_seconds: int, user_id: int) -> Dict[str, Any]:
     """Log a workout set"""
-    with app_db.get_connection() as conn:
+    with app_db.unit_of_work() as conn:
         cur = conn.cursor()
         
         # Verify workout exists
@@ -628,8 +673,22 @@ def log_workout_set(workout_id: int, set_id: int, reps: int, weight: float, rpe:
         if not cur.fetchone():
             raise ValueError("Workout not found")
         
+        # Resolve this workout's exercise instance for the planned set
+        cur.execute("""
+            SELECT we.id AS workout_exercise_id, ps.set_number
+            FROM planned_set ps
+            JOIN workout_exercise we ON we.program_day_exercise_id = ps.program_day_exercise_id
+            WHERE we.workout_id = ? AND ps.id = ?
+        """, (workout_id, set_id))
+        target = cur.fetchone()
+        if not target:
+            raise ValueError("Planned set is not part of this workout")
+        
         # Check if set already logged
-        cur.execute("SELECT id FROM workout_set WHERE planned_set_id = ? AND workout_id = ?", (set_id, workout_id))
+        cur.execute(
+            "SELECT id FROM workout_set WHERE workout_exercise_id = ? AND planned_set_id = ?",
+            (target["workout_exercise_id"], set_id),
+        )
         existing_set = cur.fetchone()
         
         if existing_set:
@@ -637,15 +696,15 @@ def log_workout_set(workout_id: int, set_id: int, reps: int, weight: float, rpe:
             cur.execute("""
                 UPDATE workout_set 
                 SET reps = ?, weight = ?, rpe = ?, rest_seconds = ?
-                WHERE planned_set_id = ? AND workout_id = ?
-            """, (reps, weight, rpe, rest_seconds, set_id, workout_id))
+                WHERE id = ?
+            """, (reps, weight, rpe, rest_seconds, existing_set["id"]))
             workout_set_id = existing_set["id"]
         else:
             # Create new set
             cur.execute("""
-                INSERT INTO workout_set (workout_id, planned_set_id, reps, weight, rpe, rest_seconds)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (workout_id, set_id, reps, weight, rpe, rest_seconds))
+                INSERT INTO workout_set (workout_exercise_id, planned_set_id, set_number, reps, weight, rpe, rest_seconds)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (target["workout_exercise_id"], set_id, target["set_number"], reps, weight, rpe, rest_seconds))
             workout_set_id = cur.lastrowid
         
         return {"workout_set_id": workout_set_id, "message": "Set logged successfully"}
@@ -734,228 +793,109 @@ def remove_user_program(user_program_id: int, user_id: int) -> Dict[str, Any]:
         return {"message": "Program removed successfully"}
 
 
-def get_day_status(program_id: int, week_number: int, day_number: int, user_id: int) -> Dict[str, Any]:
-    """Get completion status for a specific day"""
+_DAYS_STATUS_SQL = """
+    SELECT pd.id AS program_day_id, pw.week_number, pd.day_of_week,
+           COALESCE(
+               dp.planned_sets,
+               (SELECT COUNT(*) FROM planned_set ps
+                JOIN program_day_exercise pde ON pde.id = ps.program_day_exercise_id
+                WHERE pde.program_day_id = pd.id)
+           ) AS planned_sets,
+           COALESCE(dp.completed_sets, 0) AS completed_sets,
+           dp.last_workout_id AS workout_id, dp.last_workout_started_at AS workout_started_at
+    FROM program_week pw
+    JOIN program_day pd ON pd.program_week_id = pw.id
+    LEFT JOIN day_progress dp ON dp.user_id = :user_id AND dp.program_day_id = pd.id
+    WHERE pw.program_id = :program_id
+      AND (:week_number IS NULL OR pw.week_number = :week_number)
+      AND (:day_of_week IS NULL OR pd.day_of_week = :day_of_week)
+    UNION ALL
+    SELECT NULL, pw.week_number, tpd.day_of_week,
+           (SELECT COUNT(*) FROM planned_set ps
+            JOIN program_day_exercise pde ON pde.id = ps.program_day_exercise_id
+            WHERE pde.program_day_id = tpd.id),
+           0, NULL, NULL
+    FROM program_week pw
+    JOIN program_week_template t ON t.program_week_id = pw.id
+    JOIN program_day tpd ON tpd.program_week_id = t.template_week_id
+    WHERE pw.program_id = :program_id
+      AND (:week_number IS NULL OR pw.week_number = :week_number)
+      AND (:day_of_week IS NULL OR tpd.day_of_week = :day_of_week)
+      AND NOT EXISTS (SELECT 1 FROM program_day pd WHERE pd.program_week_id = pw.id AND pd.day_of_week = tpd.day_of_week)
+    ORDER BY week_number, day_of_week
+"""
+
+
+def get_days_status(program_id: int, user_id: Optional[int], week_number: Optional[int] = None, day_of_week: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Completion status of every day of a program (or one week / one day) in one query.
+    Counters come from day_progress (primary-key lookups, maintained by triggers); days the user
+    never started fall back to counting their planned sets. Without a user, completed counts are 0.
+    Days of template-derived weeks that have no rows yet report their template day's planned sets
+    and a None program_day_id (nobody can have logged them). Asking for a week of a lazily stored
+    program that has not been written yet writes it first.
+    """
     with app_db.get_connection() as conn:
         cur = conn.cursor()
         cur.execute(
-            """
-            SELECT pd.id as program_day_id
-            FROM program_day pd
-            JOIN program_week pw ON pd.program_week_id = pw.id
-            WHERE pw.program_id = ? AND pw.week_number = ? AND pd.day_of_week = ?
-            """,
-            (program_id, week_number, day_number)
-        )
-        program_day = cur.fetchone()
-        if not program_day:
-            raise ValueError("Day not found")
-        
-        program_day_id = program_day["program_day_id"]
-        
-        # Get planned sets count
-        cur.execute(
-            """
-            SELECT COUNT(*) as planned_count
-            FROM planned_set ps
-            JOIN program_day_exercise pde ON ps.program_day_exercise_id = pde.id
-            WHERE pde.program_day_id = ?
-            """,
-            (program_day_id,)
-        )
-        planned_count = cur.fetchone()["planned_count"]
-        
-        # Get completed sets count
-        cur.execute(
-            """
-            SELECT COUNT(*) as completed_count
-            FROM workout_set ws
-            JOIN workout w ON ws.workout_id = w.id
-            JOIN planned_set ps ON ws.planned_set_id = ps.id
-            JOIN program_day_exercise pde ON ps.program_day_exercise_id = pde.id
-            WHERE pde.program_day_id = ? AND w.owner_user_id = ?
-            """,
-            (program_day_id, user_id)
+            _DAYS_STATUS_SQL,
+            {"program_id": program_id, "week_number": week_number, "day_of_week": day_of_week, "user_id": user_id},
         )
-        completed_count = cur.fetchone()["completed_count"]
-        
-        # Check if workout exists
-        cur.execute(
-            """
-            SELECT id, started_at FROM workout
-            WHERE program_day_id = ? AND owner_user_id = ?
-            ORDER BY started_at DESC LIMIT 1
-            """,
-            (program_day_id, user_id)
-        )
-        workout = cur.fetchone()
-        
-        return {
-            "program_id": program_id,
-            "week_number": week_number,
-            "day_number": day_number,
-            "planned_sets": planned_count,
-            "completed_sets": completed_count,
-            "completion_percentage": (completed_count / planned_count * 100) if planned_count > 0 else 0,
-            "workout_id": workout["id"] if workout else None,
-            "workout_started_at": workout["started_at"] if workout else None
-        }
+        rows = cur.fetchall()
+        if not rows and week_number is not None and plan_import.ensure_week_materialized(program_id, week_number, conn=conn):
+            # First access to a week of a lazily stored program: it has rows now
+            cur.execute(
+                _DAYS_STATUS_SQL,
+                {"program_id": program_id, "week_number": week_number, "day_of_week": day_of_week, "user_id": user_id},
+            )
+            rows = cur.fetchall()
+        if not rows:
+            cur.execute("SELECT 1 FROM program WHERE id = ?", (program_id,))
+            if not cur.fetchone():
+                raise ValueError("Program not found")
+            if day_of_week is not None:
+                raise ValueError("Day not found")
+            if week_number is not None:
+                cur.execute("SELECT 1 FROM program_week WHERE program_id = ? AND week_number = ?", (program_id, week_number))
+                if not cur.fetchone():
+                    raise ValueError(f"Week {week_number} not found for this program")
+
+    days = []
+    for row in rows:
+        planned, completed = row["planned_sets"], row["completed_sets"]
+        days.append({
+            "program_day_id": row["program_day_id"],
+            "week_number": row["week_number"],
+            "day_number": row["day_of_week"],
+            "planned_sets": planned,
+            "completed_sets": completed,
+            "completion_percentage": (completed / planned * 100) if planned > 0 else 0,
+            "completed": planned > 0 and completed >= planned,
+            "workout_id": row["workout_id"],
+            "workout_started_at": row["workout_started_at"],
+        })
+    return days
+
+
+def get_day_status(program_id: int, week_number: int, day_number: int, user_id: int) -> Dict[str, Any]:
+    """Get completion status for a specific day"""
+    day = get_days_status(program_id, user_id, week_number=week_number, day_of_week=day_number)[0]
+    return {
+        "program_id": program_id,
+        "week_number": week_number,
+        "day_number": day_number,
+        "planned_sets": day["planned_sets"],
+        "completed_sets": day["completed_sets"],
+        "completion_percentage": day["completion_percentage"],
+        "workout_id": day["workout_id"],
+        "workout_started_at": day["workout_started_at"],
+    }
 
 
 def save_ai_plan(owner_user_id: int, plan_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Save AI-generated plan to database with 8 weeks progression"""
+    """Save AI-generated plan to database with 8 weeks progression (single transaction, see plan_import storage modes)"""
     title: str = str(plan_data.get("title") or "AI Program")
-    description: Optional[str] = plan_data.get("description")
-    weeks = plan_data.get("weeks", [])
-    
-    if not weeks:
-        raise ValueError("No weeks data provided")
-    
-    # Create the program
-    program = create_program_v2(owner_user_id, title, description)
-    program_id = program["id"]
-    
-    # Get the first week data (AI generates only 1 week)
-    first_week = weeks[0] if weeks else {}
-    first_week_days = first_week.get("days", [])
-    print(f"DEBUG: First week has {len(first_week_days)} days")
-    for i, day in enumerate(first_week_days):
-        exercises = day.get('exercises', [])
-        print(f"DEBUG: Day {i+1}: day_of_week={day.get('day_of_week')} with {len(exercises)} exercises")
-        for j, exercise in enumerate(exercises):
-            print(f"  Exercise {j+1}: {exercise.get('name')} ({exercise.get('muscle_group')})")
-    
-    # Generate 8 weeks based on the first week
-    for week_number in range(1, 9):
-        # Ensure week exists
-        ensure_week(program_id, week_number)
-        
-        # For week 1, use the original data; for other weeks, copy the structure
-        if week_number == 1:
-            days_to_process = first_week_days
-        else:
-            # Copy the structure from week 1 for weeks 2-8
-            days_to_process = first_week_days
-        
-        # Process each day
-        for day_data in days_to_process:
-            day_of_week = day_data.get("day_of_week")
-            exercises = day_data.get("exercises", [])
-            
-            print(f"DEBUG: Processing week {week_number}, day {day_of_week} with {len(exercises)} exercises")
-            
-            if not day_of_week or not exercises:
-                print(f"DEBUG: Skipping day {day_of_week} - no day_of_week or no exercises")
-                continue
-            
-            # Ensure day exists
-            ensure_day(program_id, week_number, day_of_week)
-            
-            # Process each exercise
-            for exercise_data in exercises:
-                exercise_name = exercise_data.get("name")
-                muscle_group = exercise_data.get("muscle_group")
-                equipment = exercise_data.get("equipment")
-                position = exercise_data.get("position", 1)
-                notes = exercise_data.get("notes")
-                planned_sets = exercise_data.get("planned_sets", [])
-                
-                if not exercise_name or not muscle_group:
-                    continue
-                
-                # Create or get exercise
-                try:
-                    # Use the correct create_exercise function directly from services module
-                    exercise = create_exercise(
-                        owner_user_id,
-                        exercise_name,
-                        muscle_group,
-                        equipment,
-                        False
-                    )
-                    exercise_id = exercise["id"]
-                    print(f"DEBUG: Created new exercise {exercise_name} with ID {exercise_id}")
-                except Exception as e:
-                    print(f"DEBUG: Failed to create exercise {exercise_name}: {e}")
-                    # Exercise might already exist, try to find it
-                    exercises_list = list_exercises(owner_user_id)
-                    existing_exercise = next(
-                        (ex for ex in exercises_list if ex["name"] == exercise_name), 
-                        None
-                    )
-                    if existing_exercise:
-                        exercise_id = existing_exercise["id"]
-                        print(f"DEBUG: Found existing exercise {exercise_name} with ID {exercise_id}")
-                    else:
-                        print(f"DEBUG: Exercise {exercise_name} not found, skipping...")
-                        continue
-                
-                # Add exercise to day
-                try:
-                    result = add_day_exercise(
-                        program_id=program_id,
-                        week_number=week_number,
-                        day_of_week=day_of_week,
-                        exercise_id=exercise_id,
-                        position=position,
-                        notes=notes
-                    )
-                    print(f"DEBUG: Added exercise {exercise_name} to week {week_number}, day {day_of_week}, position {position}")
-                except Exception as e:
-                    print(f"DEBUG: Error adding exercise {exercise_name} to day: {e}")
-                    pass
-                
-                # Add planned sets
-                for set_data in planned_sets:
-                    set_number = set_data.get("set_number", 1)
-                    base_reps = set_data.get("reps", 8)
-                    base_weight = set_data.get("weight")
-                    rpe = set_data.get("rpe")
-                    rest_seconds = set_data.get("rest_seconds")
-                    
-                    # Apply progression for weeks 2-8
-                    if week_number > 1:
-                        if week_number % 2 == 0:
-                            # Even weeks: +1 rep
-                            reps = base_reps + 1
-                            weight = base_weight
-                        else:
-                            # Odd weeks: +2.5% weight
-                            reps = base_reps
-                            weight = base_weight * 1.025 if base_weight else None
-                    else:
-                        reps = base_reps
-                        weight = base_weight
-                    
-                    try:
-                        add_planned_set(
-                            program_id=program_id,
-                            week_number=week_number,
-                            day_of_week=day_of_week,
-                            position=position,
-                            set_number=set_number,
-                            reps=reps,
-                            weight=weight,
-                            rpe=rpe,
-                            rest_seconds=rest_seconds
-                        )
-                    except Exception:
-                        pass
-    
-    # Create user_program relationship
-    try:
-        print(f"DEBUG: Creating user_program with user_id: {owner_user_id}, program_id: {program_id}")
-        with app_db.get_connection() as conn:
-            with app_db.transaction(conn) as cur:
-                cur.execute(
-                    "INSERT INTO user_program (user_id, program_id) VALUES (?, ?)",
-                    (owner_user_id, program_id),
-                )
-        print(f"DEBUG: Successfully created user_program")
-    except Exception as e:
-        print(f"DEBUG: Error creating user_program: {e}")
-        pass
-    
+    program_id = plan_import.import_plan(owner_user_id, plan_data)
     return {"message": "Plan saved successfully", "program_id": program_id, "program_title": title}
 
 
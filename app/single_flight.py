@@ -0,0 +1,81 @@
+"""
+Single-flight deduplication for expensive awaitables (AI plan generation).
+
+SingleFlight.do(key, fn) runs fn() once per key at a time: callers arriving while it is in flight
+await the same task instead of starting another. The work runs as its own task, so a caller that
+disconnects does not cancel it for the others. Meant for one event loop; no locking needed.
+
+A call that produces output as it goes (the plan stream) publishes it to feed(key): callers that
+join later read the same EventFeed from its first event on, then get the shared result.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class EventFeed:
+    """Events published by an in-flight call, kept from the first so late joiners see them all."""
+
+    def __init__(self) -> None:
+        self.events: List[Any] = []
+        self._changed = asyncio.Event()
+
+    def publish(self, event: Any) -> None:
+        self.events.append(event)
+        self._changed.set()
+
+    async def wait(self, seen: int) -> None:
+        """Return once there are more than `seen` events."""
+        while len(self.events) <= seen:
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._flights: Dict[str, "asyncio.Task"] = {}
+        self._feeds: Dict[str, EventFeed] = {}
+        self.stats: Dict[str, int] = {"calls": 0, "executions": 0, "coalesced": 0, "failures": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Result of the in-flight call for `key` (starting one if none) and whether it was shared."""
+        self.stats["calls"] += 1
+        task = self._flights.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            self.stats["executions"] += 1
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task), shared
+
+    def feed(self, key: str) -> EventFeed:
+        """The feed of the call for `key` (a new one if none is in flight); pass it to do()'s `fn`."""
+        feed = self._feeds.get(key)
+        if feed is None:
+            feed = self._feeds[key] = EventFeed()
+        return feed
+
+    def _done(self, key: str, task: "asyncio.Task") -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+            self._feeds.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["failures"] += 1
+
+    async def cancel_all(self) -> None:
+        """Cancel every in-flight call (app shutdown: nothing may outlive the clients it uses)."""
+        tasks = list(self._flights.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "in_flight": len(self._flights)}
+
+
+ai_generation_flight = SingleFlight()
@@ -0,0 +1,90 @@
+"""
+Minimal in-process ASGI client for benchmarks (no HTTP server or httpx needed).
+"""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlencode
+
+
+async def call(
+    app: Any,
+    method: str,
+    path: str,
+    *,
+    query: Optional[Dict[str, Any]] = None,
+    form: Optional[Dict[str, Any]] = None,
+    json_body: Any = None,
+    cookies: Optional[Dict[str, str]] = None,
+    on_body: Optional[Callable[[bytes], None]] = None,
+) -> Tuple[int, bytes]:
+    headers: Iterable[Tuple[str, str]] = []
+    body = b""
+    if form is not None:
+        body = urlencode(form).encode()
+        headers.append(("content-type", "application/x-www-form-urlencoded"))
+    elif json_body is not None:
+        body = json.dumps(json_body).encode()
+        headers.append(("content-type", "application/json"))
+    if cookies:
+        headers.append(("cookie", "; ".join(f"{k}={v}" for k, v in cookies.items())))
+    headers.append(("content-length", str(len(body))))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": urlencode(query or {}).encode(),
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    done = asyncio.Event()
+    delivered = False
+    status = 0
+    chunks = []
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Dict[str, Any]) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if on_body is not None and chunks[-1]:
+                on_body(chunks[-1])
+            if not message.get("more_body"):
+                done.set()
+
+    await app(scope, receive, send)
+    done.set()
+    return status, b"".join(chunks)
+
+
+@asynccontextmanager
+async def lifespan(app: Any):
+    inbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    outbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    task = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}}, inbox.get, outbox.put))
+    await inbox.put({"type": "lifespan.startup"})
+    await outbox.get()
+    try:
+        yield
+    finally:
+        await inbox.put({"type": "lifespan.shutdown"})
+        await outbox.get()
+        await task
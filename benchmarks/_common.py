@@ -0,0 +1,98 @@
+"""
+Shared helpers for the benchmark scripts: scratch database setup and timing.
+Benchmarks never touch database/workout.db; each run works on a fresh schema in a temp dir.
+"""
+
+import sys
+import time
+import tempfile
+import statistics
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+from app import db  # type: ignore  # noqa: E402
+from database.init_db import init_db  # type: ignore  # noqa: E402
+
+
+def scratch_db(name: str = "bench.db") -> Path:
+    """Create a fresh schema in a temp dir and point the app's pool at it."""
+    path = Path(tempfile.mkdtemp(prefix="iron-bench-")) / name
+    init_db(path)
+    db.configure(db_path=path)
+    db.ensure_schema_integrity()
+    return path
+
+
+def seed_program(days: int = 5, exercises_per_day: int = 6, sets_per_exercise: int = 4, weeks: int = 1) -> Dict[str, Any]:
+    """Insert one user, a global catalog and a program. Returns ids used by the hot-path benchmarks."""
+    ids: Dict[str, Any] = {"days": [], "pdes": [], "planned_sets": []}
+    with db.get_connection() as conn, db.transaction(conn) as cur:
+        cur.execute("INSERT INTO users(email, password_hash) VALUES('bench@example.com', 'x')")
+        ids["user_id"] = cur.lastrowid
+        exercise_ids: List[int] = []
+        for i in range(days * exercises_per_day):
+            cur.execute(
+                "INSERT INTO exercise(owner_user_id, name, muscle_group, equipment, is_global) VALUES(NULL, ?, 'chest', 'barbell', 1)",
+                (f"Bench Exercise {i + 1}",),
+            )
+            exercise_ids.append(cur.lastrowid)
+        cur.execute("INSERT INTO program(owner_user_id, title) VALUES(?, 'Bench Program')", (ids["user_id"],))
+        ids["program_id"] = cur.lastrowid
+        for week_number in range(1, weeks + 1):
+            cur.execute("INSERT INTO program_week(program_id, week_number) VALUES(?, ?)", (ids["program_id"], week_number))
+            week_id = cur.lastrowid
+            for day_of_week in range(1, days + 1):
+                cur.execute("INSERT INTO program_day(program_week_id, day_of_week) VALUES(?, ?)", (week_id, day_of_week))
+                day_id = cur.lastrowid
+                ids["days"].append(day_id)
+                for position in range(1, exercises_per_day + 1):
+                    cur.execute(
+                        "INSERT INTO program_day_exercise(program_day_id, exercise_id, position) VALUES(?, ?, ?)",
+                        (day_id, exercise_ids[(day_of_week - 1) * exercises_per_day + position - 1], position),
+                    )
+                    pde_id = cur.lastrowid
+                    ids["pdes"].append(pde_id)
+                    for set_number in range(1, sets_per_exercise + 1):
+                        cur.execute(
+                            "INSERT INTO planned_set(program_day_exercise_id, set_number, reps, weight, rest_seconds) VALUES(?, ?, 8, 60, 90)",
+                            (pde_id, set_number),
+                        )
+                        ids["planned_sets"].append(cur.lastrowid)
+    return ids
+
+
+def timed(fn: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    """Run fn `iterations` times; return mean/p50/p99 latency in microseconds and total seconds."""
+    samples: List[float] = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    total = time.perf_counter() - start
+    return summarize(samples, total)
+
+
+def summarize(samples_us: List[float], total_s: float) -> Dict[str, float]:
+    ordered = sorted(samples_us)
+    return {
+        "n": len(ordered),
+        "total_s": total_s,
+        "mean_us": statistics.fmean(ordered) if ordered else 0.0,
+        "p50_us": percentile(ordered, 50),
+        "p99_us": percentile(ordered, 99),
+    }
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def print_row(label: str, stats: Dict[str, float]) -> None:
+    print(f"{label:<40} n={int(stats['n']):>6}  mean={stats['mean_us']:>9.1f}us  p50={stats['p50_us']:>9.1f}us  p99={stats['p99_us']:>9.1f}us")
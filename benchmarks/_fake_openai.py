@@ -0,0 +1,289 @@
+"""
+Local OpenAI-compatible stand-in for benchmarks and offline development: answers
+POST /v1/chat/completions after a configurable delay with a synthetic plan (_plans.make_plan)
+sized by the "days_per_week" line of the prompt, and GET /v1/models. HTTP/1.1 keep-alive, one
+thread per connection; counts connections and requests so benchmarks can tell whether clients
+reuse connections.
+
+With "stream": true the same content is sent as chat.completion.chunk SSE events: the first
+after `first_token_s`, the rest spread evenly over the remaining latency. With `tokens_per_s` (or
+`chars_per_s`) set, latency is `first_token_s` plus the content length at that rate instead of
+fixed, so shorter completions (the split skeleton and single days of app.plan_parallel) answer
+sooner. Prompts asking for the compact output format (COMPACT_SCHEMA_BLOCK) get the same plan in
+that format. `body` replaces the synthetic plan with a canned answer; $placeholders in it are
+filled from the prompt's USER INPUT lines ($days_per_week, $title, ...), $model and $plan (the
+synthetic answer).
+
+Benchmarks start it in-process with fake_openai(). To run the app against it:
+  python benchmarks/_fake_openai.py --port 8900 --tokens-per-s 80 [--body plan.json]
+  OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=sk-fake uvicorn app.main:app
+"""
+
+import argparse
+import json
+import os
+import re
+import string
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Generator, Optional
+
+from _plans import MUSCLES, make_plan, to_compact, to_compact_day  # type: ignore
+
+DAYS_RE = re.compile(r"days_per_week:\s*(\d+)")
+DAY_RE = re.compile(r"generate_day:\s*(\d+)")
+INPUT_RE = re.compile(r"^- (\w+): (.*)$", re.MULTILINE)
+COMPACT_MARKER = "OUTPUT FORMAT (COMPACT"
+# Characters per token, for usage and tokens_per_s (roughly what OpenAI tokenizers give for JSON)
+CHARS_PER_TOKEN = 4
+# Exercises per day when not fixed: within the prompt's count rule, as app.plan_validation checks
+EXERCISES_PER_DAY = {3: 7, 4: 6, 5: 5}
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        exercises: Optional[int] = None,
+        sets: int = 3,
+        first_token_s: float = 0.05,
+        chunk_chars: int = 16,
+        chars_per_s: Optional[float] = None,
+        tokens_per_s: Optional[float] = None,
+        body: Optional[str] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.first_token_s = min(first_token_s, latency)
+        self.chunk_chars = chunk_chars
+        self.chars_per_s = tokens_per_s * CHARS_PER_TOKEN if tokens_per_s else chars_per_s
+        self.body = string.Template(body) if body is not None else None
+        self.exercises = exercises
+        self.sets = sets
+        # The next `fail_next` completions answer 500 (the client retries them)
+        self.fail_next = 0
+        # The next `stall_next` completions wait `stall_s` before answering (a stalled upstream)
+        self.stall_next = 0
+        self.stall_s = 30.0
+        self.stats: Dict[str, int] = {"connections": 0, "requests": 0, "in_flight": 0, "max_in_flight": 0}
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients hanging up mid-response (cancelled or timed-out requests) are expected here
+        pass
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+            if key == "in_flight":
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def content(self, request: Dict) -> str:
+        if self.body is None:
+            return self.plan_content(request)
+        fields = dict(INPUT_RE.findall(self.prompt(request)))
+        fields["model"] = request.get("model", "fake")
+        if "$plan" in self.body.template or "${plan}" in self.body.template:
+            fields["plan"] = self.plan_content(request)
+        return self.body.safe_substitute(fields)
+
+    def plan_content(self, request: Dict) -> str:
+        prompt = self.prompt(request)
+        match = DAYS_RE.search(prompt)
+        days = int(match.group(1)) if match else 3
+        if "SPLIT SKELETON" in prompt:
+            return json.dumps({"days": [{"day_of_week": d, "focus": [MUSCLES[d % len(MUSCLES)]]} for d in range(1, days + 1)]})
+        plan = make_plan(days, self.exercises or EXERCISES_PER_DAY.get(days, 6), self.sets)
+        compact = COMPACT_MARKER in prompt
+        day = DAY_RE.search(prompt)
+        if day:
+            plan_day = plan["weeks"][0]["days"][int(day.group(1)) - 1]
+            return json.dumps(to_compact_day(plan_day) if compact else plan_day)
+        return json.dumps(to_compact(plan) if compact else plan)
+
+    def response_time(self, content: str) -> float:
+        if self.chars_per_s:
+            return self.first_token_s + len(content) / self.chars_per_s
+        return self.latency
+
+    @staticmethod
+    def prompt(request: Dict) -> str:
+        return " ".join(str(m.get("content", "")) for m in request.get("messages", []))
+
+    def usage(self, request: Dict, content: str) -> Dict:
+        prompt = self.prompt(request)
+        prompt_tokens, completion_tokens = len(prompt) // CHARS_PER_TOKEN, len(content) // CHARS_PER_TOKEN
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    def completion(self, request: Dict) -> Dict:
+        content = self.content(request)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": self.usage(request, content),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeOpenAIServer
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        pass
+
+    def do_GET(self) -> None:
+        self.server.count("requests")
+        if not self.path.endswith("/models"):
+            self._reply(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        self._reply(200, {"object": "list", "data": [{"id": "fake", "object": "model", "created": 0, "owned_by": "bench"}]})
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("content-length") or 0))
+        self.server.count("requests")
+        if not self.path.endswith("/chat/completions"):
+            self._reply(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        request = json.loads(body or b"{}")
+        with self.server._lock:
+            fail, self.server.fail_next = self.server.fail_next > 0, max(self.server.fail_next - 1, 0)
+            stall, self.server.stall_next = self.server.stall_next > 0, max(self.server.stall_next - 1, 0)
+        if fail:
+            self._reply(500, {"error": {"message": "injected failure", "type": "server_error"}})
+            return
+        if stall:
+            time.sleep(self.server.stall_s)
+        self.server.count("in_flight")
+        try:
+            if request.get("stream"):
+                self._stream(request)
+                return
+            response = self.server.completion(request)
+            time.sleep(self.server.response_time(response["choices"][0]["message"]["content"]))
+            self._reply(200, response)
+        finally:
+            self.server.count("in_flight", -1)
+
+    def _stream(self, request: Dict) -> None:
+        server = self.server
+        content = server.content(request)
+        pieces = [content[i:i + server.chunk_chars] for i in range(0, len(content), server.chunk_chars)]
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        start = time.perf_counter()
+        step = (server.response_time(content) - server.first_token_s) / max(len(pieces) - 1, 1)
+        for i, piece in enumerate(pieces):
+            delay = start + server.first_token_s + i * step - time.perf_counter()
+            if delay > 0.002:
+                time.sleep(delay)
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        if (request.get("stream_options") or {}).get("include_usage"):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [],
+                "usage": server.usage(request, content),
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _reply(self, status: int, payload: Dict) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@contextmanager
+def fake_openai(latency: float = 0.5, **kwargs) -> Generator[FakeOpenAIServer, None, None]:
+    """Run the fake server in a background thread and point OPENAI_BASE_URL / OPENAI_API_KEY at it."""
+    server = FakeOpenAIServer(latency, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    saved = {k: os.environ.get(k) for k in ("OPENAI_BASE_URL", "OPENAI_API_KEY")}
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per completion when no rate is set")
+    parser.add_argument("--first-token-s", type=float, default=0.05)
+    parser.add_argument("--tokens-per-s", type=float, default=None, help="generation speed; latency then grows with length")
+    parser.add_argument("--exercises", type=int, default=None)
+    parser.add_argument("--sets", type=int, default=3)
+    parser.add_argument("--body", default=None, help="file with a canned (or $templated) completion body")
+    args = parser.parse_args()
+    body = None
+    if args.body:
+        with open(args.body, encoding="utf-8") as f:
+            body = f.read()
+    server = FakeOpenAIServer(
+        args.latency,
+        exercises=args.exercises,
+        sets=args.sets,
+        first_token_s=args.first_token_s,
+        tokens_per_s=args.tokens_per_s,
+        body=body,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"OpenAI stand-in at {server.base_url}  (OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=sk-fake)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
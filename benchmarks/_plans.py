@@ -0,0 +1,66 @@
+"""
+Synthetic plans in the ai_client SCHEMA_BLOCK format (and to_compact() for COMPACT_SCHEMA_BLOCK)
+for benchmarks and the fake OpenAI server.
+"""
+
+from typing import Any, Dict, List
+
+MUSCLES = ["chest", "back", "quads", "hamstrings", "shoulders", "biceps", "triceps", "glutes"]
+
+
+def make_plan(days: int = 5, exercises: int = 6, sets: int = 4, owner_user_id: int = 1, title: str = "Bench Plan") -> Dict[str, Any]:
+    return {
+        "owner_user_id": owner_user_id,
+        "title": title,
+        "description": None,
+        "weeks": [{
+            "week_number": 1,
+            "days": [
+                {
+                    "day_of_week": d,
+                    "exercises": [
+                        {
+                            "name": f"Exercise D{d}E{p}",
+                            "muscle_group": MUSCLES[(d + p) % len(MUSCLES)],
+                            "equipment": "barbell" if p % 2 else "dumbbell",
+                            "position": p,
+                            "notes": None,
+                            "planned_sets": [
+                                {"set_number": s, "reps": 8 + s % 3, "weight": 40.0 + 5 * p, "rpe": None, "rest_seconds": 120}
+                                for s in range(1, sets + 1)
+                            ],
+                        }
+                        for p in range(1, exercises + 1)
+                    ],
+                }
+                for d in range(1, days + 1)
+            ],
+        }],
+    }
+
+
+def _set_spec(count: int, s: Dict[str, Any]) -> str:
+    spec = f"{count}x{s['reps']}@{s['rest_seconds']}"
+    return spec + (f"~{s['rpe']}" if s.get("rpe") is not None else "")
+
+
+def to_compact_day(day: Dict[str, Any]) -> Dict[str, Any]:
+    """A SCHEMA_BLOCK day in the ai_client COMPACT_SCHEMA_BLOCK format (weights are not carried)."""
+    exercises = []
+    for e in day["exercises"]:
+        groups: List[List[Any]] = []  # [count, set] for runs of identical sets
+        for s in e["planned_sets"]:
+            if groups and all(groups[-1][1].get(k) == s.get(k) for k in ("reps", "rest_seconds", "rpe")):
+                groups[-1][0] += 1
+            else:
+                groups.append([1, s])
+        specs = [_set_spec(count, s) for count, s in groups]
+        item = [e["name"], e["muscle_group"], e["equipment"], specs[0] if len(specs) == 1 else specs]
+        if e.get("notes"):
+            item.append(e["notes"])
+        exercises.append(item)
+    return {"d": day["day_of_week"], "ex": exercises}
+
+
+def to_compact(plan: Dict[str, Any]) -> Dict[str, Any]:
+    return {"days": [to_compact_day(day) for day in plan["weeks"][0]["days"]]}
@@ -0,0 +1,138 @@
+"""
+Single-flight coalescing of identical generate-plan requests (app/single_flight.py) against the
+local fake OpenAI server: a burst of identical requests from different owners (double clicks,
+several tabs) should cost one model call, each caller still getting a plan with its own owner,
+while different inputs run separately. The same holds for the SSE stream endpoint, where every
+caller gets all the events of the shared generation. Also checks that a failure reaches every
+waiter and that a caller going away does not cancel the shared call.
+
+Usage:
+  python benchmarks/bench_ai_coalescing.py [clients] [latency_s]
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from _common import ROOT, scratch_db  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import main  # type: ignore  # noqa: E402
+from app.single_flight import SingleFlight, ai_generation_flight  # type: ignore  # noqa: E402
+
+
+async def burst(clients: int, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def one(owner: int) -> Dict[str, Any]:
+        status, body = await call(
+            main.app, "POST", "/api/v2/ai/generate-plan", json_body={**payload, "owner_user_id": owner}, query={"refresh": 1}
+        )
+        return json.loads(body) if status == 200 else {"error": body.decode()}
+
+    return await asyncio.gather(*(one(owner) for owner in range(1, clients + 1)))
+
+
+async def stream_burst(clients: int, payload: Dict[str, Any]) -> List[List[Any]]:
+    """Events of each caller; the callers arrive while the first one is already streaming."""
+    async def one(owner: int, delay: float) -> List[Any]:
+        await asyncio.sleep(delay)
+        _, body = await call(
+            main.app, "POST", "/api/v2/ai/generate-plan/stream",
+            json_body={**payload, "owner_user_id": owner}, query={"refresh": 1},
+        )
+        events = []
+        for block in body.decode().split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+            if "event" in lines:
+                events.append((lines["event"], json.loads(lines["data"])))
+        return events
+
+    return await asyncio.gather(*(one(owner, 0.02 * owner) for owner in range(1, clients + 1)))
+
+
+async def run(clients: int, server) -> bool:
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    payload = {"experience": "novice", "days": 4, "equipment": ["barbell"], "priorities": []}
+    async with lifespan(main.app):
+        requests = server.stats["requests"]
+        t0 = time.perf_counter()
+        plans = await burst(clients, payload)
+        elapsed = time.perf_counter() - t0
+        print(f"{clients} identical requests in {elapsed:.2f}s, model calls={server.stats['requests'] - requests}")
+        check("identical burst makes one model call", server.stats["requests"] - requests == 1)
+        check(
+            "every caller gets its own owner on the same plan",
+            [p.get("owner_user_id") for p in plans] == list(range(1, clients + 1))
+            and all(p["weeks"] == plans[0]["weeks"] for p in plans),
+        )
+        requests = server.stats["requests"]
+        await asyncio.gather(burst(clients, payload), burst(clients, {**payload, "days": 5}))
+        check("different inputs are not coalesced", server.stats["requests"] - requests == 2)
+        stats = ai_generation_flight.snapshot()
+        status, body = await call(main.app, "GET", "/api/v2/ai/coalescing/stats")
+        check("stats endpoint", status == 200 and json.loads(body)["coalesced"] == stats["coalesced"] == 3 * (clients - 1))
+        print(f"  {stats}")
+
+        requests, coalesced = server.stats["requests"], stats["coalesced"]
+        streams = await stream_burst(clients, payload)
+        plans = [next((data for name, data in events if name == "plan"), {}) for events in streams]
+        check("identical streams make one model call", server.stats["requests"] - requests == 1)
+        check(
+            "every stream gets all events and its own owner",
+            [p.get("owner_user_id") for p in plans] == list(range(1, clients + 1))
+            and all(events[:-1] == streams[0][:-1] for events in streams)
+            and [data["day"] for name, data in streams[0] if name == "day"] == plans[0]["weeks"][0]["days"],
+        )
+        check("streams are counted as coalesced", ai_generation_flight.snapshot()["coalesced"] - coalesced == clients - 1)
+
+    flight = SingleFlight()
+
+    async def boom() -> None:
+        await asyncio.sleep(0.05)
+        raise RuntimeError("model down")
+
+    results = await asyncio.gather(*(flight.do("k", boom) for _ in range(3)), return_exceptions=True)
+    check("failure reaches every waiter", all(isinstance(r, RuntimeError) for r in results) and flight.stats["failures"] == 1)
+    check("failed key is released", flight.snapshot()["in_flight"] == 0)
+
+    async def slow() -> str:
+        await asyncio.sleep(0.05)
+        return "plan"
+
+    leader = asyncio.ensure_future(flight.do("s", slow))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flight.do("s", slow))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    check("leader going away keeps the shared call", await follower == ("plan", True))
+    return failed
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    clients = int(args[0]) if len(args) > 0 else 8
+    latency = float(args[1]) if len(args) > 1 else 0.5
+
+    scratch_db()
+    # The endpoint prints a debug summary of every plan; keep it out of the report
+    with fake_openai(latency) as server, contextlib.redirect_stdout(io.StringIO()) as out:
+        failed = asyncio.run(run(clients, server))
+    print("\n".join(line for line in out.getvalue().splitlines() if not line.startswith(("DEBUG", "  T", "  W", "  F", "    "))))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,140 @@
+"""
+Compact vs full-schema model output (AI_OUTPUT_FORMAT in app/ai_client.py) against the local fake
+OpenAI server, whose response time grows with the completion length (chars_per_s). Reports the
+completion size (characters, and tokens as the fake server's usage counts them: ~4 chars each),
+the max_tokens budget sent, and wall time per format and days per week. Checks that both formats
+give the same plan (weights aside: the compact format does not carry them), that the budget covers
+the completion, that expand_compact_plan inverts the compact encoding, and that the streaming
+endpoint emits the same events for compact output.
+
+Usage:
+  python benchmarks/bench_ai_compact.py [runs] [chars_per_s]
+"""
+
+import asyncio
+import contextlib
+import copy
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from _common import ROOT, scratch_db, percentile  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+from _plans import make_plan, to_compact  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import ai_client, main  # type: ignore  # noqa: E402
+
+FORMATS = ("schema", "compact")
+
+
+def payload(days: int) -> Dict[str, Any]:
+    return {"owner_user_id": 1, "experience": "novice", "days": days, "equipment": ["barbell"], "priorities": []}
+
+
+async def post(path: str, days: int, query: Dict[str, Any]) -> bytes:
+    status, body = await call(main.app, "POST", path, json_body=payload(days), query=query)
+    if status != 200:
+        raise RuntimeError(body.decode())
+    return body
+
+
+def without_weights(plan: Dict[str, Any]) -> Dict[str, Any]:
+    plan = copy.deepcopy(plan)
+    for day in plan["weeks"][0]["days"]:
+        for exercise in day["exercises"]:
+            for s in exercise["planned_sets"]:
+                s["weight"] = None
+    return plan
+
+
+def sse_events(body: bytes) -> List[Any]:
+    events = []
+    for block in body.decode().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def run(runs: int) -> bool:
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    async with lifespan(main.app):
+        for days in (3, 4, 5):
+            plans: Dict[str, Any] = {}
+            events: Dict[str, Any] = {}
+            sizes: Dict[str, int] = {}
+            times: Dict[str, List[float]] = {fmt: [] for fmt in FORMATS}
+            for fmt in FORMATS:
+                ai_client.AI_OUTPUT_FORMAT = fmt
+                raw = json.loads(await post("/api/v2/ai/generate-plan", days, {"raw": 1}))["raw"]
+                sizes[fmt] = len(raw)
+                for _ in range(runs):
+                    t0 = time.perf_counter()
+                    plans[fmt] = json.loads(await post("/api/v2/ai/generate-plan", days, {"refresh": 1}))
+                    times[fmt].append(time.perf_counter() - t0)
+                events[fmt] = sse_events(await post("/api/v2/ai/generate-plan/stream", days, {"refresh": 1}))
+            for fmt in FORMATS:
+                budget = ai_client.max_tokens_for(days, fmt)
+                print(
+                    f"{days} days  {fmt:<8} chars={sizes[fmt]:>6}  tokens~{sizes[fmt] // 4:>5}  "
+                    f"max_tokens={budget:>5}  p50={percentile(sorted(times[fmt]), 50):>6.2f}s"
+                )
+            print(f"{days} days  compact output is {sizes['compact'] / sizes['schema']:.0%} of the schema output")
+            check(f"{days} days: same plan in both formats", plans["compact"]["weeks"] == without_weights(plans["schema"])["weeks"])
+            check(f"{days} days: max_tokens covers the completion", all(sizes[f] // 4 < ai_client.max_tokens_for(days, f) for f in FORMATS))
+            check(
+                f"{days} days: stream events match the schema stream",
+                [name for name, _ in events["compact"]] == [name for name, _ in events["schema"]]
+                and events["compact"][-1][1]["weeks"] == plans["compact"]["weeks"],
+            )
+
+    plan = make_plan(4, 6, 4)
+    plan["weeks"][0]["days"][0]["exercises"][0]["notes"] = "pause reps"
+    plan["weeks"][0]["days"][1]["exercises"][0]["planned_sets"][2]["rpe"] = 8
+    expanded = ai_client.expand_compact_plan(to_compact(plan), owner_user_id=1, title="Bench Plan", description=None)
+    check("expand_compact_plan inverts the compact encoding", expanded == without_weights(plan))
+    check(
+        "set specs: ranges, rpe, missing rest",
+        ai_client.expand_sets(["2x8-10@90~7.5", "1x5"])
+        == [
+            {"set_number": 1, "reps": 8, "weight": None, "rpe": 7.5, "rest_seconds": 90},
+            {"set_number": 2, "reps": 8, "weight": None, "rpe": 7.5, "rest_seconds": 90},
+            {"set_number": 3, "reps": 5, "weight": None, "rpe": None, "rest_seconds": None},
+        ],
+    )
+    try:
+        ai_client.expand_sets("four sets of eight")
+        check("bad set spec is rejected", False)
+    except RuntimeError:
+        check("bad set spec is rejected", True)
+    return failed
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    runs = int(args[0]) if len(args) > 0 else 2
+    chars_per_s = float(args[1]) if len(args) > 1 else 4000.0
+
+    scratch_db()
+    print(f"fake OpenAI at {chars_per_s:.0f} chars/s")
+    # The endpoint prints a debug summary of every plan; keep it out of the report
+    with fake_openai(chars_per_s=chars_per_s), contextlib.redirect_stdout(io.StringIO()) as out:
+        failed = asyncio.run(run(runs))
+    print("\n".join(line for line in out.getvalue().splitlines() if not line.startswith(("DEBUG", "  "))))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
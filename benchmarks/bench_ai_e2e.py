@@ -0,0 +1,139 @@
+"""
+End-to-end AI plan path against the local OpenAI stand-in (_fake_openai): each client generates a
+plan (POST /api/v2/ai/generate-plan, refresh=1, its own description so nothing is cached or
+coalesced) and saves it (POST /api/v2/ai/save-plan), in a loop, at each concurrency level.
+Reports plans per second, generate / save / total latency percentiles, model calls in flight and
+tokens per second, and checks that every plan was saved with all its days.
+
+Usage:
+  python benchmarks/bench_ai_e2e.py [concurrency,...] [plans_per_client] [tokens_per_s] [mode]
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from _common import ROOT, db, scratch_db, percentile  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import main  # type: ignore  # noqa: E402
+from app.ai_telemetry import telemetry  # type: ignore  # noqa: E402
+from app.security import sign_token  # type: ignore  # noqa: E402
+
+DAYS = (3, 4, 5)
+
+
+def create_user() -> int:
+    with db.get_connection() as conn, db.transaction(conn) as cur:
+        cur.execute("INSERT INTO users(email, password_hash) VALUES('e2e@example.com', 'x')")
+        return cur.lastrowid
+
+
+async def client(n: int, plans: int, mode: str, cookies: Dict[str, str], samples: Dict[str, List[float]], errors: List[str]) -> None:
+    for i in range(plans):
+        days = DAYS[(n + i) % len(DAYS)]
+        payload = {
+            "owner_user_id": 1, "experience": "intermediate", "days": days, "equipment": ["barbell", "dumbbell"],
+            "priorities": ["chest"], "description": f"client {n} plan {i}",
+        }
+        t0 = time.perf_counter()
+        status, body = await call(
+            main.app, "POST", "/api/v2/ai/generate-plan", json_body=payload, query={"refresh": 1, "mode": mode}
+        )
+        t1 = time.perf_counter()
+        if status != 200:
+            errors.append(f"generate {status}: {body[:200]!r}")
+            continue
+        status, body = await call(main.app, "POST", "/api/v2/ai/save-plan", json_body=json.loads(body), cookies=cookies)
+        t2 = time.perf_counter()
+        if status != 200:
+            errors.append(f"save {status}: {body[:200]!r}")
+            continue
+        samples["generate"].append((t1 - t0) * 1000)
+        samples["save"].append((t2 - t1) * 1000)
+        samples["total"].append((t2 - t0) * 1000)
+
+
+async def run(concurrency: int, plans: int, mode: str, cookies: Dict[str, str]) -> Dict[str, Any]:
+    samples: Dict[str, List[float]] = {"generate": [], "save": [], "total": []}
+    errors: List[str] = []
+    async with lifespan(main.app):
+        telemetry.clear()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(client(n, plans, mode, cookies, samples, errors) for n in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+        calls = telemetry.snapshot()
+    return {"samples": samples, "errors": errors, "elapsed": elapsed, "calls": calls}
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    levels = [int(c) for c in args[0].split(",")] if len(args) > 0 else [1, 4, 16]
+    plans = int(args[1]) if len(args) > 1 else 3
+    tokens_per_s = float(args[2]) if len(args) > 2 else 1000.0
+    mode = args[3] if len(args) > 3 else "single"
+
+    scratch_db()
+    user_id = create_user()
+    cookies = {main.COOKIE_NAME: sign_token(user_id)}
+    print(f"mode={mode}, {plans} plans per client, stand-in at {tokens_per_s:.0f} tokens/s")
+    failed = False
+    saved_before = 0
+    for concurrency in levels:
+        # The endpoint prints a debug summary of every plan; keep it out of the report
+        with fake_openai(tokens_per_s=tokens_per_s) as server, contextlib.redirect_stdout(io.StringIO()):
+            result = asyncio.run(run(concurrency, plans, mode, cookies))
+            stats = dict(server.stats)
+        samples, calls = result["samples"], result["calls"]
+        done = len(samples["total"])
+        cols = "  ".join(
+            f"{step} p50={percentile(sorted(v), 50):>7.0f} p95={percentile(sorted(v), 95):>7.0f} max={max(v):>7.0f}ms"
+            for step, v in samples.items() if v
+        )
+        print(
+            f"c={concurrency:<3} {done / result['elapsed']:>6.2f} plans/s  {cols}  "
+            f"model in flight={stats['max_in_flight']}  {calls['completion_tokens'] / result['elapsed']:>7.0f} tokens/s"
+        )
+        for error in result["errors"][:3]:
+            print(f"  {error}")
+        with db.get_connection() as conn:
+            saved = conn.execute("SELECT COUNT(*) FROM program WHERE owner_user_id = ?", (user_id,)).fetchone()[0]
+            days = conn.execute(
+                """
+                SELECT COUNT(*) FROM program_day pd
+                JOIN program_week pw ON pw.id = pd.program_week_id
+                JOIN program p ON p.id = pw.program_id
+                WHERE p.owner_user_id = ? AND pw.week_number = 1
+                """,
+                (user_id,),
+            ).fetchone()[0]
+        expected = concurrency * plans
+        ok = done == expected and saved - saved_before == expected
+        saved_before = saved
+        print(f"{f'c={concurrency}: every plan generated and saved':<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+    expected_days = sum(DAYS[(n + i) % len(DAYS)] for c in levels for n in range(c) for i in range(plans))
+    ok = days == expected_days
+    print(f"{'saved programs have every generated day':<48} {'ok' if ok else 'FAIL'}")
+    failed = failed or not ok
+
+    # A canned body: the synthetic plan wrapped in prose, with a prompt field filled in
+    canned = "Here is your $days_per_week-day program:\n$plan\nGood luck!"
+    with fake_openai(tokens_per_s=tokens_per_s, body=canned) as server, contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(run(1, 1, mode, cookies))
+        sample = server.content({"messages": [{"role": "user", "content": "- days_per_week: 4\n"}]})
+    ok = not result["errors"] and sample.startswith("Here is your 4-day program:\n{")
+    print(f"{'templated body is filled in and parsed':<48} {'ok' if ok else 'FAIL'}")
+    return 1 if failed or not ok else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,127 @@
+"""
+AI plan generation under concurrency, against the local fake OpenAI server (_fake_openai):
+the old handler shape (new OpenAI client per call, blocking create() inside the async handler)
+vs the shipped one (shared pooled AsyncOpenAI, awaited). Fires `clients` generations at once
+while a probe keeps calling a cheap endpoint, and reports total time, probe latency, the worst
+event-loop stall and how many TCP connections the clients opened.
+
+Usage:
+  python benchmarks/bench_ai_generation.py [clients] [latency_s] [rounds]
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from _common import ROOT, scratch_db, seed_program, percentile  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from fastapi import Body, FastAPI  # noqa: E402
+from openai import OpenAI  # noqa: E402
+from app import ai_client, main  # type: ignore  # noqa: E402
+
+PAYLOAD = {"owner_user_id": 1, "experience": "novice", "days": 3, "equipment": ["barbell"], "priorities": []}
+
+
+def legacy_app() -> FastAPI:
+    """Old shape: a fresh client per call and a blocking request on the event loop."""
+    legacy = FastAPI(lifespan=main.lifespan)
+
+    @legacy.post("/api/v2/ai/generate-plan")
+    async def generate(payload: Dict[str, Any] = Body(...)):
+        client = OpenAI(api_key=os.environ["OPENAI_API_KEY"], base_url=os.environ["OPENAI_BASE_URL"])
+        request = ai_client._completion_request(
+            owner_user_id=int(payload["owner_user_id"]), title="Bench", description=None, experience="novice",
+            days_per_week=int(payload["days"]), equipment=[], priority=None, model=None,
+        )
+        response = client.chat.completions.create(**request)
+        return ai_client.parse_json(response.choices[0].message.content or "")
+
+    @legacy.get("/api/v2/programs/{program_id}/overview")
+    def overview(program_id: int):
+        return main.api_program_overview(program_id)
+
+    return legacy
+
+
+async def loop_lag_probe(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - t0 - interval)
+    return worst
+
+
+async def drive(app, program_id: int, clients: int, rounds: int) -> Dict[str, Any]:
+    probe_ms: List[float] = []
+    statuses: List[int] = []
+    stop = asyncio.Event()
+
+    async def generate(client: int) -> None:
+        # Distinct inputs per client and refresh=1: measure generation, not coalescing or the plan cache
+        payload = {**PAYLOAD, "description": f"client {client}"}
+        for _ in range(rounds):
+            status, _ = await call(app, "POST", "/api/v2/ai/generate-plan", json_body=payload, query={"refresh": 1})
+            statuses.append(status)
+
+    async def probe() -> None:
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await call(app, "GET", f"/api/v2/programs/{program_id}/overview")
+            probe_ms.append((time.perf_counter() - t0) * 1000)
+            await asyncio.sleep(0.01)
+
+    async with lifespan(app):
+        lag = asyncio.create_task(loop_lag_probe(stop))
+        prober = asyncio.create_task(probe())
+        t0 = time.perf_counter()
+        await asyncio.gather(*(generate(client) for client in range(clients)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await prober
+        worst_lag = await lag
+    probe_ms.sort()
+    return {
+        "elapsed": elapsed,
+        "ok": statuses.count(200),
+        "probe_p50": percentile(probe_ms, 50) if probe_ms else float("nan"),
+        "probe_max": probe_ms[-1] if probe_ms else float("nan"),
+        "probes": len(probe_ms),
+        "lag": worst_lag,
+    }
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    clients = int(args[0]) if len(args) > 0 else 10
+    latency = float(args[1]) if len(args) > 1 else 0.5
+    rounds = int(args[2]) if len(args) > 2 else 2
+
+    scratch_db()
+    program_id = seed_program(weeks=4)["program_id"]
+    print(f"{clients} concurrent clients x {rounds} generations, fake OpenAI latency {latency:.2f}s")
+    failed = False
+    for label, app in (("legacy (blocking, client per call)", legacy_app()), ("async pooled client", main.app)):
+        # The endpoint prints a debug summary of every plan; keep it out of the report
+        with fake_openai(latency) as server, contextlib.redirect_stdout(io.StringIO()):
+            result = asyncio.run(drive(app, program_id, clients, rounds))
+            stats = dict(server.stats)
+        print(
+            f"{label:<36} total={result['elapsed']:>6.2f}s  ok={result['ok']}/{clients * rounds}  "
+            f"probe p50={result['probe_p50']:>8.1f}ms max={result['probe_max']:>8.1f}ms (n={result['probes']})  "
+            f"loop stall={result['lag'] * 1000:>7.1f}ms  connections={stats['connections']}"
+        )
+        failed = failed or result["ok"] != clients * rounds
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
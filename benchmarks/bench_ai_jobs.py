@@ -0,0 +1,174 @@
+"""
+Background plan generation (generate-plan?async=1, app/ai_jobs.py) against the local fake OpenAI
+server: submit latency vs a blocking generate-plan call, a burst of jobs drained by at most
+AI_JOB_WORKERS concurrent model calls, wait / run time metrics, polling, jobs surviving an app
+restart, failures recorded on the job, and lease recovery: a job left running by a dead worker is
+requeued and runs once, one a live worker holds is left alone, and one out of attempts fails.
+
+Usage:
+  python benchmarks/bench_ai_jobs.py [jobs] [workers] [latency_s]
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from _common import ROOT, db, scratch_db, percentile  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import ai_jobs, main  # type: ignore  # noqa: E402
+
+
+def payload(i: int) -> Dict[str, Any]:
+    return {"owner_user_id": 1, "experience": "novice", "days": 3, "equipment": ["barbell"], "priorities": [], "description": f"job {i}"}
+
+
+async def submit(i: int) -> str:
+    status, body = await call(main.app, "POST", "/api/v2/ai/generate-plan", json_body=payload(i), query={"async": 1})
+    assert status == 202, body
+    return json.loads(body)["job_id"]
+
+
+async def poll(job_ids: List[str], timeout: float = 60.0) -> Dict[str, Dict[str, Any]]:
+    deadline = time.perf_counter() + timeout
+    jobs: Dict[str, Dict[str, Any]] = {}
+    while time.perf_counter() < deadline:
+        for job_id in job_ids:
+            _, body = await call(main.app, "GET", f"/api/v2/ai/jobs/{job_id}")
+            jobs[job_id] = json.loads(body)
+        if all(j["status"] in ("done", "failed") for j in jobs.values()):
+            break
+        await asyncio.sleep(0.05)
+    return jobs
+
+
+async def run(count: int, server) -> bool:
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    workers = ai_jobs.job_queue.workers
+    async with lifespan(main.app):
+        t0 = time.perf_counter()
+        await call(main.app, "POST", "/api/v2/ai/generate-plan", json_body=payload(-1), query={"refresh": 1})
+        blocking = (time.perf_counter() - t0) * 1000
+
+        submit_ms: List[float] = []
+        job_ids = []
+        server.stats["max_in_flight"] = 0
+        t0 = time.perf_counter()
+        for i in range(count):
+            t1 = time.perf_counter()
+            job_ids.append(await submit(i))
+            submit_ms.append((time.perf_counter() - t1) * 1000)
+        jobs = await poll(job_ids)
+        drained = time.perf_counter() - t0
+        submit_ms.sort()
+        print(f"blocking generate-plan {blocking:>8.1f}ms   submit p50={percentile(submit_ms, 50):.2f}ms max={submit_ms[-1]:.2f}ms")
+        print(f"{count} jobs drained in {drained:.2f}s by {workers} workers")
+        check("every job done with its plan", all(j["status"] == "done" and j["result"]["weeks"] for j in jobs.values()))
+        check(f"at most {workers} generations at once", server.stats["max_in_flight"] == min(workers, count))
+        status, body = await call(main.app, "GET", "/api/v2/ai/jobs/stats")
+        stats = json.loads(body)
+        check("stats endpoint", status == 200 and stats["completed"] >= count and stats["queue_depth"] == 0)
+        print(f"  wait_s={stats['wait_s']}  run_s={stats['run_s']}")
+        status, _ = await call(main.app, "GET", "/api/v2/ai/jobs/unknown")
+        check("unknown job is 404", status == 404)
+
+        # Leave a burst queued / running when the app stops
+        pending = [await submit(count + i) for i in range(workers + 2)]
+        await asyncio.sleep(0.05)
+    with db.get_connection() as conn:
+        left = conn.execute("SELECT COUNT(*) FROM ai_generation_job WHERE status IN ('queued', 'running')").fetchone()[0]
+    async with lifespan(main.app):
+        jobs = await poll(pending)
+        check("unfinished jobs survive a restart", left == len(pending) and all(j["status"] == "done" for j in jobs.values()))
+
+    queue = ai_jobs.JobQueue(workers=1)
+
+    async def broken(inputs: Dict[str, Any], mode: str, refresh: bool) -> Dict[str, Any]:
+        raise RuntimeError("model down")
+
+    await queue.start(broken)
+    job_id = await queue.submit({"owner_user_id": 1}, "single")
+    for _ in range(100):
+        job = queue.get(job_id)
+        if job["status"] == "failed":
+            break
+        await asyncio.sleep(0.02)
+    await queue.stop()
+    check("failures are recorded on the job", job["status"] == "failed" and "model down" in job["error"])
+
+    await recovery(check)
+    return failed
+
+
+def leave_running(job_id: str, worker: str, lease_expires_at: float, attempts: int) -> None:
+    """A job row as a worker that claimed it leaves it: running, leased until `lease_expires_at`."""
+    now = time.time()
+    with db.get_connection() as conn, db.transaction(conn) as cur:
+        cur.execute(
+            """
+            INSERT INTO ai_generation_job(id, owner_user_id, status, mode, inputs_json, attempts,
+                created_at, started_at, claimed_by, lease_expires_at)
+            VALUES(?, 1, 'running', 'single', '{}', ?, ?, ?, ?, ?)
+            """,
+            (job_id, attempts, now - 60, now - 60, worker, lease_expires_at),
+        )
+
+
+async def recovery(check) -> None:
+    now = time.time()
+    leave_running("dead", "dead-host:1:0", now - 1, 1)
+    leave_running("alive", "sibling-host:2:0", now + 3600, 1)
+    leave_running("exhausted", "dead-host:1:0", now - 1, ai_jobs.AI_JOB_MAX_ATTEMPTS)
+    runs: List[str] = []
+
+    async def runner(inputs: Dict[str, Any], mode: str, refresh: bool) -> Dict[str, Any]:
+        runs.append(mode)
+        return {"weeks": []}
+
+    queue = ai_jobs.JobQueue(workers=2)
+    await queue.start(runner)
+    for _ in range(100):
+        if queue.get("dead")["status"] == "done":
+            break
+        await asyncio.sleep(0.02)
+    await asyncio.sleep(0.1)
+    await queue.stop()
+    dead, alive, exhausted = queue.get("dead"), queue.get("alive"), queue.get("exhausted")
+    check(
+        "dead worker's job is requeued and runs once",
+        dead["status"] == "done" and dead["attempts"] == 2 and runs == ["single"] and queue.stats["recovered"] == 1,
+    )
+    check("live worker's leased job is left alone", alive["status"] == "running" and alive["attempts"] == 1)
+    check("job out of attempts is marked failed", exhausted["status"] == "failed" and "abandoned" in exhausted["error"])
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    count = int(args[0]) if len(args) > 0 else 8
+    ai_jobs.job_queue.workers = int(args[1]) if len(args) > 1 else 2
+    latency = float(args[2]) if len(args) > 2 else 0.3
+
+    scratch_db()
+    # The endpoint prints a debug summary of every plan; keep it out of the report
+    with fake_openai(latency) as server, contextlib.redirect_stdout(io.StringIO()) as out:
+        failed = asyncio.run(run(count, server))
+    print("\n".join(line for line in out.getvalue().splitlines() if not line.startswith(("DEBUG", "  T", "  We", "  F", "    "))))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
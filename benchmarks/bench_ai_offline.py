@@ -0,0 +1,161 @@
+"""
+Offline rule-based plan generation (app/offline_generator.py): generation time, the SCHEMA_BLOCK
+shape and SYSTEM_PROMPT rules over every experience x days x equipment x priority combination,
+determinism, and the generate-plan fallbacks: no OPENAI_API_KEY, a model slower than the attempt
+deadline (local fake OpenAI server), an unreachable server, and AI_OFFLINE_FALLBACK=0.
+
+Usage:
+  python benchmarks/bench_ai_offline.py [runs]
+"""
+
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import socket
+import sys
+import time
+from typing import Any, Dict, List
+
+from _common import ROOT, scratch_db, percentile  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import ai_client, ai_resilience, main, offline_generator  # type: ignore  # noqa: E402
+
+PLAN_KEYS = ["owner_user_id", "title", "description", "weeks"]
+EXERCISE_KEYS = ["name", "muscle_group", "equipment", "position", "notes", "planned_sets"]
+SET_KEYS = ["set_number", "reps", "weight", "rpe", "rest_seconds"]
+EQUIPMENT = ([], ["barbell"], ["dumbbell"], ["machine"], ["barbell", "dumbbell", "machine"])
+PRIORITIES = (None, "chest", "legs, arms", "core")
+
+
+def rule_violations(plan: Dict[str, Any], experience: str, days: int, equipment: List[str], priority: Any) -> List[str]:
+    problems = []
+    if list(plan) != PLAN_KEYS or [list(w) for w in plan["weeks"]] != [["week_number", "days"]]:
+        problems.append("plan keys")
+    plan_days = plan["weeks"][0]["days"]
+    if len(plan_days) != days or len({d["day_of_week"] for d in plan_days}) != days:
+        problems.append("day count")
+    available = offline_generator._available_equipment(equipment)
+    low, high = offline_generator.SETS_BY_EXPERIENCE[experience]
+    priorities = offline_generator._priority_muscles(priority)
+    for day in plan_days:
+        exercises = day["exercises"]
+        if len(exercises) != offline_generator.exercises_per_day(days):
+            problems.append(f"day {day['day_of_week']}: {len(exercises)} exercises")
+        if len({e["name"].lower() for e in exercises}) != len(exercises):
+            problems.append(f"day {day['day_of_week']}: repeated exercise")
+        for position, ex in enumerate(exercises, start=1):
+            if list(ex) != EXERCISE_KEYS or any(list(s) != SET_KEYS for s in ex["planned_sets"]):
+                problems.append("exercise keys")
+            if ex["position"] != position or [s["set_number"] for s in ex["planned_sets"]] != list(range(1, len(ex["planned_sets"]) + 1)):
+                problems.append("numbering")
+            if ex["equipment"] not in available:
+                problems.append(f"{ex['name']}: {ex['equipment']} not available")
+            if ex["muscle_group"] in offline_generator.OPTIONAL_MUSCLES and ex["muscle_group"] not in priorities:
+                problems.append(f"{ex['name']}: {ex['muscle_group']} without priority")
+            bonus = 1 if ex["muscle_group"] in priorities else 0
+            if not low <= len(ex["planned_sets"]) <= min(high + bonus, 5):
+                problems.append(f"{ex['name']}: {len(ex['planned_sets'])} sets")
+    return problems
+
+
+async def generate(query: Dict[str, Any]) -> Any:
+    payload = {"owner_user_id": 1, "experience": "6_12", "days": 4, "equipment": ["barbell"], "priorities": ["back"]}
+    return await call(main.app, "POST", "/api/v2/ai/generate-plan", json_body=payload, query={"refresh": 1, **query})
+
+
+def closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def fallbacks(check) -> None:
+    saved = {k: os.environ.get(k) for k in ("OPENAI_API_KEY", "OPENAI_BASE_URL")}
+    timeout, retries = ai_resilience.AI_ATTEMPT_TIMEOUT_S, ai_resilience.AI_RETRIES
+    try:
+        os.environ.pop("OPENAI_API_KEY", None)
+        async with lifespan(main.app):
+            status, body = await generate({})
+            check("no API key: offline plan", status == 200 and json.loads(body)["weeks"][0]["days"])
+            status, body = await generate({"mode": "offline"})
+            check("mode=offline", status == 200 and json.loads(body)["title"].startswith("Intermediate 4Day"))
+
+        ai_resilience.AI_ATTEMPT_TIMEOUT_S, ai_resilience.AI_RETRIES = 0.3, 0
+        with fake_openai(2.0):
+            async with lifespan(main.app):
+                t0 = time.perf_counter()
+                status, body = await generate({})
+                elapsed = time.perf_counter() - t0
+            check(f"model timeout: offline plan in {elapsed:.2f}s", status == 200 and elapsed < 1.0)
+
+        os.environ.update(OPENAI_API_KEY="sk-fake", OPENAI_BASE_URL=f"http://127.0.0.1:{closed_port()}/v1")
+        async with lifespan(main.app):
+            status, _ = await generate({})
+            check("unreachable server: offline plan", status == 200)
+            ai_client.AI_OFFLINE_FALLBACK = False
+            status, _ = await generate({})
+            ai_client.AI_OFFLINE_FALLBACK = True
+            check("AI_OFFLINE_FALLBACK=0: error instead", status == 400)
+            status, body = await call(main.app, "GET", "/api/v2/ai/offline/stats")
+            stats = json.loads(body)
+            check("stats count each reason", stats["requested"] == 1 and stats["fallback_no_key"] == 1 and stats["fallback_unreachable"] == 2)
+            print(f"  {stats}")
+    finally:
+        ai_resilience.AI_ATTEMPT_TIMEOUT_S, ai_resilience.AI_RETRIES = timeout, retries
+        ai_resilience.policy.clear()
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def main_() -> int:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    scratch_db()
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    kwargs = dict(owner_user_id=1, title="Offline", description=None, experience="intermediate", days_per_week=5, equipment=[], priority="legs")
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        offline_generator.generate_weekly_program_offline(**kwargs)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    print(f"offline generation (incl. catalog read) p50={percentile(samples, 50):.3f}ms  max={samples[-1]:.3f}ms  (n={runs})")
+
+    problems = []
+    combos = list(itertools.product(offline_generator.SETS_BY_EXPERIENCE, range(1, 8), EQUIPMENT, PRIORITIES))
+    catalog = offline_generator.load_catalog()
+    for experience, days, equipment, priority in combos:
+        plan = offline_generator.generate_weekly_program_offline(
+            owner_user_id=1, title="t", description=None, experience=experience, days_per_week=days,
+            equipment=equipment, priority=priority, catalog=catalog,
+        )
+        problems += [f"{experience}/{days}/{equipment}/{priority}: {p}" for p in rule_violations(plan, experience, days, equipment, priority)]
+    check(f"schema and rules hold for {len(combos)} combinations", not problems)
+    for p in problems[:5]:
+        print(f"  {p}")
+    check("deterministic", offline_generator.generate_weekly_program_offline(**kwargs) == offline_generator.generate_weekly_program_offline(**kwargs))
+
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        asyncio.run(fallbacks(check))
+    print("\n".join(line for line in out.getvalue().splitlines() if not line.startswith(("DEBUG", "  T", "  We", "  F", "    "))))
+    failed = failed or "FAIL" in out.getvalue()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,111 @@
+"""
+Single-completion vs fan-out/fan-in (app/plan_parallel.py) plan generation against the local fake
+OpenAI server, whose response time grows with the completion length (chars_per_s). Reports wall
+time per mode and days per week, checks the parallel plan matches the single one, that at most
+AI_DAY_PARALLELISM days are generated at once, and that merge_days repairs or rejects
+inconsistent days.
+
+Usage:
+  python benchmarks/bench_ai_parallel.py [runs] [chars_per_s] [max_parallel]
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from _common import ROOT, scratch_db, percentile  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import main, plan_parallel  # type: ignore  # noqa: E402
+
+
+async def generate(days: int, mode: str) -> Dict[str, Any]:
+    payload = {"owner_user_id": 1, "experience": "novice", "days": days, "equipment": ["barbell"], "priorities": []}
+    status, body = await call(main.app, "POST", "/api/v2/ai/generate-plan", json_body=payload, query={"mode": mode, "refresh": 1})
+    if status != 200:
+        raise RuntimeError(body.decode())
+    return json.loads(body)
+
+
+def check_merge(check) -> None:
+    skeleton = [{"day_of_week": 1, "focus": ["chest"]}, {"day_of_week": 3, "focus": ["back"]}]
+    bench = {"name": "Bench Press", "muscle_group": "chest", "equipment": "barbell", "position": 4, "planned_sets": [{"set_number": 3, "reps": 8}]}
+    days = [
+        {"day_of_week": 2, "exercises": [bench, dict(bench), {**bench, "name": "Fly", "planned_sets": []}]},
+        {"day_of_week": 3, "exercises": [{**bench, "muscle_group": "pecs", "equipment": "smith"}]},
+    ]
+    plan = plan_parallel.merge_days(skeleton, days, owner_user_id=1, title="t", description=None)
+    merged = plan["weeks"][0]["days"]
+    check(
+        "merge repairs numbering, repeats, cross-day drift",
+        [d["day_of_week"] for d in merged] == [1, 3]
+        and [len(d["exercises"]) for d in merged] == [1, 1]
+        and merged[0]["exercises"][0]["position"] == 1
+        and merged[0]["exercises"][0]["planned_sets"][0]["set_number"] == 1
+        and merged[1]["exercises"][0]["muscle_group"] == "chest"
+        and merged[1]["exercises"][0]["equipment"] == "barbell",
+    )
+    rejected = 0
+    for bad in ([days[0]], [days[0], {"day_of_week": 3, "exercises": []}]):
+        try:
+            plan_parallel.merge_days(skeleton, bad, owner_user_id=1, title="t", description=None)
+        except RuntimeError:
+            rejected += 1
+    check("merge rejects missing and empty days", rejected == 2)
+
+
+async def run(runs: int, server) -> bool:
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    async with lifespan(main.app):
+        for days in (3, 4, 5):
+            times: Dict[str, List[float]] = {"single": [], "parallel": []}
+            plans: Dict[str, Any] = {}
+            for _ in range(runs):
+                for mode in times:
+                    server.stats["max_in_flight"] = 0
+                    t0 = time.perf_counter()
+                    plans[mode] = await generate(days, mode)
+                    times[mode].append(time.perf_counter() - t0)
+            single, parallel = (percentile(sorted(times[m]), 50) for m in ("single", "parallel"))
+            print(f"{days} days  single p50={single:>6.2f}s  parallel p50={parallel:>6.2f}s  speedup={single / parallel:>4.1f}x")
+            check(f"{days} days: parallel plan matches single", plans["parallel"]["weeks"] == plans["single"]["weeks"])
+            check(
+                f"{days} days: at most {plan_parallel.AI_DAY_PARALLELISM} days in flight",
+                server.stats["max_in_flight"] == min(days, plan_parallel.AI_DAY_PARALLELISM),
+            )
+    check_merge(check)
+    return failed
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    runs = int(args[0]) if len(args) > 0 else 2
+    chars_per_s = float(args[1]) if len(args) > 1 else 4000.0
+    if len(args) > 2:
+        plan_parallel.AI_DAY_PARALLELISM = int(args[2])
+
+    scratch_db()
+    print(f"fake OpenAI at {chars_per_s:.0f} chars/s, AI_DAY_PARALLELISM={plan_parallel.AI_DAY_PARALLELISM}")
+    # The endpoint prints a debug summary of every plan; keep it out of the report
+    with fake_openai(chars_per_s=chars_per_s) as server, contextlib.redirect_stdout(io.StringIO()) as out:
+        failed = asyncio.run(run(runs, server))
+    print("\n".join(line for line in out.getvalue().splitlines() if not line.startswith(("DEBUG", "  "))))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
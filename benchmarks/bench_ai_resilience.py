@@ -0,0 +1,221 @@
+"""
+Timeouts, retries, hedging and the circuit breaker of app/ai_resilience.py against the local
+OpenAI stand-in (_fake_openai), through POST /api/v2/ai/generate-plan: 5xx answers are retried,
+a stream is retried until it starts, a stalled completion is abandoned at its deadline, hedging
+cuts the tail when some completions stall, repeated failures open the breaker (the fallback
+generator answers without calling the model, AI_FALLBACK_GENERATOR picks it), a probe closes
+it again and a cancelled probe does not leave it stuck half open. Also reports the cost of the policy around an attempt.
+
+Usage:
+  python benchmarks/bench_ai_resilience.py [requests] [stall_every] [stall_s] [iterations]
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from _common import ROOT, scratch_db, percentile  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+from _plans import make_plan  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import ai_client, ai_resilience, main, offline_generator  # type: ignore  # noqa: E402
+from app.ai_telemetry import AICall, telemetry  # type: ignore  # noqa: E402
+
+policy = ai_resilience.policy
+PAYLOAD = {"owner_user_id": 1, "experience": "novice", "days": 3, "equipment": ["barbell"], "priorities": []}
+
+
+def canned_plan(**inputs: Any) -> Dict[str, Any]:
+    """Stand-in AI_FALLBACK_GENERATOR."""
+    return make_plan(inputs["days_per_week"], 7, 2, owner_user_id=inputs["owner_user_id"], title="Canned fallback")
+
+
+async def generate() -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    status, body = await call(main.app, "POST", "/api/v2/ai/generate-plan", json_body=PAYLOAD, query={"refresh": 1})
+    return {"status": status, "plan": json.loads(body), "ms": (time.perf_counter() - t0) * 1000}
+
+
+async def tail(server, requests: int, stall_every: int, stall_s: float) -> List[float]:
+    """Latencies of `requests` generations where every `stall_every`-th completion stalls."""
+    server.stall_s = stall_s
+    samples = []
+    for i in range(requests):
+        if i % stall_every == stall_every // 2:
+            server.stall_next = 1
+        result = await generate()
+        samples.append(result["ms"] if result["status"] == 200 else float("inf"))
+    return sorted(samples)
+
+
+async def run(server, requests: int, stall_every: int, stall_s: float) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    async with lifespan(main.app):
+        policy.clear()
+        telemetry.clear()
+        server.fail_next = 2
+        before = server.stats["requests"]
+        result = await generate()
+        out["retried"] = (result["status"], policy.stats["retries"], telemetry.snapshot()["retries"], server.stats["requests"] - before)
+
+        server.fail_next = 1
+        _, body = await call(main.app, "POST", "/api/v2/ai/generate-plan/stream", json_body=PAYLOAD, query={"refresh": 1})
+        out["stream_retried"] = (b"event: plan" in body, policy.stats["retries"])
+
+        ai_resilience.AI_ATTEMPT_TIMEOUT_S = 0.6
+        server.stall_s, server.stall_next = 3.0, 1
+        result = await generate()
+        ai_resilience.AI_ATTEMPT_TIMEOUT_S = None
+        out["deadline"] = (result["status"], result["ms"], policy.stats["timeouts"])
+
+        policy.clear()
+        out["plain"] = await tail(server, requests, stall_every, stall_s)
+        policy.clear()
+        ai_resilience.AI_HEDGE, ai_resilience.AI_HEDGE_MIN_SAMPLES = True, max(stall_every // 2 - 1, 1)
+        out["hedged"] = await tail(server, requests, stall_every, stall_s)
+        ai_resilience.AI_HEDGE = False
+        out["hedging"] = dict(policy.stats)
+
+        policy.clear()
+        ai_resilience.AI_RETRIES, ai_resilience.AI_BREAKER_FAILURES, ai_resilience.AI_BREAKER_RESET_S = 0, 3, 0.5
+        offline_generator.stats["fallback_unreachable"] = offline_generator.stats["fallback_circuit_open"] = 0
+        server.fail_next = 100
+        failing = [await generate() for _ in range(3)]
+        before = server.stats["requests"]
+        ai_resilience.AI_FALLBACK_GENERATOR = "__main__:canned_plan"
+        rejected = await generate()
+        ai_resilience.AI_FALLBACK_GENERATOR = "app.offline_generator:generate_weekly_program_offline"
+        out["breaker_open"] = {
+            "fallbacks": [r["status"] for r in failing],
+            "state": policy.breaker.snapshot(),
+            "rejected": rejected,
+            "server_calls": server.stats["requests"] - before,
+            "offline": dict(offline_generator.stats),
+        }
+        server.fail_next = 0
+        await asyncio.sleep(ai_resilience.AI_BREAKER_RESET_S)
+        probe = await generate()
+        out["breaker_closed"] = (probe["status"], probe["plan"].get("title"), policy.breaker.snapshot()["state"])
+        ai_resilience.AI_RETRIES, ai_resilience.AI_BREAKER_FAILURES, ai_resilience.AI_BREAKER_RESET_S = 2, 5, 30
+    return out
+
+
+async def cancelled_probe() -> Dict[str, Any]:
+    """Open breaker past its reset window; the probe is cancelled, then a healthy call comes in."""
+    async def slow(call: AICall) -> int:
+        await asyncio.sleep(10)
+        return 1
+
+    async def fast(call: AICall) -> int:
+        return 1
+
+    policy.clear()
+    breaker = policy.breaker
+    breaker.state, breaker.opened_at = "open", time.monotonic() - ai_resilience.AI_BREAKER_RESET_S
+    probe = asyncio.ensure_future(policy.run("bench", slow, call=AICall("bench", None), timeout_s=10))
+    await asyncio.sleep(0.05)
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+    try:
+        result = await policy.run("bench", fast, call=AICall("bench", None), timeout_s=10)
+    except ai_resilience.CircuitOpenError:
+        result = None
+    state = breaker.snapshot()["state"]
+    policy.clear()
+    return {"result": result, "state": state}
+
+
+async def overhead(iterations: int) -> Dict[str, float]:
+    async def attempt(call: AICall) -> int:
+        return 1
+
+    direct, wrapped = [], []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        await attempt(None)  # type: ignore[arg-type]
+        t1 = time.perf_counter()
+        await policy.run("bench", attempt, call=AICall("bench", None), timeout_s=10)
+        t2 = time.perf_counter()
+        direct.append((t1 - t0) * 1e6)
+        wrapped.append((t2 - t1) * 1e6)
+    return {"direct": percentile(sorted(direct), 50), "wrapped": percentile(sorted(wrapped), 50)}
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    requests = int(args[0]) if len(args) > 0 else 50
+    stall_every = int(args[1]) if len(args) > 1 else 25
+    stall_s = float(args[2]) if len(args) > 2 else 1.5
+    iterations = int(args[3]) if len(args) > 3 else 5000
+
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    scratch_db()
+    # The endpoint prints a debug summary of every plan; keep it out of the report
+    with fake_openai(0.2) as server, contextlib.redirect_stdout(io.StringIO()):
+        out = asyncio.run(run(server, requests, stall_every, stall_s))
+        server.fail_next = 1
+        policy.clear()
+        blocking = ai_client.generate_weekly_program(
+            owner_user_id=1, title="t", description=None, experience="novice", days_per_week=3, equipment=[], priority=None
+        )
+        blocking_retries = policy.stats["retries"]
+        ai_client.get_client().close()
+
+    print(f"{requests} generations, every {stall_every}th completion stalls {stall_s:g}s")
+    for label in ("plain", "hedged"):
+        v = out[label]
+        print(f"  {label:<7} p50={percentile(v, 50):>7.0f}  p95={percentile(v, 95):>7.0f}  p99={percentile(v, 99):>7.0f}  max={v[-1]:>7.0f}ms")
+    hedging = out["hedging"]
+    print(f"  hedges={hedging['hedges']} hedge_wins={hedging['hedge_wins']} attempts={hedging['attempts']}")
+
+    status, retries, recorded, sent = out["retried"]
+    check("5xx answers are retried", status == 200 and retries == 2 and recorded == 2 and sent == 3)
+    check("a stream is retried until it starts", out["stream_retried"] == (True, 3))
+    status, ms, timeouts = out["deadline"]
+    check(f"stalled completion abandoned ({ms:.0f}ms)", status == 200 and timeouts == 1 and ms < 1500)
+    stalls = len(range(stall_every // 2, requests, stall_every))
+    check(
+        "hedging cuts the stalled tail",
+        out["hedged"][-1] < stall_s * 1000 * 0.6 and out["plain"][-1] > stall_s * 1000
+        and hedging["hedge_wins"] >= stalls,
+    )
+    opened = out["breaker_open"]
+    check(
+        "failures open the breaker, fallback answers",
+        opened["fallbacks"] == [200, 200, 200] and opened["state"]["state"] == "open"
+        and opened["offline"]["fallback_unreachable"] == 3,
+    )
+    rejected = opened["rejected"]
+    check(
+        "open breaker skips the model",
+        rejected["status"] == 200 and opened["server_calls"] == 0 and opened["offline"]["fallback_circuit_open"] == 1,
+    )
+    check("AI_FALLBACK_GENERATOR is used", rejected["plan"]["title"] == "Canned fallback")
+    status, title, state = out["breaker_closed"]
+    check("a successful probe closes it", status == 200 and title != "Canned fallback" and state == "closed")
+    check("blocking client retries too", len(blocking["weeks"][0]["days"]) == 3 and blocking_retries == 1)
+
+    probe = asyncio.run(cancelled_probe())
+    check("a cancelled probe does not block the next call", probe == {"result": 1, "state": "closed"})
+
+    cost = asyncio.run(overhead(iterations))
+    print(f"policy around an attempt: p50={cost['wrapped']:.1f}us (bare attempt {cost['direct']:.1f}us)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
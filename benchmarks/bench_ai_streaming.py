@@ -0,0 +1,128 @@
+"""
+Time to first content for AI plan generation, against the local fake OpenAI server
+(_fake_openai, streaming at a fixed total latency): the buffered generate-plan endpoint vs the
+SSE generate-plan/stream endpoint. Reports time to first byte, first exercise, first day and the
+complete plan, and checks that the streamed plan equals the buffered one and every exercise and
+day arrived as its own event, also with mode=parallel (one completion per day).
+
+Usage:
+  python benchmarks/bench_ai_streaming.py [runs] [latency_s] [days]
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from _common import ROOT, scratch_db, percentile  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import main  # type: ignore  # noqa: E402
+
+
+def parse_sse(body: bytes) -> List[Any]:
+    events = []
+    for block in body.decode().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def buffered(payload: Dict[str, Any]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    status, body = await call(main.app, "POST", "/api/v2/ai/generate-plan", json_body=payload, query={"refresh": 1})
+    elapsed = (time.perf_counter() - t0) * 1000
+    return {"status": status, "first": elapsed, "exercise": elapsed, "day": elapsed, "done": elapsed, "plan": json.loads(body)}
+
+
+async def streamed(payload: Dict[str, Any], mode: str = "single") -> Dict[str, Any]:
+    marks: Dict[str, float] = {}
+    t0 = time.perf_counter()
+
+    def on_body(chunk: bytes) -> None:
+        now = (time.perf_counter() - t0) * 1000
+        marks.setdefault("first", now)
+        for name in ("exercise", "day"):
+            if f"event: {name}\n".encode() in chunk:
+                marks.setdefault(name, now)
+
+    status, body = await call(
+        main.app, "POST", "/api/v2/ai/generate-plan/stream", json_body=payload, query={"refresh": 1, "mode": mode}, on_body=on_body
+    )
+    marks["done"] = (time.perf_counter() - t0) * 1000
+    events = parse_sse(body)
+    plan = next((data for name, data in events if name == "plan"), None)
+    return {"status": status, **marks, "plan": plan, "events": events}
+
+
+async def run(runs: int, days: int) -> bool:
+    payload = {"owner_user_id": 1, "experience": "novice", "days": days, "equipment": ["barbell"], "priorities": []}
+    samples: Dict[str, Dict[str, List[float]]] = {"buffered": {}, "stream": {}}
+    last: Dict[str, Dict[str, Any]] = {}
+    async with lifespan(main.app):
+        for _ in range(runs):
+            for label, fn in (("buffered", buffered), ("stream", streamed)):
+                result = await fn(payload)
+                last[label] = result
+                for mark in ("first", "exercise", "day", "done"):
+                    samples[label].setdefault(mark, []).append(result.get(mark, float("nan")))
+        last["parallel"] = await streamed(payload, "parallel")
+    for label, marks in samples.items():
+        cols = "  ".join(f"{mark}={percentile(sorted(values), 50):>8.1f}ms" for mark, values in marks.items())
+        print(f"{label:<10} p50 {cols}")
+
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    plan, events = last["stream"]["plan"], last["stream"]["events"]
+    check("streamed plan equals the buffered plan", plan is not None and plan["weeks"] == last["buffered"]["plan"]["weeks"])
+    day_events = [data["day"] for name, data in events if name == "day"]
+    exercise_events = [data for name, data in events if name == "exercise"]
+    check("one event per day", plan is not None and day_events == plan["weeks"][0]["days"])
+    check(
+        "one event per exercise, tagged with its day",
+        plan is not None
+        and [(e["day_of_week"], e["exercise"]) for e in exercise_events]
+        == [(d["day_of_week"], ex) for d in plan["weeks"][0]["days"] for ex in d["exercises"]],
+    )
+    check("first exercise well before the full plan", last["stream"]["exercise"] < last["buffered"]["done"] / 2)
+
+    plan, events = last["parallel"]["plan"], last["parallel"]["events"]
+    day_events = sorted((data["day_index"], data["day"]) for name, data in events if name == "day")
+    check(
+        "parallel mode streams each day, then the plan",
+        plan is not None and [day for _, day in day_events] == plan["weeks"][0]["days"]
+        and events[-1][0] == "plan" and last["parallel"]["day"] < last["parallel"]["done"],
+    )
+    return failed
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    runs = int(args[0]) if len(args) > 0 else 3
+    latency = float(args[1]) if len(args) > 1 else 2.0
+    days = int(args[2]) if len(args) > 2 else 5
+
+    scratch_db()
+    print(f"{runs} runs, {days} days, fake OpenAI latency {latency:.1f}s")
+    # The endpoint prints a debug summary of every plan; keep it out of the report
+    with fake_openai(latency), contextlib.redirect_stdout(io.StringIO()) as out:
+        failed = asyncio.run(run(runs, days))
+    print("\n".join(line for line in out.getvalue().splitlines() if not line.startswith(("DEBUG", "  ", "    "))))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
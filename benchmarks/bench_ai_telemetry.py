@@ -0,0 +1,135 @@
+"""
+Model call telemetry (app/ai_telemetry.py) against the local fake OpenAI server: generations in
+single, parallel and streaming mode, a call the client retries and output that does not parse.
+Checks the counters and histograms on GET /api/v2/ai/metrics against the fake server's usage, that
+streams record time to first token, that every call lands in ai_call_log and the table stays
+within AI_TELEMETRY_MAX_ROWS, and reports the cost of recording one call.
+
+Usage:
+  python benchmarks/bench_ai_telemetry.py [iterations]
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict
+
+from _common import ROOT, db, scratch_db, percentile  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import ai_telemetry, main  # type: ignore  # noqa: E402
+
+telemetry = ai_telemetry.telemetry
+
+
+def payload(days: int) -> Dict[str, Any]:
+    return {"owner_user_id": 1, "experience": "novice", "days": days, "equipment": ["barbell"], "priorities": []}
+
+
+async def generate(days: int, **query: Any) -> int:
+    status, _ = await call(main.app, "POST", "/api/v2/ai/generate-plan", json_body=payload(days), query={"refresh": 1, **query})
+    return status
+
+
+async def run(server) -> Dict[str, Any]:
+    async with lifespan(main.app):
+        telemetry.clear()
+        await generate(3)
+        await generate(4, mode="parallel")
+        await call(main.app, "POST", "/api/v2/ai/generate-plan/stream", json_body=payload(5), query={"refresh": 1})
+        server.fail_next = 1
+        retried = await generate(3)
+        content = server.content
+        server.content = lambda request: "Sorry, I cannot help with that."
+        unparsed = await generate(4)
+        server.content = content
+        _, body = await call(main.app, "GET", "/api/v2/ai/metrics")
+    return {"metrics": json.loads(body), "retried": retried, "unparsed": unparsed}
+
+
+def report(result: Dict[str, Any], server, check) -> Dict[str, Any]:
+    metrics, retried, unparsed = result["metrics"], result["retried"], result["unparsed"]
+    calls = metrics["calls"]
+    print(
+        f"calls={calls['calls']} by_kind={calls['by_kind']} retries={calls['retries']} "
+        f"parse_failures={calls['parse_failures']} tokens={calls['prompt_tokens']}+{calls['completion_tokens']}"
+    )
+    for name, h in calls["histograms"].items():
+        print(f"  {name:<18} count={h['count']:>3}  mean={h['mean'] or 0:>9.3f}  p50<={h['p50']}  p95<={h['p95']}")
+    check("retried call succeeds", retried == 200)
+    check("unparseable output is a 400", unparsed == 400)
+    check("one record per model call", calls["by_kind"] == {"plan": 3, "skeleton": 1, "day": 4, "stream": 1})
+    check("retry counted", calls["retries"] == 1 and calls["errors"] == 0)
+    check("parse failure counted", calls["parse_failures"] == 1)
+    check("tokens match the server's usage", calls["completion_tokens"] == server.completion_tokens)
+    check("stream records time to first token", calls["histograms"]["ttft_s"]["count"] == 1)
+    check("cache and coalescing stats included", {"plan_cache", "coalescing", "offline"} <= set(metrics))
+    return calls
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    iterations = int(args[0]) if len(args) > 0 else 20000
+
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    scratch_db()
+    # The endpoint prints a debug summary of every plan; keep it out of the report
+    with fake_openai(0.2) as server, contextlib.redirect_stdout(io.StringIO()) as out:
+        completion_usage = server.usage
+        server.completion_tokens = 0
+
+        def usage(request, content):
+            result = completion_usage(request, content)
+            server.completion_tokens += result["completion_tokens"]
+            return result
+
+        server.usage = usage
+        result = asyncio.run(run(server))
+    print("\n".join(line for line in out.getvalue().splitlines() if not line.startswith(("DEBUG", "  "))))
+    calls = report(result, server, check)
+
+    with db.get_connection() as conn:
+        rows = conn.execute("SELECT COUNT(*) AS n, SUM(parse_failed) AS pf, SUM(retries) AS r FROM ai_call_log").fetchone()
+    check("every call lands in ai_call_log", (rows["n"], rows["pf"], rows["r"]) == (calls["calls"], 1, 1))
+    summary = telemetry.summary(3600)
+    check("log summary per kind and model", sum(r["calls"] for r in summary) == calls["calls"])
+
+    saved = ai_telemetry.AI_TELEMETRY_MAX_ROWS
+    ai_telemetry.AI_TELEMETRY_MAX_ROWS = 5
+    for _ in range(20):
+        with telemetry.call("bench", "fake") as c:
+            c.response()
+    telemetry.flush()
+    ai_telemetry.AI_TELEMETRY_MAX_ROWS = saved
+    with db.get_connection() as conn:
+        kept = conn.execute("SELECT COUNT(*) FROM ai_call_log").fetchone()[0]
+    check("table is pruned to AI_TELEMETRY_MAX_ROWS", kept == 5)
+
+    telemetry.clear()
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        with telemetry.call("bench", "fake") as c:
+            c.response()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    telemetry.clear()
+    samples.sort()
+    print(f"record one call: p50={percentile(samples, 50):.2f}us  p99={percentile(samples, 99):.2f}us")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,96 @@
+"""
+Latency of DB-bound endpoints under many parallel clients, and how long the event
+loop stalls meanwhile. Compares the shipped sync handlers (run in the threadpool)
+with the same handlers called inline from `async def` wrappers (the old behaviour).
+
+Usage:
+  python benchmarks/bench_concurrency.py [clients] [requests_per_client]
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+from _common import ROOT, scratch_db, seed_program, summarize, print_row  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from fastapi import FastAPI, Request  # noqa: E402
+from app import main  # type: ignore  # noqa: E402
+from app.security import sign_token  # type: ignore  # noqa: E402
+
+
+def inline_app() -> FastAPI:
+    """Old shape: async handlers that run the blocking sqlite3 code on the event loop."""
+    blocking = FastAPI(lifespan=main.lifespan)
+
+    @blocking.get("/api/v2/workouts/{workout_id}/session")
+    async def session(request: Request, workout_id: int):
+        return main.api_get_workout_session(request, workout_id)
+
+    @blocking.get("/api/v2/programs/{program_id}/weeks/{week_number}/days/{day_number}/status")
+    async def status(request: Request, program_id: int, week_number: int, day_number: int):
+        return main.api_get_day_status(request, program_id, week_number, day_number)
+
+    return blocking
+
+
+async def loop_lag_probe(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - t0 - interval)
+    return worst
+
+
+async def drive(app, ids, workout_id, clients: int, per_client: int):
+    cookies = {main.COOKIE_NAME: sign_token(ids["user_id"])}
+    program_id = ids["program_id"]
+    samples = []
+
+    async def client(n: int) -> None:
+        # Latency is measured from when the client *wanted* to send: the run start for
+        # the first request, then the previous response. Inline handlers that never
+        # yield would otherwise hide their queueing delay.
+        issued = start
+        for i in range(per_client):
+            if (n + i) % 2:
+                path = f"/api/v2/workouts/{workout_id}/session"
+            else:
+                path = f"/api/v2/programs/{program_id}/weeks/1/days/{1 + (n + i) % 5}/status"
+            status, _ = await call(app, "GET", path, cookies=cookies)
+            done = time.perf_counter()
+            samples.append((done - issued) * 1e6)
+            issued = done
+            assert status == 200, status
+
+    async with lifespan(app):
+        stop = asyncio.Event()
+        probe = asyncio.create_task(loop_lag_probe(stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(client(n) for n in range(clients)))
+        total = time.perf_counter() - start
+        stop.set()
+        lag = await probe
+    return summarize(samples, total), lag
+
+
+def main_() -> None:
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    scratch_db()
+    ids = seed_program()
+    workout_id = main.api_start_workout(ids["user_id"], ids["program_id"], 1, 1)["workout_id"]
+
+    for label, app in (("inline async handlers", inline_app()), ("threadpool sync handlers", main.app)):
+        stats, lag = asyncio.run(drive(app, ids, workout_id, clients, per_client))
+        print_row(f"{label} ({clients} clients)", stats)
+        print(f"{'':<40} throughput={stats['n'] / stats['total_s']:.0f} req/s  worst loop stall={lag * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,90 @@
+"""
+Trigger-maintained day_progress counters: set-logging cost with the triggers in place,
+single-day status latency, and a drift check (rebuild_day_progress must find nothing to repair
+after logging, re-logging in a second workout, re-pointing a set, adding planned sets and
+deleting a workout).
+
+Usage:
+  python benchmarks/bench_day_progress.py [iterations] [exercises] [sets]
+"""
+
+import sys
+
+from _common import db, scratch_db, seed_program, timed, print_row  # type: ignore
+
+from starlette.requests import Request  # noqa: E402
+from app import main, services  # type: ignore  # noqa: E402
+from app.security import sign_token  # type: ignore  # noqa: E402
+
+
+def auth_request(user_id: int) -> Request:
+    cookie = f"{main.COOKIE_NAME}={sign_token(user_id)}"
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [(b"cookie", cookie.encode())]})
+
+
+def log_day(ids, user_id: int, program_id: int, exercises: int, sets: int, logged_sets: int) -> int:
+    workout_id = services.start_workout(user_id, program_id, 1, 1)["id"]
+    for position in range(1, exercises + 1):
+        for set_number in range(1, logged_sets + 1):
+            planned_set_id = ids["planned_sets"][(position - 1) * sets + set_number - 1]
+            services.log_workout_set(workout_id, position, planned_set_id, set_number, 8, 60.0, None, 90)
+    return workout_id
+
+
+def main_() -> int:
+    args = [int(a) for a in sys.argv[1:]]
+    iterations, exercises, sets = (args + [2000, 6, 4][len(args):])[:3]
+
+    scratch_db()
+    ids = seed_program(days=1, exercises_per_day=exercises, sets_per_exercise=sets)
+    program_id, user_id = ids["program_id"], ids["user_id"]
+    request = auth_request(user_id)
+    failed = False
+
+    def check(label: str, expect_completed: int, expect_planned: int) -> None:
+        nonlocal failed
+        status = main.api_get_day_status(request, program_id, 1, 1)
+        drift = db.rebuild_day_progress()
+        ok = status["completed_sets"] == expect_completed and status["total_sets"] == expect_planned
+        ok = ok and drift["repaired"] == 0 and drift["removed"] == 0
+        print(f"{label:<40} completed={status['completed_sets']}/{status['total_sets']} rebuild={drift} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    log_day(ids, user_id, program_id, exercises, sets, sets // 2)
+    check("half the day logged", exercises * (sets // 2), exercises * sets)
+
+    second = log_day(ids, user_id, program_id, exercises, sets, sets)
+    check("second workout logs every set", exercises * sets, exercises * sets)
+
+    with db.get_connection() as conn, db.transaction(conn) as cur:
+        # Re-point the last logged set onto the same planned set: counters must not move
+        cur.execute(
+            "UPDATE workout_set SET planned_set_id = planned_set_id WHERE id = (SELECT MAX(id) FROM workout_set)"
+        )
+    check("no-op re-point", exercises * sets, exercises * sets)
+
+    services.add_planned_set(program_id, 1, 1, 1, sets + 1, 5, 80.0, None, None)
+    check("planned set added", exercises * sets, exercises * sets + 1)
+
+    with db.get_connection() as conn, db.transaction(conn) as cur:
+        cur.execute("DELETE FROM workout WHERE id = ?", (second,))
+    check("second workout deleted", exercises * (sets // 2), exercises * sets + 1)
+
+    with db.get_connection() as conn, db.transaction(conn) as cur:
+        cur.execute("UPDATE day_progress SET completed_sets = 0")
+    drift = db.rebuild_day_progress()
+    print(f"{'manual drift repaired':<40} rebuild={drift}")
+    failed = failed or drift["repaired"] != 1
+    check("after repair", exercises * (sets // 2), exercises * sets + 1)
+
+    print_row("api_get_day_status (day_progress)", timed(lambda: main.api_get_day_status(request, program_id, 1, 1), iterations))
+    print_row(
+        "start + log full day (triggers on)",
+        timed(lambda: log_day(ids, user_id, program_id, exercises, sets, sets), max(1, iterations // 100)),
+    )
+    print_row("rebuild_day_progress", timed(db.rebuild_day_progress, max(1, iterations // 100)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,97 @@
+"""
+Day completion status for a whole program: one request per day card (legacy follow-plan.html)
+vs the batch week / program status endpoints.
+Exits non-zero if a batch call issues more than one query or disagrees with the per-day endpoint.
+
+Usage:
+  python benchmarks/bench_day_status.py [iterations] [weeks] [days] [exercises] [sets]
+"""
+
+import sys
+from typing import List
+
+from _common import db, scratch_db, seed_program, timed, print_row  # type: ignore
+
+from starlette.requests import Request  # noqa: E402
+from app import main, services  # type: ignore  # noqa: E402
+from app.security import sign_token  # type: ignore  # noqa: E402
+
+MAX_QUERIES = 1
+
+
+def auth_request(user_id: int) -> Request:
+    cookie = f"{main.COOKIE_NAME}={sign_token(user_id)}"
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [(b"cookie", cookie.encode())]})
+
+
+def count_queries(fn) -> List[str]:
+    statements: List[str] = []
+    with db.get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            fn()
+        finally:
+            conn.set_trace_callback(None)
+    return [s for s in statements if not s.lstrip().startswith("--")]
+
+
+def main_() -> int:
+    args = [int(a) for a in sys.argv[1:]]
+    iterations, weeks, days, exercises, sets = (args + [200, 8, 5, 6, 4][len(args):])[:5]
+
+    scratch_db()
+    ids = seed_program(days=days, exercises_per_day=exercises, sets_per_exercise=sets, weeks=weeks)
+    program_id, user_id = ids["program_id"], ids["user_id"]
+    request = auth_request(user_id)
+
+    # Week 1: complete day 1, half of day 2
+    per_day = exercises * sets
+    for day_of_week, logged_sets in ((1, sets), (2, sets // 2)):
+        workout_id = main.api_start_workout(user_id, program_id, 1, day_of_week)["workout_id"]
+        first = (day_of_week - 1) * per_day
+        for position in range(1, exercises + 1):
+            for set_number in range(1, logged_sets + 1):
+                planned_set_id = ids["planned_sets"][first + (position - 1) * sets + set_number - 1]
+                services.log_workout_set(workout_id, position, planned_set_id, set_number, 8, 60.0, None, 90)
+
+    def per_day_calls() -> list:
+        return [
+            main.api_get_day_status(request, program_id, week_number, day_of_week)
+            for week_number in range(1, weeks + 1)
+            for day_of_week in range(1, days + 1)
+        ]
+
+    def batch_program() -> dict:
+        return main.api_get_program_status(request, program_id)
+
+    legacy = per_day_calls()
+    batch = batch_program()["days"]
+    failed = False
+    for old, new in zip(legacy, batch):
+        if (old["completed"], old["total_sets"], old["completed_sets"]) != (new["completed"], new["planned_sets"], new["completed_sets"]):
+            print(f"FAIL: mismatch {old} vs {new}")
+            failed = True
+    week1 = main.api_get_week_status(request, program_id, 1)["days"]
+    if not (week1[0]["completed"] and not week1[1]["completed"] and week1[1]["completion_percentage"] == 50):
+        print(f"FAIL: unexpected week 1 status {week1[:2]}")
+        failed = True
+
+    per_day_queries = count_queries(per_day_calls)
+    week_queries = count_queries(lambda: main.api_get_week_status(request, program_id, 1))
+    program_queries = count_queries(batch_program)
+    print(
+        f"{weeks} weeks x {days} days: per-day endpoint {weeks * days} requests / {len(per_day_queries)} queries, "
+        f"week status {len(week_queries)} query, program status {len(program_queries)} query"
+    )
+    print_row(f"per-day status x{weeks * days}", timed(per_day_calls, max(1, iterations // 10)))
+    print_row("program status (batch)", timed(batch_program, iterations))
+    print_row("week status (batch)", timed(lambda: main.api_get_week_status(request, program_id, 1), iterations))
+
+    if len(week_queries) > MAX_QUERIES or len(program_queries) > MAX_QUERIES:
+        print(f"FAIL: expected <= {MAX_QUERIES} queries per batch call")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,133 @@
+"""
+Connection-setup cost on the UserRepo/ProgramRepo/WorkoutRepo hot paths:
+per-call sqlite3.connect (legacy) vs the pooled, PRAGMA-tuned connections in app.db.
+Also checks that no more than DB_POOL_SIZE connections are checked out at once and that a
+thread waiting longer than DB_POOL_TIMEOUT_S gets an error.
+
+Usage:
+  python benchmarks/bench_db_pool.py [iterations]
+"""
+
+import sys
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from _common import db, scratch_db, seed_program, timed, print_row  # type: ignore
+
+from app.repo import UserRepo, ProgramRepo, WorkoutRepo  # type: ignore
+
+
+@contextmanager
+def legacy_connection():
+    # The pre-pool implementation: one connect + PRAGMA per repo call
+    conn = sqlite3.connect(str(db.DB_PATH))
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON;")
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def hot_paths(ids):
+    day_id = ids["days"][0]
+    pde_id = ids["pdes"][0]
+    ps_id = ids["planned_sets"][0]
+    state = {"set_number": 100}
+
+    def add_planned_set():
+        state["set_number"] += 1
+        ProgramRepo.add_planned_set(pde_id, state["set_number"], 8, 60.0, None, 90)
+
+    return [
+        ("UserRepo.get_by_id", lambda: UserRepo.get_by_id(ids["user_id"])),
+        ("ProgramRepo.get_week", lambda: ProgramRepo.get_week(ids["program_id"], 1)),
+        ("ProgramRepo.list_day_exercises", lambda: ProgramRepo.list_day_exercises(day_id)),
+        ("ProgramRepo.list_planned_sets", lambda: ProgramRepo.list_planned_sets(pde_id)),
+        ("WorkoutRepo.get_planned_set", lambda: WorkoutRepo.get_planned_set(ps_id)),
+        ("WorkoutRepo.planned_count_for_pde", lambda: WorkoutRepo.planned_count_for_pde(pde_id)),
+        ("ProgramRepo.add_planned_set (write)", add_planned_set),
+    ]
+
+
+def run(label, iterations):
+    ids = seed_program()
+    print(f"\n== {label} ==")
+    for name, fn in hot_paths(ids):
+        print_row(name, timed(fn, iterations))
+
+
+def bound(size: int = 4, threads: int = 12) -> bool:
+    """`threads` threads each holding a connection briefly through a pool of `size`."""
+    pool_size = db.DB_POOL_SIZE
+    pool = db.configure(pool_size=size)
+    lock = threading.Lock()
+    state = {"out": 0, "max_out": 0}
+
+    def hold() -> None:
+        with db.get_connection():
+            with lock:
+                state["out"] += 1
+                state["max_out"] = max(state["max_out"], state["out"])
+            time.sleep(0.02)
+            with lock:
+                state["out"] -= 1
+
+    workers = [threading.Thread(target=hold) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    ok = state["max_out"] <= size and pool.stats["opened"] <= size and pool.stats["waits"] > 0
+    print(f"\n{threads} threads, pool of {size}: at most {state['max_out']} checked out, {pool.stats['opened']} opened, {pool.stats['waits']} waits")
+
+    # Every connection held: the next thread gives up after DB_POOL_TIMEOUT_S
+    timeout, db.DB_POOL_TIMEOUT_S = db.DB_POOL_TIMEOUT_S, 0.05
+    held = threading.Barrier(size + 1)
+    release = threading.Event()
+
+    def occupy() -> None:
+        with db.get_connection():
+            held.wait()
+            release.wait()
+
+    holders = [threading.Thread(target=occupy) for _ in range(size)]
+    for t in holders:
+        t.start()
+    held.wait()
+    try:
+        with db.get_connection():
+            timed_out = False
+    except sqlite3.OperationalError:
+        timed_out = True
+    release.set()
+    for t in holders:
+        t.join()
+    db.DB_POOL_TIMEOUT_S = timeout
+    ok = ok and timed_out and pool.stats["timeouts"] == 1
+    print(f"{'pool bound and wait timeout':<48} {'ok' if ok else 'FAIL'}")
+    db.configure(pool_size=pool_size)
+    return ok
+
+
+def main() -> int:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    scratch_db("legacy.db")
+    pooled_get_connection = db.get_connection
+    db.get_connection = legacy_connection
+    try:
+        run("legacy: connect per call", iterations)
+    finally:
+        db.get_connection = pooled_get_connection
+
+    scratch_db("pooled.db")
+    run("pooled: WAL + tuned PRAGMAs", iterations)
+    print(f"\npool stats: {db.get_pool().stats}")
+    return 0 if bound() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Lazy plan storage: saving writes only week 1 and later weeks are written on first access.
+Compares save latency and rows written against "full" and "template" storage as the program
+gets longer, checks that each first-access path (week data, week status, starting a workout)
+writes the week with the values a full save would have, and that concurrent first access to
+the same week writes it exactly once.
+
+Usage:
+  python benchmarks/bench_lazy_weeks.py [runs] [threads] [days] [exercises] [sets]
+"""
+
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+from _common import ROOT, db, scratch_db, seed_program, percentile  # type: ignore
+from _plans import make_plan  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import main as app_main, plan_import, services  # type: ignore  # noqa: E402
+from app.program_tree import load_program_tree  # type: ignore  # noqa: E402
+
+
+def total_rows() -> int:
+    with db.get_connection() as conn:
+        return sum(
+            conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+            for t in ("program_week", "program_week_template", "program_day", "program_day_exercise", "planned_set")
+        )
+
+
+def week_view(program_id: int, week_number: int) -> List[Any]:
+    tree = load_program_tree(program_id)
+    week = next(w for w in tree["weeks"] if w["week_number"] == week_number)
+    return [
+        (d["day_of_week"], ex["position"], ex["name"], s["set_number"], s["reps"], s["weight"], s["rpe"], s["rest_seconds"])
+        for d in week["days"] for ex in d["exercises"] for s in ex["planned_sets"]
+    ]
+
+
+def week_rows(program_id: int, week_number: int) -> int:
+    with db.get_connection() as conn:
+        return conn.execute(
+            """
+            SELECT COUNT(*) FROM program_week pw
+            JOIN program_day pd ON pd.program_week_id = pw.id
+            JOIN program_day_exercise pde ON pde.program_day_id = pd.id
+            JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
+            WHERE pw.program_id = ? AND pw.week_number = ?
+            """,
+            (program_id, week_number),
+        ).fetchone()[0]
+
+
+def bench_save(user_id: int, plan: Dict[str, Any], storage: str, weeks: int, runs: int) -> None:
+    rows0 = total_rows()
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        plan_import.import_plan(user_id, plan, weeks=weeks, storage=storage)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    rows = (total_rows() - rows0) / runs
+    print(f"{storage:<9} {weeks:>3} weeks  save p50={percentile(samples, 50):>8.2f}ms  max={samples[-1]:>8.2f}ms  rows/plan={rows:>7.0f}")
+
+
+def main() -> int:
+    args = [int(a) for a in sys.argv[1:]]
+    runs, threads, days, exercises, sets = (args + [10, 8, 5, 6, 4][len(args):])[:5]
+    plan = make_plan(days, exercises, sets)
+    print(f"plan: {days} days x {exercises} exercises x {sets} sets")
+
+    scratch_db()
+    user_id = seed_program(days=1, exercises_per_day=1, sets_per_exercise=1)["user_id"]
+    for weeks in (8, 16, 52):
+        for storage in ("full", "template", "lazy"):
+            bench_save(user_id, plan, storage, weeks, runs)
+
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    full = plan_import.import_plan(user_id, plan, storage="full")
+    lazy = plan_import.import_plan(user_id, plan, storage="lazy")
+    per_week = days * exercises * sets
+    check("lazy save writes week 1 only", [w["week_number"] for w in load_program_tree(lazy)["weeks"]] == [1])
+    check("weeks_count reports the planned length", services.get_program_weeks_count(lazy)["weeks_count"] == plan_import.PROGRAM_WEEKS)
+    plan_import.import_plan(user_id, {**plan, "title": "Lazy legacy"}, storage="lazy")
+    check("legacy weeks endpoint reports it too", app_main.get_program_weeks("lazy legacy")["weeks_count"] == plan_import.PROGRAM_WEEKS)
+
+    services.get_program_week_data(lazy, 2)
+    check("week data access writes week 2", week_rows(lazy, 2) == per_week and week_view(lazy, 2) == week_view(full, 2))
+    status = services.get_days_status(lazy, user_id, week_number=3)
+    check("week status access writes week 3", len(status) == days and week_view(lazy, 3) == week_view(full, 3))
+    services.start_workout(user_id, lazy, 4, 1)
+    check("start_workout writes week 4", week_view(lazy, 4) == week_view(full, 4))
+    check("weeks past the plan stay missing", plan_import.ensure_week_materialized(lazy, plan_import.PROGRAM_WEEKS + 1) is None)
+
+    # Concurrent first access to the same week: one writer, everyone sees the same week
+    errors: List[BaseException] = []
+    barrier = threading.Barrier(threads)
+
+    def first_access(week_number: int) -> None:
+        try:
+            barrier.wait()
+            services.get_days_status(lazy, user_id, week_number=week_number)
+        except BaseException as e:  # noqa: BLE001
+            errors.append(e)
+
+    for week_number in range(5, plan_import.PROGRAM_WEEKS + 1):
+        workers = [threading.Thread(target=first_access, args=(week_number,)) for _ in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    check(
+        f"{threads} concurrent first accesses per week",
+        not errors and all(week_rows(lazy, n) == per_week for n in range(5, plan_import.PROGRAM_WEEKS + 1)),
+    )
+    if errors:
+        print(f"  first error: {errors[0]!r}")
+    check(
+        "every week matches the full save",
+        all(week_view(lazy, n) == week_view(full, n) for n in range(1, plan_import.PROGRAM_WEEKS + 1)),
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
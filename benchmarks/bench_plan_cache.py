@@ -0,0 +1,114 @@
+"""
+Generated plan cache (app/plan_cache.py) through the generate-plan endpoint, against the local
+fake OpenAI server: cold generation vs memory hit vs SQLite hit (after the in-memory LRU is
+dropped). Checks that a different owner / order of equipment hits, that different inputs and
+refresh=1 miss, and that TTL and row-limit eviction work.
+
+Usage:
+  python benchmarks/bench_plan_cache.py [runs] [latency_s]
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+from _common import ROOT, db, scratch_db, percentile  # type: ignore
+from _asgi import call, lifespan  # type: ignore
+from _fake_openai import fake_openai  # type: ignore
+
+os.chdir(ROOT)  # StaticFiles mount is relative to the repo root
+
+from app import main  # type: ignore  # noqa: E402
+from app.plan_cache import PlanCache, plan_cache  # type: ignore  # noqa: E402
+
+PAYLOAD = {"owner_user_id": 1, "experience": "6_12", "days": 4, "equipment": ["barbell", "dumbbell"], "priorities": ["chest"]}
+
+
+async def generate(payload: Dict[str, Any], **query: Any) -> Tuple[int, Dict[str, Any], float]:
+    t0 = time.perf_counter()
+    status, body = await call(main.app, "POST", "/api/v2/ai/generate-plan", json_body=payload, query=query or None)
+    return status, json.loads(body), (time.perf_counter() - t0) * 1000
+
+
+def report(label: str, samples: List[float]) -> None:
+    samples.sort()
+    print(f"{label:<28} p50={percentile(samples, 50):>8.2f}ms  max={samples[-1]:>8.2f}ms  (n={len(samples)})")
+
+
+async def run(runs: int, server) -> bool:
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    cold: List[float] = []
+    memory: List[float] = []
+    stored: List[float] = []
+    async with lifespan(main.app):
+        plan_cache.clear()
+        for i in range(runs):
+            payload = {**PAYLOAD, "description": f"variant {i}"}
+            cold.append((await generate(payload))[2])
+            memory.append((await generate(payload))[2])
+            with plan_cache._lock:
+                plan_cache._entries.clear()
+            stored.append((await generate(payload))[2])
+        report("cold (model call)", cold)
+        report("memory hit", memory)
+        report("sqlite hit", stored)
+
+        requests = server.stats["requests"]
+        _, first, _ = await generate(PAYLOAD)
+        _, other, _ = await generate({**PAYLOAD, "owner_user_id": 7, "equipment": ["Dumbbell", "barbell"]})
+        check("other owner / equipment order hits", server.stats["requests"] == requests + 1)
+        check("hit carries the caller's owner id", other.get("owner_user_id") == 7 and first.get("weeks") == other.get("weeks"))
+        await generate({**PAYLOAD, "days": 5})
+        check("different inputs miss", server.stats["requests"] == requests + 2)
+        await generate(PAYLOAD, refresh=1)
+        check("refresh=1 regenerates", server.stats["requests"] == requests + 3)
+
+        status, body = await call(main.app, "GET", "/api/v2/ai/plan-cache/stats")
+        stats = json.loads(body)
+        check("stats endpoint", status == 200 and stats["hits"] >= 2 * runs + 1 and stats["misses"] >= runs + 2)
+        print(f"  {stats}")
+
+    small = PlanCache(max_entries=2, ttl_s=3600, max_rows=3)
+    small.clear()
+    for i in range(5):
+        small.put(f"k{i}", {"n": i})
+    with db.get_connection() as conn:
+        keys = sorted(r[0] for r in conn.execute("SELECT key FROM ai_plan_cache"))
+    check("row limit keeps the newest rows", keys == ["k2", "k3", "k4"] and small.stats["evictions"] == 2)
+    check("memory LRU is bounded", len(small._entries) == 2 and small.get("k2") is not None)
+
+    expiring = PlanCache(ttl_s=0.05)
+    expiring.put("old", {"n": 1})
+    time.sleep(0.1)
+    check("expired entries miss", expiring.get("old") is None and expiring.stats["expired"] == 1)
+    return failed
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    runs = int(args[0]) if len(args) > 0 else 5
+    latency = float(args[1]) if len(args) > 1 else 0.3
+
+    scratch_db()
+    # The endpoint prints a debug summary of every plan; keep it out of the report
+    with fake_openai(latency) as server:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            failed = asyncio.run(run(runs, server))
+        print("\n".join(line for line in out.getvalue().splitlines() if not line.startswith(("DEBUG", "  Title", "  Weeks", "  First", "    Day"))))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
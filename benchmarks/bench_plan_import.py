@@ -0,0 +1,70 @@
+"""
+Saving an 8-week AI plan: the per-call path (ensure_week/ensure_day/create_exercise/
+add_day_exercise/add_planned_set, one commit each) vs the single-transaction
+executemany import in app.plan_import, in both storage modes.
+
+Usage:
+  python benchmarks/bench_plan_import.py [runs] [days] [exercises] [sets]
+"""
+
+import sys
+import time
+from typing import Any, Dict
+
+from _common import db, scratch_db, seed_program, percentile  # type: ignore
+from _plans import make_plan  # type: ignore
+
+from app import services, plan_import  # type: ignore
+
+
+def legacy_save(owner_user_id: int, plan: Dict[str, Any]) -> int:
+    """The pre-import-engine algorithm (minus debug prints)."""
+    program_id = services.create_program(owner_user_id, plan["title"], plan.get("description"))["id"]
+    days = plan["weeks"][0]["days"]
+    for week_number in range(1, 9):
+        services.ensure_week(program_id, week_number)
+        for day in days:
+            services.ensure_day(program_id, week_number, day["day_of_week"])
+            for ex in day["exercises"]:
+                try:
+                    exercise_id = services.create_exercise(owner_user_id, ex["name"], ex["muscle_group"], ex["equipment"], False)["id"]
+                except Exception:
+                    exercise_id = next(e for e in services.list_exercises(owner_user_id) if e["name"] == ex["name"])["id"]
+                services.add_day_exercise(program_id, week_number, day["day_of_week"], exercise_id, ex["position"], ex["notes"])
+                for s in ex["planned_sets"]:
+                    reps, weight = plan_import.week_progression(week_number, s["reps"], s["weight"])
+                    services.add_planned_set(program_id, week_number, day["day_of_week"], ex["position"], s["set_number"], reps, weight, s["rpe"], s["rest_seconds"])
+    return program_id
+
+
+def bench(label: str, save, owner_user_id: int, plan: Dict[str, Any], runs: int) -> None:
+    pool = db.get_pool()
+    commits0 = pool.stats["commits"]
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        save(owner_user_id, plan)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    commits = (pool.stats["commits"] - commits0) / runs
+    print(f"{label:<28} mean={sum(samples) / runs:>9.2f}ms  p50={percentile(samples, 50):>9.2f}ms  max={samples[-1]:>9.2f}ms  commits/save={commits:.0f}")
+
+
+def main() -> None:
+    args = [int(a) for a in sys.argv[1:]]
+    runs, days, exercises, sets = (args + [5, 5, 6, 4][len(args):])[:4]
+    plan = make_plan(days, exercises, sets)
+    print(f"plan: {days} days x {exercises} exercises x {sets} sets, 8 weeks")
+
+    scratch_db("legacy.db")
+    user_id = seed_program(days=1, exercises_per_day=1, sets_per_exercise=1)["user_id"]
+    bench("legacy per-call save", legacy_save, user_id, plan, runs)
+
+    scratch_db("bulk.db")
+    user_id = seed_program(days=1, exercises_per_day=1, sets_per_exercise=1)["user_id"]
+    bench("bulk import_plan (full)", lambda u, p: plan_import.import_plan(u, p, storage="full"), user_id, plan, runs)
+    bench("bulk import_plan (template)", lambda u, p: plan_import.import_plan(u, p, storage="template"), user_id, plan, runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Plan storage modes: "full" (8 materialized weeks) vs "template" (week 1 + per-week deltas,
+computed on read). Reports save latency, rows written and database growth per saved plan, and
+checks that every read path sees the same program: overview tree, day status, planned-set
+report, a workout session started on a derived day, and whole-program regeneration.
+
+Usage:
+  python benchmarks/bench_plan_storage.py [runs] [days] [exercises] [sets]
+"""
+
+import sys
+import time
+from typing import Any, Dict, List
+
+from _common import db, scratch_db, seed_program, percentile  # type: ignore
+from _plans import make_plan  # type: ignore
+
+from app import main as app_main, plan_import, services  # type: ignore  # noqa: E402
+from app.program_tree import load_program_tree  # type: ignore  # noqa: E402
+
+TABLES = ("program_week", "program_week_template", "program_day", "program_day_exercise", "planned_set")
+
+
+def row_counts() -> Dict[str, int]:
+    with db.get_connection() as conn:
+        return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in TABLES}
+
+
+def db_bytes() -> int:
+    with db.get_connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+def plan_view(program_id: int) -> List[Any]:
+    """The tree without ids / materialized flags: what a reader can observe."""
+    tree = load_program_tree(program_id)
+    return [
+        (w["week_number"], d["day_of_week"], ex["position"], ex["name"], s["set_number"], s["reps"], s["weight"], s["rpe"], s["rest_seconds"])
+        for w in tree["weeks"] for d in w["days"] for ex in d["exercises"] for s in ex["planned_sets"]
+    ]
+
+
+def session_view(workout_id: int) -> List[Any]:
+    session = services.load_workout_session(workout_id)
+    return [(ex["position"], s["set_number"], s["planned_reps"], s["planned_weight"]) for ex in session["exercises"] for s in ex["sets"]]
+
+
+def bench_save(storage: str, user_id: int, plan: Dict[str, Any], runs: int) -> List[int]:
+    rows0, size0 = row_counts(), db_bytes()
+    samples, program_ids = [], []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        program_ids.append(plan_import.import_plan(user_id, plan, storage=storage))
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    rows = sum(row_counts().values()) - sum(rows0.values())
+    growth = (db_bytes() - size0) / runs / 1024
+    print(
+        f"{storage:<10} save mean={sum(samples) / runs:>8.2f}ms  p50={percentile(samples, 50):>8.2f}ms  "
+        f"rows/plan={rows / runs:>7.0f}  db growth/plan={growth:>7.1f}KiB"
+    )
+    return program_ids
+
+
+def main() -> int:
+    args = [int(a) for a in sys.argv[1:]]
+    runs, days, exercises, sets = (args + [20, 5, 6, 4][len(args):])[:4]
+    plan = make_plan(days, exercises, sets)
+    print(f"plan: {days} days x {exercises} exercises x {sets} sets, {plan_import.PROGRAM_WEEKS} weeks")
+
+    scratch_db()
+    user_id = seed_program(days=1, exercises_per_day=1, sets_per_exercise=1)["user_id"]
+    full = bench_save("full", user_id, plan, runs)[0]
+    template = bench_save("template", user_id, plan, runs)[0]
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<44} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    def status(program_id: int) -> List[Any]:
+        return [(d["week_number"], d["day_number"], d["planned_sets"]) for d in services.get_days_status(program_id, user_id)]
+
+    check("overview tree identical", plan_view(full) == plan_view(template))
+    check("day status identical", status(full) == status(template))
+    check(
+        "planned-set report identical",
+        all(
+            services.report_total_planned_sets(full, n) == services.report_total_planned_sets(template, n)
+            for n in range(1, plan_import.PROGRAM_WEEKS + 1)
+        ),
+    )
+
+    for label, program_id in (("full", full), ("template", template)):
+        samples = []
+        for _ in range(runs * 10):
+            t0 = time.perf_counter()
+            load_program_tree(program_id)
+            samples.append((time.perf_counter() - t0) * 1000)
+        samples.sort()
+        print(f"{label:<10} uncached tree load p50={percentile(samples, 50):>8.3f}ms")
+
+    # Starting a workout materializes just that day, with the values the reader already saw
+    before = row_counts()["planned_set"]
+    sessions = [
+        session_view(app_main.api_start_workout(owner_user_id=user_id, program_id=p, week_number=3, day_of_week=2)["workout_id"])
+        for p in (full, template)
+    ]
+    check("derived-day session identical", sessions[0] == sessions[1] and len(sessions[0]) == exercises * sets)
+    check("start materializes one day", row_counts()["planned_set"] - before == exercises * sets)
+    check("tree unchanged by materialization", plan_view(full) == plan_view(template))
+
+    for program_id in (full, template):
+        services.regenerate_program_progression(program_id)
+    check("regenerated programs identical", plan_view(full) == plan_view(template))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Parsing and validation of model output (app/plan_validation.py): the single-pass parse_json vs
+the retry-based parser it replaced (up to four json.loads of the whole content) on clean,
+fenced and prose-wrapped plans, the cost of validate_generated_plan, and checks that it repairs
+what it can and names the path of everything it cannot.
+
+Usage:
+  python benchmarks/bench_plan_validation.py [iterations] [days] [exercises] [sets]
+"""
+
+import copy
+import json
+import sys
+import time
+from typing import Any, Callable, Dict
+
+from _common import percentile  # type: ignore
+from _plans import make_plan  # type: ignore
+
+from app.plan_validation import PlanValidationError, parse_json, validate_generated_plan  # type: ignore  # noqa: E402
+
+
+def legacy_parse(content: str) -> Dict[str, Any]:
+    """The previous ai_client._parse_json_strict."""
+    try:
+        return json.loads(content)
+    except Exception:
+        pass
+    s = content.strip()
+    if s.startswith("```") and s.endswith("```"):
+        lines = s.splitlines()
+        s = "\n".join(lines[1:-1]).strip()
+    if "{" in s and "}" in s:
+        try:
+            return json.loads(s[s.find("{"):s.rfind("}") + 1])
+        except Exception:
+            pass
+    try:
+        return json.loads(s.lstrip("﻿\n\r\t "))
+    except Exception as e:
+        raise RuntimeError(f"Failed to parse JSON from OpenAI: {e}")
+
+
+def timed(fn: Callable[[], Any], iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return percentile(sorted(samples), 50)
+
+
+def main_() -> int:
+    args = sys.argv[1:]
+    iterations = int(args[0]) if len(args) > 0 else 300
+    days = int(args[1]) if len(args) > 1 else 5
+    exercises = int(args[2]) if len(args) > 2 else 6
+    sets = int(args[3]) if len(args) > 3 else 4
+
+    plan = make_plan(days, exercises, sets)
+    text = json.dumps(plan, indent=2)
+    inputs = {
+        "clean": text,
+        "fenced": f"```json\n{text}\n```",
+        "prose": f"Here is your program:\n{text}\nLet me know if you want changes.",
+    }
+    print(f"{days} days x {exercises} exercises x {sets} sets, {len(text)} chars, {iterations} iterations")
+    for label, content in inputs.items():
+        old = timed(lambda: legacy_parse(content), iterations)
+        new = timed(lambda: parse_json(content), iterations)
+        print(f"{label:<8} legacy p50={old:>8.1f}us  single-pass p50={new:>8.1f}us  speedup={old / new:>4.1f}x")
+    validate = timed(lambda: validate_generated_plan(plan, owner_user_id=1, title="t", days_per_week=days), iterations)
+    print(f"validate_generated_plan p50={validate:>8.1f}us")
+
+    failed = False
+
+    def check(label: str, ok: bool) -> None:
+        nonlocal failed
+        print(f"{label:<48} {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+
+    check("every wrapping parses to the plan", all(parse_json(c) == plan for c in inputs.values()))
+    check("valid plan passes unchanged", validate_generated_plan(plan, owner_user_id=1, days_per_week=days) == plan)
+
+    messy = copy.deepcopy(plan)
+    day = messy["weeks"][0]["days"][0]
+    day["exercises"].append(copy.deepcopy(day["exercises"][0]))
+    for ex in day["exercises"]:
+        ex["position"] = 9
+    day["exercises"][1]["planned_sets"] = day["exercises"][1]["planned_sets"][:1]
+    day["exercises"][1]["planned_sets"][0].update(set_number=7, reps=None)
+    day["exercises"][2]["planned_sets"] *= 3
+    day["exercises"][3]["equipment"] = "none"
+    messy["weeks"][0]["days"][1]["day_of_week"] = 1
+    messy["weeks"][0]["days"].append({"day_of_week": 7, "exercises": []})
+    messy["owner_user_id"] = 99
+    repaired = validate_generated_plan(messy, owner_user_id=1, title="t", days_per_week=days)
+    fixed = repaired["weeks"][0]["days"]
+    check(
+        "repairs numbering, repeats, set counts, defaults",
+        repaired["owner_user_id"] == 1
+        and [d["day_of_week"] for d in fixed] == list(range(1, days + 1))
+        and [e["position"] for e in fixed[0]["exercises"]] == list(range(1, exercises + 1))
+        and [s["set_number"] for s in fixed[0]["exercises"][1]["planned_sets"]] == [1, 2]
+        and fixed[0]["exercises"][1]["planned_sets"][0]["reps"] == 8
+        and len(fixed[0]["exercises"][2]["planned_sets"]) == 5
+        and fixed[0]["exercises"][3]["equipment"] is None,
+    )
+
+    broken = copy.deepcopy(plan)
+    broken["weeks"][0]["days"][1]["exercises"][2]["name"] = ""
+    broken["weeks"][0]["days"][2]["exercises"][0]["planned_sets"][1]["reps"] = "lots"
+    try:
+        validate_generated_plan(broken, owner_user_id=1)
+        check("schema errors name their path", False)
+    except PlanValidationError as e:
+        check(
+            "schema errors name their path",
+            e.errors[0].startswith("weeks.0.days.1.exercises.2.name")
+            and e.errors[1].startswith("weeks.0.days.2.exercises.0.planned_sets.1.reps"),
+        )
+
+    short = copy.deepcopy(plan)
+    short["weeks"][0]["days"] = short["weeks"][0]["days"][:-1]
+    short["weeks"][0]["days"][0]["exercises"] = short["weeks"][0]["days"][0]["exercises"][:2]
+    try:
+        validate_generated_plan(short, owner_user_id=1, days_per_week=days)
+        check("count rules are enforced", False)
+    except PlanValidationError as e:
+        check("count rules are enforced", len(e.errors) == 2 and "training days" in e.errors[0] and "day 1" in e.errors[1])
+
+    try:
+        parse_json('{"weeks": [')
+        check("truncated output is rejected", False)
+    except RuntimeError as e:
+        check("truncated output is rejected", "line 1 column" in str(e))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
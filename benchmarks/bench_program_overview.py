@@ -0,0 +1,72 @@
+"""
+Query count and latency of browsing a whole program the way follow-plan.html does
+(program info, weeks count, then every week), plus GET /api/v2/programs/{id}/overview.
+Exits non-zero if a cold browse issues more than one query, a warm browse issues any,
+or a ProgramRepo write is not visible on the next read.
+
+Usage:
+  python benchmarks/bench_program_overview.py [iterations] [weeks] [days] [exercises] [sets]
+"""
+
+import sys
+from typing import List
+
+from _common import db, scratch_db, seed_program, timed, print_row  # type: ignore
+
+from app import main, services  # type: ignore  # noqa: E402
+from app.program_tree import load_program_tree, program_tree_cache  # type: ignore  # noqa: E402
+
+
+def count_queries(fn) -> List[str]:
+    statements: List[str] = []
+    with db.get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            fn()
+        finally:
+            conn.set_trace_callback(None)
+    return [s for s in statements if not s.lstrip().startswith("--")]
+
+
+def main_() -> int:
+    args = [int(a) for a in sys.argv[1:]]
+    iterations, weeks, days, exercises, sets = (args + [2000, 8, 4, 6, 4][len(args):])[:5]
+
+    scratch_db()
+    ids = seed_program(days=days, exercises_per_day=exercises, sets_per_exercise=sets, weeks=weeks)
+    program_id = ids["program_id"]
+
+    def browse() -> None:
+        main.get_program_info(program_id)
+        main.get_program_weeks_by_id(program_id)
+        for week_number in range(1, weeks + 1):
+            main.get_program_week_by_id(program_id, week_number)
+
+    program_tree_cache.clear()
+    cold = count_queries(browse)
+    warm = count_queries(browse)
+    legacy = 1 + 1 + weeks * (2 + 1 + days)
+    print(f"browse {weeks} weeks x {days} days: cold={len(cold)} warm={len(warm)} queries (legacy per-day loops: {legacy})")
+
+    failed = len(cold) > 1 or len(warm) > 0
+
+    # A repo write must show up on the very next read
+    services.add_planned_set(program_id, 1, 1, 1, sets + 1, 5, 100.0, None, None)
+    tree = main.api_program_overview(program_id)
+    first_exercise = tree["weeks"][0]["days"][0]["exercises"][0]
+    if len(first_exercise["planned_sets"]) != sets + 1:
+        print("FAIL: cached tree not invalidated by ProgramRepo.add_planned_set")
+        failed = True
+
+    print_row("load_program_tree (uncached)", timed(lambda: load_program_tree(program_id), max(1, iterations // 10)))
+    print_row("api_program_overview (cached)", timed(lambda: main.api_program_overview(program_id), iterations))
+    print_row("browse all weeks (cached)", timed(browse, max(1, iterations // 10)))
+    print(f"cache stats: {program_tree_cache.stats}")
+    if failed:
+        print(f"FAIL: cold queries:\n" + "\n".join(cold) + "\nwarm queries:\n" + "\n".join(warm))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,153 @@
+"""
+Next-week progression from actuals: the per-set Python loop (SELECT pde, SELECT planned_set,
+UPDATE or INSERT for every set) vs the set-based upsert, per workout and in bulk mode for a
+whole program. Exits non-zero if the three paths disagree on the resulting week 2 plan.
+
+Usage:
+  python benchmarks/bench_progression.py [runs] [days] [exercises] [sets]
+"""
+
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from _common import db, scratch_db, seed_program, percentile  # type: ignore
+
+from app import services  # type: ignore  # noqa: E402
+
+
+def legacy_apply(workout_id: int) -> None:
+    """The pre-upsert algorithm: one SELECT/SELECT/UPDATE-or-INSERT round per planned set."""
+    with db.get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT w.program_day_id, pw.program_id, pw.week_number, pd.day_of_week
+            FROM workout w
+            JOIN program_day pd ON pd.id = w.program_day_id
+            JOIN program_week pw ON pw.id = pd.program_week_id
+            WHERE w.id = ?
+            """,
+            (workout_id,),
+        )
+        program_day_id, program_id, week_number, day_of_week = cur.fetchone()
+        cur.execute(
+            """
+            SELECT ps.set_number, pde.position, ws.reps, ws.weight
+            FROM program_day pd
+            JOIN program_day_exercise pde ON pde.program_day_id = pd.id
+            JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
+            LEFT JOIN workout_exercise we ON we.program_day_exercise_id = pde.id AND we.workout_id = ?
+            LEFT JOIN workout_set ws ON ws.workout_exercise_id = we.id AND ws.planned_set_id = ps.id
+            WHERE pd.id = ?
+            ORDER BY pde.position, ps.set_number
+            """,
+            (workout_id, program_day_id),
+        )
+        rows = cur.fetchall()
+        if not rows or any(r[2] is None for r in rows):
+            return
+        next_day_id = services.ensure_day(program_id, week_number + 1, day_of_week, conn=conn)["id"]
+        with db.transaction(conn) as tcur:
+            for set_number, position, actual_reps, actual_weight in rows:
+                tcur.execute("SELECT id FROM program_day_exercise WHERE program_day_id = ? AND position = ?", (next_day_id, position))
+                pde_next = tcur.fetchone()
+                if not pde_next:
+                    continue
+                tcur.execute("SELECT id FROM planned_set WHERE program_day_exercise_id = ? AND set_number = ?", (pde_next[0], set_number))
+                ps_next = tcur.fetchone()
+                if ps_next:
+                    tcur.execute("UPDATE planned_set SET reps = ?, weight = ? WHERE id = ?", (max(1, actual_reps + 1), actual_weight, ps_next[0]))
+                else:
+                    tcur.execute(
+                        "INSERT INTO planned_set (program_day_exercise_id, set_number, reps, weight) VALUES (?, ?, ?, ?)",
+                        (pde_next[0], set_number, max(1, actual_reps + 1), actual_weight),
+                    )
+
+
+def week_plan(program_id: int, week_number: int) -> List[Tuple]:
+    with db.get_connection() as conn:
+        return [tuple(r) for r in conn.execute(
+            """
+            SELECT pd.day_of_week, pde.position, ps.set_number, ps.reps, ps.weight
+            FROM program_week pw
+            JOIN program_day pd ON pd.program_week_id = pw.id
+            JOIN program_day_exercise pde ON pde.program_day_id = pd.id
+            JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
+            WHERE pw.program_id = ? AND pw.week_number = ?
+            ORDER BY 1, 2, 3
+            """,
+            (program_id, week_number),
+        ).fetchall()]
+
+
+def reset_week(program_id: int, week_number: int) -> None:
+    with db.get_connection() as conn, db.transaction(conn) as cur:
+        cur.execute(
+            """
+            UPDATE planned_set SET reps = 8, weight = 60
+            WHERE program_day_exercise_id IN (
+                SELECT pde.id FROM program_day_exercise pde
+                JOIN program_day pd ON pd.id = pde.program_day_id
+                JOIN program_week pw ON pw.id = pd.program_week_id
+                WHERE pw.program_id = ? AND pw.week_number = ?
+            )
+            """,
+            (program_id, week_number),
+        )
+
+
+def bench(label: str, fn: Callable[[], None], program_id: int, runs: int) -> List[Tuple]:
+    statements: List[str] = []
+    samples = []
+    for run in range(runs):
+        reset_week(program_id, 2)
+        with db.get_connection() as conn:
+            if run == 0:
+                conn.set_trace_callback(statements.append)
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+            conn.set_trace_callback(None)
+    samples.sort()
+    # The trace repeats a statement once per trigger program it fires; count each execution once
+    issued = [s for i, s in enumerate(statements) if i == 0 or s != statements[i - 1]]
+    print(f"{label:<32} mean={sum(samples) / runs:>8.2f}ms  p50={percentile(samples, 50):>8.2f}ms  statements={len(issued)}")
+    return week_plan(program_id, 2)
+
+
+def main() -> int:
+    args = [int(a) for a in sys.argv[1:]]
+    runs, days, exercises, sets = (args + [20, 5, 6, 4][len(args):])[:4]
+
+    scratch_db()
+    ids = seed_program(days=days, exercises_per_day=exercises, sets_per_exercise=sets, weeks=2)
+    program_id, user_id = ids["program_id"], ids["user_id"]
+    workout_ids: List[int] = []
+    for day_of_week in range(1, days + 1):
+        workout_id = services.start_workout(user_id, program_id, 1, day_of_week)["id"]
+        workout_ids.append(workout_id)
+        for position in range(1, exercises + 1):
+            for set_number in range(1, sets + 1):
+                index = ((day_of_week - 1) * exercises + position - 1) * sets + set_number - 1
+                services.log_workout_set(workout_id, position, ids["planned_sets"][index], set_number, 5 + set_number, 40.0 + position, None, 90)
+    print(f"program: {days} completed days x {exercises} exercises x {sets} sets -> week 2")
+
+    results: Dict[str, List[Tuple]] = {}
+    results["legacy"] = bench("legacy loop (per workout)", lambda: [legacy_apply(w) for w in workout_ids], program_id, runs)
+    results["upsert"] = bench(
+        "set-based upsert (per workout)",
+        lambda: [services._apply_next_week_progression_from_actuals(w) for w in workout_ids],
+        program_id,
+        runs,
+    )
+    results["bulk"] = bench("bulk mode (whole program)", lambda: services.apply_progression_from_actuals(program_id), program_id, runs)
+
+    if not (results["legacy"] == results["upsert"] == results["bulk"]) or results["legacy"][0][3] == 8:
+        print("FAIL: progression results differ between implementations")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
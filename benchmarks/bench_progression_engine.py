@@ -0,0 +1,108 @@
+"""
+Progression engine: whole-program regeneration in one pass (progress_program) vs chaining one
+progress_week call per week (each from week 1), on a large program. Also checks that both
+produce the same plan, that it matches the week-1-relative progression of AI plan templates
+(plan_import.week_progression), that the default rules reject another from_week, that deload
+weeks do not carry over with the cumulative rules, and that from-actuals progression uses
+logged reps and leaves unlogged sets as planned.
+
+Usage:
+  python benchmarks/bench_progression_engine.py [runs] [weeks] [days] [exercises] [sets]
+"""
+
+import sys
+import time
+from typing import List, Tuple
+
+from _common import db, scratch_db, seed_program, percentile  # type: ignore
+
+from app import plan_import, progression, services  # type: ignore  # noqa: E402
+
+
+def program_plan(program_id: int) -> List[Tuple]:
+    with db.get_connection() as conn:
+        return [tuple(r) for r in conn.execute(
+            """
+            SELECT pw.week_number, pd.day_of_week, pde.position, ps.set_number, ps.reps, ps.weight, ps.rpe
+            FROM program_week pw
+            JOIN program_day pd ON pd.program_week_id = pw.id
+            JOIN program_day_exercise pde ON pde.program_day_id = pd.id
+            JOIN planned_set ps ON ps.program_day_exercise_id = pde.id
+            WHERE pw.program_id = ?
+            ORDER BY 1, 2, 3, 4
+            """,
+            (program_id,),
+        ).fetchall()]
+
+
+def run(label: str, fn, runs: int) -> None:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    print(f"{label:<36} mean={sum(samples) / runs:>8.2f}ms  p50={percentile(samples, 50):>8.2f}ms")
+
+
+def main() -> int:
+    args = [int(a) for a in sys.argv[1:]]
+    runs, weeks, days, exercises, sets = (args + [5, 16, 6, 8, 5][len(args):])[:5]
+
+    scratch_db()
+    ids = seed_program(days=days, exercises_per_day=exercises, sets_per_exercise=sets, weeks=weeks)
+    program_id, user_id = ids["program_id"], ids["user_id"]
+    print(f"program: {weeks} weeks x {days} days x {exercises} exercises x {sets} sets = {weeks * days * exercises * sets} planned sets")
+    failed = False
+
+    def chained() -> None:
+        for week_number in range(2, weeks + 1):
+            services.generate_week_progression(program_id, 1, week_number)
+
+    chained()
+    by_week = program_plan(program_id)
+    services.regenerate_program_progression(program_id)
+    if program_plan(program_id) != by_week:
+        print("FAIL: progress_program differs from chained progress_week")
+        failed = True
+
+    plan = program_plan(program_id)
+    week1 = {r[1:4]: (r[4], r[5]) for r in plan if r[0] == 1}
+    mismatched = [r for r in plan if (r[4], r[5]) != plan_import.week_progression(r[0], *week1[r[1:4]])]
+    if mismatched:
+        print(f"FAIL: {len(mismatched)} sets differ from the AI plan template progression, e.g. {mismatched[0]}")
+        failed = True
+
+    try:
+        services.generate_week_progression(program_id, 2, 3)
+        print("FAIL: the default rules accepted from_week=2")
+        failed = True
+    except ValueError:
+        pass
+
+    run(f"chained progress_week x{weeks - 1}", chained, runs)
+    run("progress_program (one pass)", lambda: services.regenerate_program_progression(program_id), runs)
+
+    # Deloads shape their own week only
+    rules = list(progression.CUMULATIVE_RULES) + [progression.Deload(every=4, load_factor=0.5)]
+    progression.progress_program(program_id, weeks, rules=rules)
+    plan = {(r[0], r[1], r[2], r[3]): r[5] for r in program_plan(program_id)}
+    if not (plan[(4, 1, 1, 1)] < plan[(3, 1, 1, 1)] < plan[(5, 1, 1, 1)]):
+        print(f"FAIL: deload week 4 should dip and week 5 resume: {plan[(3, 1, 1, 1)]}, {plan[(4, 1, 1, 1)]}, {plan[(5, 1, 1, 1)]}")
+        failed = True
+
+    # From actuals: log week 1 day 1 with 10 reps, week 2 becomes 11 there; unlogged days carry over as planned
+    workout_id = services.start_workout(user_id, program_id, 1, 1)["id"]
+    for position in range(1, exercises + 1):
+        for set_number in range(1, sets + 1):
+            services.log_workout_set(workout_id, position, ids["planned_sets"][(position - 1) * sets + set_number - 1], set_number, 10, 70.0, 8.0, 90)
+    result = services.generate_week_progression_from_actuals(program_id, 1, 2, user_id)
+    plan = {(r[0], r[1], r[2], r[3]): (r[4], r[5]) for r in program_plan(program_id)}
+    if plan[(2, 1, 1, 1)] != (11, 70.0) or plan[(2, 2, 1, 1)] != plan[(1, 2, 1, 1)] or result["from_actuals"] != exercises * sets:
+        print(f"FAIL: from-actuals progression {plan[(2, 1, 1, 1)]}, {plan[(2, 2, 1, 1)]}, {result}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Query count and latency of GET /api/v2/workouts/{id}/session.
+Exits non-zero if the endpoint issues more than one SQL query (N+1 regression guard).
+
+Usage:
+  python benchmarks/bench_session_loader.py [iterations] [exercises] [sets]
+"""
+
+import sys
+from typing import List
+
+from _common import db, scratch_db, seed_program, timed, print_row  # type: ignore
+
+from starlette.requests import Request  # noqa: E402
+from app import main, services  # type: ignore  # noqa: E402
+from app.security import sign_token  # type: ignore  # noqa: E402
+
+MAX_QUERIES = 1
+
+
+def auth_request(user_id: int) -> Request:
+    cookie = f"{main.COOKIE_NAME}={sign_token(user_id)}"
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [(b"cookie", cookie.encode())]})
+
+
+def count_queries(fn) -> List[str]:
+    """Statements run by fn on this thread's pooled connection (nested get_connection shares it)."""
+    statements: List[str] = []
+    with db.get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            fn()
+        finally:
+            conn.set_trace_callback(None)
+    return [s for s in statements if not s.lstrip().startswith("--")]
+
+
+def main_() -> int:
+    args = [int(a) for a in sys.argv[1:]]
+    iterations, exercises, sets = (args + [2000, 7, 4][len(args):])[:3]
+
+    scratch_db()
+    ids = seed_program(days=1, exercises_per_day=exercises, sets_per_exercise=sets)
+    workout_id = main.api_start_workout(ids["user_id"], ids["program_id"], 1, 1)["workout_id"]
+    # Log half of the sets so actuals are joined in
+    for pde_index in range(exercises):
+        for set_number in range(1, sets // 2 + 1):
+            planned_set_id = ids["planned_sets"][pde_index * sets + set_number - 1]
+            services.log_workout_set(workout_id, pde_index + 1, planned_set_id, set_number, 8, 50.0, None, 90)
+
+    request = auth_request(ids["user_id"])
+    session = main.api_get_workout_session(request, workout_id)
+    logged = sum(1 for ex in session["exercises"] for s in ex["sets"] if s["actual_reps"] is not None)
+    assert len(session["exercises"]) == exercises and logged == exercises * (sets // 2), session
+
+    queries = count_queries(lambda: main.api_get_workout_session(request, workout_id))
+    print(f"session {exercises} exercises x {sets} sets: {len(queries)} queries (legacy N+1: {1 + 1 + exercises + exercises * sets})")
+    print_row("api_get_workout_session", timed(lambda: main.api_get_workout_session(request, workout_id), iterations))
+    if len(queries) > MAX_QUERIES:
+        print(f"FAIL: expected <= {MAX_QUERIES} queries, got {len(queries)}:\n" + "\n".join(queries))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
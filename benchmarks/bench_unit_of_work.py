@@ -0,0 +1,113 @@
+"""
+Commits and pool checkouts per service call: repo calls that each commit on their
+own (legacy) vs the same operations run in one db.unit_of_work().
+
+Usage:
+  python benchmarks/bench_unit_of_work.py [iterations]
+"""
+
+import sys
+from typing import Any, Callable, Dict
+
+from _common import db, scratch_db, seed_program, timed, print_row  # type: ignore
+
+from app import services  # type: ignore
+from app.repo import ProgramRepo, WorkoutRepo  # type: ignore
+
+
+# Legacy composites: the pre-unit-of-work service bodies, one connection + commit per repo call
+def legacy_ensure_week(program_id: int, week_number: int) -> Dict[str, Any]:
+    week = ProgramRepo.get_week(program_id, week_number)
+    if week:
+        return week
+    ProgramRepo.create_week(program_id, week_number)
+    return ProgramRepo.get_week(program_id, week_number)  # type: ignore
+
+
+def legacy_ensure_day(program_id: int, week_number: int, day_of_week: int) -> Dict[str, Any]:
+    week = legacy_ensure_week(program_id, week_number)
+    day = ProgramRepo.get_day(week["id"], day_of_week)
+    if day:
+        return day
+    ProgramRepo.create_day(week["id"], day_of_week)
+    return ProgramRepo.get_day(week["id"], day_of_week)  # type: ignore
+
+
+def legacy_add_planned_set(program_id, week_number, day_of_week, position, set_number, reps, weight, rpe, rest_seconds):
+    day = legacy_ensure_day(program_id, week_number, day_of_week)
+    pde = ProgramRepo.get_day_exercise(day["id"], position)
+    return ProgramRepo.add_planned_set(pde["id"], set_number, reps, weight, rpe, rest_seconds)  # type: ignore
+
+
+def legacy_start_workout(owner_user_id, program_id, week_number, day_of_week):
+    day = legacy_ensure_day(program_id, week_number, day_of_week)
+    wid = WorkoutRepo.start(owner_user_id, day["id"], None)
+    return WorkoutRepo.get_workout(wid)
+
+
+def legacy_log_workout_set(workout_id, position, planned_set_id, set_number, reps, weight, rpe, rest_seconds):
+    w = WorkoutRepo.get_workout(workout_id)
+    pdes = ProgramRepo.list_day_exercises(w["program_day_id"])  # type: ignore
+    target = next(d for d in pdes if d["position"] == position)
+    wex_id = WorkoutRepo.ensure_workout_exercise(workout_id, target["id"], position)
+    ps = WorkoutRepo.get_planned_set(planned_set_id)
+    WorkoutRepo.get_workout_exercise(wex_id)
+    WorkoutRepo.count_actual_sets_for_wex(wex_id)
+    WorkoutRepo.planned_count_for_pde(ps["program_day_exercise_id"])  # type: ignore
+    return WorkoutRepo.add_workout_set(wex_id, planned_set_id, set_number, reps, weight, rpe, rest_seconds)
+
+
+def measure(label: str, fn: Callable[[], Any], iterations: int) -> None:
+    pool = db.get_pool()
+    before = dict(pool.stats)
+    stats = timed(fn, iterations)
+    commits = (pool.stats["commits"] - before["commits"]) / iterations
+    checkouts = (pool.stats["opened"] + pool.stats["reused"] - before["opened"] - before["reused"]) / iterations
+    print_row(label, stats)
+    print(f"{'':<40} commits/call={commits:.2f}  pool checkouts/call={checkouts:.2f}")
+
+
+def run(iterations: int) -> None:
+    ids = seed_program(days=5, exercises_per_day=1, sets_per_exercise=1)
+    program_id, user_id = ids["program_id"], ids["user_id"]
+    state = {"week": 1, "set": 1}
+
+    def new_week_day(ensure: Callable[..., Any]) -> Callable[[], Any]:
+        def op():
+            state["week"] += 1
+            return ensure(program_id, state["week"], 1)
+        return op
+
+    def planned_set(add: Callable[..., Any]) -> Callable[[], Any]:
+        def op():
+            state["set"] += 1
+            return add(program_id, 1, 1, 1, state["set"], 8, 50.0, None, 90)
+        return op
+
+    for name, legacy, current in (
+        ("ensure_day (new week)", new_week_day(legacy_ensure_day), new_week_day(services.ensure_day)),
+        ("add_planned_set", planned_set(legacy_add_planned_set), planned_set(services.add_planned_set)),
+        ("start_workout", lambda: legacy_start_workout(user_id, program_id, 1, 1), lambda: services.start_workout(user_id, program_id, 1, 1)),
+    ):
+        measure(f"legacy  {name}", legacy, iterations)
+        measure(f"uow     {name}", current, iterations)
+
+    # log_workout_set: one fresh workout per call so invariant C never trips
+    def logger(log: Callable[..., Any]) -> Callable[[], Any]:
+        def op():
+            w = services.start_workout(user_id, program_id, 1, 2)
+            return log(w["id"], 1, ids["planned_sets"][1], 1, 8, 50.0, None, 90)
+        return op
+
+    measure("legacy  start + log_workout_set", logger(legacy_log_workout_set), iterations)
+    measure("uow     start + log_workout_set", logger(services.log_workout_set), iterations)
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    scratch_db()
+    run(iterations)
+
+
+if __name__ == "__main__":
+    main()
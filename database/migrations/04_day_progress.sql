@@ -0,0 +1,163 @@
+BEGIN TRANSACTION;
+
+-- Per (user, program day) completion counters, kept current by the triggers below.
+-- completed_sets counts distinct planned sets the user has logged in any workout of that day.
+-- Rows are created when the user starts a workout for the day; app.db.rebuild_day_progress repairs drift.
+CREATE TABLE IF NOT EXISTS day_progress (
+  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  program_day_id INTEGER NOT NULL REFERENCES program_day(id) ON DELETE CASCADE,
+  planned_sets INTEGER NOT NULL DEFAULT 0,
+  completed_sets INTEGER NOT NULL DEFAULT 0,
+  last_workout_id INTEGER,
+  last_workout_started_at TEXT,
+  updated_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+  PRIMARY KEY (user_id, program_day_id)
+);
+CREATE INDEX IF NOT EXISTS day_progress_day_idx ON day_progress(program_day_id);
+
+CREATE INDEX IF NOT EXISTS workout_set_wex_planned_idx ON workout_set(workout_exercise_id, planned_set_id);
+
+-- Workouts: create the row and track the latest workout
+CREATE TRIGGER IF NOT EXISTS trg_day_progress_workout_ins
+AFTER INSERT ON workout FOR EACH ROW
+BEGIN
+  INSERT OR IGNORE INTO day_progress(user_id, program_day_id, planned_sets, completed_sets)
+  VALUES (
+    NEW.owner_user_id,
+    NEW.program_day_id,
+    (SELECT COUNT(*) FROM planned_set ps
+     JOIN program_day_exercise pde ON pde.id = ps.program_day_exercise_id
+     WHERE pde.program_day_id = NEW.program_day_id),
+    0
+  );
+  UPDATE day_progress
+  SET last_workout_id = NEW.id, last_workout_started_at = NEW.started_at, updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = NEW.owner_user_id AND program_day_id = NEW.program_day_id
+    AND (last_workout_started_at IS NULL OR NEW.started_at >= last_workout_started_at);
+END;
+
+-- Deleting a workout cascades to its sets after the workout row is gone, so recount here
+CREATE TRIGGER IF NOT EXISTS trg_day_progress_workout_del
+AFTER DELETE ON workout FOR EACH ROW
+BEGIN
+  UPDATE day_progress
+  SET completed_sets = (
+        SELECT COUNT(DISTINCT ws.planned_set_id)
+        FROM workout w
+        JOIN workout_exercise we ON we.workout_id = w.id
+        JOIN workout_set ws ON ws.workout_exercise_id = we.id
+        WHERE w.owner_user_id = OLD.owner_user_id AND w.program_day_id = OLD.program_day_id AND w.id <> OLD.id
+      ),
+      last_workout_id = (
+        SELECT w.id FROM workout w
+        WHERE w.owner_user_id = OLD.owner_user_id AND w.program_day_id = OLD.program_day_id AND w.id <> OLD.id
+        ORDER BY w.started_at DESC, w.id DESC LIMIT 1
+      ),
+      last_workout_started_at = (
+        SELECT w.started_at FROM workout w
+        WHERE w.owner_user_id = OLD.owner_user_id AND w.program_day_id = OLD.program_day_id AND w.id <> OLD.id
+        ORDER BY w.started_at DESC, w.id DESC LIMIT 1
+      ),
+      updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = OLD.owner_user_id AND program_day_id = OLD.program_day_id;
+END;
+
+-- Logged sets: count a planned set once per user, however many workouts logged it
+CREATE TRIGGER IF NOT EXISTS trg_day_progress_workout_set_ins
+AFTER INSERT ON workout_set FOR EACH ROW
+BEGIN
+  UPDATE day_progress
+  SET completed_sets = completed_sets + 1, updated_at = CURRENT_TIMESTAMP
+  WHERE (user_id, program_day_id) = (
+      SELECT w.owner_user_id, w.program_day_id
+      FROM workout_exercise we JOIN workout w ON w.id = we.workout_id
+      WHERE we.id = NEW.workout_exercise_id
+    )
+    AND NOT EXISTS (
+      SELECT 1 FROM workout_set ws
+      JOIN workout_exercise we ON we.id = ws.workout_exercise_id
+      JOIN workout w ON w.id = we.workout_id
+      WHERE ws.planned_set_id = NEW.planned_set_id AND ws.id <> NEW.id AND w.owner_user_id = day_progress.user_id
+    );
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_day_progress_workout_set_del
+AFTER DELETE ON workout_set FOR EACH ROW
+BEGIN
+  UPDATE day_progress
+  SET completed_sets = completed_sets - 1, updated_at = CURRENT_TIMESTAMP
+  WHERE (user_id, program_day_id) = (
+      SELECT w.owner_user_id, w.program_day_id
+      FROM workout_exercise we JOIN workout w ON w.id = we.workout_id
+      WHERE we.id = OLD.workout_exercise_id
+    )
+    AND NOT EXISTS (
+      SELECT 1 FROM workout_set ws
+      JOIN workout_exercise we ON we.id = ws.workout_exercise_id
+      JOIN workout w ON w.id = we.workout_id
+      WHERE ws.planned_set_id = OLD.planned_set_id AND ws.id <> OLD.id AND w.owner_user_id = day_progress.user_id
+    );
+END;
+
+-- Re-pointing a set is a delete of the old key followed by an insert of the new one
+CREATE TRIGGER IF NOT EXISTS trg_day_progress_workout_set_upd
+AFTER UPDATE OF planned_set_id, workout_exercise_id ON workout_set FOR EACH ROW
+BEGIN
+  UPDATE day_progress
+  SET completed_sets = completed_sets - 1, updated_at = CURRENT_TIMESTAMP
+  WHERE (user_id, program_day_id) = (
+      SELECT w.owner_user_id, w.program_day_id
+      FROM workout_exercise we JOIN workout w ON w.id = we.workout_id
+      WHERE we.id = OLD.workout_exercise_id
+    )
+    AND NOT EXISTS (
+      SELECT 1 FROM workout_set ws
+      JOIN workout_exercise we ON we.id = ws.workout_exercise_id
+      JOIN workout w ON w.id = we.workout_id
+      WHERE ws.planned_set_id = OLD.planned_set_id AND ws.id <> OLD.id AND w.owner_user_id = day_progress.user_id
+    );
+  UPDATE day_progress
+  SET completed_sets = completed_sets + 1, updated_at = CURRENT_TIMESTAMP
+  WHERE (user_id, program_day_id) = (
+      SELECT w.owner_user_id, w.program_day_id
+      FROM workout_exercise we JOIN workout w ON w.id = we.workout_id
+      WHERE we.id = NEW.workout_exercise_id
+    )
+    AND NOT EXISTS (
+      SELECT 1 FROM workout_set ws
+      JOIN workout_exercise we ON we.id = ws.workout_exercise_id
+      JOIN workout w ON w.id = we.workout_id
+      WHERE ws.planned_set_id = NEW.planned_set_id AND ws.id <> NEW.id AND w.owner_user_id = day_progress.user_id
+    );
+END;
+
+-- Planned sets: adjust the planned count of every user tracking that day
+CREATE TRIGGER IF NOT EXISTS trg_day_progress_planned_set_ins
+AFTER INSERT ON planned_set FOR EACH ROW
+BEGIN
+  UPDATE day_progress
+  SET planned_sets = planned_sets + 1, updated_at = CURRENT_TIMESTAMP
+  WHERE program_day_id = (SELECT program_day_id FROM program_day_exercise WHERE id = NEW.program_day_exercise_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_day_progress_planned_set_del
+AFTER DELETE ON planned_set FOR EACH ROW
+BEGIN
+  UPDATE day_progress
+  SET planned_sets = planned_sets - 1, updated_at = CURRENT_TIMESTAMP
+  WHERE program_day_id = (SELECT program_day_id FROM program_day_exercise WHERE id = OLD.program_day_exercise_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_day_progress_planned_set_upd
+AFTER UPDATE OF program_day_exercise_id ON planned_set FOR EACH ROW
+WHEN OLD.program_day_exercise_id <> NEW.program_day_exercise_id
+BEGIN
+  UPDATE day_progress
+  SET planned_sets = planned_sets - 1, updated_at = CURRENT_TIMESTAMP
+  WHERE program_day_id = (SELECT program_day_id FROM program_day_exercise WHERE id = OLD.program_day_exercise_id);
+  UPDATE day_progress
+  SET planned_sets = planned_sets + 1, updated_at = CURRENT_TIMESTAMP
+  WHERE program_day_id = (SELECT program_day_id FROM program_day_exercise WHERE id = NEW.program_day_exercise_id);
+END;
+
+COMMIT;
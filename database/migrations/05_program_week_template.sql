@@ -0,0 +1,19 @@
+BEGIN TRANSACTION;
+
+-- Weeks stored as "template week + deltas" instead of full copies of every row.
+-- A week with a row here takes the days of template_week_id that it has no program_day of its own for;
+-- their planned sets are computed on read: reps + rep_delta, weight * load_factor (NULL/0 weights stay as they are
+-- when load_factor is 1, and become NULL otherwise, matching plan_import.week_progression).
+-- Days are materialized (copied with the computed values) when a workout starts or the day is customized.
+CREATE TABLE IF NOT EXISTS program_week_template (
+  program_week_id INTEGER PRIMARY KEY REFERENCES program_week(id) ON DELETE CASCADE,
+  template_week_id INTEGER NOT NULL REFERENCES program_week(id) ON DELETE CASCADE,
+  rep_delta INTEGER NOT NULL DEFAULT 0,
+  load_factor REAL NOT NULL DEFAULT 1.0,
+  created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+  CHECK (program_week_id <> template_week_id),
+  CHECK (load_factor > 0)
+);
+CREATE INDEX IF NOT EXISTS program_week_template_template_idx ON program_week_template(template_week_id);
+
+COMMIT;
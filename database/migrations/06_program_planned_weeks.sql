@@ -0,0 +1,8 @@
+BEGIN TRANSACTION;
+
+-- Length of a lazily stored program. Only week 1 is written when the plan is saved; weeks
+-- 2..planned_weeks get their rows on first access (plan_import.ensure_week_materialized).
+-- NULL for programs whose weeks all exist as rows.
+ALTER TABLE program ADD COLUMN planned_weeks INTEGER;
+
+COMMIT;
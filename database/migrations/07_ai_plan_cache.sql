@@ -0,0 +1,15 @@
+BEGIN TRANSACTION;
+
+-- Generated plans keyed by a hash of the normalized generation inputs (app/plan_cache.py).
+-- Times are unix epoch seconds; rows expire after AI_PLAN_CACHE_TTL_S and the least recently
+-- used rows are evicted beyond AI_PLAN_CACHE_MAX_ROWS.
+CREATE TABLE IF NOT EXISTS ai_plan_cache (
+  key TEXT PRIMARY KEY,
+  plan_json TEXT NOT NULL,
+  created_at REAL NOT NULL,
+  last_used_at REAL NOT NULL,
+  hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ai_plan_cache_last_used_idx ON ai_plan_cache(last_used_at);
+
+COMMIT;
@@ -0,0 +1,21 @@
+BEGIN TRANSACTION;
+
+-- Background AI plan generations (app/ai_jobs.py). status: queued → running → done | failed.
+-- Times are unix epoch seconds; inputs/result are JSON.
+CREATE TABLE IF NOT EXISTS ai_generation_job (
+  id TEXT PRIMARY KEY,
+  owner_user_id INTEGER,
+  status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+  mode TEXT NOT NULL,
+  refresh INTEGER NOT NULL DEFAULT 0,
+  inputs_json TEXT NOT NULL,
+  result_json TEXT,
+  error TEXT,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  created_at REAL NOT NULL,
+  started_at REAL,
+  finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ai_generation_job_status_idx ON ai_generation_job(status, created_at);
+
+COMMIT;
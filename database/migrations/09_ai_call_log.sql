@@ -0,0 +1,20 @@
+BEGIN TRANSACTION;
+
+-- One row per model call (app/ai_telemetry.py), kept for AI_TELEMETRY_RETENTION_S and at most
+-- AI_TELEMETRY_MAX_ROWS rows. Times are unix epoch seconds / durations in seconds.
+CREATE TABLE IF NOT EXISTS ai_call_log (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  created_at REAL NOT NULL,
+  kind TEXT NOT NULL,
+  model TEXT,
+  prompt_tokens INTEGER,
+  completion_tokens INTEGER,
+  ttft_s REAL,
+  latency_s REAL NOT NULL,
+  retries INTEGER NOT NULL DEFAULT 0,
+  parse_failed INTEGER NOT NULL DEFAULT 0,
+  error TEXT
+);
+CREATE INDEX IF NOT EXISTS ai_call_log_created_idx ON ai_call_log(created_at);
+
+COMMIT;
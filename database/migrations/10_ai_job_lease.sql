@@ -0,0 +1,9 @@
+BEGIN TRANSACTION;
+
+-- Lease on a running ai_generation_job (app/ai_jobs.py): the worker that claimed it and until when
+-- its claim holds. The worker renews the lease while the job runs; only rows whose lease expired
+-- (the worker's process died or stopped) are requeued. NULL on rows claimed before this migration.
+ALTER TABLE ai_generation_job ADD COLUMN claimed_by TEXT;
+ALTER TABLE ai_generation_job ADD COLUMN lease_expires_at REAL;
+
+COMMIT;
@@ -0,0 +1,24 @@
+"""
+Recompute the day_progress completion counters from workouts and planned sets.
+The counters are normally kept current by triggers; run this to repair drift
+(e.g. after editing the database by hand).
+
+Usage:
+  python database/rebuild_day_progress.py [user_id]
+"""
+
+import sys
+from pathlib import Path
+
+# Ensure we can import from app
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+from app import db  # type: ignore
+
+
+if __name__ == "__main__":
+    user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    db.ensure_schema_integrity()
+    result = db.rebuild_day_progress(user_id)
+    print(f"day_progress at {db.DB_PATH}: {result}")